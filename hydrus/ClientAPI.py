@@ -1,3 +1,6 @@
+import array
+import bisect
+import collections
 from . import ClientTags
 from . import HydrusData
 from . import HydrusExceptions
@@ -24,6 +27,7 @@ basic_permission_to_str_lookup[ CLIENT_API_PERMISSION_MANAGE_PAGES ] = 'manage p
 basic_permission_to_str_lookup[ CLIENT_API_PERMISSION_MANAGE_COOKIES ] = 'manage cookies'
 
 SEARCH_RESULTS_CACHE_TIMEOUT = 4 * 3600
+MAX_SEARCH_CURSORS_PER_ACCESS = 5
 
 SESSION_EXPIRY = 86400
 
@@ -196,6 +200,64 @@ class APIManager( HydrusSerialisable.SerialisableBase ):
     
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_CLIENT_API_MANAGER ] = APIManager
 
+class SearchResults( object ):
+    
+    def __init__( self, hash_ids ):
+        
+        # a 2M file search is 8MB here, rather than the ~100MB of a set of python ints
+        
+        self._ordered_hash_ids = array.array( 'I', hash_ids )
+        self._sorted_hash_ids = array.array( 'I', sorted( self._ordered_hash_ids ) )
+        
+        self._timeout = HydrusData.GetNow() + SEARCH_RESULTS_CACHE_TIMEOUT
+        
+    
+    def __len__( self ):
+        
+        return len( self._ordered_hash_ids )
+        
+    
+    def CountContained( self, hash_ids ):
+        
+        sorted_hash_ids = self._sorted_hash_ids
+        num_hash_ids = len( sorted_hash_ids )
+        
+        count = 0
+        
+        for hash_id in set( hash_ids ):
+            
+            i = bisect.bisect_left( sorted_hash_ids, hash_id )
+            
+            if i < num_hash_ids and sorted_hash_ids[ i ] == hash_id:
+                
+                count += 1
+                
+            
+        
+        return count
+        
+    
+    def GetHashIds( self, offset = 0, limit = None ):
+        
+        if limit is None:
+            
+            return self._ordered_hash_ids[ offset : ]
+            
+        
+        return self._ordered_hash_ids[ offset : offset + limit ]
+        
+    
+    def IsExpired( self ):
+        
+        return HydrusData.TimeHasPassed( self._timeout )
+        
+    
+    def Touch( self ):
+        
+        self._timeout = HydrusData.GetNow() + SEARCH_RESULTS_CACHE_TIMEOUT
+        
+    
+
 class APIPermissions( HydrusSerialisable.SerialisableBaseNamed ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_CLIENT_API_PERMISSIONS
@@ -227,7 +289,7 @@ class APIPermissions( HydrusSerialisable.SerialisableBaseNamed ):
         self._search_tag_filter = search_tag_filter
         
         self._last_search_results = None
-        self._search_results_timeout = 0
+        self._search_cursors_to_search_results = collections.OrderedDict()
         
         self._lock = threading.Lock()
         
@@ -313,8 +375,8 @@ class APIPermissions( HydrusSerialisable.SerialisableBaseNamed ):
                 raise HydrusExceptions.BadRequestException( 'It looks like those search results are no longer available--please run the search again!' )
                 
             
-            num_files_asked_for = len( hash_ids )
-            num_files_allowed_to_see = len( self._last_search_results.intersection( hash_ids ) )
+            num_files_asked_for = len( set( hash_ids ) )
+            num_files_allowed_to_see = self._last_search_results.CountContained( hash_ids )
             
             if num_files_allowed_to_see != num_files_asked_for:
                 
@@ -325,7 +387,7 @@ class APIPermissions( HydrusSerialisable.SerialisableBaseNamed ):
                 raise HydrusExceptions.InsufficientCredentialsException( error_text )
                 
             
-            self._search_results_timeout = HydrusData.GetNow() + SEARCH_RESULTS_CACHE_TIMEOUT
+            self._last_search_results.Touch()
             
         
     
@@ -380,6 +442,25 @@ class APIPermissions( HydrusSerialisable.SerialisableBaseNamed ):
             
         
     
+    def GetSearchResults( self, search_cursor ):
+        
+        with self._lock:
+            
+            if search_cursor not in self._search_cursors_to_search_results:
+                
+                raise HydrusExceptions.NotFoundException( 'It looks like that search cursor is no longer available--please run the search again!' )
+                
+            
+            search_results = self._search_cursors_to_search_results[ search_cursor ]
+            
+            search_results.Touch()
+            
+            self._search_cursors_to_search_results.move_to_end( search_cursor )
+            
+            return search_results
+            
+        
+    
     def GetSearchTagFilter( self ):
         
         with self._lock:
@@ -400,11 +481,18 @@ class APIPermissions( HydrusSerialisable.SerialisableBaseNamed ):
         
         with self._lock:
             
-            if self._last_search_results is not None and HydrusData.TimeHasPassed( self._search_results_timeout ):
+            if self._last_search_results is not None and self._last_search_results.IsExpired():
                 
                 self._last_search_results = None
                 
             
+            expired_search_cursors = [ search_cursor for ( search_cursor, search_results ) in self._search_cursors_to_search_results.items() if search_results.IsExpired() ]
+            
+            for search_cursor in expired_search_cursors:
+                
+                del self._search_cursors_to_search_results[ search_cursor ]
+                
+            
         
     
     def SetLastSearchResults( self, hash_ids ):
@@ -416,9 +504,35 @@ class APIPermissions( HydrusSerialisable.SerialisableBaseNamed ):
                 return
                 
             
-            self._last_search_results = set( hash_ids )
+            if isinstance( hash_ids, SearchResults ):
+                
+                search_results = hash_ids
+                
+                search_results.Touch()
+                
+            else:
+                
+                search_results = SearchResults( hash_ids )
+                
+            
+            self._last_search_results = search_results
+            
+        
+    
+    def SetSearchResults( self, search_results ):
+        
+        with self._lock:
+            
+            search_cursor = HydrusData.GenerateKey()
+            
+            self._search_cursors_to_search_results[ search_cursor ] = search_results
+            
+            while len( self._search_cursors_to_search_results ) > MAX_SEARCH_CURSORS_PER_ACCESS:
+                
+                self._search_cursors_to_search_results.popitem( last = False )
+                
             
-            self._search_results_timeout = HydrusData.GetNow() + SEARCH_RESULTS_CACHE_TIMEOUT
+            return search_cursor
             
         
     
@@ -2,11 +2,13 @@ from . import ClientFiles
 from . import ClientImageHandling
 from . import ClientParsing
 from . import ClientRendering
+from . import ClientTags
 from . import HydrusConstants as HC
 from . import HydrusExceptions
 from . import HydrusImageHandling
 from . import HydrusThreading
 import json
+import numpy
 import os
 import threading
 import time
@@ -17,8 +19,66 @@ import collections
 import traceback
 import weakref
 
+POPCOUNT_M1 = numpy.uint64( 0x5555555555555555 )
+POPCOUNT_M2 = numpy.uint64( 0x3333333333333333 )
+POPCOUNT_M4 = numpy.uint64( 0x0F0F0F0F0F0F0F0F )
+POPCOUNT_H01 = numpy.uint64( 0x0101010101010101 )
+
+def ConvertPHashesToUInt64Array( phashes ):
+    
+    # phashes are big-endian 8-byte strings, as in HydrusData.Get64BitHammingDistance
+    
+    return numpy.frombuffer( b''.join( phashes ), dtype = '>u8' ).astype( numpy.uint64 )
+    
+def ConvertHashIdsToPostingList( hash_ids ):
+    
+    # a posting list is a sorted numpy array of unique hash_ids, four bytes an id while they fit, rather than the ~70 a python int in a set costs
+    
+    posting_list = numpy.fromiter( hash_ids, dtype = numpy.int64, count = len( hash_ids ) )
+    
+    posting_list.sort()
+    
+    if len( posting_list ) == 0 or posting_list[-1] < 2 ** 32:
+        
+        posting_list = posting_list.astype( numpy.uint32 )
+        
+    
+    return posting_list
+    
+def IntersectHashIdsWithPostingList( hash_ids, posting_list ):
+    
+    query_posting_list = numpy.fromiter( hash_ids, dtype = numpy.int64, count = len( hash_ids ) )
+    
+    return set( query_posting_list[ numpy.isin( query_posting_list, posting_list, assume_unique = True ) ].tolist() )
+    
+def IntersectPostingLists( posting_list_1, posting_list_2 ):
+    
+    return numpy.intersect1d( posting_list_1, posting_list_2, assume_unique = True )
+    
+def PopCount64( array ):
+    
+    # the same bit-twiddling as HydrusData.Get64BitHammingDistance, but over a whole uint64 array
+    
+    array = array - ( ( array >> numpy.uint64( 1 ) ) & POPCOUNT_M1 )
+    array = ( array & POPCOUNT_M2 ) + ( ( array >> numpy.uint64( 2 ) ) & POPCOUNT_M2 )
+    array = ( array + ( array >> numpy.uint64( 4 ) ) ) & POPCOUNT_M4
+    
+    return ( ( array * POPCOUNT_H01 ) >> numpy.uint64( 56 ) ).astype( numpy.uint8 )
+    
+def SubtractPostingListFromHashIds( hash_ids, posting_list ):
+    
+    query_posting_list = numpy.fromiter( hash_ids, dtype = numpy.int64, count = len( hash_ids ) )
+    
+    return set( query_posting_list[ numpy.isin( query_posting_list, posting_list, assume_unique = True, invert = True ) ].tolist() )
+    
 class DataCache( object ):
     
+    # this is a size-limited segmented LRU
+    # new data goes into a probationary segment and is only promoted to the protected segment if it is asked for again
+    # so flicking through a huge page of new thumbs only churns the probationary segment, and the stuff that is actually being reused survives
+    
+    PROTECTED_SEGMENT_FRACTION = 0.8
+    
     def __init__( self, controller, cache_size, timeout = 1200 ):
         
         self._controller = controller
@@ -26,9 +86,18 @@ class DataCache( object ):
         self._timeout = timeout
         
         self._keys_to_data = {}
-        self._keys_fifo = collections.OrderedDict()
+        self._keys_to_memory_footprints = {}
+        
+        # key -> last access time, in LRU order
+        self._probationary_keys_fifo = collections.OrderedDict()
+        self._protected_keys_fifo = collections.OrderedDict()
         
         self._total_estimated_memory_footprint = 0
+        self._protected_estimated_memory_footprint = 0
+        
+        self._num_hits = 0
+        self._num_misses = 0
+        self._num_evictions = 0
         
         self._lock = threading.Lock()
         
@@ -42,34 +111,112 @@ class DataCache( object ):
             return
             
         
-        deletee_data = self._keys_to_data[ key ]
-        
         del self._keys_to_data[ key ]
         
-        self._RecalcMemoryUsage()
+        memory_footprint = self._keys_to_memory_footprints.pop( key )
+        
+        self._total_estimated_memory_footprint -= memory_footprint
+        
+        if key in self._protected_keys_fifo:
+            
+            del self._protected_keys_fifo[ key ]
+            
+            self._protected_estimated_memory_footprint -= memory_footprint
+            
+        elif key in self._probationary_keys_fifo:
+            
+            del self._probationary_keys_fifo[ key ]
+            
         
     
     def _DeleteItem( self ):
         
-        ( deletee_key, last_access_time ) = self._keys_fifo.popitem( last = False )
+        if len( self._probationary_keys_fifo ) > 0:
+            
+            keys_fifo = self._probationary_keys_fifo
+            
+        else:
+            
+            keys_fifo = self._protected_keys_fifo
+            
+        
+        ( deletee_key, last_access_time ) = next( iter( keys_fifo.items() ) )
         
         self._Delete( deletee_key )
         
     
-    def _RecalcMemoryUsage( self ):
+    def _RefreshMemoryFootprint( self, key ):
+        
+        # a renderer's footprint grows once it has actually rendered, so we re-measure rather than trusting what we saw at add time
+        
+        memory_footprint = self._keys_to_data[ key ].GetEstimatedMemoryFootprint()
+        
+        difference = memory_footprint - self._keys_to_memory_footprints[ key ]
+        
+        if difference == 0:
+            
+            return
+            
+        
+        self._keys_to_memory_footprints[ key ] = memory_footprint
+        
+        self._total_estimated_memory_footprint += difference
+        
+        if key in self._protected_keys_fifo:
+            
+            self._protected_estimated_memory_footprint += difference
+            
+        
+    
+    def _ReduceToSize( self ):
+        
+        # the item we just touched is at the fresh end of its segment, so it goes last
         
-        self._total_estimated_memory_footprint = sum( ( data.GetEstimatedMemoryFootprint() for data in self._keys_to_data.values() ) )
+        while self._total_estimated_memory_footprint > self._cache_size and len( self._keys_to_data ) > 1:
+            
+            self._DeleteItem()
+            
+            self._num_evictions += 1
+            
         
     
     def _TouchKey( self, key ):
         
-        # have to delete first, rather than overwriting, so the ordereddict updates its internal order
-        if key in self._keys_fifo:
+        now = HydrusData.GetNow()
+        
+        if key in self._protected_keys_fifo:
             
-            del self._keys_fifo[ key ]
+            self._protected_keys_fifo.move_to_end( key )
+            
+            self._protected_keys_fifo[ key ] = now
+            
+        elif key in self._probationary_keys_fifo:
+            
+            # second access, so promote it
+            
+            del self._probationary_keys_fifo[ key ]
+            
+            self._protected_keys_fifo[ key ] = now
+            
+            self._protected_estimated_memory_footprint += self._keys_to_memory_footprints[ key ]
+            
+            protected_limit = self._cache_size * self.PROTECTED_SEGMENT_FRACTION
+            
+            while self._protected_estimated_memory_footprint > protected_limit and len( self._protected_keys_fifo ) > 1:
+                
+                # demote the least recently used protected item to the fresh end of probation, giving it one more chance
+                
+                ( demotee_key, last_access_time ) = self._protected_keys_fifo.popitem( last = False )
+                
+                self._protected_estimated_memory_footprint -= self._keys_to_memory_footprints[ demotee_key ]
+                
+                self._probationary_keys_fifo[ demotee_key ] = last_access_time
+                
+            
+        else:
+            
+            self._probationary_keys_fifo[ key ] = now
             
-        
-        self._keys_fifo[ key ] = HydrusData.GetNow()
         
     
     def Clear( self ):
@@ -77,9 +224,13 @@ class DataCache( object ):
         with self._lock:
             
             self._keys_to_data = {}
-            self._keys_fifo = collections.OrderedDict()
+            self._keys_to_memory_footprints = {}
+            
+            self._probationary_keys_fifo = collections.OrderedDict()
+            self._protected_keys_fifo = collections.OrderedDict()
             
             self._total_estimated_memory_footprint = 0
+            self._protected_estimated_memory_footprint = 0
             
         
     
@@ -89,16 +240,21 @@ class DataCache( object ):
             
             if key not in self._keys_to_data:
                 
-                while self._total_estimated_memory_footprint > self._cache_size:
+                memory_footprint = data.GetEstimatedMemoryFootprint()
+                
+                while self._total_estimated_memory_footprint + memory_footprint > self._cache_size and len( self._keys_to_data ) > 0:
                     
                     self._DeleteItem()
                     
+                    self._num_evictions += 1
+                    
                 
                 self._keys_to_data[ key ] = data
+                self._keys_to_memory_footprints[ key ] = memory_footprint
                 
-                self._TouchKey( key )
+                self._total_estimated_memory_footprint += memory_footprint
                 
-                self._RecalcMemoryUsage()
+                self._TouchKey( key )
                 
             
         
@@ -117,11 +273,19 @@ class DataCache( object ):
             
             if key not in self._keys_to_data:
                 
+                self._num_misses += 1
+                
                 raise Exception( 'Cache error! Looking for ' + str( key ) + ', but it was missing.' )
                 
             
+            self._num_hits += 1
+            
+            self._RefreshMemoryFootprint( key )
+            
             self._TouchKey( key )
             
+            self._ReduceToSize()
+            
             return self._keys_to_data[ key ]
             
         
@@ -132,17 +296,43 @@ class DataCache( object ):
             
             if key in self._keys_to_data:
                 
+                self._num_hits += 1
+                
+                self._RefreshMemoryFootprint( key )
+                
                 self._TouchKey( key )
                 
+                self._ReduceToSize()
+                
                 return self._keys_to_data[ key ]
                 
             else:
                 
+                self._num_misses += 1
+                
                 return None
                 
             
         
     
+    def GetStats( self ):
+        
+        with self._lock:
+            
+            stats = {}
+            
+            stats[ 'num_items' ] = len( self._keys_to_data )
+            stats[ 'num_protected_items' ] = len( self._protected_keys_fifo )
+            stats[ 'estimated_memory_footprint' ] = self._total_estimated_memory_footprint
+            stats[ 'cache_size' ] = self._cache_size
+            stats[ 'num_hits' ] = self._num_hits
+            stats[ 'num_misses' ] = self._num_misses
+            stats[ 'num_evictions' ] = self._num_evictions
+            
+            return stats
+            
+        
+    
     def HasData( self, key ):
         
         with self._lock:
@@ -155,27 +345,282 @@ class DataCache( object ):
         
         with self._lock:
             
-            while True:
+            # demoted items keep their real last access time at the fresh end of probation, so the segments are not in time order and we check everything
+            
+            for keys_fifo in ( self._probationary_keys_fifo, self._protected_keys_fifo ):
                 
-                if len( self._keys_fifo ) == 0:
-                    
-                    break
-                    
-                else:
+                expired_keys = [ key for ( key, last_access_time ) in keys_fifo.items() if HydrusData.TimeHasPassed( last_access_time + self._timeout ) ]
+                
+                for key in expired_keys:
                     
-                    ( key, last_access_time ) = next( iter( self._keys_fifo.items() ) )
-                    
-                    if HydrusData.TimeHasPassed( last_access_time + self._timeout ):
-                        
-                        self._DeleteItem()
-                        
-                    else:
-                        
-                        break
-                        
+                    self._Delete( key )
                     
                 
             
+            for key in list( self._keys_to_data.keys() ):
+                
+                self._RefreshMemoryFootprint( key )
+                
+            
+            self._ReduceToSize()
+            
+        
+    
+class FileSearchResultCache( object ):
+    
+    # remembers recent file search results, so refreshing a page or re-running the same api search is near free
+    # each entry lists what its results depend on (services, the inbox, siblings...), and the db drops entries as those change
+    # the db only stores results made from a snapshot that no write has started since, so everything in here is as new as the last commit
+    
+    def __init__( self, max_entries, max_bytes ):
+        
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        
+        self._lock = threading.Lock()
+        
+        # key -> ( hash_ids, dependencies ), in LRU order
+        self._keys_to_results = collections.OrderedDict()
+        
+        self._total_bytes = 0
+        
+        self._num_hits = 0
+        self._num_misses = 0
+        
+    
+    def _Delete( self, key ):
+        
+        ( hash_ids, dependencies ) = self._keys_to_results.pop( key )
+        
+        self._total_bytes -= hash_ids.nbytes
+        
+    
+    def Clear( self ):
+        
+        with self._lock:
+            
+            self._keys_to_results = collections.OrderedDict()
+            
+            self._total_bytes = 0
+            
+        
+    
+    def GetHitsAndMisses( self ):
+        
+        with self._lock:
+            
+            return ( self._num_hits, self._num_misses )
+            
+        
+    
+    def GetResult( self, key ):
+        
+        with self._lock:
+            
+            if key not in self._keys_to_results:
+                
+                self._num_misses += 1
+                
+                return None
+                
+            
+            self._num_hits += 1
+            
+            self._keys_to_results.move_to_end( key )
+            
+            ( hash_ids, dependencies ) = self._keys_to_results[ key ]
+            
+            # the caller gets their own list to mess with
+            
+            return hash_ids.tolist()
+            
+        
+    
+    def InvalidateDependency( self, dependency ):
+        
+        with self._lock:
+            
+            deletee_keys = [ key for ( key, ( hash_ids, dependencies ) ) in self._keys_to_results.items() if dependency in dependencies ]
+            
+            for key in deletee_keys:
+                
+                self._Delete( key )
+                
+            
+        
+    
+    def SetResult( self, key, result, dependencies ):
+        
+        hash_ids = numpy.fromiter( result, dtype = numpy.int64, count = len( result ) )
+        
+        with self._lock:
+            
+            if hash_ids.nbytes > self._max_bytes:
+                
+                return
+                
+            
+            if key in self._keys_to_results:
+                
+                self._Delete( key )
+                
+            
+            self._keys_to_results[ key ] = ( hash_ids, frozenset( dependencies ) )
+            
+            self._total_bytes += hash_ids.nbytes
+            
+            while self._total_bytes > self._max_bytes or len( self._keys_to_results ) > self._max_entries:
+                
+                oldest_key = next( iter( self._keys_to_results ) )
+                
+                self._Delete( oldest_key )
+                
+            
+        
+    
+class HashIdPostingListCache( object ):
+    
+    # the db keeps the hash_ids for hot searches (a tag, the inbox, a file service) here as posting lists, so it can and/andnot them in numpy without going to SQLite
+    # a key has to be asked for a couple of times before it is cached, so one-off searches do not churn out the useful stuff
+    # each posting list records the services it depends on, and the db invalidates by service as mappings and files change
+    
+    MIN_REQUESTS_TO_CACHE = 2
+    MAX_TRACKED_REQUEST_KEYS = 10000
+    
+    def __init__( self, max_bytes ):
+        
+        self._max_bytes = max_bytes
+        
+        self._lock = threading.Lock()
+        
+        # key -> ( posting_list, service_ids ), in LRU order
+        self._keys_to_posting_lists = collections.OrderedDict()
+        self._keys_to_num_requests = collections.Counter()
+        
+        self._total_bytes = 0
+        
+        self._num_hits = 0
+        self._num_misses = 0
+        
+    
+    def _Delete( self, key ):
+        
+        ( posting_list, service_ids ) = self._keys_to_posting_lists.pop( key )
+        
+        self._total_bytes -= posting_list.nbytes
+        
+    
+    def Clear( self ):
+        
+        with self._lock:
+            
+            self._keys_to_posting_lists = collections.OrderedDict()
+            self._keys_to_num_requests = collections.Counter()
+            
+            self._total_bytes = 0
+            
+        
+    
+    def GetHitsAndMisses( self ):
+        
+        with self._lock:
+            
+            return ( self._num_hits, self._num_misses )
+            
+        
+    
+    def GetPostingList( self, key ):
+        
+        with self._lock:
+            
+            if key not in self._keys_to_posting_lists:
+                
+                self._num_misses += 1
+                
+                return None
+                
+            
+            self._num_hits += 1
+            
+            self._keys_to_posting_lists.move_to_end( key )
+            
+            ( posting_list, service_ids ) = self._keys_to_posting_lists[ key ]
+            
+            return posting_list
+            
+        
+    
+    def Invalidate( self, key ):
+        
+        with self._lock:
+            
+            if key in self._keys_to_posting_lists:
+                
+                self._Delete( key )
+                
+            
+        
+    
+    def InvalidateService( self, service_id ):
+        
+        with self._lock:
+            
+            deletee_keys = [ key for ( key, ( posting_list, service_ids ) ) in self._keys_to_posting_lists.items() if service_id in service_ids ]
+            
+            for key in deletee_keys:
+                
+                self._Delete( key )
+                
+            
+        
+    
+    def SetPostingList( self, key, posting_list, service_ids = None ):
+        
+        if service_ids is None:
+            
+            service_ids = set()
+            
+        
+        with self._lock:
+            
+            if key in self._keys_to_posting_lists:
+                
+                self._Delete( key )
+                
+            
+            if posting_list.nbytes > self._max_bytes:
+                
+                return
+                
+            
+            self._keys_to_posting_lists[ key ] = ( posting_list, frozenset( service_ids ) )
+            
+            self._total_bytes += posting_list.nbytes
+            
+            while self._total_bytes > self._max_bytes:
+                
+                oldest_key = next( iter( self._keys_to_posting_lists ) )
+                
+                self._Delete( oldest_key )
+                
+            
+        
+    
+    def WantsPostingList( self, key ):
+        
+        # call this on a miss. it counts the request and says whether the key is now hot enough to fetch in full and cache
+        
+        with self._lock:
+            
+            if len( self._keys_to_num_requests ) > self.MAX_TRACKED_REQUEST_KEYS:
+                
+                self._keys_to_num_requests = collections.Counter()
+                
+            
+            self._keys_to_num_requests[ key ] += 1
+            
+            return self._keys_to_num_requests[ key ] >= self.MIN_REQUESTS_TO_CACHE
+            
         
     
 class LocalBooruCache( object ):
@@ -344,6 +789,7 @@ class MediaResultCache( object ):
         HG.client_controller.sub( self, 'ProcessServiceUpdates', 'service_updates_data' )
         HG.client_controller.sub( self, 'NewForceRefreshTags', 'notify_new_force_refresh_tags_data' )
         HG.client_controller.sub( self, 'NewTagDisplayRules', 'notify_new_tag_display_rules' )
+        HG.client_controller.sub( self, 'NewSiblingsLookup', 'notify_new_siblings_lookup' )
         
     
     def AddMediaResults( self, media_results ):
@@ -446,6 +892,39 @@ class MediaResultCache( object ):
         HG.client_controller.CallToThread( do_it, hash_ids )
         
     
+    def NewSiblingsLookup( self, changed_tags ):
+        
+        # None means the siblings manager rebuilt everything, so we do not know which tags changed
+        
+        if changed_tags is None:
+            
+            changed_tag_ids = None
+            
+        else:
+            
+            changed_tag_ids = { ClientTags.tag_id_table.PeekTagId( tag ) for tag in changed_tags }
+            
+            changed_tag_ids.discard( None )
+            
+            # no tags manager has ever held any of these tags
+            
+            if len( changed_tag_ids ) == 0:
+                
+                return
+                
+            
+        
+        with self._lock:
+            
+            for media_result in self._hash_ids_to_media_results.values():
+                
+                media_result.GetTagsManager().NewSiblingsLookup( changed_tag_ids )
+                
+            
+        
+        HG.client_controller.pub( 'refresh_all_tag_presentation_gui' )
+        
+    
     def NewTagDisplayRules( self ):
         
         with self._lock:
@@ -615,6 +1094,201 @@ class ParsingCache( object ):
             
         
     
+class PHashIndex( object ):
+    
+    # an in-memory alternative to walking the shape_vptree table. all the phashes sit in one contiguous uint64 array and we xor/popcount the whole lot at once
+    # 3M phashes is only ~48MB with their ids, and numpy chews through that far faster than we can do a few hundred SQLite round trips
+    
+    # maximum number of query x index cells we will calculate in one numpy op, to keep temporary memory use reasonable
+    MAX_BLOCK_CELLS = 2 ** 22
+    
+    def __init__( self ):
+        
+        self._lock = threading.Lock()
+        
+        # these are kept sorted by phash_id
+        self._phash_ids = numpy.empty( 0, dtype = numpy.int64 )
+        self._phashes = numpy.empty( 0, dtype = numpy.uint64 )
+        
+        self._pending_adds = {}
+        self._pending_deletes = set()
+        
+    
+    def _Consolidate( self ):
+        
+        if len( self._pending_deletes ) > 0:
+            
+            delete_phash_ids = numpy.fromiter( self._pending_deletes, dtype = numpy.int64, count = len( self._pending_deletes ) )
+            
+            indices = numpy.searchsorted( self._phash_ids, delete_phash_ids )
+            
+            indices = indices[ indices < len( self._phash_ids ) ]
+            
+            indices = indices[ numpy.isin( self._phash_ids[ indices ], delete_phash_ids ) ]
+            
+            if len( indices ) > 0:
+                
+                self._phash_ids = numpy.delete( self._phash_ids, indices )
+                self._phashes = numpy.delete( self._phashes, indices )
+                
+            
+            self._pending_deletes = set()
+            
+        
+        if len( self._pending_adds ) > 0:
+            
+            num_adds = len( self._pending_adds )
+            
+            add_phash_ids = numpy.fromiter( self._pending_adds.keys(), dtype = numpy.int64, count = num_adds )
+            add_phashes = ConvertPHashesToUInt64Array( list( self._pending_adds.values() ) )
+            
+            if len( self._phash_ids ) > 0:
+                
+                indices = numpy.searchsorted( self._phash_ids, add_phash_ids )
+                
+                already_in = numpy.zeros( num_adds, dtype = bool )
+                
+                valid = indices < len( self._phash_ids )
+                
+                already_in[ valid ] = self._phash_ids[ indices[ valid ] ] == add_phash_ids[ valid ]
+                
+                add_phash_ids = add_phash_ids[ ~already_in ]
+                add_phashes = add_phashes[ ~already_in ]
+                
+            
+            if len( add_phash_ids ) > 0:
+                
+                phash_ids = numpy.concatenate( ( self._phash_ids, add_phash_ids ) )
+                phashes = numpy.concatenate( ( self._phashes, add_phashes ) )
+                
+                # new phash_ids are usually fresh autoincrement ids that go on the end, so we can often skip the sort
+                
+                if ( len( self._phash_ids ) > 0 and add_phash_ids.min() < self._phash_ids[-1] ) or numpy.any( numpy.diff( add_phash_ids ) < 0 ):
+                    
+                    order = numpy.argsort( phash_ids, kind = 'stable' )
+                    
+                    phash_ids = phash_ids[ order ]
+                    phashes = phashes[ order ]
+                    
+                
+                self._phash_ids = phash_ids
+                self._phashes = phashes
+                
+            
+            self._pending_adds = {}
+            
+        
+    
+    def AddPHashes( self, phash_ids_and_phashes ):
+        
+        with self._lock:
+            
+            for ( phash_id, phash ) in phash_ids_and_phashes:
+                
+                self._pending_deletes.discard( phash_id )
+                
+                self._pending_adds[ phash_id ] = phash
+                
+            
+        
+    
+    def DeletePHashIds( self, phash_ids ):
+        
+        with self._lock:
+            
+            for phash_id in phash_ids:
+                
+                if phash_id in self._pending_adds:
+                    
+                    del self._pending_adds[ phash_id ]
+                    
+                
+                self._pending_deletes.add( phash_id )
+                
+            
+        
+    
+    def GetNumPHashes( self ):
+        
+        with self._lock:
+            
+            self._Consolidate()
+            
+            return len( self._phash_ids )
+            
+        
+    
+    def Search( self, search_phashes, max_hamming_distance ):
+        
+        similar_phash_ids_to_distances = {}
+        
+        for phash_ids_and_distances in self.SearchMany( search_phashes, max_hamming_distance ):
+            
+            for ( phash_id, distance ) in phash_ids_and_distances:
+                
+                if phash_id not in similar_phash_ids_to_distances or distance < similar_phash_ids_to_distances[ phash_id ]:
+                    
+                    similar_phash_ids_to_distances[ phash_id ] = distance
+                    
+                
+            
+        
+        return similar_phash_ids_to_distances
+        
+    
+    def SearchMany( self, search_phashes, max_hamming_distance ):
+        
+        # returns a list, in the same order as search_phashes, of lists of ( phash_id, distance )
+        
+        with self._lock:
+            
+            self._Consolidate()
+            
+            results = [ [] for search_phash in search_phashes ]
+            
+            num_phashes = len( self._phashes )
+            
+            if len( search_phashes ) == 0 or num_phashes == 0:
+                
+                return results
+                
+            
+            queries = ConvertPHashesToUInt64Array( search_phashes )
+            
+            index_block_size = min( num_phashes, self.MAX_BLOCK_CELLS )
+            query_block_size = max( 1, self.MAX_BLOCK_CELLS // index_block_size )
+            
+            for query_start in range( 0, len( queries ), query_block_size ):
+                
+                query_block = queries[ query_start : query_start + query_block_size, numpy.newaxis ]
+                
+                for index_start in range( 0, num_phashes, index_block_size ):
+                    
+                    index_block = self._phashes[ numpy.newaxis, index_start : index_start + index_block_size ]
+                    
+                    distances = PopCount64( numpy.bitwise_xor( query_block, index_block ) )
+                    
+                    ( query_indices, index_indices ) = numpy.nonzero( distances <= max_hamming_distance )
+                    
+                    if len( query_indices ) == 0:
+                        
+                        continue
+                        
+                    
+                    found_distances = distances[ query_indices, index_indices ].tolist()
+                    found_phash_ids = self._phash_ids[ index_indices + index_start ].tolist()
+                    
+                    for ( query_index, phash_id, distance ) in zip( ( query_indices + query_start ).tolist(), found_phash_ids, found_distances ):
+                        
+                        results[ query_index ].append( ( phash_id, distance ) )
+                        
+                    
+                
+            
+            return results
+            
+        
+    
 class RenderedImageCache( object ):
     
     def __init__( self, controller ):
@@ -654,6 +1328,11 @@ class RenderedImageCache( object ):
         return image_renderer
         
     
+    def GetStats( self ):
+        
+        return self._data_cache.GetStats()
+        
+    
     def HasImageRenderer( self, hash ):
         
         key = hash
@@ -711,7 +1390,7 @@ class ThumbnailCache( object ):
         
         try:
             
-            path = self._controller.client_files_manager.GetThumbnailPath( display_media )
+            thumbnail_bytes = self._controller.client_files_manager.GetThumbnailBytes( display_media )
             
         except HydrusExceptions.FileMissingException as e:
             
@@ -727,7 +1406,7 @@ class ThumbnailCache( object ):
         
         try:
             
-            numpy_image = ClientImageHandling.GenerateNumPyImage( path, mime )
+            numpy_image = ClientImageHandling.GenerateNumPyImageFromBytes( thumbnail_bytes, mime )
             
         except Exception as e:
             
@@ -747,7 +1426,9 @@ class ThumbnailCache( object ):
             
             try:
                 
-                numpy_image = ClientImageHandling.GenerateNumPyImage( path, mime )
+                thumbnail_bytes = self._controller.client_files_manager.GetThumbnailBytes( display_media )
+                
+                numpy_image = ClientImageHandling.GenerateNumPyImageFromBytes( thumbnail_bytes, mime )
                 
             except Exception as e:
                 
@@ -1165,6 +1846,11 @@ class ThumbnailCache( object ):
             
         
     
+    def GetStats( self ):
+        
+        return self._data_cache.GetStats()
+        
+    
     def HasThumbnailCached( self, media ):
         
         display_media = media.GetDisplayMedia()
@@ -3,6 +3,7 @@ from . import ClientCaches
 from . import ClientData
 from . import ClientDefaults
 from . import ClientFiles
+from . import ClientManagers
 from . import ClientMedia
 from . import ClientNetworkingBandwidth
 from . import ClientNetworkingContexts
@@ -141,6 +142,13 @@ YAML_DUMP_ID_LOCAL_BOORU = 8
 MIN_CACHED_INTEGER = -99999999
 MAX_CACHED_INTEGER = 99999999
 
+MAX_WILDCARD_TRIGRAMS = 8
+
+HASH_ID_POSTING_LIST_CACHE_SIZE = 64 * 1048576
+
+FILE_SEARCH_RESULT_CACHE_MAX_ENTRIES = 64
+FILE_SEARCH_RESULT_CACHE_SIZE = 32 * 1048576
+
 def CanCacheInteger( num ):
     
     return MIN_CACHED_INTEGER <= num and num <= MAX_CACHED_INTEGER
@@ -231,6 +239,58 @@ def GenerateSpecificMappingsCacheTableNames( file_service_id, tag_service_id ):
     
     return ( cache_files_table_name, cache_current_mappings_table_name, cache_deleted_mappings_table_name, cache_pending_mappings_table_name, ac_cache_table_name )
     
+def GenerateSubtagTrigrams( subtag ):
+    
+    # we pack the three code points into one integer, which keeps the index a lot smaller than text would
+    # casefold has no context rules, so a fragment's trigrams are always a subset of its containing string's
+    
+    subtag = subtag.casefold()
+    
+    return { ( ord( subtag[ i ] ) << 42 ) | ( ord( subtag[ i + 1 ] ) << 21 ) | ord( subtag[ i + 2 ] ) for i in range( len( subtag ) - 2 ) }
+    
+def GenerateSubtagWildcardPredicate( subtag_wildcard ):
+    
+    # returns a predicate on the subtags table and its parameters
+    # the trigram lookup cuts the table down to a small superset of candidates, and LIKE then checks them properly
+    
+    like_param = ConvertWildcardToSQLiteLikeParameter( subtag_wildcard )
+    
+    trigrams = GenerateWildcardTrigrams( subtag_wildcard )
+    
+    if len( trigrams ) == 0:
+        
+        return ( 'subtag LIKE ?', [ like_param ] )
+        
+    
+    trigram_select = ' INTERSECT '.join( ( 'SELECT subtag_id FROM subtag_trigrams WHERE trigram = ?' for trigram in trigrams ) )
+    
+    predicate = '( subtag_id IN ( {} ) AND subtag LIKE ? )'.format( trigram_select )
+    
+    return ( predicate, trigrams + [ like_param ] )
+    
+def GenerateWildcardTrigrams( wildcard ):
+    
+    # everything LIKE treats as a wildcard splits the pattern into literal fragments, and a match has to contain all their trigrams
+    
+    fragments_trigrams = [ sorted( GenerateSubtagTrigrams( fragment ) ) for fragment in re.split( '[*%_]', wildcard ) ]
+    
+    # a handful is plenty to get the candidates down, so we take them round-robin to give every fragment a say
+    
+    trigrams = []
+    
+    for row in itertools.zip_longest( *fragments_trigrams ):
+        
+        for trigram in row:
+            
+            if trigram is not None and trigram not in trigrams:
+                
+                trigrams.append( trigram )
+                
+            
+        
+    
+    return trigrams[ : MAX_WILDCARD_TRIGRAMS ]
+    
 def report_content_speed_to_job_key( job_key, rows_done, total_rows, precise_timestamp, num_rows, row_name ):
     
     it_took = HydrusData.GetNowPrecise() - precise_timestamp
@@ -271,14 +331,85 @@ def report_speed_to_log( precise_timestamp, num_rows, row_name ):
 class DB( HydrusDB.HydrusDB ):
     
     READ_WRITE_ACTIONS = [ 'service_info', 'system_predicates', 'missing_thumbnail_hashes' ]
+    READ_ONLY_ACTIONS = [ 'autocomplete_predicates', 'file_hashes', 'file_query_ids', 'filter_hashes', 'hash_ids_to_hashes', 'in_inbox', 'media_results', 'media_results_from_ids', 'related_tags', 'url_statuses' ]
+    READ_ONLY_CONNECTION_POOL_SIZE = 2
+    MAINTENANCE_ACTIONS = [ 'analyze', 'cull_file_viewing_statistics', 'maintain_similar_files_search_for_potential_duplicates', 'maintain_similar_files_tree', 'process_repository_content', 'process_repository_definitions', 'vacuum' ]
+    COALESCABLE_WRITE_ACTIONS = [ 'content_updates' ]
+    
+    SIMILAR_FILES_SEARCH_BATCH_SIZE = 256
     
     def __init__( self, controller, db_dir, db_name ):
         
         self._initial_messages = []
         
+        # these need to exist before any repair or update work touches the tables they cache
+        
+        self._hash_id_posting_list_cache = ClientCaches.HashIdPostingListCache( HASH_ID_POSTING_LIST_CACHE_SIZE )
+        self._file_search_result_cache = ClientCaches.FileSearchResultCache( FILE_SEARCH_RESULT_CACHE_MAX_ENTRIES, FILE_SEARCH_RESULT_CACHE_SIZE )
+        
         HydrusDB.HydrusDB.__init__( self, controller, db_dir, db_name )
         
     
+    # the id -> definition lookups are filled and emptied as they are read, so each read-only connection keeps its own rather than sharing the main one across threads
+    
+    def _GetHashIdsToHashesCache( self ):
+        
+        if self._InReadOnlyJob():
+            
+            if not hasattr( self._read_only_local, 'hash_ids_to_hashes_cache' ):
+                
+                self._read_only_local.hash_ids_to_hashes_cache = {}
+                
+            
+            return self._read_only_local.hash_ids_to_hashes_cache
+            
+        
+        return self._main_hash_ids_to_hashes_cache
+        
+    
+    def _SetHashIdsToHashesCache( self, hash_ids_to_hashes_cache ):
+        
+        if self._InReadOnlyJob():
+            
+            self._read_only_local.hash_ids_to_hashes_cache = hash_ids_to_hashes_cache
+            
+        else:
+            
+            self._main_hash_ids_to_hashes_cache = hash_ids_to_hashes_cache
+            
+        
+    
+    _hash_ids_to_hashes_cache = property( _GetHashIdsToHashesCache, _SetHashIdsToHashesCache )
+    
+    def _GetTagIdsToTagsCache( self ):
+        
+        if self._InReadOnlyJob():
+            
+            if not hasattr( self._read_only_local, 'tag_ids_to_tags_cache' ):
+                
+                self._read_only_local.tag_ids_to_tags_cache = {}
+                
+            
+            return self._read_only_local.tag_ids_to_tags_cache
+            
+        
+        return self._main_tag_ids_to_tags_cache
+        
+    
+    def _SetTagIdsToTagsCache( self, tag_ids_to_tags_cache ):
+        
+        if self._InReadOnlyJob():
+            
+            self._read_only_local.tag_ids_to_tags_cache = tag_ids_to_tags_cache
+            
+        else:
+            
+            self._main_tag_ids_to_tags_cache = tag_ids_to_tags_cache
+            
+        
+    
+    _tag_ids_to_tags_cache = property( _GetTagIdsToTagsCache, _SetTagIdsToTagsCache )
+    
     def _AddFilesInfo( self, rows, overwrite = False ):
         
         if overwrite:
@@ -293,6 +424,17 @@ class DB( HydrusDB.HydrusDB ):
         # hash_id, size, mime, width, height, duration, num_frames, has_audio, num_words
         self._c.executemany( insert_phrase + ' files_info VALUES ( ?, ?, ?, ?, ?, ?, ?, ?, ? );', rows )
         
+        if overwrite:
+            
+            self._file_search_result_cache.InvalidateDependency( 'files_info' )
+            
+        elif self._GetRowCount() > 0:
+            
+            # all known files searches files_info itself, so new rows change its results. other file domains only change when the file is added to them, which invalidates that service
+            
+            self._file_search_result_cache.InvalidateDependency( ( 'service', self._combined_file_service_id ) )
+            
+        
     
     def _AddFiles( self, service_id, rows ):
         
@@ -310,6 +452,9 @@ class DB( HydrusDB.HydrusDB ):
             
             self._c.executemany( 'INSERT OR IGNORE INTO current_files VALUES ( ?, ?, ? );', ( ( service_id, hash_id, timestamp ) for ( hash_id, timestamp ) in valid_rows ) )
             
+            self._hash_id_posting_list_cache.InvalidateService( service_id )
+            self._file_search_result_cache.InvalidateDependency( ( 'service', service_id ) )
+            
             self._c.executemany( 'DELETE FROM file_transfers WHERE service_id = ? AND hash_id = ?;', ( ( service_id, hash_id ) for hash_id in valid_hash_ids ) )
             
             info = list( self._ExecuteManySelectSingleParam( 'SELECT hash_id, size, mime FROM files_info WHERE hash_id = ?;', valid_hash_ids ) )
@@ -374,6 +519,11 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _AddSubtagTrigrams( self, subtag_ids_and_subtags ):
+        
+        self._c.executemany( 'INSERT OR IGNORE INTO subtag_trigrams ( trigram, subtag_id ) VALUES ( ?, ? );', ( ( trigram, subtag_id ) for ( subtag_id, subtag ) in subtag_ids_and_subtags for trigram in GenerateSubtagTrigrams( subtag ) ) )
+        
+    
     def _AddService( self, service_key, service_type, name, dictionary ):
         
         result = self._c.execute( 'SELECT 1 FROM services WHERE name = ?;', ( name, ) ).fetchone()
@@ -458,6 +608,8 @@ class DB( HydrusDB.HydrusDB ):
         
         self._c.executemany( 'INSERT OR IGNORE INTO tag_siblings ( service_id, bad_tag_id, good_tag_id, status ) VALUES ( ?, ?, ?, ? );', ( ( service_id, bad_tag_id, good_tag_id, HC.CONTENT_STATUS_CURRENT ) for ( bad_tag_id, good_tag_id ) in pairs ) )
         
+        self._CacheTagSiblingsUpdate( service_id, { bad_tag_id for ( bad_tag_id, good_tag_id ) in pairs } )
+        
         tag_ids = set()
         
         for ( bad_tag_id, good_tag_id ) in pairs:
@@ -580,6 +732,9 @@ class DB( HydrusDB.HydrusDB ):
             
             self._inbox_hash_ids.difference_update( valid_hash_ids )
             
+            self._hash_id_posting_list_cache.Invalidate( ( 'inbox', ) )
+            self._file_search_result_cache.InvalidateDependency( 'inbox' )
+            
         
     
     def _AssociateRepositoryUpdateHashes( self, service_key, metadata_slice ):
@@ -1242,6 +1397,221 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _CacheTagSiblingsClear( self ):
+        
+        self._tag_service_ids_to_sibling_lookups = None
+        self._tag_service_ids_to_sibling_pair_lookups = None
+        self._tag_sibling_tags_to_tag_ids = None
+        
+        self._file_search_result_cache.InvalidateDependency( 'siblings' )
+        
+    
+    def _CacheTagSiblingsGenerateLookups( self ):
+        
+        # this mirrors the tag siblings manager, but we also keep id lookups of the results, so we can hand out display tags straight from the db
+        # the collapse breaks conflicts by sort order, so the pair lookups have to be on the tag text to match the siblings manager
+        
+        service_ids_to_pair_ids = HydrusData.BuildKeyToSetDict( ( ( service_id, ( bad_tag_id, good_tag_id ) ) for ( service_id, bad_tag_id, good_tag_id ) in self._c.execute( 'SELECT service_id, bad_tag_id, good_tag_id FROM tag_siblings WHERE status = ? UNION SELECT service_id, bad_tag_id, good_tag_id FROM tag_sibling_petitions WHERE status = ?;', ( HC.CONTENT_STATUS_CURRENT, HC.CONTENT_STATUS_PENDING ) ) ) )
+        
+        all_tag_ids = set()
+        
+        for pair_ids in service_ids_to_pair_ids.values():
+            
+            for ( bad_tag_id, good_tag_id ) in pair_ids:
+                
+                all_tag_ids.add( bad_tag_id )
+                all_tag_ids.add( good_tag_id )
+                
+            
+        
+        self._PopulateTagIdsToTagsCache( all_tag_ids )
+        
+        tags_to_tag_ids = { self._tag_ids_to_tags_cache[ tag_id ] : tag_id for tag_id in all_tag_ids }
+        
+        local_tag_service_ids = set( self._GetServiceIds( ( HC.LOCAL_TAG, ) ) )
+        
+        local_tags_pairs = set()
+        tag_repo_pairs = set()
+        
+        tag_service_ids_to_sibling_pair_lookups = {}
+        
+        for ( service_id, pair_ids ) in service_ids_to_pair_ids.items():
+            
+            pairs = { ( self._tag_ids_to_tags_cache[ bad_tag_id ], self._tag_ids_to_tags_cache[ good_tag_id ] ) for ( bad_tag_id, good_tag_id ) in pair_ids }
+            
+            if service_id in local_tag_service_ids:
+                
+                local_tags_pairs.update( pairs )
+                
+            else:
+                
+                tag_repo_pairs.update( pairs )
+                
+            
+            tag_service_ids_to_sibling_pair_lookups[ service_id ] = ClientManagers.TagSiblingsLookup( [ pairs ] )
+            
+        
+        tag_service_ids_to_sibling_pair_lookups[ self._combined_tag_service_id ] = ClientManagers.TagSiblingsLookup( [ local_tags_pairs, tag_repo_pairs ] )
+        
+        tag_service_ids_to_sibling_lookups = {}
+        
+        for ( service_id, pair_lookup ) in tag_service_ids_to_sibling_pair_lookups.items():
+            
+            tag_service_ids_to_sibling_lookups[ service_id ] = { tags_to_tag_ids[ bad ] : tags_to_tag_ids[ good ] for ( bad, good ) in pair_lookup.GetSiblings().items() }
+            
+        
+        return ( tag_service_ids_to_sibling_lookups, tag_service_ids_to_sibling_pair_lookups, tags_to_tag_ids )
+        
+    
+    def _CacheTagSiblingsGetLookup( self, tag_service_id ):
+        
+        tag_service_ids_to_sibling_lookups = self._tag_service_ids_to_sibling_lookups
+        
+        if tag_service_ids_to_sibling_lookups is None:
+            
+            if self._InReadOnlyJob():
+                
+                # we are called once per service, so a read-only job builds this once and keeps it for the rest of its snapshot
+                # if that snapshot is still current, the main cache can have it too
+                
+                job_cache = self._read_only_local.job_cache
+                
+                if 'tag_sibling_lookups' not in job_cache:
+                    
+                    job_cache[ 'tag_sibling_lookups' ] = self._CacheTagSiblingsGenerateLookups()
+                    
+                    self._FillCache( self._CacheTagSiblingsSetLookups, *job_cache[ 'tag_sibling_lookups' ] )
+                    
+                
+                ( tag_service_ids_to_sibling_lookups, tag_service_ids_to_sibling_pair_lookups, tags_to_tag_ids ) = job_cache[ 'tag_sibling_lookups' ]
+                
+            else:
+                
+                ( tag_service_ids_to_sibling_lookups, tag_service_ids_to_sibling_pair_lookups, tags_to_tag_ids ) = self._CacheTagSiblingsGenerateLookups()
+                
+                self._CacheTagSiblingsSetLookups( tag_service_ids_to_sibling_lookups, tag_service_ids_to_sibling_pair_lookups, tags_to_tag_ids )
+                
+            
+        
+        if self._controller.new_options.GetBoolean( 'apply_all_siblings_to_all_services' ):
+            
+            tag_service_id = self._combined_tag_service_id
+            
+        
+        if tag_service_id in tag_service_ids_to_sibling_lookups:
+            
+            return tag_service_ids_to_sibling_lookups[ tag_service_id ]
+            
+        else:
+            
+            return {}
+            
+        
+    
+    def _CacheTagSiblingsSetLookups( self, tag_service_ids_to_sibling_lookups, tag_service_ids_to_sibling_pair_lookups, tags_to_tag_ids ):
+        
+        self._tag_service_ids_to_sibling_lookups = tag_service_ids_to_sibling_lookups
+        self._tag_service_ids_to_sibling_pair_lookups = tag_service_ids_to_sibling_pair_lookups
+        self._tag_sibling_tags_to_tag_ids = tags_to_tag_ids
+        
+    
+    def _CacheTagSiblingsUpdate( self, service_id, bad_tag_ids ):
+        
+        # the sibling rows for these bad tags have changed, so we recollapse just the tags they connect to, like the tag siblings manager does
+        
+        self._file_search_result_cache.InvalidateDependency( 'siblings' )
+        
+        if self._tag_service_ids_to_sibling_lookups is None:
+            
+            return
+            
+        
+        pair_ids = set()
+        
+        for bad_tag_id in bad_tag_ids:
+            
+            pair_ids.update( self._c.execute( 'SELECT bad_tag_id, good_tag_id FROM tag_siblings WHERE service_id = ? AND bad_tag_id = ? AND status = ? UNION SELECT bad_tag_id, good_tag_id FROM tag_sibling_petitions WHERE service_id = ? AND bad_tag_id = ? AND status = ?;', ( service_id, bad_tag_id, HC.CONTENT_STATUS_CURRENT, service_id, bad_tag_id, HC.CONTENT_STATUS_PENDING ) ) )
+            
+        
+        all_tag_ids = set( bad_tag_ids ).union( itertools.chain.from_iterable( pair_ids ) )
+        
+        self._PopulateTagIdsToTagsCache( all_tag_ids )
+        
+        # every tag a lookup can change has been in a pair we loaded, so this always has what we need
+        
+        tags_to_tag_ids = self._tag_sibling_tags_to_tag_ids
+        
+        tags_to_tag_ids.update( ( ( self._tag_ids_to_tags_cache[ tag_id ], tag_id ) for tag_id in all_tag_ids ) )
+        
+        bad_tags = { self._tag_ids_to_tags_cache[ bad_tag_id ] for bad_tag_id in bad_tag_ids }
+        pairs = { ( self._tag_ids_to_tags_cache[ bad_tag_id ], self._tag_ids_to_tags_cache[ good_tag_id ] ) for ( bad_tag_id, good_tag_id ) in pair_ids }
+        
+        pair_lookups = self._tag_service_ids_to_sibling_pair_lookups
+        
+        if service_id not in pair_lookups:
+            
+            pair_lookups[ service_id ] = ClientManagers.TagSiblingsLookup( [ set() ] )
+            
+        
+        service_ids_to_changed_tags = {}
+        
+        service_ids_to_changed_tags[ service_id ] = pair_lookups[ service_id ].SetPairs( bad_tags, pairs )
+        
+        # local tags take precedence in the combined service
+        
+        local_tag_service_ids = set( self._GetServiceIds( ( HC.LOCAL_TAG, ) ) )
+        
+        service_is_local = service_id in local_tag_service_ids
+        
+        group_index = 0 if service_is_local else 1
+        
+        group_pairs = set()
+        
+        for ( lookup_service_id, pair_lookup ) in pair_lookups.items():
+            
+            if lookup_service_id != self._combined_tag_service_id and ( lookup_service_id in local_tag_service_ids ) == service_is_local:
+                
+                group_pairs.update( pair_lookup.GetPairs( bad_tags ) )
+                
+            
+        
+        service_ids_to_changed_tags[ self._combined_tag_service_id ] = pair_lookups[ self._combined_tag_service_id ].SetPairs( bad_tags, group_pairs, group_index = group_index )
+        
+        # read-only jobs may be using the id lookups right now, so we swap in edited copies rather than change them under them
+        
+        tag_service_ids_to_sibling_lookups = dict( self._tag_service_ids_to_sibling_lookups )
+        
+        for ( lookup_service_id, changed_tags ) in service_ids_to_changed_tags.items():
+            
+            if len( changed_tags ) == 0:
+                
+                continue
+                
+            
+            siblings = pair_lookups[ lookup_service_id ].GetSiblings()
+            
+            sibling_lookup = dict( tag_service_ids_to_sibling_lookups.get( lookup_service_id, {} ) )
+            
+            for tag in changed_tags:
+                
+                tag_id = tags_to_tag_ids[ tag ]
+                
+                if tag in siblings:
+                    
+                    sibling_lookup[ tag_id ] = tags_to_tag_ids[ siblings[ tag ] ]
+                    
+                elif tag_id in sibling_lookup:
+                    
+                    del sibling_lookup[ tag_id ]
+                    
+                
+            
+            tag_service_ids_to_sibling_lookups[ lookup_service_id ] = sibling_lookup
+            
+        
+        self._tag_service_ids_to_sibling_lookups = tag_service_ids_to_sibling_lookups
+        
+    
     def _CheckDBIntegrity( self ):
         
         prefix_string = 'checking db integrity: '
@@ -1564,6 +1934,8 @@ class DB( HydrusDB.HydrusDB ):
         
         self._c.execute( 'CREATE VIRTUAL TABLE IF NOT EXISTS external_master.subtags_fts4 USING fts4( subtag );' )
         
+        self._c.execute( 'CREATE TABLE IF NOT EXISTS external_master.subtag_trigrams ( trigram INTEGER, subtag_id INTEGER, PRIMARY KEY ( trigram, subtag_id ) ) WITHOUT ROWID;' )
+        
         self._c.execute( 'CREATE TABLE IF NOT EXISTS external_master.tags ( tag_id INTEGER PRIMARY KEY, namespace_id INTEGER, subtag_id INTEGER );' )
         self._CreateIndex( 'external_master.tags', [ 'subtag_id', 'namespace_id' ] )
         
@@ -1802,6 +2174,9 @@ class DB( HydrusDB.HydrusDB ):
             
             self._c.executemany( 'DELETE FROM current_files WHERE service_id = ? AND hash_id = ?;', ( ( service_id, hash_id ) for hash_id in existing_hash_ids ) )
             
+            self._hash_id_posting_list_cache.InvalidateService( service_id )
+            self._file_search_result_cache.InvalidateDependency( ( 'service', service_id ) )
+            
             self._c.executemany( 'DELETE FROM file_petitions WHERE service_id = ? AND hash_id = ?;', ( ( service_id, hash_id ) for hash_id in existing_hash_ids ) )
             
             info = list( self._ExecuteManySelectSingleParam( 'SELECT size, mime FROM files_info WHERE hash_id = ?;', existing_hash_ids ) )
@@ -1924,6 +2299,8 @@ class DB( HydrusDB.HydrusDB ):
             self._c.execute( 'DELETE FROM tag_sibling_petitions WHERE service_id = ?;', ( service_id, ) )
             self._c.execute( 'DELETE FROM tag_parent_petitions WHERE service_id = ?;', ( service_id, ) )
             
+            self._CacheTagSiblingsClear()
+            
         elif service.GetServiceType() in ( HC.FILE_REPOSITORY, HC.IPFS ):
             
             self._c.execute( 'DELETE FROM file_transfers WHERE service_id = ?;', ( service_id, ) )
@@ -1982,6 +2359,9 @@ class DB( HydrusDB.HydrusDB ):
         service_key = service.GetServiceKey()
         service_type = service.GetServiceType()
         
+        self._hash_id_posting_list_cache.Clear()
+        self._file_search_result_cache.Clear()
+        
         self._c.execute( 'DELETE FROM services WHERE service_id = ?;', ( service_id, ) )
         
         self._c.execute( 'DELETE FROM remote_thumbnails WHERE service_id = ?;', ( service_id, ) )
@@ -2011,6 +2391,8 @@ class DB( HydrusDB.HydrusDB ):
             
             self._CacheCombinedFilesMappingsDrop( service_id )
             
+            self._CacheTagSiblingsClear()
+            
             file_service_ids = self._GetServiceIds( HC.AUTOCOMPLETE_CACHE_SPECIFIC_FILE_SERVICES )
             
             for file_service_id in file_service_ids:
@@ -2071,6 +2453,8 @@ class DB( HydrusDB.HydrusDB ):
         
         self._c.executemany( 'INSERT OR IGNORE INTO tag_siblings ( service_id, bad_tag_id, good_tag_id, status ) VALUES ( ?, ?, ?, ? );', ( ( service_id, bad_tag_id, good_tag_id, HC.CONTENT_STATUS_DELETED ) for ( bad_tag_id, good_tag_id ) in pairs ) )
         
+        self._CacheTagSiblingsUpdate( service_id, { bad_tag_id for ( bad_tag_id, good_tag_id ) in pairs } )
+        
     
     def _DeleteYAMLDump( self, dump_type, dump_name = None ):
         
@@ -2106,17 +2490,31 @@ class DB( HydrusDB.HydrusDB ):
         self._controller.SafeShowCriticalMessage( 'hydrus db failed', message )
         
     
-    def _DuplicatesAddPotentialDuplicates( self, media_id, potential_duplicate_media_ids_and_distances ):
+    def _DuplicatesAddPotentialDuplicatePairs( self, media_id_pairs_and_distances ):
         
-        inserts = []
+        smaller_larger_pairs_to_distances = {}
         
-        for ( potential_duplicate_media_id, distance ) in potential_duplicate_media_ids_and_distances:
+        for ( media_id, potential_duplicate_media_id, distance ) in media_id_pairs_and_distances:
             
             if potential_duplicate_media_id == media_id: # already duplicates!
                 
                 continue
                 
             
+            smaller_media_id = min( media_id, potential_duplicate_media_id )
+            larger_media_id = max( media_id, potential_duplicate_media_id )
+            
+            pair = ( smaller_media_id, larger_media_id )
+            
+            # both sides of a pair will often turn up in the same batch, so only check them once
+            
+            if pair in smaller_larger_pairs_to_distances:
+                
+                smaller_larger_pairs_to_distances[ pair ] = min( distance, smaller_larger_pairs_to_distances[ pair ] )
+                
+                continue
+                
+            
             if self._DuplicatesMediasAreFalsePositive( media_id, potential_duplicate_media_id ):
                 
                 continue
@@ -2130,18 +2528,20 @@ class DB( HydrusDB.HydrusDB ):
             # if they are alternates with different alt label and index, do not add
             # however this _could_ be folded into areconfirmedalts on the setalt event--any other alt with diff label/index also gets added
             
-            smaller_media_id = min( media_id, potential_duplicate_media_id )
-            larger_media_id = max( media_id, potential_duplicate_media_id )
-            
-            inserts.append( ( smaller_media_id, larger_media_id, distance ) )
+            smaller_larger_pairs_to_distances[ pair ] = distance
             
         
-        if len( inserts ) > 0:
+        if len( smaller_larger_pairs_to_distances ) > 0:
             
-            self._c.executemany( 'INSERT OR IGNORE INTO potential_duplicate_pairs ( smaller_media_id, larger_media_id, distance ) VALUES ( ?, ?, ? );', inserts )
+            self._c.executemany( 'INSERT OR IGNORE INTO potential_duplicate_pairs ( smaller_media_id, larger_media_id, distance ) VALUES ( ?, ?, ? );', ( ( smaller_media_id, larger_media_id, distance ) for ( ( smaller_media_id, larger_media_id ), distance ) in smaller_larger_pairs_to_distances.items() ) )
             
         
     
+    def _DuplicatesAddPotentialDuplicates( self, media_id, potential_duplicate_media_ids_and_distances ):
+        
+        self._DuplicatesAddPotentialDuplicatePairs( ( ( media_id, potential_duplicate_media_id, distance ) for ( potential_duplicate_media_id, distance ) in potential_duplicate_media_ids_and_distances ) )
+        
+    
     def _DuplicatesAlternatesGroupsAreFalsePositive( self, alternates_group_id_a, alternates_group_id_b ):
         
         if alternates_group_id_a == alternates_group_id_b:
@@ -3800,6 +4200,8 @@ class DB( HydrusDB.HydrusDB ):
                     
                     self._c.execute( 'REPLACE INTO file_modified_timestamps ( hash_id, file_modified_timestamp ) VALUES ( ?, ? );', ( hash_id, file_modified_timestamp ) )
                     
+                    self._file_search_result_cache.InvalidateDependency( 'files_info' )
+                    
                     new_file_info.add( ( hash_id, hash ) )
                     
                 elif job_type == ClientFiles.REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_METADATA:
@@ -3982,7 +4384,7 @@ class DB( HydrusDB.HydrusDB ):
         
         service_id = self._GetServiceId( service_key )
         
-        tag_ids_to_tags = { self._GetTagId( tag ) : tag for tag in tags }
+        tag_ids_to_tags = { tag_id : tag for ( tag, tag_id ) in self._GetTagsToTagIds( tags ).items() }
         
         counts = self._CacheCombinedFilesMappingsGetAutocompleteCounts( service_id, list( tag_ids_to_tags.keys() ) )
         
@@ -4142,11 +4544,9 @@ class DB( HydrusDB.HydrusDB ):
                 
                 if ClientSearch.IsComplexWildcard( half_complete_subtag ):
                     
-                    like_param = ConvertWildcardToSQLiteLikeParameter( half_complete_subtag )
-                    
                     t_j = ' NATURAL JOIN subtags'
-                    pred = 'subtag LIKE ?'
-                    param = like_param
+                    
+                    ( pred, params ) = GenerateSubtagWildcardPredicate( half_complete_subtag )
                     
                 else:
                     
@@ -4154,10 +4554,10 @@ class DB( HydrusDB.HydrusDB ):
                     
                     t_j = ', subtags_fts4 ON ( subtag_id = docid )'
                     pred = 'subtag MATCH ?'
-                    param = subtags_fts4_param
+                    params = [ subtags_fts4_param ]
                     
                 
-                return ( t_j, pred, param )
+                return ( t_j, pred, params )
                 
             
             ( namespace, half_complete_subtag ) = HydrusTags.SplitTag( search_text )
@@ -4196,11 +4596,11 @@ class DB( HydrusDB.HydrusDB ):
                 
                 if half_complete_subtag not in ( '*', '' ):
                     
-                    ( t_j, pred, param ) = GetSubTagSearchInfo( half_complete_subtag )
+                    ( t_j, pred, params ) = GetSubTagSearchInfo( half_complete_subtag )
                     
                     table_join += t_j
                     predicates.append( pred )
-                    parameters.append( param )
+                    parameters.extend( params )
                     
                 
                 predicates_phrase = ' AND '.join( predicates )
@@ -4216,11 +4616,11 @@ class DB( HydrusDB.HydrusDB ):
                     return set()
                     
                 
-                ( t_j, pred, param ) = GetSubTagSearchInfo( half_complete_subtag )
+                ( t_j, pred, params ) = GetSubTagSearchInfo( half_complete_subtag )
                 
                 table_join += t_j
                 predicates.append( pred )
-                parameters.append( param )
+                parameters.extend( params )
                 
                 predicates_phrase = ' OR '.join( predicates )
                 
@@ -4587,31 +4987,163 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
-    def _GetFileSystemPredicates( self, service_key, force_system_everything = False ):
-        
-        service_id = self._GetServiceId( service_key )
+    def _GetFileQueryIds( self, file_search_context: ClientSearch.FileSearchContext, job_key = None, apply_implicit_limit = True, sort_by = None, limit_sort_by = None ):
         
-        service = self._GetService( service_id )
+        dependencies = self._GetFileSearchResultDependencies( file_search_context, sort_by, limit_sort_by )
         
-        service_type = service.GetServiceType()
+        if dependencies is None:
+            
+            return self._GetHashIdsFromQuery( file_search_context, job_key = job_key, apply_implicit_limit = apply_implicit_limit, sort_by = sort_by, limit_sort_by = limit_sort_by )
+            
         
-        have_ratings = len( self._GetServiceIds( HC.RATINGS_SERVICES ) ) > 0
+        serialisable_sorts = [ None if sort is None else sort.GetSerialisableTuple() for sort in ( sort_by, limit_sort_by ) ]
         
-        predicates = []
+        key = ( file_search_context.GetCanonicalKey(), apply_implicit_limit, json.dumps( serialisable_sorts ) )
         
-        system_everything_limit = 10000
+        result = self._file_search_result_cache.GetResult( key )
         
-        if service_type in ( HC.COMBINED_FILE, HC.COMBINED_TAG ):
-            
-            predicates.extend( [ ClientSearch.Predicate( predicate_type, None ) for predicate_type in [ ClientSearch.PREDICATE_TYPE_SYSTEM_EVERYTHING, ClientSearch.PREDICATE_TYPE_SYSTEM_NUM_TAGS, ClientSearch.PREDICATE_TYPE_SYSTEM_LIMIT, ClientSearch.PREDICATE_TYPE_SYSTEM_KNOWN_URLS, ClientSearch.PREDICATE_TYPE_SYSTEM_HASH, ClientSearch.PREDICATE_TYPE_SYSTEM_FILE_SERVICE, ClientSearch.PREDICATE_TYPE_SYSTEM_FILE_RELATIONSHIPS ] ] )
+        if result is not None:
             
-        elif service_type in HC.REAL_TAG_SERVICES:
+            return result
             
-            service_info = self._GetServiceInfoSpecific( service_id, service_type, { HC.SERVICE_INFO_NUM_FILES } )
+        
+        if job_key is None:
             
-            num_everything = service_info[ HC.SERVICE_INFO_NUM_FILES ]
+            job_key = ClientThreading.JobKey( cancellable = True )
             
-            if force_system_everything or ( num_everything <= system_everything_limit or self._controller.new_options.GetBoolean( 'always_show_system_everything' ) ):
+        
+        result = self._GetHashIdsFromQuery( file_search_context, job_key = job_key, apply_implicit_limit = apply_implicit_limit, sort_by = sort_by, limit_sort_by = limit_sort_by )
+        
+        # a cancelled search is incomplete, and a result cut down to the limit may be a random sample, so neither is worth giving out again
+        
+        limit = file_search_context.GetSystemPredicates().GetLimit( apply_implicit_limit = apply_implicit_limit )
+        
+        if not job_key.IsCancelled() and ( limit is None or len( result ) < limit ):
+            
+            self._FillCache( self._file_search_result_cache.SetResult, key, result, dependencies )
+            
+        
+        return result
+        
+    
+    def _GetFileSearchResultDependencies( self, file_search_context: ClientSearch.FileSearchContext, sort_by, limit_sort_by ):
+        
+        # what a search's results rest on, so the result cache knows which entries to drop as content changes
+        # None means the results can change without a db write we track (time passing, file views, dupe work), so we do not cache them
+        
+        file_service_id = self._GetServiceId( file_search_context.GetFileServiceKey() )
+        
+        tag_service_key = file_search_context.GetTagSearchContext().service_key
+        
+        if tag_service_key == CC.COMBINED_TAG_SERVICE_KEY:
+            
+            tag_service_ids = self._GetServiceIds( HC.REAL_TAG_SERVICES )
+            
+        else:
+            
+            tag_service_ids = [ self._GetServiceId( tag_service_key ) ]
+            
+        
+        dependencies = { 'files_info', 'siblings', ( 'service', file_service_id ) }
+        
+        dependencies.update( ( ( 'service', tag_service_id ) for tag_service_id in tag_service_ids ) )
+        
+        if file_service_id == self._combined_local_file_service_id:
+            
+            dependencies.add( ( 'service', self._local_update_service_id ) )
+            
+        
+        for sort in ( sort_by, limit_sort_by ):
+            
+            if sort is not None and sort.sort_type in ( ( 'system', CC.SORT_FILES_BY_MEDIA_VIEWS ), ( 'system', CC.SORT_FILES_BY_MEDIA_VIEWTIME ) ):
+                
+                return None
+                
+            
+        
+        uncacheable_predicate_types = { ClientSearch.PREDICATE_TYPE_SYSTEM_SIMILAR_TO, ClientSearch.PREDICATE_TYPE_SYSTEM_FILE_RELATIONSHIPS, ClientSearch.PREDICATE_TYPE_SYSTEM_FILE_RELATIONSHIPS_COUNT, ClientSearch.PREDICATE_TYPE_SYSTEM_FILE_RELATIONSHIPS_KING, ClientSearch.PREDICATE_TYPE_SYSTEM_FILE_VIEWING_STATS, ClientSearch.PREDICATE_TYPE_SYSTEM_KNOWN_URLS }
+        
+        predicates = list( file_search_context.GetPredicates() )
+        
+        while len( predicates ) > 0:
+            
+            predicate = predicates.pop()
+            
+            predicate_type = predicate.GetType()
+            value = predicate.GetValue()
+            
+            if predicate_type in uncacheable_predicate_types:
+                
+                return None
+                
+            elif predicate_type == ClientSearch.PREDICATE_TYPE_OR_CONTAINER:
+                
+                predicates.extend( value )
+                
+            elif predicate_type in ( ClientSearch.PREDICATE_TYPE_SYSTEM_AGE, ClientSearch.PREDICATE_TYPE_SYSTEM_MODIFIED_TIME ):
+                
+                ( operator, age_type, age_value ) = value
+                
+                if age_type == 'delta':
+                    
+                    return None
+                    
+                
+            elif predicate_type in ( ClientSearch.PREDICATE_TYPE_SYSTEM_INBOX, ClientSearch.PREDICATE_TYPE_SYSTEM_ARCHIVE ):
+                
+                dependencies.add( 'inbox' )
+                
+            elif predicate_type in ( ClientSearch.PREDICATE_TYPE_SYSTEM_LOCAL, ClientSearch.PREDICATE_TYPE_SYSTEM_NOT_LOCAL ):
+                
+                dependencies.add( ( 'service', self._combined_local_file_service_id ) )
+                
+            elif predicate_type == ClientSearch.PREDICATE_TYPE_SYSTEM_RATING:
+                
+                ( operator, rating, service_key ) = value
+                
+                dependencies.add( ( 'service', self._GetServiceId( service_key ) ) )
+                
+            elif predicate_type == ClientSearch.PREDICATE_TYPE_SYSTEM_FILE_SERVICE:
+                
+                ( operator, current_or_pending, service_key ) = value
+                
+                if current_or_pending != HC.CONTENT_STATUS_CURRENT:
+                    
+                    return None
+                    
+                
+                dependencies.add( ( 'service', self._GetServiceId( service_key ) ) )
+                
+            
+        
+        return dependencies
+        
+    
+    def _GetFileSystemPredicates( self, service_key, force_system_everything = False ):
+        
+        service_id = self._GetServiceId( service_key )
+        
+        service = self._GetService( service_id )
+        
+        service_type = service.GetServiceType()
+        
+        have_ratings = len( self._GetServiceIds( HC.RATINGS_SERVICES ) ) > 0
+        
+        predicates = []
+        
+        system_everything_limit = 10000
+        
+        if service_type in ( HC.COMBINED_FILE, HC.COMBINED_TAG ):
+            
+            predicates.extend( [ ClientSearch.Predicate( predicate_type, None ) for predicate_type in [ ClientSearch.PREDICATE_TYPE_SYSTEM_EVERYTHING, ClientSearch.PREDICATE_TYPE_SYSTEM_NUM_TAGS, ClientSearch.PREDICATE_TYPE_SYSTEM_LIMIT, ClientSearch.PREDICATE_TYPE_SYSTEM_KNOWN_URLS, ClientSearch.PREDICATE_TYPE_SYSTEM_HASH, ClientSearch.PREDICATE_TYPE_SYSTEM_FILE_SERVICE, ClientSearch.PREDICATE_TYPE_SYSTEM_FILE_RELATIONSHIPS ] ] )
+            
+        elif service_type in HC.REAL_TAG_SERVICES:
+            
+            service_info = self._GetServiceInfoSpecific( service_id, service_type, { HC.SERVICE_INFO_NUM_FILES } )
+            
+            num_everything = service_info[ HC.SERVICE_INFO_NUM_FILES ]
+            
+            if force_system_everything or ( num_everything <= system_everything_limit or self._controller.new_options.GetBoolean( 'always_show_system_everything' ) ):
                 
                 predicates.append( ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_EVERYTHING, min_current_count = num_everything ) )
                 
@@ -4771,7 +5303,30 @@ class DB( HydrusDB.HydrusDB ):
         
         hash_ids_to_raw_tag_data = HydrusData.BuildKeyToListDict( tag_data )
         
-        self._PopulateTagIdsToTagsCache( seen_tag_ids )
+        # we collapse siblings here once per tag for the whole batch, rather than have every tags manager do it for itself
+        
+        tag_service_ids_to_tag_ids_to_display_tag_ids = {}
+        
+        for tag_service_id in tag_service_ids:
+            
+            sibling_lookup = self._CacheTagSiblingsGetLookup( tag_service_id )
+            
+            tag_service_ids_to_tag_ids_to_display_tag_ids[ tag_service_id ] = { tag_id : sibling_lookup[ tag_id ] if tag_id in sibling_lookup else tag_id for tag_id in seen_tag_ids }
+            
+        
+        display_tag_ids = set( itertools.chain.from_iterable( ( tag_ids_to_display_tag_ids.values() for tag_ids_to_display_tag_ids in tag_service_ids_to_tag_ids_to_display_tag_ids.values() ) ) )
+        
+        self._PopulateTagIdsToTagsCache( seen_tag_ids.union( display_tag_ids ) )
+        
+        # the tags managers store compact arrays of client-side tag ids, so we map our tag ids to those just once for the whole batch
+        
+        all_tag_ids = list( seen_tag_ids.union( display_tag_ids ) )
+        
+        client_tag_ids = ClientTags.tag_id_table.GetTagIds( [ self._tag_ids_to_tags_cache[ tag_id ] for tag_id in all_tag_ids ] )
+        
+        tag_ids_to_client_tag_ids = dict( zip( all_tag_ids, client_tag_ids ) )
+        
+        tag_service_ids_to_tag_ids_to_display_client_tag_ids = { tag_service_id : { tag_id : tag_ids_to_client_tag_ids[ display_tag_id ] for ( tag_id, display_tag_id ) in tag_ids_to_display_tag_ids.items() } for ( tag_service_id, tag_ids_to_display_tag_ids ) in tag_service_ids_to_tag_ids_to_display_tag_ids.items() }
         
         service_ids_to_service_keys = { service_id : service_key for ( service_id, service_key ) in self._c.execute( 'SELECT service_id, service_key FROM services;' ) }
         
@@ -4779,17 +5334,19 @@ class DB( HydrusDB.HydrusDB ):
         
         for hash_id in hash_ids:
             
-            # service_id, status, tag_id
-            raw_tag_data = hash_ids_to_raw_tag_data[ hash_id ]
+            service_keys_to_statuses_to_client_tag_ids = collections.defaultdict( HydrusData.default_dict_set )
+            service_keys_to_statuses_to_display_client_tag_ids = collections.defaultdict( HydrusData.default_dict_set )
             
-            # service_id -> ( status, tag )
-            service_ids_to_tag_data = HydrusData.BuildKeyToListDict( ( ( tag_service_id, ( status, self._tag_ids_to_tags_cache[ tag_id ] ) ) for ( tag_service_id, status, tag_id ) in raw_tag_data ) )
-            
-            service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
-            
-            service_keys_to_statuses_to_tags.update( { service_ids_to_service_keys[ service_id ] : HydrusData.BuildKeyToSetDict( tag_data ) for ( service_id, tag_data ) in list(service_ids_to_tag_data.items()) } )
+            # service_id, status, tag_id
+            for ( tag_service_id, status, tag_id ) in hash_ids_to_raw_tag_data[ hash_id ]:
+                
+                service_key = service_ids_to_service_keys[ tag_service_id ]
+                
+                service_keys_to_statuses_to_client_tag_ids[ service_key ][ status ].add( tag_ids_to_client_tag_ids[ tag_id ] )
+                service_keys_to_statuses_to_display_client_tag_ids[ service_key ][ status ].add( tag_service_ids_to_tag_ids_to_display_client_tag_ids[ tag_service_id ][ tag_id ] )
+                
             
-            tags_manager = ClientMedia.TagsManager( service_keys_to_statuses_to_tags )
+            tags_manager = ClientMedia.TagsManager.FromTagIds( service_keys_to_statuses_to_client_tag_ids, service_keys_to_statuses_to_display_client_tag_ids )
             
             hash_ids_to_tag_managers[ hash_id ] = tags_manager
             
@@ -4811,8 +5368,29 @@ class DB( HydrusDB.HydrusDB ):
         return [ self._hash_ids_to_hashes_cache[ hash_id ] for hash_id in hash_ids ]
         
     
+    def _GetHashesToHashIds( self, hashes ):
+        
+        hashes = { hash for hash in hashes if hash is not None }
+        
+        ( hashes_to_hash_ids, new_hashes ) = self._GetMasterDefinitionsToIds( hashes, self._hashes_to_hash_ids_cache, 'hashes', 'hash', 'BLOB_BYTES', 'hash_id', row_converter = sqlite3.Binary )
+        
+        return hashes_to_hash_ids
+        
+    
     def _GetHashId( self, hash ):
         
+        use_cache = not self._InReadOnlyJob()
+        
+        if use_cache:
+            
+            ( hashes_to_hash_ids, missing_hashes ) = self._hashes_to_hash_ids_cache.GetIds( ( hash, ) )
+            
+            if hash in hashes_to_hash_ids:
+                
+                return hashes_to_hash_ids[ hash ]
+                
+            
+        
         result = self._c.execute( 'SELECT hash_id FROM hashes WHERE hash = ?;', ( sqlite3.Binary( hash ), ) ).fetchone()
         
         if result is None:
@@ -4826,48 +5404,17 @@ class DB( HydrusDB.HydrusDB ):
             ( hash_id, ) = result
             
         
+        if use_cache:
+            
+            self._hashes_to_hash_ids_cache.AddIds( { hash : hash_id } )
+            
+        
         return hash_id
         
     
     def _GetHashIds( self, hashes ):
         
-        hash_ids = set()
-        hashes_not_in_db = set()
-        
-        for hash in hashes:
-            
-            if hash is None:
-                
-                continue
-                
-            
-            result = self._c.execute( 'SELECT hash_id FROM hashes WHERE hash = ?;', ( sqlite3.Binary( hash ), ) ).fetchone()
-            
-            if result is None:
-                
-                hashes_not_in_db.add( hash )
-                
-            else:
-                
-                ( hash_id, ) = result
-                
-                hash_ids.add( hash_id )
-                
-            
-        
-        if len( hashes_not_in_db ) > 0:
-            
-            self._c.executemany( 'INSERT INTO hashes ( hash ) VALUES ( ? );', ( ( sqlite3.Binary( hash ), ) for hash in hashes_not_in_db ) )
-            
-            for hash in hashes_not_in_db:
-                
-                ( hash_id, ) = self._c.execute( 'SELECT hash_id FROM hashes WHERE hash = ?;', ( sqlite3.Binary( hash ), ) ).fetchone()
-                
-                hash_ids.add( hash_id )
-                
-            
-        
-        return hash_ids
+        return set( self._GetHashesToHashIds( hashes ).values() )
         
     
     def _GetHashIdsFromFileViewingStatistics( self, view_type, viewing_locations, operator, viewing_value ):
@@ -5279,27 +5826,73 @@ class DB( HydrusDB.HydrusDB ):
         
         #
         
-        if 'hash' in simple_preds:
+        def get_rating_predicate_and_range( operator, value, rating_service_key ):
             
-            specific_hash_ids = set()
+            service = HG.client_controller.services_manager.GetService( rating_service_key )
             
-            ( search_hashes, search_hash_type ) = simple_preds[ 'hash' ]
-            
-            if search_hash_type == 'sha256':
+            if service.GetServiceType() == HC.LOCAL_RATING_LIKE:
                 
-                matching_sha256_hashes = [ search_hash for search_hash in search_hashes if self._HashExists( search_hash ) ]
+                half_a_star_value = 0.5
                 
             else:
                 
-                matching_sha256_hashes = self._GetFileHashes( search_hashes, search_hash_type, 'sha256' )
+                num_stars = service.GetNumStars()
+                
+                if service.AllowZero():
+                    
+                    num_stars += 1
+                    
+                
+                half_a_star_value = 1.0 / ( ( num_stars - 1 ) * 2 )
                 
             
-            specific_hash_ids = self._GetHashIds( matching_sha256_hashes )
+            if isinstance( value, str ):
+                
+                value = float( value )
+                
+            
+            # floats are a pain! as is storing rating as 0.0-1.0 and then allowing number of stars to change!
+            
+            if operator == '\u2248':
+                
+                ( min_rating, max_rating ) = ( ( value - half_a_star_value ) * 0.8, ( value + half_a_star_value ) * 1.2 )
+                
+                predicate = str( min_rating ) + ' < rating AND rating < ' + str( max_rating )
+                
+            elif operator == '<':
+                
+                ( min_rating, max_rating ) = ( None, value - half_a_star_value )
+                
+                predicate = 'rating <= ' + str( max_rating )
+                
+            elif operator == '>':
+                
+                ( min_rating, max_rating ) = ( value + half_a_star_value, None )
+                
+                predicate = 'rating > ' + str( min_rating )
+                
+            elif operator == '=':
+                
+                ( min_rating, max_rating ) = ( value - half_a_star_value, value + half_a_star_value )
+                
+                predicate = str( min_rating ) + ' < rating AND rating <= ' + str( max_rating )
+                
             
-            query_hash_ids = intersection_update_qhi( query_hash_ids, specific_hash_ids )
+            return ( predicate, min_rating, max_rating )
             
         
-        #
+        # now the predicates that can populate query_hash_ids
+        # rather than doing them in a fixed order, we guess how many files each will match and do the most selective first
+        # the steps that can be restricted to a hash_ids table then only have to look at the survivors
+        
+        search_steps = []
+        
+        if 'hash' in simple_preds:
+            
+            ( search_hashes, search_hash_type ) = simple_preds[ 'hash' ]
+            
+            search_steps.append( ( len( search_hashes ), 'hash', ( search_hashes, search_hash_type ) ) )
+            
         
         modified_timestamp_predicates = []
         
@@ -5308,39 +5901,18 @@ class DB( HydrusDB.HydrusDB ):
         
         if len( modified_timestamp_predicates ) > 0:
             
-            pred_string = ' AND '.join( modified_timestamp_predicates )
+            estimate = self._GetRowCountEstimateForRange( 'file_modified_timestamps', 'file_modified_timestamp', simple_preds.get( 'min_modified_timestamp', None ), simple_preds.get( 'max_modified_timestamp', None ) )
             
-            modified_timestamp_hash_ids = self._STS( self._c.execute( 'SELECT hash_id FROM file_modified_timestamps WHERE {};'.format( pred_string ) ) )
+            search_steps.append( ( estimate, 'modified_timestamp', ' AND '.join( modified_timestamp_predicates ) ) )
             
-            query_hash_ids = intersection_update_qhi( query_hash_ids, modified_timestamp_hash_ids )
-            
-        
-        #
         
         if system_predicates.HasSimilarTo():
             
-            ( similar_to_hashes, max_hamming ) = system_predicates.GetSimilarTo()
-            
-            all_similar_hash_ids = set()
-            
-            for similar_to_hash in similar_to_hashes:
-                
-                hash_id = self._GetHashId( similar_to_hash )
-                
-                similar_hash_ids_and_distances = self._PHashesSearch( hash_id, max_hamming )
-                
-                similar_hash_ids = [ similar_hash_id for ( similar_hash_id, distance ) in similar_hash_ids_and_distances ]
-                
-                all_similar_hash_ids.update( similar_hash_ids )
-                
-            
-            query_hash_ids = intersection_update_qhi( query_hash_ids, all_similar_hash_ids )
+            search_steps.append( ( None, 'similar_to', system_predicates.GetSimilarTo() ) )
             
         
         for ( operator, value, rating_service_key ) in system_predicates.GetRatingsPredicates():
             
-            service_id = self._GetServiceId( rating_service_key )
-            
             if value == 'not rated':
                 
                 continue
@@ -5348,65 +5920,23 @@ class DB( HydrusDB.HydrusDB ):
             
             if value == 'rated':
                 
-                rating_hash_ids = self._STI( self._c.execute( 'SELECT hash_id FROM local_ratings WHERE service_id = ?;', ( service_id, ) ) )
-                
-                query_hash_ids = intersection_update_qhi( query_hash_ids, rating_hash_ids )
+                ( min_rating, max_rating ) = ( None, None )
                 
             else:
                 
-                service = HG.client_controller.services_manager.GetService( rating_service_key )
-                
-                if service.GetServiceType() == HC.LOCAL_RATING_LIKE:
-                    
-                    half_a_star_value = 0.5
-                    
-                else:
-                    
-                    num_stars = service.GetNumStars()
-                    
-                    if service.AllowZero():
-                        
-                        num_stars += 1
-                        
-                    
-                    half_a_star_value = 1.0 / ( ( num_stars - 1 ) * 2 )
-                    
-                
-                if isinstance( value, str ):
-                    
-                    value = float( value )
-                    
-                
-                # floats are a pain! as is storing rating as 0.0-1.0 and then allowing number of stars to change!
-                
-                if operator == '\u2248':
-                    
-                    predicate = str( ( value - half_a_star_value ) * 0.8 ) + ' < rating AND rating < ' + str( ( value + half_a_star_value ) * 1.2 )
-                    
-                elif operator == '<':
-                    
-                    predicate = 'rating <= ' + str( value - half_a_star_value )
-                    
-                elif operator == '>':
-                    
-                    predicate = 'rating > ' + str( value + half_a_star_value )
-                    
-                elif operator == '=':
-                    
-                    predicate = str( value - half_a_star_value ) + ' < rating AND rating <= ' + str( value + half_a_star_value )
-                    
-                
-                rating_hash_ids = self._STI( self._c.execute( 'SELECT hash_id FROM local_ratings WHERE service_id = ? AND ' + predicate + ';', ( service_id, ) ) )
-                
-                query_hash_ids = intersection_update_qhi( query_hash_ids, rating_hash_ids )
+                ( predicate, min_rating, max_rating ) = get_rating_predicate_and_range( operator, value, rating_service_key )
                 
             
+            estimate = self._GetRowCountEstimateForRange( 'local_ratings', 'rating', min_rating, max_rating )
+            
+            search_steps.append( ( estimate, 'rating', ( operator, value, rating_service_key ) ) )
+            
         
         is_inbox = system_predicates.MustBeInbox()
         
         if is_inbox:
             
-            query_hash_ids = intersection_update_qhi( query_hash_ids, self._inbox_hash_ids, force_create_new_set = True )
+            search_steps.append( ( len( self._inbox_hash_ids ), 'inbox', None ) )
             
         
         for ( operator, num_relationships, dupe_type ) in system_predicates.GetDuplicateRelationshipCountPredicates():
@@ -5424,11 +5954,7 @@ class DB( HydrusDB.HydrusDB ):
                 
             else:
                 
-                dupe_hash_ids = self._DuplicatesGetHashIdsFromDuplicateCountPredicate( file_service_key, operator, num_relationships, dupe_type )
-                
-                query_hash_ids = intersection_update_qhi( query_hash_ids, dupe_hash_ids )
-                
-                have_cross_referenced_file_service = True
+                search_steps.append( ( None, 'duplicate_count', ( operator, num_relationships, dupe_type ) ) )
                 
             
         
@@ -5447,94 +5973,200 @@ class DB( HydrusDB.HydrusDB ):
                 
             else:
                 
-                viewing_hash_ids = self._GetHashIdsFromFileViewingStatistics( view_type, viewing_locations, operator, viewing_value )
-                
-                query_hash_ids = intersection_update_qhi( query_hash_ids, viewing_hash_ids )
+                search_steps.append( ( None, 'file_viewing_stats', ( view_type, viewing_locations, operator, viewing_value ) ) )
                 
             
         
-        # first tags
+        for tag in tags_to_include:
+            
+            estimate = self._GetHashIdsFromTagCountEstimate( file_service_key, tag_service_key, tag, include_current_tags, include_pending_tags )
+            
+            search_steps.append( ( estimate, 'tag', tag ) )
+            
+        
+        for namespace in namespaces_to_include:
+            
+            search_steps.append( ( None, 'namespace', namespace ) )
+            
         
-        if there_are_tags_to_search:
+        for wildcard in wildcards_to_include:
+            
+            search_steps.append( ( None, 'wildcard', wildcard ) )
             
-            def sort_longest_first_key( s ):
+        
+        restrictable_step_types = { 'modified_timestamp', 'rating', 'tag', 'namespace', 'wildcard' }
+        cross_referencing_step_types = { 'duplicate_count', 'tag', 'namespace', 'wildcard' }
+        
+        def search_step_sort_key( search_step ):
+            
+            ( estimate, step_type, step_value ) = search_step
+            
+            # unknown estimates go last, and of equals, the steps that cannot be restricted go first so the ones that can get a smaller domain
+            
+            can_restrict = step_type in restrictable_step_types
+            
+            if estimate is None:
                 
-                return -len( s )
+                return ( 1, 0, can_restrict )
+                
+            else:
+                
+                return ( 0, estimate, can_restrict )
                 
             
-            tags_to_include = list( tags_to_include )
-            
-            tags_to_include.sort( key = sort_longest_first_key )
+        
+        search_steps.sort( key = search_step_sort_key )
+        
+        def get_search_step_hash_ids( step_type, step_value, hash_ids_table_name = None ):
             
-            for tag in tags_to_include:
+            if step_type == 'hash':
                 
-                if query_hash_ids is None:
-                    
-                    tag_query_hash_ids = self._GetHashIdsFromTag( file_service_key, tag_service_key, tag, include_current_tags, include_pending_tags )
-                    
-                elif is_inbox and len( query_hash_ids ) == len( self._inbox_hash_ids ):
+                ( search_hashes, search_hash_type ) = step_value
+                
+                if search_hash_type == 'sha256':
                     
-                    tag_query_hash_ids = self._GetHashIdsFromTag( file_service_key, tag_service_key, tag, include_current_tags, include_pending_tags, hash_ids_table_name = 'file_inbox' )
+                    matching_sha256_hashes = [ search_hash for search_hash in search_hashes if self._HashExists( search_hash ) ]
                     
                 else:
                     
-                    with HydrusDB.TemporaryIntegerTable( self._c, query_hash_ids, 'hash_id' ) as temp_table_name:
-                        
-                        self._AnalyzeTempTable( temp_table_name )
-                        
-                        tag_query_hash_ids = self._GetHashIdsFromTag( file_service_key, tag_service_key, tag, include_current_tags, include_pending_tags, hash_ids_table_name = temp_table_name )
-                        
+                    matching_sha256_hashes = self._GetFileHashes( search_hashes, search_hash_type, 'sha256' )
                     
                 
-                query_hash_ids = intersection_update_qhi( query_hash_ids, tag_query_hash_ids )
+                return self._GetHashIds( matching_sha256_hashes )
                 
-                have_cross_referenced_file_service = True
+            elif step_type == 'modified_timestamp':
+                
+                table = 'file_modified_timestamps'
                 
-                if query_hash_ids == set():
+                if hash_ids_table_name is not None:
                     
-                    return query_hash_ids
+                    table += ' NATURAL JOIN {}'.format( hash_ids_table_name )
                     
                 
-            
-            for namespace in namespaces_to_include:
+                return self._STS( self._c.execute( 'SELECT hash_id FROM {} WHERE {};'.format( table, step_value ) ) )
                 
-                if query_hash_ids is None:
-                    
-                    namespace_query_hash_ids = self._GetHashIdsFromNamespace( file_service_key, tag_search_context, namespace, include_siblings = True )
+            elif step_type == 'similar_to':
+                
+                ( similar_to_hashes, max_hamming ) = step_value
+                
+                all_similar_hash_ids = set()
+                
+                for similar_to_hash in similar_to_hashes:
                     
-                elif is_inbox and len( query_hash_ids ) == len( self._inbox_hash_ids ):
+                    hash_id = self._GetHashId( similar_to_hash )
                     
-                    namespace_query_hash_ids = self._GetHashIdsFromNamespace( file_service_key, tag_search_context, namespace, include_siblings = True, hash_ids_table_name = 'file_inbox' )
+                    similar_hash_ids_and_distances = self._PHashesSearch( hash_id, max_hamming )
                     
-                else:
+                    similar_hash_ids = [ similar_hash_id for ( similar_hash_id, distance ) in similar_hash_ids_and_distances ]
                     
-                    with HydrusDB.TemporaryIntegerTable( self._c, query_hash_ids, 'hash_id' ) as temp_table_name:
-                        
-                        self._AnalyzeTempTable( temp_table_name )
-                        
-                        namespace_query_hash_ids = self._GetHashIdsFromNamespace( file_service_key, tag_search_context, namespace, include_siblings = True, hash_ids_table_name = temp_table_name )
-                        
+                    all_similar_hash_ids.update( similar_hash_ids )
                     
                 
-                query_hash_ids = intersection_update_qhi( query_hash_ids, namespace_query_hash_ids )
+                return all_similar_hash_ids
                 
-                have_cross_referenced_file_service = True
+            elif step_type == 'rating':
+                
+                ( operator, value, rating_service_key ) = step_value
+                
+                service_id = self._GetServiceId( rating_service_key )
                 
-                if query_hash_ids == set():
+                table = 'local_ratings'
+                
+                if hash_ids_table_name is not None:
                     
-                    return query_hash_ids
+                    table += ' NATURAL JOIN {}'.format( hash_ids_table_name )
+                    
+                
+                if value == 'rated':
                     
+                    return self._STS( self._c.execute( 'SELECT hash_id FROM {} WHERE service_id = ?;'.format( table ), ( service_id, ) ) )
+                    
+                
+                ( predicate, min_rating, max_rating ) = get_rating_predicate_and_range( operator, value, rating_service_key )
+                
+                return self._STS( self._c.execute( 'SELECT hash_id FROM {} WHERE service_id = ? AND {};'.format( table, predicate ), ( service_id, ) ) )
+                
+            elif step_type == 'duplicate_count':
+                
+                ( operator, num_relationships, dupe_type ) = step_value
+                
+                return self._DuplicatesGetHashIdsFromDuplicateCountPredicate( file_service_key, operator, num_relationships, dupe_type )
+                
+            elif step_type == 'file_viewing_stats':
+                
+                ( view_type, viewing_locations, operator, viewing_value ) = step_value
+                
+                return self._GetHashIdsFromFileViewingStatistics( view_type, viewing_locations, operator, viewing_value )
+                
+            elif step_type == 'tag':
                 
+                return self._GetHashIdsFromTag( file_service_key, tag_service_key, step_value, include_current_tags, include_pending_tags, hash_ids_table_name = hash_ids_table_name )
+                
+            elif step_type == 'namespace':
+                
+                return self._GetHashIdsFromNamespace( file_service_key, tag_search_context, step_value, include_siblings = True, hash_ids_table_name = hash_ids_table_name )
+                
+            elif step_type == 'wildcard':
+                
+                return self._GetHashIdsFromWildcard( file_service_key, tag_service_key, step_value, include_current_tags, include_pending_tags, hash_ids_table_name = hash_ids_table_name )
+                
+            
+        
+        def get_search_step_posting_list( step_type, step_value ):
             
-            for wildcard in wildcards_to_include:
+            if step_type == 'inbox':
+                
+                return self._GetHashIdsPostingListForInbox()
                 
-                if query_hash_ids is None:
+            elif step_type == 'tag':
+                
+                return self._GetHashIdsPostingListForTag( file_service_key, tag_service_key, step_value, include_current_tags, include_pending_tags )
+                
+            
+            return None
+            
+        
+        done_inbox = False
+        
+        # while we are only and-ing cached posting lists, we stay in numpy and only make a python set once something needs one
+        
+        query_posting_list = None
+        
+        for ( estimate, step_type, step_value ) in search_steps:
+            
+            posting_list = get_search_step_posting_list( step_type, step_value )
+            
+            if posting_list is not None and query_hash_ids is None:
+                
+                if query_posting_list is None:
+                    
+                    query_posting_list = posting_list
+                    
+                else:
                     
-                    wildcard_query_hash_ids = self._GetHashIdsFromWildcard( file_service_key, tag_service_key, wildcard, include_current_tags, include_pending_tags )
+                    query_posting_list = ClientCaches.IntersectPostingLists( query_posting_list, posting_list )
                     
-                elif is_inbox and len( query_hash_ids ) == len( self._inbox_hash_ids ):
+                
+            else:
+                
+                if query_posting_list is not None:
                     
-                    wildcard_query_hash_ids = self._GetHashIdsFromWildcard( file_service_key, tag_service_key, wildcard, include_current_tags, include_pending_tags, hash_ids_table_name = 'file_inbox' )
+                    query_hash_ids = set( query_posting_list.tolist() )
+                    
+                    query_posting_list = None
+                    
+                
+                if posting_list is not None:
+                    
+                    query_hash_ids = ClientCaches.IntersectHashIdsWithPostingList( query_hash_ids, posting_list )
+                    
+                elif query_hash_ids is None or step_type not in restrictable_step_types:
+                    
+                    query_hash_ids = intersection_update_qhi( query_hash_ids, get_search_step_hash_ids( step_type, step_value ) )
+                    
+                elif done_inbox and len( query_hash_ids ) == len( self._inbox_hash_ids ):
+                    
+                    query_hash_ids = intersection_update_qhi( query_hash_ids, get_search_step_hash_ids( step_type, step_value, hash_ids_table_name = 'file_inbox' ) )
                     
                 else:
                     
@@ -5542,19 +6174,37 @@ class DB( HydrusDB.HydrusDB ):
                         
                         self._AnalyzeTempTable( temp_table_name )
                         
-                        wildcard_query_hash_ids = self._GetHashIdsFromWildcard( file_service_key, tag_service_key, wildcard, include_current_tags, include_pending_tags, hash_ids_table_name = temp_table_name )
+                        step_hash_ids = get_search_step_hash_ids( step_type, step_value, hash_ids_table_name = temp_table_name )
                         
                     
+                    query_hash_ids = intersection_update_qhi( query_hash_ids, step_hash_ids )
+                    
+                
+            
+            if step_type == 'inbox':
+                
+                done_inbox = True
                 
-                query_hash_ids = intersection_update_qhi( query_hash_ids, wildcard_query_hash_ids )
+            
+            if step_type in cross_referencing_step_types:
                 
                 have_cross_referenced_file_service = True
                 
-                if query_hash_ids == set():
-                    
-                    return query_hash_ids
-                    
+            
+            if query_hash_ids == set() or ( query_posting_list is not None and len( query_posting_list ) == 0 ):
+                
+                return set()
+                
+            
+            if job_key.IsCancelled():
                 
+                return set()
+                
+            
+        
+        if query_posting_list is not None:
+            
+            query_hash_ids = set( query_posting_list.tolist() )
             
         
         #
@@ -5676,13 +6326,22 @@ class DB( HydrusDB.HydrusDB ):
         
         for tag in tags_to_exclude:
             
-            with HydrusDB.TemporaryIntegerTable( self._c, query_hash_ids, 'hash_id' ) as temp_table_name:
+            unwanted_posting_list = self._GetHashIdsPostingListForTag( file_service_key, tag_service_key, tag, include_current_tags, include_pending_tags )
+            
+            if unwanted_posting_list is not None:
                 
-                self._AnalyzeTempTable( temp_table_name )
+                query_hash_ids = ClientCaches.SubtractPostingListFromHashIds( query_hash_ids, unwanted_posting_list )
                 
-                unwanted_hash_ids = self._GetHashIdsFromTag( file_service_key, tag_service_key, tag, include_current_tags, include_pending_tags, hash_ids_table_name = temp_table_name )
+            else:
                 
-                query_hash_ids.difference_update( unwanted_hash_ids )
+                with HydrusDB.TemporaryIntegerTable( self._c, query_hash_ids, 'hash_id' ) as temp_table_name:
+                    
+                    self._AnalyzeTempTable( temp_table_name )
+                    
+                    unwanted_hash_ids = self._GetHashIdsFromTag( file_service_key, tag_service_key, tag, include_current_tags, include_pending_tags, hash_ids_table_name = temp_table_name )
+                    
+                    query_hash_ids.difference_update( unwanted_hash_ids )
+                    
                 
             
             if len( query_hash_ids ) == 0:
@@ -5738,7 +6397,16 @@ class DB( HydrusDB.HydrusDB ):
             
             service_id = self._GetServiceId( service_key )
             
-            query_hash_ids = intersection_update_qhi( query_hash_ids, self._STI( self._c.execute( 'SELECT hash_id FROM current_files WHERE service_id = ?;', ( service_id, ) ) ) )
+            posting_list = self._GetHashIdsPostingListForFileService( service_id )
+            
+            if posting_list is not None:
+                
+                query_hash_ids = ClientCaches.IntersectHashIdsWithPostingList( query_hash_ids, posting_list )
+                
+            else:
+                
+                query_hash_ids = intersection_update_qhi( query_hash_ids, self._STI( self._c.execute( 'SELECT hash_id FROM current_files WHERE service_id = ?;', ( service_id, ) ) ) )
+                
             
         
         for service_key in file_services_to_include_pending:
@@ -5752,7 +6420,16 @@ class DB( HydrusDB.HydrusDB ):
             
             service_id = self._GetServiceId( service_key )
             
-            query_hash_ids.difference_update( self._STI( self._c.execute( 'SELECT hash_id FROM current_files WHERE service_id = ?;', ( service_id, ) ) ) )
+            posting_list = self._GetHashIdsPostingListForFileService( service_id )
+            
+            if posting_list is not None:
+                
+                query_hash_ids = ClientCaches.SubtractPostingListFromHashIds( query_hash_ids, posting_list )
+                
+            else:
+                
+                query_hash_ids.difference_update( self._STI( self._c.execute( 'SELECT hash_id FROM current_files WHERE service_id = ?;', ( service_id, ) ) ) )
+                
             
         
         for service_key in file_services_to_exclude_pending:
@@ -6163,6 +6840,51 @@ class DB( HydrusDB.HydrusDB ):
         return hash_ids
         
     
+    def _GetHashIdsFromTagCountEstimate( self, file_service_key, tag_service_key, tag, include_current_tags, include_pending_tags ):
+        
+        # a cheap guess from the autocomplete count caches at how many files _GetHashIdsFromTag will return
+        
+        siblings_manager = self._controller.tag_siblings_manager
+        
+        tags = siblings_manager.GetAllSiblings( tag_service_key, tag )
+        
+        tag_ids = set()
+        
+        for tag in tags:
+            
+            ( namespace, subtag ) = HydrusTags.SplitTag( tag )
+            
+            if namespace != '':
+                
+                if self._TagExists( tag ):
+                    
+                    tag_ids.add( self._GetTagId( tag ) )
+                    
+                
+            else:
+                
+                if self._SubtagExists( subtag ):
+                    
+                    subtag_id = self._GetSubtagId( subtag )
+                    
+                    tag_ids.update( self._STI( self._c.execute( 'SELECT tag_id FROM tags WHERE subtag_id = ?;', ( subtag_id, ) ) ) )
+                    
+                
+            
+        
+        if len( tag_ids ) == 0:
+            
+            return 0
+            
+        
+        file_service_id = self._GetServiceId( file_service_key )
+        tag_service_id = self._GetServiceId( tag_service_key )
+        
+        ids_to_count = self._GetAutocompleteCounts( tag_service_id, file_service_id, tag_ids, include_current_tags, include_pending_tags )
+        
+        return sum( ( current_min + pending_min for ( current_min, current_max, pending_min, pending_max ) in ids_to_count.values() ) )
+        
+    
     def _GetHashIdsFromURLRule( self, rule_type, rule, hash_ids_table_name = None ):
         
         if rule_type == 'exact_match':
@@ -6267,37 +6989,122 @@ class DB( HydrusDB.HydrusDB ):
             
             select = 'SELECT hash_id, url FROM {};'.format( table )
             
-            result_hash_ids = set()
+            result_hash_ids = set()
+            
+            for ( hash_id, url ) in self._c.execute( select ):
+                
+                if re.search( regex, url ) is not None:
+                    
+                    result_hash_ids.add( hash_id )
+                    
+                
+            
+            return result_hash_ids
+            
+        
+    
+    def _GetHashIdsFromWildcard( self, file_service_key, tag_service_key, wildcard, include_current_tags, include_pending_tags, hash_ids_table_name = None ):
+        
+        ( namespace_wildcard, subtag_wildcard ) = HydrusTags.SplitTag( wildcard )
+        
+        possible_subtag_ids = self._GetSubtagIdsFromWildcard( subtag_wildcard )
+        
+        if namespace_wildcard != '':
+            
+            possible_namespace_ids = self._GetNamespaceIdsFromWildcard( namespace_wildcard )
+            
+            return self._GetHashIdsFromNamespaceIdsSubtagIds( file_service_key, tag_service_key, possible_namespace_ids, possible_subtag_ids, include_current_tags, include_pending_tags, hash_ids_table_name = hash_ids_table_name )
+            
+        else:
+            
+            return self._GetHashIdsFromSubtagIds( file_service_key, tag_service_key, possible_subtag_ids, include_current_tags, include_pending_tags, hash_ids_table_name = hash_ids_table_name )
+            
+        
+    
+    def _GetHashIdsPostingListForFileService( self, service_id ):
+        
+        key = ( 'file_service', service_id )
+        
+        posting_list = self._hash_id_posting_list_cache.GetPostingList( key )
+        
+        if posting_list is None and self._hash_id_posting_list_cache.WantsPostingList( key ):
+            
+            hash_ids = self._STL( self._c.execute( 'SELECT hash_id FROM current_files WHERE service_id = ?;', ( service_id, ) ) )
+            
+            posting_list = ClientCaches.ConvertHashIdsToPostingList( hash_ids )
+            
+            self._FillCache( self._hash_id_posting_list_cache.SetPostingList, key, posting_list, service_ids = ( service_id, ) )
+            
+        
+        return posting_list
+        
+    
+    def _GetHashIdsPostingListForInbox( self ):
+        
+        key = ( 'inbox', )
+        
+        posting_list = self._hash_id_posting_list_cache.GetPostingList( key )
+        
+        if posting_list is None:
+            
+            # we have the inbox in memory anyway, so no need to wait for it to get hot
+            # but that set belongs to the main connection and may be changing under us, so a read-only job reads its own snapshot's
+            
+            if self._InReadOnlyJob():
+                
+                inbox_hash_ids = self._STL( self._c.execute( 'SELECT hash_id FROM file_inbox;' ) )
+                
+            else:
+                
+                inbox_hash_ids = self._inbox_hash_ids
+                
+            
+            posting_list = ClientCaches.ConvertHashIdsToPostingList( inbox_hash_ids )
+            
+            self._FillCache( self._hash_id_posting_list_cache.SetPostingList, key, posting_list )
+            
+        
+        return posting_list
+        
+    
+    def _GetHashIdsPostingListForTag( self, file_service_key, tag_service_key, tag, include_current_tags, include_pending_tags ):
+        
+        file_service_id = self._GetServiceId( file_service_key )
+        
+        if tag_service_key == CC.COMBINED_TAG_SERVICE_KEY:
+            
+            search_tag_service_ids = self._GetServiceIds( HC.REAL_TAG_SERVICES )
             
-            for ( hash_id, url ) in self._c.execute( select ):
-                
-                if re.search( regex, url ) is not None:
-                    
-                    result_hash_ids.add( hash_id )
-                    
-                
+        else:
             
-            return result_hash_ids
+            search_tag_service_ids = [ self._GetServiceId( tag_service_key ) ]
             
         
-    
-    def _GetHashIdsFromWildcard( self, file_service_key, tag_service_key, wildcard, include_current_tags, include_pending_tags, hash_ids_table_name = None ):
+        siblings_manager = self._controller.tag_siblings_manager
         
-        ( namespace_wildcard, subtag_wildcard ) = HydrusTags.SplitTag( wildcard )
+        # the siblings are part of the key, so a sibling change just makes a new key and the old one ages out
         
-        possible_subtag_ids = self._GetSubtagIdsFromWildcard( subtag_wildcard )
+        siblings = siblings_manager.GetAllSiblings( tag_service_key, tag )
         
-        if namespace_wildcard != '':
+        key = ( 'tag', file_service_id, tuple( search_tag_service_ids ), tuple( sorted( siblings ) ), include_current_tags, include_pending_tags )
+        
+        posting_list = self._hash_id_posting_list_cache.GetPostingList( key )
+        
+        if posting_list is None and self._hash_id_posting_list_cache.WantsPostingList( key ):
             
-            possible_namespace_ids = self._GetNamespaceIdsFromWildcard( namespace_wildcard )
+            hash_ids = self._GetHashIdsFromTag( file_service_key, tag_service_key, tag, include_current_tags, include_pending_tags )
             
-            return self._GetHashIdsFromNamespaceIdsSubtagIds( file_service_key, tag_service_key, possible_namespace_ids, possible_subtag_ids, include_current_tags, include_pending_tags, hash_ids_table_name = hash_ids_table_name )
+            service_ids = set( search_tag_service_ids )
             
-        else:
+            service_ids.add( file_service_id )
             
-            return self._GetHashIdsFromSubtagIds( file_service_key, tag_service_key, possible_subtag_ids, include_current_tags, include_pending_tags, hash_ids_table_name = hash_ids_table_name )
+            posting_list = ClientCaches.ConvertHashIdsToPostingList( hash_ids )
+            
+            self._FillCache( self._hash_id_posting_list_cache.SetPostingList, key, posting_list, service_ids = service_ids )
             
         
+        return posting_list
+        
     
     def _GetHashIdsTagCounts( self, tag_service_key, include_current, include_pending, hash_ids ):
         
@@ -6864,6 +7671,60 @@ class DB( HydrusDB.HydrusDB ):
         return tables
         
     
+    def _GetMasterDefinitionsToIds( self, definitions, id_cache, table_name, column_name, column_type, id_column_name, row_converter = None ):
+        
+        # resolves a whole batch of master definitions (hashes, namespaces, etc...) to ids in a couple of set-based queries, inserting what is missing
+        # the id cache only belongs to the main connection, since it may know about ids the read-only connections cannot see yet
+        
+        use_cache = id_cache is not None and not self._InReadOnlyJob()
+        
+        if use_cache:
+            
+            ( definitions_to_ids, definitions_to_look_up ) = id_cache.GetIds( definitions )
+            
+        else:
+            
+            definitions_to_ids = {}
+            definitions_to_look_up = list( definitions )
+            
+        
+        if row_converter is None:
+            
+            row_converter = lambda definition: definition
+            
+        
+        new_definitions = set()
+        
+        if len( definitions_to_look_up ) > 0:
+            
+            with HydrusDB.TemporaryTable( self._c, ( ( row_converter( definition ), ) for definition in definitions_to_look_up ), [ ( column_name, column_type ) ] ) as temp_table_name:
+                
+                # temp table first, so sqlite walks our batch and hits the master table's unique index for each row
+                select_statement = 'SELECT {}, {} FROM {} CROSS JOIN {} USING ( {} );'.format( column_name, id_column_name, temp_table_name, table_name, column_name )
+                
+                found_definitions_to_ids = dict( self._c.execute( select_statement ) )
+                
+                if len( found_definitions_to_ids ) < len( definitions_to_look_up ):
+                    
+                    new_definitions = { definition for definition in definitions_to_look_up if definition not in found_definitions_to_ids }
+                    
+                    self._c.executemany( 'INSERT INTO {} ( {} ) VALUES ( ? );'.format( table_name, column_name ), ( ( row_converter( definition ), ) for definition in new_definitions ) )
+                    
+                    found_definitions_to_ids = dict( self._c.execute( select_statement ) )
+                    
+                
+            
+            if use_cache:
+                
+                id_cache.AddIds( found_definitions_to_ids )
+                
+            
+            definitions_to_ids.update( found_definitions_to_ids )
+            
+        
+        return ( definitions_to_ids, new_definitions )
+        
+    
     def _GetMediaResults( self, hash_ids ):
         
         ( cached_media_results, missing_hash_ids ) = self._weakref_media_result_cache.GetMediaResultsAndMissing( hash_ids )
@@ -7042,6 +7903,26 @@ class DB( HydrusDB.HydrusDB ):
         return namespace_id
         
     
+    def _GetNamespacesToNamespaceIds( self, namespaces ):
+        
+        namespaces = set( namespaces )
+        
+        namespaces_to_namespace_ids = {}
+        
+        if '' in namespaces:
+            
+            namespaces.discard( '' )
+            
+            namespaces_to_namespace_ids[ '' ] = self._null_namespace_id
+            
+        
+        ( found_namespaces_to_namespace_ids, new_namespaces ) = self._GetMasterDefinitionsToIds( namespaces, None, 'namespaces', 'namespace', 'TEXT', 'namespace_id' )
+        
+        namespaces_to_namespace_ids.update( found_namespaces_to_namespace_ids )
+        
+        return namespaces_to_namespace_ids
+        
+    
     def _GetNamespaceIdsFromWildcard( self, namespace_wildcard ):
         
         if '*' in namespace_wildcard:
@@ -7564,6 +8445,85 @@ class DB( HydrusDB.HydrusDB ):
         return hashes
         
     
+    def _GetRowCountEstimate( self, table_name ):
+        
+        # ANALYZE leaves an approximate row count at the front of each sqlite_stat1 row, which is much cheaper than a COUNT( * )
+        
+        result = self._c.execute( 'SELECT 1 FROM sqlite_master WHERE name = ?;', ( 'sqlite_stat1', ) ).fetchone()
+        
+        if result is None:
+            
+            return None
+            
+        
+        result = self._c.execute( 'SELECT stat FROM sqlite_stat1 WHERE tbl = ?;', ( table_name, ) ).fetchone()
+        
+        if result is None:
+            
+            return None
+            
+        
+        ( stat, ) = result
+        
+        return int( stat.split()[0] )
+        
+    
+    def _GetRowCountEstimateForRange( self, table_name, column_name, min_value, max_value ):
+        
+        # without ANALYZE stats we have no idea, and an unknown estimate sorts after the tag steps
+        
+        num_rows = self._GetRowCountEstimate( table_name )
+        
+        if num_rows is None:
+            
+            return None
+            
+        
+        # the column is indexed, so each end is a quick lookup. we then assume values are spread evenly between them
+        
+        ( column_min, ) = self._c.execute( 'SELECT MIN( {} ) FROM {};'.format( column_name, table_name ) ).fetchone()
+        ( column_max, ) = self._c.execute( 'SELECT MAX( {} ) FROM {};'.format( column_name, table_name ) ).fetchone()
+        
+        if column_min is None or column_max is None:
+            
+            return 0
+            
+        
+        if min_value is None or min_value < column_min:
+            
+            min_value = column_min
+            
+        
+        if max_value is None or max_value > column_max:
+            
+            max_value = column_max
+            
+        
+        if max_value < min_value:
+            
+            return 0
+            
+        
+        if column_max == column_min:
+            
+            return num_rows
+            
+        
+        return int( num_rows * ( max_value - min_value ) / ( column_max - column_min ) )
+        
+    
+    def _GetSearchCacheHitsAndMisses( self ):
+        
+        # counted since boot, so callers compare before and after
+        
+        result = {}
+        
+        result[ 'file_search_results' ] = self._file_search_result_cache.GetHitsAndMisses()
+        result[ 'hash_id_posting_lists' ] = self._hash_id_posting_list_cache.GetHitsAndMisses()
+        
+        return result
+        
+    
     def _GetService( self, service_id ):
         
         if service_id in self._service_cache:
@@ -7856,6 +8816,8 @@ class DB( HydrusDB.HydrusDB ):
             
             self._c.execute( 'REPLACE INTO subtags_fts4 ( docid, subtag ) VALUES ( ?, ? );', ( subtag_id, subtag_searchable ) )
             
+            self._AddSubtagTrigrams( ( ( subtag_id, subtag ), ) )
+            
             try:
                 
                 integer_subtag = int( subtag )
@@ -7878,13 +8840,48 @@ class DB( HydrusDB.HydrusDB ):
         return subtag_id
         
     
+    def _GetSubtagsToSubtagIds( self, subtags ):
+        
+        ( subtags_to_subtag_ids, new_subtags ) = self._GetMasterDefinitionsToIds( set( subtags ), None, 'subtags', 'subtag', 'TEXT', 'subtag_id' )
+        
+        if len( new_subtags ) > 0:
+            
+            self._c.executemany( 'REPLACE INTO subtags_fts4 ( docid, subtag ) VALUES ( ?, ? );', ( ( subtags_to_subtag_ids[ subtag ], ClientSearch.ConvertTagToSearchable( subtag ) ) for subtag in new_subtags ) )
+            
+            self._AddSubtagTrigrams( ( ( subtags_to_subtag_ids[ subtag ], subtag ) for subtag in new_subtags ) )
+            
+            integer_subtag_inserts = []
+            
+            for subtag in new_subtags:
+                
+                try:
+                    
+                    integer_subtag = int( subtag )
+                    
+                    if CanCacheInteger( integer_subtag ):
+                        
+                        integer_subtag_inserts.append( ( subtags_to_subtag_ids[ subtag ], integer_subtag ) )
+                        
+                    
+                except ValueError:
+                    
+                    pass
+                    
+                
+            
+            self._c.executemany( 'INSERT OR IGNORE INTO integer_subtags ( subtag_id, integer_subtag ) VALUES ( ?, ? );', integer_subtag_inserts )
+            
+        
+        return subtags_to_subtag_ids
+        
+    
     def _GetSubtagIdsFromWildcard( self, subtag_wildcard ):
         
         if '*' in subtag_wildcard:
             
-            like_param = ConvertWildcardToSQLiteLikeParameter( subtag_wildcard )
+            ( predicate, params ) = GenerateSubtagWildcardPredicate( subtag_wildcard )
             
-            return self._STL( self._c.execute( 'SELECT subtag_id FROM subtags WHERE subtag LIKE ?;', ( like_param, ) ) )
+            return self._STL( self._c.execute( 'SELECT subtag_id FROM subtags WHERE {};'.format( predicate ), params ) )
             
         else:
             
@@ -7914,6 +8911,18 @@ class DB( HydrusDB.HydrusDB ):
         
         HydrusTags.CheckTagNotEmpty( tag )
         
+        use_cache = not self._InReadOnlyJob()
+        
+        if use_cache:
+            
+            ( tags_to_tag_ids, missing_tags ) = self._tags_to_tag_ids_cache.GetIds( ( tag, ) )
+            
+            if tag in tags_to_tag_ids:
+                
+                return tags_to_tag_ids[ tag ]
+                
+            
+        
         ( namespace, subtag ) = HydrusTags.SplitTag( tag )
         
         result = self._c.execute( 'SELECT tag_id FROM tags NATURAL JOIN namespaces NATURAL JOIN subtags WHERE namespace = ? AND subtag = ?;', ( namespace, subtag ) ).fetchone()
@@ -7932,9 +8941,19 @@ class DB( HydrusDB.HydrusDB ):
             ( tag_id, ) = result
             
         
+        if use_cache:
+            
+            self._tags_to_tag_ids_cache.AddIds( { tag : tag_id } )
+            
+        
         return tag_id
         
     
+    def _GetTagIds( self, tags ):
+        
+        return set( self._GetTagsToTagIds( tags ).values() )
+        
+    
     def _GetTagParents( self, service_key = None ):
         
         def convert_statuses_and_pair_ids_to_statuses_to_pairs( statuses_and_pair_ids ):
@@ -7995,6 +9014,32 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _GetTagParentsChanges( self, service_ids_to_child_tag_ids ):
+        
+        service_keys_to_changes = {}
+        
+        for ( service_id, child_tag_ids ) in service_ids_to_child_tag_ids.items():
+            
+            pair_ids = set()
+            
+            for child_tag_id in child_tag_ids:
+                
+                pair_ids.update( self._c.execute( 'SELECT child_tag_id, parent_tag_id FROM tag_parents WHERE service_id = ? AND child_tag_id = ? AND status = ? UNION SELECT child_tag_id, parent_tag_id FROM tag_parent_petitions WHERE service_id = ? AND child_tag_id = ? AND status = ?;', ( service_id, child_tag_id, HC.CONTENT_STATUS_CURRENT, service_id, child_tag_id, HC.CONTENT_STATUS_PENDING ) ) )
+                
+            
+            self._PopulateTagIdsToTagsCache( child_tag_ids.union( itertools.chain.from_iterable( pair_ids ) ) )
+            
+            children = { self._tag_ids_to_tags_cache[ child_tag_id ] for child_tag_id in child_tag_ids }
+            pairs = { ( self._tag_ids_to_tags_cache[ child_tag_id ], self._tag_ids_to_tags_cache[ parent_tag_id ] ) for ( child_tag_id, parent_tag_id ) in pair_ids }
+            
+            service_key = self._GetService( service_id ).GetServiceKey()
+            
+            service_keys_to_changes[ service_key ] = ( children, pairs )
+            
+        
+        return service_keys_to_changes
+        
+    
     def _GetTagSiblings( self, service_key = None ):
         
         def convert_statuses_and_pair_ids_to_statuses_to_pairs( statuses_and_pair_ids ):
@@ -8055,6 +9100,32 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _GetTagSiblingsChanges( self, service_ids_to_bad_tag_ids ):
+        
+        service_keys_to_changes = {}
+        
+        for ( service_id, bad_tag_ids ) in service_ids_to_bad_tag_ids.items():
+            
+            pair_ids = set()
+            
+            for bad_tag_id in bad_tag_ids:
+                
+                pair_ids.update( self._c.execute( 'SELECT bad_tag_id, good_tag_id FROM tag_siblings WHERE service_id = ? AND bad_tag_id = ? AND status = ? UNION SELECT bad_tag_id, good_tag_id FROM tag_sibling_petitions WHERE service_id = ? AND bad_tag_id = ? AND status = ?;', ( service_id, bad_tag_id, HC.CONTENT_STATUS_CURRENT, service_id, bad_tag_id, HC.CONTENT_STATUS_PENDING ) ) )
+                
+            
+            self._PopulateTagIdsToTagsCache( bad_tag_ids.union( itertools.chain.from_iterable( pair_ids ) ) )
+            
+            bad_tags = { self._tag_ids_to_tags_cache[ bad_tag_id ] for bad_tag_id in bad_tag_ids }
+            pairs = { ( self._tag_ids_to_tags_cache[ bad_tag_id ], self._tag_ids_to_tags_cache[ good_tag_id ] ) for ( bad_tag_id, good_tag_id ) in pair_ids }
+            
+            service_key = self._GetService( service_id ).GetServiceKey()
+            
+            service_keys_to_changes[ service_key ] = ( bad_tags, pairs )
+            
+        
+        return service_keys_to_changes
+        
+    
     def _GetTagSiblingIds( self, service_id, tag_ids ):
         
         search_tag_ids = set( tag_ids )
@@ -8096,6 +9167,71 @@ class DB( HydrusDB.HydrusDB ):
         return sibling_tag_ids
         
     
+    def _GetTagsToTagIds( self, tags ):
+        
+        tags_to_clean_tags = {}
+        
+        for tag in tags:
+            
+            clean_tag = HydrusTags.CleanTag( tag )
+            
+            HydrusTags.CheckTagNotEmpty( clean_tag )
+            
+            tags_to_clean_tags[ tag ] = clean_tag
+            
+        
+        use_cache = not self._InReadOnlyJob()
+        
+        if use_cache:
+            
+            ( clean_tags_to_tag_ids, clean_tags_to_look_up ) = self._tags_to_tag_ids_cache.GetIds( set( tags_to_clean_tags.values() ) )
+            
+        else:
+            
+            clean_tags_to_tag_ids = {}
+            clean_tags_to_look_up = set( tags_to_clean_tags.values() )
+            
+        
+        if len( clean_tags_to_look_up ) > 0:
+            
+            clean_tags_to_split_tags = { clean_tag : HydrusTags.SplitTag( clean_tag ) for clean_tag in clean_tags_to_look_up }
+            
+            # any tag that already exists has its namespace and subtag in there too, so this only adds definitions for genuinely new tags
+            
+            namespaces_to_namespace_ids = self._GetNamespacesToNamespaceIds( ( namespace for ( namespace, subtag ) in clean_tags_to_split_tags.values() ) )
+            subtags_to_subtag_ids = self._GetSubtagsToSubtagIds( ( subtag for ( namespace, subtag ) in clean_tags_to_split_tags.values() ) )
+            
+            clean_tags_to_pairs = { clean_tag : ( namespaces_to_namespace_ids[ namespace ], subtags_to_subtag_ids[ subtag ] ) for ( clean_tag, ( namespace, subtag ) ) in clean_tags_to_split_tags.items() }
+            
+            pairs = set( clean_tags_to_pairs.values() )
+            
+            with HydrusDB.TemporaryTable( self._c, pairs, [ ( 'namespace_id', 'INTEGER' ), ( 'subtag_id', 'INTEGER' ) ] ) as temp_table_name:
+                
+                select_statement = 'SELECT namespace_id, subtag_id, tag_id FROM {} CROSS JOIN tags USING ( namespace_id, subtag_id );'.format( temp_table_name )
+                
+                pairs_to_tag_ids = { ( namespace_id, subtag_id ) : tag_id for ( namespace_id, subtag_id, tag_id ) in self._c.execute( select_statement ) }
+                
+                if len( pairs_to_tag_ids ) < len( pairs ):
+                    
+                    self._c.executemany( 'INSERT INTO tags ( namespace_id, subtag_id ) VALUES ( ?, ? );', ( pair for pair in pairs if pair not in pairs_to_tag_ids ) )
+                    
+                    pairs_to_tag_ids = { ( namespace_id, subtag_id ) : tag_id for ( namespace_id, subtag_id, tag_id ) in self._c.execute( select_statement ) }
+                    
+                
+            
+            found_clean_tags_to_tag_ids = { clean_tag : pairs_to_tag_ids[ pair ] for ( clean_tag, pair ) in clean_tags_to_pairs.items() }
+            
+            if use_cache:
+                
+                self._tags_to_tag_ids_cache.AddIds( found_clean_tags_to_tag_ids )
+                
+            
+            clean_tags_to_tag_ids.update( found_clean_tags_to_tag_ids )
+            
+        
+        return { tag : clean_tags_to_tag_ids[ clean_tag ] for ( tag, clean_tag ) in tags_to_clean_tags.items() }
+        
+    
     def _GetText( self, text_id ):
         
         result = self._c.execute( 'SELECT text FROM texts WHERE text_id = ?;', ( text_id, ) ).fetchone()
@@ -8486,6 +9622,9 @@ class DB( HydrusDB.HydrusDB ):
             
             self._inbox_hash_ids.update( hash_ids )
             
+            self._hash_id_posting_list_cache.Invalidate( ( 'inbox', ) )
+            self._file_search_result_cache.InvalidateDependency( 'inbox' )
+            
         
     
     def _InitCaches( self ):
@@ -8508,6 +9647,16 @@ class DB( HydrusDB.HydrusDB ):
         self._hash_ids_to_hashes_cache = {}
         self._tag_ids_to_tags_cache = {}
         
+        self._hashes_to_hash_ids_cache = HydrusDB.IdCache( 50000 )
+        self._tags_to_tag_ids_cache = HydrusDB.IdCache( 50000 )
+        
+        self._phash_index = None
+        
+        self._hash_id_posting_list_cache.Clear()
+        self._file_search_result_cache.Clear()
+        
+        self._CacheTagSiblingsClear()
+        
         ( self._null_namespace_id, ) = self._c.execute( 'SELECT namespace_id FROM namespaces WHERE namespace = ?;', ( '', ) ).fetchone()
         
         HG.client_controller.pub( 'splash_set_status_subtext', 'inbox' )
@@ -9151,6 +10300,11 @@ class DB( HydrusDB.HydrusDB ):
             self._c.execute( 'REPLACE INTO shape_search_cache ( hash_id, searched_distance ) VALUES ( ?, ? );', ( hash_id, None ) )
             
         
+        if self._phash_index is not None:
+            
+            self._phash_index.AddPHashes( self._ExecuteManySelectSingleParam( 'SELECT phash_id, phash FROM shape_perceptual_hashes WHERE phash_id = ?;', phash_ids ) )
+            
+        
         return phash_ids
         
     
@@ -9196,6 +10350,11 @@ class DB( HydrusDB.HydrusDB ):
         
         self._c.executemany( 'INSERT OR IGNORE INTO shape_maintenance_branch_regen ( phash_id ) VALUES ( ? );', ( ( phash_id, ) for phash_id in useless_phash_ids ) )
         
+        if self._phash_index is not None:
+            
+            self._phash_index.DeletePHashIds( useless_phash_ids )
+            
+        
     
     def _PHashesGenerateBranch( self, job_key, parent_id, phash_id, phash, children ):
         
@@ -9268,22 +10427,50 @@ class DB( HydrusDB.HydrusDB ):
             
             insert_rows.append( ( phash_id, parent_id, radius, inner_id, inner_population, outer_id, outer_population ) )
             
-            if inner_id is not None:
-                
-                process_queue.append( ( phash_id, inner_id, inner_phash, inner_children ) )
-                
+            if inner_id is not None:
+                
+                process_queue.append( ( phash_id, inner_id, inner_phash, inner_children ) )
+                
+            
+            if outer_id is not None:
+                
+                process_queue.append( ( phash_id, outer_id, outer_phash, outer_children ) )
+                
+            
+            num_done += 1
+            
+        
+        job_key.SetVariable( 'popup_text_2', 'branch constructed, now committing' )
+        
+        self._c.executemany( 'INSERT OR REPLACE INTO shape_vptree ( phash_id, parent_id, radius, inner_id, inner_population, outer_id, outer_population ) VALUES ( ?, ?, ?, ?, ?, ?, ? );', insert_rows )
+        
+    
+    def _PHashesGetIndex( self ):
+        
+        if not self._controller.new_options.GetBoolean( 'use_in_memory_similar_files_index' ):
+            
+            self._phash_index = None
+            
+            return None
+            
+        
+        if self._InReadOnlyJob():
             
-            if outer_id is not None:
-                
-                process_queue.append( ( phash_id, outer_id, outer_phash, outer_children ) )
-                
+            # the index belongs to the main connection and is not safe to consolidate from another thread, and it may hold uncommitted phashes
             
-            num_done += 1
+            return None
             
         
-        job_key.SetVariable( 'popup_text_2', 'branch constructed, now committing' )
+        if self._phash_index is None:
+            
+            phash_index = ClientCaches.PHashIndex()
+            
+            phash_index.AddPHashes( self._c.execute( 'SELECT phash_id, phash FROM shape_perceptual_hashes WHERE phash_id IN ( SELECT phash_id FROM shape_perceptual_hash_map );' ) )
+            
+            self._phash_index = phash_index
+            
         
-        self._c.executemany( 'INSERT OR REPLACE INTO shape_vptree ( phash_id, parent_id, radius, inner_id, inner_population, outer_id, outer_population ) VALUES ( ?, ?, ?, ?, ?, ?, ? );', insert_rows )
+        return self._phash_index
         
     
     def _PHashesGetMaintenanceStatus( self ):
@@ -9578,6 +10765,8 @@ class DB( HydrusDB.HydrusDB ):
             
             self._c.execute( 'DELETE FROM shape_perceptual_hash_map WHERE hash_id NOT IN ( SELECT hash_id FROM current_files );' )
             
+            self._phash_index = None
+            
             job_key.SetVariable( 'popup_text_1', 'gathering all leaves' )
             
             self._c.execute( 'DELETE FROM shape_vptree;' )
@@ -9634,7 +10823,9 @@ class DB( HydrusDB.HydrusDB ):
             
             total_done_previously = total_num_hash_ids_in_cache - len( hash_ids )
             
-            for ( i, hash_id ) in enumerate( hash_ids ):
+            num_done = 0
+            
+            for group_of_hash_ids in HydrusData.SplitListIntoChunks( hash_ids, self.SIMILAR_FILES_SEARCH_BATCH_SIZE ):
                 
                 job_key.SetVariable( 'popup_title', 'similar files duplicate pair discovery' )
                 
@@ -9654,23 +10845,16 @@ class DB( HydrusDB.HydrusDB ):
                     return
                     
                 
-                if i % 25 == 0:
-                    
-                    text = 'searched ' + HydrusData.ConvertValueRangeToPrettyString( total_done_previously + i, total_num_hash_ids_in_cache ) + ' files'
-                    
-                    job_key.SetVariable( 'popup_text_1', text )
-                    job_key.SetVariable( 'popup_gauge_1', ( total_done_previously + i, total_num_hash_ids_in_cache ) )
-                    
-                    HG.client_controller.pub( 'splash_set_status_subtext', text )
-                    
+                text = 'searched ' + HydrusData.ConvertValueRangeToPrettyString( total_done_previously + num_done, total_num_hash_ids_in_cache ) + ' files'
                 
-                media_id = self._DuplicatesGetMediaId( hash_id )
+                job_key.SetVariable( 'popup_text_1', text )
+                job_key.SetVariable( 'popup_gauge_1', ( total_done_previously + num_done, total_num_hash_ids_in_cache ) )
                 
-                potential_duplicate_media_ids_and_distances = [ ( self._DuplicatesGetMediaId( duplicate_hash_id ), distance ) for ( duplicate_hash_id, distance ) in self._PHashesSearch( hash_id, search_distance ) if duplicate_hash_id != hash_id ]
+                HG.client_controller.pub( 'splash_set_status_subtext', text )
                 
-                self._DuplicatesAddPotentialDuplicates( media_id, potential_duplicate_media_ids_and_distances )
+                self._PHashesSearchForPotentialDuplicatesBatch( group_of_hash_ids, search_distance )
                 
-                self._c.execute( 'UPDATE shape_search_cache SET searched_distance = ? WHERE hash_id = ?;', ( search_distance, hash_id ) )
+                num_done += len( group_of_hash_ids )
                 
             
         finally:
@@ -9684,112 +10868,129 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
-    def _PHashesSearch( self, hash_id, max_hamming_distance ):
+    def _PHashesSearchForPotentialDuplicatesBatch( self, hash_ids, search_distance ):
         
-        if max_hamming_distance == 0:
+        hash_ids_to_phash_ids = HydrusData.BuildKeyToSetDict( self._ExecuteManySelectSingleParam( 'SELECT hash_id, phash_id FROM shape_perceptual_hash_map WHERE hash_id = ?;', hash_ids ) )
+        
+        search_phash_ids = set()
+        
+        for phash_ids in hash_ids_to_phash_ids.values():
             
-            similar_hash_ids = self._STL( self._c.execute( 'SELECT hash_id FROM shape_perceptual_hash_map WHERE phash_id IN ( SELECT phash_id FROM shape_perceptual_hash_map WHERE hash_id = ? );', ( hash_id, ) ) )
+            search_phash_ids.update( phash_ids )
             
-            similar_hash_ids_and_distances = [ ( similar_hash_id, 0 ) for similar_hash_id in similar_hash_ids ]
+        
+        search_phash_ids = list( search_phash_ids )
+        
+        if search_distance == 0:
+            
+            search_phash_ids_to_similar_phash_ids_and_distances = { phash_id : [ ( phash_id, 0 ) ] for phash_id in search_phash_ids }
             
         else:
             
-            search_radius = max_hamming_distance
+            phash_ids_to_phashes = dict( self._ExecuteManySelectSingleParam( 'SELECT phash_id, phash FROM shape_perceptual_hashes WHERE phash_id = ?;', search_phash_ids ) )
+            
+            search_phashes = [ phash_ids_to_phashes[ phash_id ] for phash_id in search_phash_ids ]
             
-            top_node_result = self._c.execute( 'SELECT phash_id FROM shape_vptree WHERE parent_id IS NULL;' ).fetchone()
+            phash_index = self._PHashesGetIndex()
             
-            if top_node_result is None:
+            if phash_index is None:
                 
-                return []
+                results = self._PHashesSearchTreeMany( search_phashes, search_distance )
+                
+            else:
+                
+                results = phash_index.SearchMany( search_phashes, search_distance )
                 
             
-            ( root_node_phash_id, ) = top_node_result
+            search_phash_ids_to_similar_phash_ids_and_distances = dict( zip( search_phash_ids, results ) )
             
-            search_phashes = self._STL( self._c.execute( 'SELECT phash FROM shape_perceptual_hashes NATURAL JOIN shape_perceptual_hash_map WHERE hash_id = ?;', ( hash_id, ) ) )
+        
+        similar_phash_ids = set()
+        
+        for similar_phash_ids_and_distances in search_phash_ids_to_similar_phash_ids_and_distances.values():
             
-            if len( search_phashes ) == 0:
+            similar_phash_ids.update( ( phash_id for ( phash_id, distance ) in similar_phash_ids_and_distances ) )
+            
+        
+        similar_phash_ids_to_hash_ids = HydrusData.BuildKeyToListDict( self._ExecuteManySelectSingleParam( 'SELECT phash_id, hash_id FROM shape_perceptual_hash_map WHERE phash_id = ?;', similar_phash_ids ) )
+        
+        hash_ids_to_media_ids = {}
+        
+        def get_media_id( h_id ):
+            
+            if h_id not in hash_ids_to_media_ids:
                 
-                return []
+                hash_ids_to_media_ids[ h_id ] = self._DuplicatesGetMediaId( h_id )
                 
             
-            similar_phash_ids_to_distances = {}
+            return hash_ids_to_media_ids[ h_id ]
+            
+        
+        media_id_pairs_and_distances = []
+        
+        for hash_id in hash_ids:
             
-            num_cycles = 0
+            # files can have multiple phashes, and phashes can refer to multiple files, so let's make sure we are setting the smallest distance we found
             
-            for search_phash in search_phashes:
-                
-                next_potentials = [ root_node_phash_id ]
+            similar_hash_ids_to_distances = {}
+            
+            for search_phash_id in hash_ids_to_phash_ids[ hash_id ]:
                 
-                while len( next_potentials ) > 0:
-                    
-                    current_potentials = next_potentials
-                    next_potentials = []
-                    
-                    num_cycles += 1
+                for ( similar_phash_id, distance ) in search_phash_ids_to_similar_phash_ids_and_distances[ search_phash_id ]:
                     
-                    for group_of_current_potentials in HydrusData.SplitListIntoChunks( current_potentials, 1024 ):
+                    for similar_hash_id in similar_phash_ids_to_hash_ids[ similar_phash_id ]:
                         
-                        # this is split into fixed lists of results of subgroups because as an iterable it was causing crashes on linux!!
-                        # after investigation, it seemed to be SQLite having a problem with part of Get64BitHammingDistance touching phashes it presumably was still hanging on to
-                        # the crash was in sqlite code, again presumably on subsequent fetch
-                        # adding a delay in seemed to fix it as well. guess it was some memory maintenance buffer/bytes thing
-                        # anyway, we now just get the whole lot of results first and then work on the whole lot
-                        
-                        select_statement = 'SELECT phash_id, phash, radius, inner_id, outer_id FROM shape_perceptual_hashes NATURAL JOIN shape_vptree WHERE phash_id = ?;'
-                        
-                        results = list( self._ExecuteManySelectSingleParam( select_statement, group_of_current_potentials ) )
-                        
-                        for ( node_phash_id, node_phash, node_radius, inner_phash_id, outer_phash_id ) in results:
-                            
-                            # first check the node itself--is it similar?
+                        if similar_hash_id == hash_id:
                             
-                            node_hamming_distance = HydrusData.Get64BitHammingDistance( search_phash, node_phash )
-                            
-                            if node_hamming_distance <= search_radius:
-                                
-                                similar_phash_ids_to_distances[ node_phash_id ] = node_hamming_distance
-                                
+                            continue
                             
-                            # now how about its children?
+                        
+                        if similar_hash_id not in similar_hash_ids_to_distances or distance < similar_hash_ids_to_distances[ similar_hash_id ]:
                             
-                            if node_radius is not None:
-                                
-                                # we have two spheres--node and search--their centers separated by node_hamming_distance
-                                # we want to search inside/outside the node_sphere if the search_sphere intersects with those spaces
-                                # there are four possibles:
-                                # (----N----)-(--S--)    intersects with outer only - distance between N and S > their radii
-                                # (----N---(-)-S--)      intersects with both
-                                # (----N-(--S-)-)        intersects with both
-                                # (---(-N-S--)-)         intersects with inner only - distance between N and S + radius_S does not exceed radius_N
-                                
-                                if inner_phash_id is not None:
-                                    
-                                    spheres_disjoint = node_hamming_distance > ( node_radius + search_radius )
-                                    
-                                    if not spheres_disjoint: # i.e. they intersect at some point
-                                        
-                                        next_potentials.append( inner_phash_id )
-                                        
-                                    
-                                
-                                if outer_phash_id is not None:
-                                    
-                                    search_sphere_subset_of_node_sphere = ( node_hamming_distance + search_radius ) <= node_radius
-                                    
-                                    if not search_sphere_subset_of_node_sphere: # i.e. search sphere intersects with non-node sphere space at some point
-                                        
-                                        next_potentials.append( outer_phash_id )
-                                        
-                                    
-                                
+                            similar_hash_ids_to_distances[ similar_hash_id ] = distance
                             
                         
                     
                 
             
-            if HG.db_report_mode:
+            media_id = get_media_id( hash_id )
+            
+            media_id_pairs_and_distances.extend( ( ( media_id, get_media_id( similar_hash_id ), distance ) for ( similar_hash_id, distance ) in similar_hash_ids_to_distances.items() ) )
+            
+        
+        self._DuplicatesAddPotentialDuplicatePairs( media_id_pairs_and_distances )
+        
+        self._c.executemany( 'UPDATE shape_search_cache SET searched_distance = ? WHERE hash_id = ?;', ( ( search_distance, hash_id ) for hash_id in hash_ids ) )
+        
+    
+    def _PHashesSearch( self, hash_id, max_hamming_distance ):
+        
+        if max_hamming_distance == 0:
+            
+            similar_hash_ids = self._STL( self._c.execute( 'SELECT hash_id FROM shape_perceptual_hash_map WHERE phash_id IN ( SELECT phash_id FROM shape_perceptual_hash_map WHERE hash_id = ? );', ( hash_id, ) ) )
+            
+            similar_hash_ids_and_distances = [ ( similar_hash_id, 0 ) for similar_hash_id in similar_hash_ids ]
+            
+        else:
+            
+            search_radius = max_hamming_distance
+            
+            search_phashes = self._STL( self._c.execute( 'SELECT phash FROM shape_perceptual_hashes NATURAL JOIN shape_perceptual_hash_map WHERE hash_id = ?;', ( hash_id, ) ) )
+            
+            if len( search_phashes ) == 0:
+                
+                return []
+                
+            
+            phash_index = self._PHashesGetIndex()
+            
+            if phash_index is None:
+                
+                similar_phash_ids_to_distances = self._PHashesSearchTree( search_phashes, search_radius )
+                
+            else:
                 
-                HydrusData.ShowText( 'Similar file search completed in ' + HydrusData.ToHumanInt( num_cycles ) + ' cycles.' )
+                similar_phash_ids_to_distances = phash_index.Search( search_phashes, search_radius )
                 
             
             # so, so now we have phash_ids and distances. let's map that to actual files.
@@ -9829,6 +11030,121 @@ class DB( HydrusDB.HydrusDB ):
         return similar_hash_ids_and_distances
         
     
+    def _PHashesSearchTree( self, search_phashes, search_radius ):
+        
+        similar_phash_ids_to_distances = {}
+        
+        for phash_ids_and_distances in self._PHashesSearchTreeMany( search_phashes, search_radius ):
+            
+            for ( phash_id, distance ) in phash_ids_and_distances:
+                
+                if phash_id not in similar_phash_ids_to_distances or distance < similar_phash_ids_to_distances[ phash_id ]:
+                    
+                    similar_phash_ids_to_distances[ phash_id ] = distance
+                    
+                
+            
+        
+        return similar_phash_ids_to_distances
+        
+    
+    def _PHashesSearchTreeMany( self, search_phashes, search_radius ):
+        
+        # walks the tree for all the search phashes at once, so each node we visit is only fetched once per level, no matter how many searches want it
+        # returns a list, in the same order as search_phashes, of lists of ( phash_id, distance )
+        
+        results = [ [] for search_phash in search_phashes ]
+        
+        top_node_result = self._c.execute( 'SELECT phash_id FROM shape_vptree WHERE parent_id IS NULL;' ).fetchone()
+        
+        if top_node_result is None or len( search_phashes ) == 0:
+            
+            return results
+            
+        
+        ( root_node_phash_id, ) = top_node_result
+        
+        num_cycles = 0
+        
+        next_potentials = { root_node_phash_id : list( range( len( search_phashes ) ) ) }
+        
+        while len( next_potentials ) > 0:
+            
+            current_potentials = next_potentials
+            next_potentials = collections.defaultdict( list )
+            
+            num_cycles += 1
+            
+            for group_of_current_potentials in HydrusData.SplitListIntoChunks( list( current_potentials.keys() ), 1024 ):
+                
+                # this is split into fixed lists of results of subgroups because as an iterable it was causing crashes on linux!!
+                # after investigation, it seemed to be SQLite having a problem with part of Get64BitHammingDistance touching phashes it presumably was still hanging on to
+                # the crash was in sqlite code, again presumably on subsequent fetch
+                # adding a delay in seemed to fix it as well. guess it was some memory maintenance buffer/bytes thing
+                # anyway, we now just get the whole lot of results first and then work on the whole lot
+                
+                select_statement = 'SELECT phash_id, phash, radius, inner_id, outer_id FROM shape_perceptual_hashes NATURAL JOIN shape_vptree WHERE phash_id = ?;'
+                
+                nodes = list( self._ExecuteManySelectSingleParam( select_statement, group_of_current_potentials ) )
+                
+                for ( node_phash_id, node_phash, node_radius, inner_phash_id, outer_phash_id ) in nodes:
+                    
+                    for search_index in current_potentials[ node_phash_id ]:
+                        
+                        # first check the node itself--is it similar?
+                        
+                        node_hamming_distance = HydrusData.Get64BitHammingDistance( search_phashes[ search_index ], node_phash )
+                        
+                        if node_hamming_distance <= search_radius:
+                            
+                            results[ search_index ].append( ( node_phash_id, node_hamming_distance ) )
+                            
+                        
+                        # now how about its children?
+                        
+                        if node_radius is not None:
+                            
+                            # we have two spheres--node and search--their centers separated by node_hamming_distance
+                            # we want to search inside/outside the node_sphere if the search_sphere intersects with those spaces
+                            # there are four possibles:
+                            # (----N----)-(--S--)    intersects with outer only - distance between N and S > their radii
+                            # (----N---(-)-S--)      intersects with both
+                            # (----N-(--S-)-)        intersects with both
+                            # (---(-N-S--)-)         intersects with inner only - distance between N and S + radius_S does not exceed radius_N
+                            
+                            if inner_phash_id is not None:
+                                
+                                spheres_disjoint = node_hamming_distance > ( node_radius + search_radius )
+                                
+                                if not spheres_disjoint: # i.e. they intersect at some point
+                                    
+                                    next_potentials[ inner_phash_id ].append( search_index )
+                                    
+                                
+                            
+                            if outer_phash_id is not None:
+                                
+                                search_sphere_subset_of_node_sphere = ( node_hamming_distance + search_radius ) <= node_radius
+                                
+                                if not search_sphere_subset_of_node_sphere: # i.e. search sphere intersects with non-node sphere space at some point
+                                    
+                                    next_potentials[ outer_phash_id ].append( search_index )
+                                    
+                                
+                            
+                        
+                    
+                
+            
+        
+        if HG.db_report_mode:
+            
+            HydrusData.ShowText( 'Similar file search for ' + HydrusData.ToHumanInt( len( search_phashes ) ) + ' phashes completed in ' + HydrusData.ToHumanInt( num_cycles ) + ' cycles.' )
+            
+        
+        return results
+        
+    
     def _PHashesSetFileMetadata( self, hash_id, phashes ):
         
         current_phash_ids = self._STS( self._c.execute( 'SELECT phash_id FROM shape_perceptual_hash_map WHERE hash_id = ?;', ( hash_id, ) ) )
@@ -9944,6 +11260,9 @@ class DB( HydrusDB.HydrusDB ):
         notify_new_pending = False
         notify_new_parents = False
         notify_new_siblings = False
+        
+        parent_service_ids_to_child_tag_ids = collections.defaultdict( set )
+        sibling_service_ids_to_bad_tag_ids = collections.defaultdict( set )
         notify_new_force_refresh_tags = False
         
         for ( service_key, content_updates ) in service_keys_to_content_updates.items():
@@ -10339,6 +11658,8 @@ class DB( HydrusDB.HydrusDB ):
                             notify_new_pending = True
                             
                         
+                        parent_service_ids_to_child_tag_ids[ service_id ].add( child_tag_id )
+                        
                         notify_new_parents = True
                         
                     elif data_type == HC.CONTENT_TYPE_TAG_SIBLINGS:
@@ -10401,6 +11722,8 @@ class DB( HydrusDB.HydrusDB ):
                             
                             self._c.execute( 'INSERT OR IGNORE INTO tag_sibling_petitions ( service_id, bad_tag_id, good_tag_id, reason_id, status ) VALUES ( ?, ?, ?, ?, ? );', ( service_id, bad_tag_id, good_tag_id, reason_id, new_status ) )
                             
+                            self._CacheTagSiblingsUpdate( service_id, ( bad_tag_id, ) )
+                            
                             notify_new_pending = True
                             
                         elif action in ( HC.CONTENT_UPDATE_RESCIND_PEND, HC.CONTENT_UPDATE_RESCIND_PETITION ):
@@ -10427,14 +11750,20 @@ class DB( HydrusDB.HydrusDB ):
                             
                             self._c.execute( 'DELETE FROM tag_sibling_petitions WHERE service_id = ? AND bad_tag_id = ? AND status = ?;', ( service_id, bad_tag_id, deletee_status ) )
                             
+                            self._CacheTagSiblingsUpdate( service_id, ( bad_tag_id, ) )
+                            
                             notify_new_pending = True
                             
                         
+                        sibling_service_ids_to_bad_tag_ids[ service_id ].add( bad_tag_id )
+                        
                         notify_new_siblings = True
                         
                     
                 elif service_type in HC.RATINGS_SERVICES:
                     
+                    self._file_search_result_cache.InvalidateDependency( ( 'service', service_id ) )
+                    
                     if action == HC.CONTENT_UPDATE_ADD:
                         
                         ( rating, hashes ) = row
@@ -10524,14 +11853,15 @@ class DB( HydrusDB.HydrusDB ):
                 
                 self.pub_after_job( 'notify_new_pending' )
                 
+            # the managers can update just these tags, and the parents manager will recollapse itself once the new siblings are in
+            
             if notify_new_siblings:
                 
-                self.pub_after_job( 'notify_new_siblings_data' )
-                self.pub_after_job( 'notify_new_parents' )
+                self.pub_after_job( 'notify_new_siblings_data', self._GetTagSiblingsChanges( sibling_service_ids_to_bad_tag_ids ) )
                 
-            elif notify_new_parents:
+            if notify_new_parents:
                 
-                self.pub_after_job( 'notify_new_parents' )
+                self.pub_after_job( 'notify_new_parents', self._GetTagParentsChanges( parent_service_ids_to_child_tag_ids ) )
                 
             if notify_new_force_refresh_tags:
                 
@@ -10838,14 +12168,9 @@ class DB( HydrusDB.HydrusDB ):
             
             for chunk in HydrusData.SplitIteratorIntoAutothrottledChunks( i, 50, precise_time_to_stop ):
                 
-                inserts = []
+                hashes_to_hash_ids = self._GetHashesToHashIds( ( hash for ( service_hash_id, hash ) in chunk ) )
                 
-                for ( service_hash_id, hash ) in chunk:
-                    
-                    hash_id = self._GetHashId( hash )
-                    
-                    inserts.append( ( service_hash_id, hash_id ) )
-                    
+                inserts = [ ( service_hash_id, hashes_to_hash_ids[ hash ] ) for ( service_hash_id, hash ) in chunk ]
                 
                 self._c.executemany( 'INSERT OR IGNORE INTO {} ( service_hash_id, hash_id ) VALUES ( ?, ? );'.format( hash_id_map_table_name ), inserts )
                 
@@ -10866,14 +12191,9 @@ class DB( HydrusDB.HydrusDB ):
             
             for chunk in HydrusData.SplitIteratorIntoAutothrottledChunks( i, 50, precise_time_to_stop ):
                 
-                inserts = []
+                tags_to_tag_ids = self._GetTagsToTagIds( ( tag for ( service_tag_id, tag ) in chunk ) )
                 
-                for ( service_tag_id, tag ) in chunk:
-                    
-                    tag_id = self._GetTagId( tag )
-                    
-                    inserts.append( ( service_tag_id, tag_id ) )
-                    
+                inserts = [ ( service_tag_id, tags_to_tag_ids[ tag ] ) for ( service_tag_id, tag ) in chunk ]
                 
                 self._c.executemany( 'INSERT OR IGNORE INTO {} ( service_tag_id, tag_id ) VALUES ( ?, ? );'.format( tag_id_map_table_name ), inserts )
                 
@@ -10909,7 +12229,7 @@ class DB( HydrusDB.HydrusDB ):
             
             now = HydrusData.GetNow()
             
-            tag_ids = [ self._GetTagId( tag ) for tag in tags ]
+            tag_ids = self._GetTagIds( tags )
             
             self._c.executemany( 'REPLACE INTO recent_tags ( service_id, tag_id, timestamp ) VALUES ( ?, ?, ? );', ( ( service_id, tag_id, now ) for tag_id in tag_ids ) )
             
@@ -10927,7 +12247,7 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'file_maintenance_get_job': result = self._FileMaintenanceGetJob( *args, **kwargs )
         elif action == 'file_maintenance_get_job_counts': result = self._FileMaintenanceGetJobCounts( *args, **kwargs )
         elif action == 'file_notes': result = self._GetFileNotes( *args, **kwargs )
-        elif action == 'file_query_ids': result = self._GetHashIdsFromQuery( *args, **kwargs )
+        elif action == 'file_query_ids': result = self._GetFileQueryIds( *args, **kwargs )
         elif action == 'file_system_predicates': result = self._GetFileSystemPredicates( *args, **kwargs )
         elif action == 'filter_existing_tags': result = self._FilterExistingTags( *args, **kwargs )
         elif action == 'filter_hashes': result = self._FilterHashes( *args, **kwargs )
@@ -10959,6 +12279,7 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'repository_progress': result = self._GetRepositoryProgress( *args, **kwargs )
         elif action == 'repository_unprocessed_hashes': result = self._GetRepositoryUpdateHashesUnprocessed( *args, **kwargs )
         elif action == 'repository_update_hashes_to_process': result = self._GetRepositoryUpdateHashesICanProcess( *args, **kwargs )
+        elif action == 'search_cache_hits_and_misses': result = self._GetSearchCacheHitsAndMisses( *args, **kwargs )
         elif action == 'serialisable': result = self._GetJSONDump( *args, **kwargs )
         elif action == 'serialisable_simple': result = self._GetJSONSimple( *args, **kwargs )
         elif action == 'serialisable_named': result = self._GetJSONDumpNamed( *args, **kwargs )
@@ -10982,6 +12303,9 @@ class DB( HydrusDB.HydrusDB ):
     
     def _RegenerateACCache( self ):
         
+        self._hash_id_posting_list_cache.Clear()
+        self._file_search_result_cache.Clear()
+        
         job_key = ClientThreading.JobKey( cancellable = True )
         
         try:
@@ -11111,6 +12435,8 @@ class DB( HydrusDB.HydrusDB ):
         self._hash_ids_to_hashes_cache = {}
         self._tag_ids_to_tags_cache = {}
         
+        self._CacheTagSiblingsClear()
+        
         ( self._null_namespace_id, ) = self._c.execute( 'SELECT namespace_id FROM namespaces WHERE namespace = ?;', ( '', ) ).fetchone()
         
         tag_service_ids = self._GetServiceIds( HC.REAL_TAG_SERVICES )
@@ -11161,6 +12487,23 @@ class DB( HydrusDB.HydrusDB ):
             self._CreateIndex( 'external_master.local_hashes', [ 'sha512' ] )
             
         
+        if 'subtag_trigrams' not in existing_master_tables:
+            
+            message = 'On boot, the \'subtag_trigrams\' table, which is the wildcard tag search index, was missing. All of this data can be regenerated.'
+            message += os.linesep * 2
+            message += 'If you wish, click ok on this message and the client will recreate and repopulate this table from your subtags. This may take a few minutes. But if you want to solve this problem otherwise, kill the hydrus process now.'
+            message += os.linesep * 2
+            message += 'If you do not already know what caused this, it was likely a hard drive fault--either due to a recent abrupt power cut or actual hardware failure. Check \'help my db is broke.txt\' in the install_dir/db directory as soon as you can.'
+            
+            self._controller.CallBlockingToQt( self._controller.app, QW.QMessageBox.warning, None, 'Warning', message )
+            
+            self._c.execute( 'CREATE TABLE IF NOT EXISTS external_master.subtag_trigrams ( trigram INTEGER, subtag_id INTEGER, PRIMARY KEY ( trigram, subtag_id ) ) WITHOUT ROWID;' )
+            
+            status_hook = lambda s: self._controller.pub( 'splash_set_status_subtext', s )
+            
+            self._RepopulateSubtagTrigrams( status_hook = status_hook )
+            
+        
         # mappings
         
         existing_mapping_tables = self._STS( self._c.execute( 'SELECT name FROM external_mappings.sqlite_master WHERE type = ?;', ( 'table', ) ) )
@@ -11330,6 +12673,32 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _RepopulateSubtagTrigrams( self, status_hook: typing.Optional[ typing.Callable[ [ str ], None ] ] = None ):
+        
+        BLOCK_SIZE = 1000
+        
+        self._c.execute( 'DELETE FROM subtag_trigrams;' )
+        
+        select_statement = 'SELECT subtag_id FROM subtags;'
+        
+        for ( i, group_of_subtag_ids ) in enumerate( HydrusDB.ReadLargeIdQueryInSeparateChunks( self._c, select_statement, BLOCK_SIZE ) ):
+            
+            if status_hook is not None:
+                
+                message = 'Regenerating tag wildcard search index\u2026 {}'.format( HydrusData.ToHumanInt( i * BLOCK_SIZE ) )
+                
+                status_hook( message )
+                
+            
+            with HydrusDB.TemporaryIntegerTable( self._c, group_of_subtag_ids, 'subtag_id' ) as temp_table_name:
+                
+                subtag_ids_and_subtags = self._c.execute( 'SELECT subtag_id, subtag FROM {} CROSS JOIN subtags USING ( subtag_id );'.format( temp_table_name ) ).fetchall()
+                
+            
+            self._AddSubtagTrigrams( subtag_ids_and_subtags )
+            
+        
+    
     def _ReportOverupdatedDB( self, version ):
         
         def qt_code():
@@ -11375,6 +12744,9 @@ class DB( HydrusDB.HydrusDB ):
     
     def _ResetRepository( self, service ):
         
+        self._hash_id_posting_list_cache.Clear()
+        self._file_search_result_cache.Clear()
+        
         self._Commit()
         
         self._c.execute( 'PRAGMA foreign_keys = ON;' )
@@ -11418,6 +12790,35 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _ResyncCachesAfterRollback( self ):
+        
+        # anything the rolled back work did in memory is now ahead of the db, so we drop it or reload it from what the db now says
+        
+        self._ResyncDefinitionCachesAfterRollback()
+        
+        self._service_cache = {}
+        
+        self._phash_index = None
+        
+        self._hash_id_posting_list_cache.Clear()
+        self._file_search_result_cache.Clear()
+        
+        self._CacheTagSiblingsClear()
+        
+        self._inbox_hash_ids = self._STS( self._c.execute( 'SELECT hash_id FROM file_inbox;' ) )
+        
+    
+    def _ResyncDefinitionCachesAfterRollback( self ):
+        
+        # any definitions we added since the last save are gone, so the ids we cached for them are now wrong and may be handed out again
+        
+        self._hashes_to_hash_ids_cache.Clear()
+        self._tags_to_tag_ids_cache.Clear()
+        
+        self._hash_ids_to_hashes_cache = {}
+        self._tag_ids_to_tags_cache = {}
+        
+    
     def _SaveDirtyServices( self, dirty_services ):
         
         # if allowed to save objects
@@ -13854,6 +15255,27 @@ class DB( HydrusDB.HydrusDB ):
                 
             
         
+        if version == 390:
+            
+            try:
+                
+                self._c.execute( 'CREATE TABLE IF NOT EXISTS external_master.subtag_trigrams ( trigram INTEGER, subtag_id INTEGER, PRIMARY KEY ( trigram, subtag_id ) ) WITHOUT ROWID;' )
+                
+                status_hook = lambda s: self._controller.pub( 'splash_set_status_subtext', s )
+                
+                self._RepopulateSubtagTrigrams( status_hook = status_hook )
+                
+            except Exception as e:
+                
+                HydrusData.Print( 'Failed to populate the subtag trigram index:' )
+                HydrusData.PrintException( e )
+                
+                message = 'Trying to create the new wildcard tag search index failed! Please let hydrus dev know!'
+                
+                self.pub_initial_message( message )
+                
+            
+        
         self._controller.pub( 'splash_set_title_text', 'updated db to v{}'.format( HydrusData.ToHumanInt( version + 1 ) ) )
         
         self._c.execute( 'UPDATE version SET version = ?;', ( version + 1, ) )
@@ -13870,6 +15292,9 @@ class DB( HydrusDB.HydrusDB ):
         if petitioned_mappings_ids is None: petitioned_mappings_ids = []
         if petitioned_rescinded_mappings_ids is None: petitioned_rescinded_mappings_ids = []
         
+        self._hash_id_posting_list_cache.InvalidateService( tag_service_id )
+        self._file_search_result_cache.InvalidateDependency( ( 'service', tag_service_id ) )
+        
         file_service_ids = self._GetServiceIds( HC.AUTOCOMPLETE_CACHE_SPECIFIC_FILE_SERVICES )
         
         change_in_num_mappings = 0
@@ -14420,6 +15845,7 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'regenerate_ac_cache': self._RegenerateACCache( *args, **kwargs )
         elif action == 'regenerate_similar_files': self._PHashesRegenerateTree( *args, **kwargs )
         elif action == 'repopulate_fts_cache': self._RepopulateAndUpdateFTSTags( *args, **kwargs )
+        elif action == 'repopulate_subtag_trigrams': self._RepopulateSubtagTrigrams( *args, **kwargs )
         elif action == 'relocate_client_files': self._RelocateClientFiles( *args, **kwargs )
         elif action == 'remove_alternates_member': self._DuplicatesRemoveAlternateMemberFromHashes( *args, **kwargs )
         elif action == 'remove_duplicates_member': self._DuplicatesRemoveMediaIdMemberFromHashes( *args, **kwargs )
@@ -13,13 +13,21 @@ from . import HydrusImageHandling
 from . import HydrusNetworking
 from . import HydrusPaths
 from . import HydrusThreading
+import mmap
 import os
 import random
+import struct
 import threading
 import time
 from qtpy import QtWidgets as QW
 from . import QtPorting as QP
 
+THUMBNAIL_PACK_FILENAME = 'thumbnails.pack'
+THUMBNAIL_PACK_RECORD_HEADER = struct.Struct( '<32sI' )
+THUMBNAIL_PACK_TOMBSTONE_LENGTH = 0xFFFFFFFF
+THUMBNAIL_PACK_COMPACTION_DEAD_RATIO = 0.25
+THUMBNAIL_MIGRATION_BATCH_SIZE = 256
+
 REGENERATE_FILE_DATA_JOB_FILE_METADATA = 0
 REGENERATE_FILE_DATA_JOB_FORCE_THUMBNAIL = 1
 REGENERATE_FILE_DATA_JOB_REFIT_THUMBNAIL = 2
@@ -156,6 +164,9 @@ class ClientFilesManager( object ):
         
         self._prefixes_to_locations = {}
         
+        self._thumbnail_packs_lock = threading.Lock()
+        self._prefixes_to_thumbnail_packs = {}
+        
         self._bad_error_occurred = False
         self._missing_locations = set()
         
@@ -183,18 +194,39 @@ class ClientFilesManager( object ):
         
         dest_path = self._GenerateExpectedThumbnailPath( hash )
         
+        thumbnail_pack = self._GetThumbnailPack( hash )
+        
+        use_packs = self._controller.new_options.GetBoolean( 'thumbnail_pack_storage' )
+        
         if HG.file_report_mode:
             
-            HydrusData.ShowText( 'Adding thumbnail: ' + str( ( len( thumbnail_bytes ), dest_path ) ) )
+            HydrusData.ShowText( 'Adding thumbnail: ' + str( ( len( thumbnail_bytes ), dest_path, use_packs ) ) )
             
         
         try:
             
-            HydrusPaths.MakeFileWritable( dest_path )
-            
-            with open( dest_path, 'wb' ) as f:
+            if use_packs:
+                
+                thumbnail_pack.AddThumbnails( [ ( hash, thumbnail_bytes ) ] )
                 
-                f.write( thumbnail_bytes )
+                if os.path.exists( dest_path ):
+                    
+                    HydrusPaths.DeletePath( dest_path )
+                    
+                
+            else:
+                
+                HydrusPaths.MakeFileWritable( dest_path )
+                
+                with open( dest_path, 'wb' ) as f:
+                    
+                    f.write( thumbnail_bytes )
+                    
+                
+                if thumbnail_pack.HasThumbnail( hash ):
+                    
+                    thumbnail_pack.DeleteThumbnails( ( hash, ) )
+                    
                 
             
         except Exception as e:
@@ -346,6 +378,19 @@ class ClientFilesManager( object ):
         return needed_to_copy_file
         
     
+    def _CloseThumbnailPacks( self ):
+        
+        with self._thumbnail_packs_lock:
+            
+            for thumbnail_pack in self._prefixes_to_thumbnail_packs.values():
+                
+                thumbnail_pack.Close()
+                
+            
+            self._prefixes_to_thumbnail_packs = {}
+            
+        
+    
     def _GenerateExpectedFilePath( self, hash, mime ):
         
         self._WaitOnWakeup()
@@ -402,6 +447,54 @@ class ClientFilesManager( object ):
         return thumbnail_bytes
         
     
+    def _GetThumbnailBytes( self, hash ):
+        
+        thumbnail_pack = self._GetThumbnailPack( hash )
+        
+        if thumbnail_pack.HasThumbnail( hash ):
+            
+            return thumbnail_pack.GetThumbnailBytes( hash )
+            
+        
+        path = self._GenerateExpectedThumbnailPath( hash )
+        
+        if not os.path.exists( path ):
+            
+            raise HydrusExceptions.FileMissingException( 'No thumbnail found at path {}!'.format( path ) )
+            
+        
+        with open( path, 'rb' ) as f:
+            
+            return f.read()
+            
+        
+    
+    def _GetThumbnailPack( self, hash ):
+        
+        self._WaitOnWakeup()
+        
+        prefix = 't' + hash.hex()[:2]
+        
+        return self._GetThumbnailPackForPrefix( prefix )
+        
+    
+    def _GetThumbnailPackForPrefix( self, prefix ):
+        
+        with self._thumbnail_packs_lock:
+            
+            if prefix not in self._prefixes_to_thumbnail_packs:
+                
+                location = self._prefixes_to_locations[ prefix ]
+                
+                path = os.path.join( location, prefix, THUMBNAIL_PACK_FILENAME )
+                
+                self._prefixes_to_thumbnail_packs[ prefix ] = ThumbnailPack( path )
+                
+            
+            return self._prefixes_to_thumbnail_packs[ prefix ]
+            
+        
+    
     def _GetRecoverTuple( self ):
         
         all_locations = { location for location in list(self._prefixes_to_locations.values()) }
@@ -557,6 +650,11 @@ class ClientFilesManager( object ):
                 
                 for filename in filenames:
                     
+                    if filename.startswith( THUMBNAIL_PACK_FILENAME ):
+                        
+                        continue
+                        
+                    
                     yield os.path.join( dir, filename )
                     
                 
@@ -593,6 +691,8 @@ class ClientFilesManager( object ):
     
     def _Reinit( self ):
         
+        self._CloseThumbnailPacks()
+        
         self._prefixes_to_locations = self._controller.Read( 'client_files_locations' )
         
         if HG.client_controller.IsFirstStart():
@@ -793,6 +893,7 @@ class ClientFilesManager( object ):
             
             orphan_paths = []
             orphan_thumbnails = []
+            orphan_packed_thumbnails = collections.defaultdict( list )
             
             for ( i, path ) in enumerate( self._IterateAllFilePaths() ):
                 
@@ -887,6 +988,34 @@ class ClientFilesManager( object ):
                     
                 
             
+            thumbnail_prefixes = sorted( prefix for prefix in self._prefixes_to_locations.keys() if prefix.startswith( 't' ) )
+            
+            for prefix in thumbnail_prefixes:
+                
+                ( i_paused, should_quit ) = job_key.WaitIfNeeded()
+                
+                if should_quit:
+                    
+                    return
+                    
+                
+                status = 'reviewing thumbnail pack ' + prefix
+                
+                job_key.SetVariable( 'popup_text_1', status )
+                
+                thumbnail_pack = self._GetThumbnailPackForPrefix( prefix )
+                
+                for hash in thumbnail_pack.GetHashes():
+                    
+                    if HG.client_controller.Read( 'is_an_orphan', 'thumbnail', hash ):
+                        
+                        orphan_packed_thumbnails[ prefix ].append( hash )
+                        
+                    
+                
+            
+            num_orphan_thumbnails = len( orphan_thumbnails ) + sum( ( len( hashes ) for hashes in orphan_packed_thumbnails.values() ) )
+            
             time.sleep( 2 )
             
             if move_location is None and len( orphan_paths ) > 0:
@@ -916,9 +1045,9 @@ class ClientFilesManager( object ):
                     
                 
             
-            if len( orphan_thumbnails ) > 0:
+            if num_orphan_thumbnails > 0:
                 
-                status = 'found ' + HydrusData.ToHumanInt( len( orphan_thumbnails ) ) + ' orphan thumbnails, now deleting'
+                status = 'found ' + HydrusData.ToHumanInt( num_orphan_thumbnails ) + ' orphan thumbnails, now deleting'
                 
                 job_key.SetVariable( 'popup_text_1', status )
                 
@@ -942,14 +1071,28 @@ class ClientFilesManager( object ):
                     ClientPaths.DeletePath( path, always_delete_fully = True )
                     
                 
+                for ( prefix, hashes ) in orphan_packed_thumbnails.items():
+                    
+                    HydrusData.Print( 'Deleting ' + HydrusData.ToHumanInt( len( hashes ) ) + ' orphans from thumbnail pack ' + prefix )
+                    
+                    thumbnail_pack = self._GetThumbnailPackForPrefix( prefix )
+                    
+                    thumbnail_pack.DeleteThumbnails( hashes )
+                    
+                    if thumbnail_pack.NeedsCompaction():
+                        
+                        thumbnail_pack.Compact()
+                        
+                    
+                
             
-            if len( orphan_paths ) == 0 and len( orphan_thumbnails ) == 0:
+            if len( orphan_paths ) == 0 and num_orphan_thumbnails == 0:
                 
                 final_text = 'no orphans found!'
                 
             else:
                 
-                final_text = HydrusData.ToHumanInt( len( orphan_paths ) ) + ' orphan files and ' + HydrusData.ToHumanInt( len( orphan_thumbnails ) ) + ' orphan thumbnails cleared!'
+                final_text = HydrusData.ToHumanInt( len( orphan_paths ) ) + ' orphan files and ' + HydrusData.ToHumanInt( num_orphan_thumbnails ) + ' orphan thumbnails cleared!'
                 
             
             job_key.SetVariable( 'popup_text_1', final_text )
@@ -960,6 +1103,40 @@ class ClientFilesManager( object ):
             
         
     
+    def CompactThumbnailPacks( self, job_key = None ):
+        
+        num_compacted = 0
+        
+        for prefix in sorted( prefix for prefix in self._prefixes_to_locations.keys() if prefix.startswith( 't' ) ):
+            
+            if job_key is not None:
+                
+                ( i_paused, should_quit ) = job_key.WaitIfNeeded()
+                
+                if should_quit:
+                    
+                    break
+                    
+                
+                job_key.SetVariable( 'popup_text_1', 'checking thumbnail pack ' + prefix )
+                
+            
+            with self._rwlock.write:
+                
+                thumbnail_pack = self._GetThumbnailPackForPrefix( prefix )
+                
+                if thumbnail_pack.NeedsCompaction():
+                    
+                    thumbnail_pack.Compact()
+                    
+                    num_compacted += 1
+                    
+                
+            
+        
+        return num_compacted
+        
+    
     def DelayedDeleteFiles( self, hashes ):
         
         if HG.file_report_mode:
@@ -1015,6 +1192,13 @@ class ClientFilesManager( object ):
                     
                     ClientPaths.DeletePath( path, always_delete_fully = True )
                     
+                    thumbnail_pack = self._GetThumbnailPack( hash )
+                    
+                    if thumbnail_pack.HasThumbnail( hash ):
+                        
+                        thumbnail_pack.DeleteThumbnails( ( hash, ) )
+                        
+                    
                 
             
             big_pauser.Pause()
@@ -1124,29 +1308,62 @@ class ClientFilesManager( object ):
         return path
         
     
-    def GetThumbnailPath( self, media ):
+    def GetThumbnailBytes( self, media ):
         
         hash = media.GetHash()
         mime = media.GetMime()
         
         if HG.file_report_mode:
             
-            HydrusData.ShowText( 'Thumbnail path request: ' + str( ( hash, mime ) ) )
+            HydrusData.ShowText( 'Thumbnail request: ' + str( ( hash, mime ) ) )
             
         
         with self._rwlock.read:
             
-            path = self._GenerateExpectedThumbnailPath( hash )
-            
-            thumb_missing = not os.path.exists( path )
+            try:
+                
+                return self._GetThumbnailBytes( hash )
+                
+            except HydrusExceptions.FileMissingException:
+                
+                pass
+                
             
         
-        if thumb_missing:
+        self.RegenerateThumbnail( media )
+        
+        with self._rwlock.read:
             
-            self.RegenerateThumbnail( media )
+            return self._GetThumbnailBytes( hash )
             
         
-        return path
+    
+    def GetThumbnailLastModified( self, hash ):
+        
+        # a pack is only ever appended to or rewritten, so its modified time is never older than any thumbnail in it
+        
+        with self._rwlock.read:
+            
+            thumbnail_pack = self._GetThumbnailPack( hash )
+            
+            if thumbnail_pack.HasThumbnail( hash ):
+                
+                path = thumbnail_pack.GetPath()
+                
+            else:
+                
+                path = self._GenerateExpectedThumbnailPath( hash )
+                
+            
+            try:
+                
+                return int( os.path.getmtime( path ) )
+                
+            except OSError:
+                
+                return None
+                
+            
         
     
     def LocklessHasThumbnail( self, hash ):
@@ -1158,7 +1375,148 @@ class ClientFilesManager( object ):
             HydrusData.ShowText( 'Thumbnail path test: ' + path )
             
         
-        return os.path.exists( path )
+        return os.path.exists( path ) or self._GetThumbnailPack( hash ).HasThumbnail( hash )
+        
+    
+    def MigrateThumbnailStorage( self, use_packs, job_key ):
+        
+        # new thumbnails go to the new storage straight away, and reads check both, so the client stays usable throughout
+        
+        self._controller.new_options.SetBoolean( 'thumbnail_pack_storage', use_packs )
+        
+        num_moved = 0
+        
+        try:
+            
+            thumbnail_prefixes = sorted( prefix for prefix in self._prefixes_to_locations.keys() if prefix.startswith( 't' ) )
+            
+            for ( i, prefix ) in enumerate( thumbnail_prefixes ):
+                
+                ( i_paused, should_quit ) = job_key.WaitIfNeeded()
+                
+                if should_quit:
+                    
+                    return
+                    
+                
+                job_key.SetVariable( 'popup_text_1', 'migrating thumbnails: ' + HydrusData.ConvertValueRangeToPrettyString( i + 1, len( thumbnail_prefixes ) ) )
+                job_key.SetVariable( 'popup_gauge_1', ( i, len( thumbnail_prefixes ) ) )
+                
+                # we only hold the write lock for a batch at a time, so thumbnail reads and imports can carry on in between
+                # each batch looks again at what is left, so anything added or deleted meanwhile is fine
+                
+                prefix_done = False
+                
+                while not prefix_done:
+                    
+                    ( i_paused, should_quit ) = job_key.WaitIfNeeded()
+                    
+                    if should_quit:
+                        
+                        return
+                        
+                    
+                    with self._rwlock.write:
+                        
+                        location = self._prefixes_to_locations[ prefix ]
+                        
+                        dir = os.path.join( location, prefix )
+                        
+                        thumbnail_pack = self._GetThumbnailPackForPrefix( prefix )
+                        
+                        if use_packs:
+                            
+                            rows = []
+                            paths = []
+                            
+                            for filename in os.listdir( dir ):
+                                
+                                if not filename.endswith( '.thumbnail' ):
+                                    
+                                    continue
+                                    
+                                
+                                try:
+                                    
+                                    hash = bytes.fromhex( filename[:-len( '.thumbnail' )] )
+                                    
+                                except ValueError:
+                                    
+                                    continue
+                                    
+                                
+                                path = os.path.join( dir, filename )
+                                
+                                with open( path, 'rb' ) as f:
+                                    
+                                    thumbnail_bytes = f.read()
+                                    
+                                
+                                rows.append( ( hash, thumbnail_bytes ) )
+                                paths.append( path )
+                                
+                                if len( rows ) == THUMBNAIL_MIGRATION_BATCH_SIZE:
+                                    
+                                    break
+                                    
+                                
+                            
+                            if len( rows ) > 0:
+                                
+                                # the pack is synced to disk before we delete anything
+                                
+                                thumbnail_pack.AddThumbnails( rows, sync = True )
+                                
+                                for path in paths:
+                                    
+                                    HydrusPaths.DeletePath( path )
+                                    
+                                
+                                num_moved += len( rows )
+                                
+                            
+                            prefix_done = len( rows ) < THUMBNAIL_MIGRATION_BATCH_SIZE
+                            
+                        else:
+                            
+                            hashes = thumbnail_pack.GetHashes()[ : THUMBNAIL_MIGRATION_BATCH_SIZE ]
+                            
+                            for hash in hashes:
+                                
+                                path = os.path.join( dir, hash.hex() + '.thumbnail' )
+                                
+                                with open( path, 'wb' ) as f:
+                                    
+                                    f.write( thumbnail_pack.GetThumbnailBytes( hash ) )
+                                    
+                                
+                            
+                            num_moved += len( hashes )
+                            
+                            prefix_done = len( hashes ) < THUMBNAIL_MIGRATION_BATCH_SIZE
+                            
+                            if prefix_done:
+                                
+                                thumbnail_pack.Delete()
+                                
+                            else:
+                                
+                                thumbnail_pack.DeleteThumbnails( hashes )
+                                
+                            
+                        
+                    
+                
+            
+        finally:
+            
+            job_key.SetVariable( 'popup_text_1', 'done! ' + HydrusData.ToHumanInt( num_moved ) + ' thumbnails migrated' )
+            job_key.DeleteVariable( 'popup_gauge_1' )
+            
+            HydrusData.Print( job_key.ToString() )
+            
+            job_key.Finish()
+            
         
     
     def Rebalance( self, job_key ):
@@ -1191,6 +1549,9 @@ class ClientFilesManager( object ):
                     
                     job_key.SetVariable( 'popup_text_1', text )
                     
+                    # packs are mmapped, which stops them being moved on some platforms
+                    self._CloseThumbnailPacks()
+                    
                     # these two lines can cause a deadlock because the db sometimes calls stuff in here.
                     self._controller.Write( 'relocate_client_files', prefix, overweight_location, underweight_location )
                     
@@ -1219,6 +1580,8 @@ class ClientFilesManager( object ):
                     recoverable_path = os.path.join( recoverable_location, prefix )
                     correct_path = os.path.join( correct_location, prefix )
                     
+                    self._CloseThumbnailPacks()
+                    
                     HydrusPaths.MergeTree( recoverable_path, correct_path )
                     
                     recover_tuple = self._GetRecoverTuple()
@@ -1287,9 +1650,12 @@ class ClientFilesManager( object ):
             
             ( media_width, media_height ) = media.GetResolution()
             
-            path = self._GenerateExpectedThumbnailPath( hash )
+            with self._rwlock.read:
+                
+                thumbnail_bytes = self._GetThumbnailBytes( hash )
+                
             
-            numpy_image = ClientImageHandling.GenerateNumPyImage( path, mime )
+            numpy_image = ClientImageHandling.GenerateNumPyImageFromBytes( thumbnail_bytes, mime )
             
             ( current_width, current_height ) = HydrusImageHandling.GetResolutionNumPy( numpy_image )
             
@@ -2176,3 +2542,368 @@ class FilesMaintenanceManager( object ):
         
         self._controller.CallToThreadLongRunning( self.MainLoopBackgroundWork )
         
+    
+class ThumbnailPack( object ):
+    
+    # an append-only file of ( hash, length, thumbnail_bytes ) records for one thumbnail prefix
+    # a length of THUMBNAIL_PACK_TOMBSTONE_LENGTH marks a deletion, and a later record for the same hash replaces an earlier one
+    # the hash -> span index is rebuilt by walking the record headers when the pack is first touched
+    
+    def __init__( self, path ):
+        
+        self._path = path
+        
+        self._lock = threading.Lock()
+        
+        self._loaded = False
+        
+        self._hashes_to_spans = {}
+        self._file_size = 0
+        self._dead_bytes = 0
+        
+        self._mmap = None
+        
+    
+    def _AppendRecords( self, rows, sync = False ):
+        
+        self._LoadIndex()
+        
+        header_size = THUMBNAIL_PACK_RECORD_HEADER.size
+        
+        offset = self._file_size
+        
+        with open( self._path, 'ab' ) as f:
+            
+            for ( hash, thumbnail_bytes ) in rows:
+                
+                if thumbnail_bytes is None:
+                    
+                    if hash not in self._hashes_to_spans:
+                        
+                        continue
+                        
+                    
+                    f.write( THUMBNAIL_PACK_RECORD_HEADER.pack( hash, THUMBNAIL_PACK_TOMBSTONE_LENGTH ) )
+                    
+                    ( old_offset, old_length ) = self._hashes_to_spans.pop( hash )
+                    
+                    self._dead_bytes += header_size + old_length + header_size
+                    
+                    offset += header_size
+                    
+                else:
+                    
+                    length = len( thumbnail_bytes )
+                    
+                    f.write( THUMBNAIL_PACK_RECORD_HEADER.pack( hash, length ) )
+                    f.write( thumbnail_bytes )
+                    
+                    if hash in self._hashes_to_spans:
+                        
+                        ( old_offset, old_length ) = self._hashes_to_spans[ hash ]
+                        
+                        self._dead_bytes += header_size + old_length
+                        
+                    
+                    self._hashes_to_spans[ hash ] = ( offset + header_size, length )
+                    
+                    offset += header_size + length
+                    
+                
+            
+            if sync:
+                
+                f.flush()
+                
+                os.fsync( f.fileno() )
+                
+            
+        
+        self._file_size = offset
+        
+    
+    def _CloseMMap( self ):
+        
+        if self._mmap is not None:
+            
+            self._mmap.close()
+            
+            self._mmap = None
+            
+        
+    
+    def _GetMMap( self ):
+        
+        if self._mmap is not None and len( self._mmap ) < self._file_size:
+            
+            # the pack has grown since we mapped it
+            
+            self._CloseMMap()
+            
+        
+        if self._mmap is None:
+            
+            with open( self._path, 'rb' ) as f:
+                
+                self._mmap = mmap.mmap( f.fileno(), 0, access = mmap.ACCESS_READ )
+                
+            
+        
+        return self._mmap
+        
+    
+    def _LoadIndex( self ):
+        
+        if self._loaded:
+            
+            return
+            
+        
+        self._hashes_to_spans = {}
+        self._file_size = 0
+        self._dead_bytes = 0
+        
+        header_size = THUMBNAIL_PACK_RECORD_HEADER.size
+        
+        if os.path.exists( self._path ):
+            
+            good_size = 0
+            
+            with open( self._path, 'rb' ) as f:
+                
+                actual_size = os.fstat( f.fileno() ).st_size
+                
+                while True:
+                    
+                    header = f.read( header_size )
+                    
+                    if len( header ) < header_size:
+                        
+                        break
+                        
+                    
+                    ( hash, length ) = THUMBNAIL_PACK_RECORD_HEADER.unpack( header )
+                    
+                    if length == THUMBNAIL_PACK_TOMBSTONE_LENGTH:
+                        
+                        if hash in self._hashes_to_spans:
+                            
+                            ( old_offset, old_length ) = self._hashes_to_spans.pop( hash )
+                            
+                            self._dead_bytes += header_size + old_length
+                            
+                        
+                        self._dead_bytes += header_size
+                        
+                        good_size += header_size
+                        
+                        continue
+                        
+                    
+                    data_offset = good_size + header_size
+                    
+                    if data_offset + length > actual_size:
+                        
+                        break
+                        
+                    
+                    if hash in self._hashes_to_spans:
+                        
+                        ( old_offset, old_length ) = self._hashes_to_spans[ hash ]
+                        
+                        self._dead_bytes += header_size + old_length
+                        
+                    
+                    self._hashes_to_spans[ hash ] = ( data_offset, length )
+                    
+                    good_size = data_offset + length
+                    
+                    f.seek( good_size )
+                    
+                
+            
+            if good_size < actual_size:
+                
+                # a record was only partly written, probably due to a crash, so we lop it off
+                
+                HydrusData.Print( 'The thumbnail pack {} had a truncated record at its end. {} were discarded.'.format( self._path, HydrusData.ToHumanBytes( actual_size - good_size ) ) )
+                
+                self._CloseMMap()
+                
+                with open( self._path, 'r+b' ) as f:
+                    
+                    f.truncate( good_size )
+                    
+                
+            
+            self._file_size = good_size
+            
+        
+        self._loaded = True
+        
+    
+    def AddThumbnails( self, rows, sync = False ):
+        
+        with self._lock:
+            
+            try:
+                
+                self._AppendRecords( rows, sync = sync )
+                
+            except:
+                
+                # we don't know how much got written, so rescan next time
+                
+                self._loaded = False
+                
+                raise
+                
+            
+        
+    
+    def Close( self ):
+        
+        with self._lock:
+            
+            self._CloseMMap()
+            
+            self._loaded = False
+            
+        
+    
+    def Compact( self ):
+        
+        with self._lock:
+            
+            self._LoadIndex()
+            
+            if self._dead_bytes == 0:
+                
+                return
+                
+            
+            if len( self._hashes_to_spans ) == 0:
+                
+                self._CloseMMap()
+                
+                HydrusPaths.DeletePath( self._path )
+                
+                self._loaded = False
+                
+                return
+                
+            
+            header_size = THUMBNAIL_PACK_RECORD_HEADER.size
+            
+            temp_path = self._path + '.compacting'
+            
+            mm = self._GetMMap()
+            
+            new_hashes_to_spans = {}
+            offset = 0
+            
+            # keeping the old order keeps thumbnails that were added together near each other
+            
+            spans_and_hashes = sorted( ( span, hash ) for ( hash, span ) in self._hashes_to_spans.items() )
+            
+            with open( temp_path, 'wb' ) as f:
+                
+                for ( ( old_offset, length ), hash ) in spans_and_hashes:
+                    
+                    f.write( THUMBNAIL_PACK_RECORD_HEADER.pack( hash, length ) )
+                    f.write( mm[ old_offset : old_offset + length ] )
+                    
+                    new_hashes_to_spans[ hash ] = ( offset + header_size, length )
+                    
+                    offset += header_size + length
+                    
+                
+                f.flush()
+                
+                os.fsync( f.fileno() )
+                
+            
+            self._CloseMMap()
+            
+            os.replace( temp_path, self._path )
+            
+            self._hashes_to_spans = new_hashes_to_spans
+            self._file_size = offset
+            self._dead_bytes = 0
+            
+        
+    
+    def Delete( self ):
+        
+        with self._lock:
+            
+            self._CloseMMap()
+            
+            if os.path.exists( self._path ):
+                
+                HydrusPaths.DeletePath( self._path )
+                
+            
+            self._loaded = False
+            
+        
+    
+    def DeleteThumbnails( self, hashes ):
+        
+        self.AddThumbnails( [ ( hash, None ) for hash in hashes ] )
+        
+    
+    def GetHashes( self ):
+        
+        with self._lock:
+            
+            self._LoadIndex()
+            
+            return list( self._hashes_to_spans.keys() )
+            
+        
+    
+    def GetPath( self ):
+        
+        return self._path
+        
+    
+    def GetThumbnailBytes( self, hash ):
+        
+        with self._lock:
+            
+            self._LoadIndex()
+            
+            if hash not in self._hashes_to_spans:
+                
+                raise HydrusExceptions.FileMissingException( 'The thumbnail for file "{}" is not in the pack "{}"!'.format( hash.hex(), self._path ) )
+                
+            
+            ( offset, length ) = self._hashes_to_spans[ hash ]
+            
+            mm = self._GetMMap()
+            
+            return mm[ offset : offset + length ]
+            
+        
+    
+    def HasThumbnail( self, hash ):
+        
+        with self._lock:
+            
+            self._LoadIndex()
+            
+            return hash in self._hashes_to_spans
+            
+        
+    
+    def NeedsCompaction( self ):
+        
+        with self._lock:
+            
+            self._LoadIndex()
+            
+            return self._dead_bytes > 0 and self._dead_bytes >= self._file_size * THUMBNAIL_PACK_COMPACTION_DEAD_RATIO
+            
+        
+    
@@ -613,11 +613,11 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
             
             stop_time = HydrusData.GetNow() + 120
             
-            self._controller.Write( 'analyze', maintenance_mode = HC.MAINTENANCE_FORCED, stop_time = stop_time )
+            self._controller.WriteUserRequested( 'analyze', maintenance_mode = HC.MAINTENANCE_FORCED, stop_time = stop_time )
             
         elif result == QW.QDialog.Rejected:
             
-            self._controller.Write( 'analyze', maintenance_mode = HC.MAINTENANCE_FORCED, force_reanalyze = True )
+            self._controller.WriteUserRequested( 'analyze', maintenance_mode = HC.MAINTENANCE_FORCED, force_reanalyze = True )
             
         
     
@@ -1076,6 +1076,31 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
             
         
     
+    def _CompactThumbnailPacks( self ):
+        
+        def do_it():
+            
+            job_key = ClientThreading.JobKey( cancellable = True )
+            
+            job_key.SetVariable( 'popup_title', 'compacting thumbnail packs' )
+            
+            self._controller.pub( 'message', job_key )
+            
+            try:
+                
+                num_compacted = self._controller.client_files_manager.CompactThumbnailPacks( job_key = job_key )
+                
+                job_key.SetVariable( 'popup_text_1', 'done! ' + HydrusData.ToHumanInt( num_compacted ) + ' packs compacted' )
+                
+            finally:
+                
+                job_key.Finish()
+                
+            
+        
+        self._controller.CallToThread( do_it )
+        
+    
     def _CullFileViewingStats( self ):
         
         text = 'If your file viewing statistics have some erroneous values due to many short views or accidental long views, this routine will cull your current numbers to compensate. For instance:'
@@ -1090,7 +1115,7 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
         
         if result == QW.QDialog.Accepted:
             
-            self._controller.WriteSynchronous( 'cull_file_viewing_statistics' )
+            self._controller.WriteSynchronousUserRequested( 'cull_file_viewing_statistics' )
             
             QW.QMessageBox.information( self, 'Information', 'Cull done! Please restart the client to see the changes in the UI.' )
             
@@ -1477,6 +1502,29 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
         HydrusData.DebugPrint( 'garbage printing finished' )
         
     
+    def _DebugShowImageCacheStats( self ):
+        
+        for ( name, description ) in ( ( 'thumbnail', 'thumbnail cache' ), ( 'images', 'image rendering cache' ) ):
+            
+            stats = self._controller.GetCache( name ).GetStats()
+            
+            num_lookups = stats[ 'num_hits' ] + stats[ 'num_misses' ]
+            
+            if num_lookups == 0:
+                
+                hit_rate = 'no lookups yet'
+                
+            else:
+                
+                hit_rate = HydrusData.ConvertFloatToPercentage( stats[ 'num_hits' ] / num_lookups ) + ' hit rate'
+                
+            
+            text = '{}: {} items ({} protected), {}/{}, {} hits, {} misses ({}), {} evictions'.format( description, HydrusData.ToHumanInt( stats[ 'num_items' ] ), HydrusData.ToHumanInt( stats[ 'num_protected_items' ] ), HydrusData.ToHumanBytes( stats[ 'estimated_memory_footprint' ] ), HydrusData.ToHumanBytes( stats[ 'cache_size' ] ), HydrusData.ToHumanInt( stats[ 'num_hits' ] ), HydrusData.ToHumanInt( stats[ 'num_misses' ] ), hit_rate, HydrusData.ToHumanInt( stats[ 'num_evictions' ] ) )
+            
+            HydrusData.ShowText( text )
+            
+        
+    
     def _DebugShowScheduledJobs( self ):
         
         self._controller.DebugShowScheduledJobs()
@@ -2725,6 +2773,34 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
         self._menu_updater.Update()
         
     
+    def _MigrateThumbnailStorage( self, use_packs ):
+        
+        if use_packs:
+            
+            text = 'This will move all your thumbnails out of their individual files and into one pack file per thumbnail folder. With a great many thumbnails, this is kinder to your filesystem and backups and faster to load on an HDD.'
+            
+        else:
+            
+            text = 'This will move all your thumbnails out of their pack files and back to one file per thumbnail.'
+            
+        
+        text += os.linesep * 2
+        text += 'It may take some time. Thumbnails will load slowly while it runs, so it is best to leave the client alone until it is done.'
+        
+        result = ClientGUIDialogsQuick.GetYesNo( self, text, yes_label = 'do it', no_label = 'forget it' )
+        
+        if result == QW.QDialog.Accepted:
+            
+            job_key = ClientThreading.JobKey( cancellable = True )
+            
+            job_key.SetVariable( 'popup_title', 'migrating thumbnail storage' )
+            
+            self._controller.pub( 'message', job_key )
+            
+            self._controller.CallToThread( self._controller.client_files_manager.MigrateThumbnailStorage, use_packs, job_key )
+            
+        
+    
     def _MigrateTags( self ):
         
         default_tag_repository_key = HC.options[ 'default_tag_repository' ]
@@ -2925,6 +3001,7 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
             status_hook = lambda s: job_key.SetVariable( 'popup_text_1', s )
             
             self._controller.Write( 'repopulate_fts_cache', status_hook = status_hook )
+            self._controller.Write( 'repopulate_subtag_trigrams', status_hook = status_hook )
             
             job_key.Delete( 3 )
             
@@ -3598,11 +3675,11 @@ The password is cleartext here but obscured in the entry dialog. Enter a blank p
         
         if result == QW.QDialog.Accepted:
             
-            self._controller.Write( 'vacuum', maintenance_mode = HC.MAINTENANCE_FORCED )
+            self._controller.WriteUserRequested( 'vacuum', maintenance_mode = HC.MAINTENANCE_FORCED )
             
         elif result == QW.QDialog.Rejected:
             
-            self._controller.Write( 'vacuum', maintenance_mode = HC.MAINTENANCE_FORCED, force_vacuum = True )
+            self._controller.WriteUserRequested( 'vacuum', maintenance_mode = HC.MAINTENANCE_FORCED, force_vacuum = True )
             
         
     
@@ -4049,6 +4126,20 @@ The password is cleartext here but obscured in the entry dialog. Enter a blank p
             ClientGUIMenus.AppendMenuItem( submenu, 'clear orphan files', 'Clear out surplus files that have found their way into the file structure.', self._ClearOrphanFiles )
             ClientGUIMenus.AppendMenuItem( submenu, 'clear orphan file records', 'Clear out surplus file records that have not been deleted correctly.', self._ClearOrphanFileRecords )
             
+            thumbnail_storage_menu = QW.QMenu( submenu )
+            
+            if self._controller.new_options.GetBoolean( 'thumbnail_pack_storage' ):
+                
+                ClientGUIMenus.AppendMenuItem( thumbnail_storage_menu, 'compact thumbnail packs', 'Rewrite thumbnail pack files that have a lot of space taken up by deleted or replaced thumbnails.', self._CompactThumbnailPacks )
+                ClientGUIMenus.AppendMenuItem( thumbnail_storage_menu, 'move thumbnails back to individual files', 'Unpack all your thumbnails to one file each.', self._MigrateThumbnailStorage, False )
+                
+            else:
+                
+                ClientGUIMenus.AppendMenuItem( thumbnail_storage_menu, 'move thumbnails to pack files', 'Store your thumbnails in one pack file per thumbnail folder rather than one file each.', self._MigrateThumbnailStorage, True )
+                
+            
+            ClientGUIMenus.AppendMenu( submenu, thumbnail_storage_menu, 'thumbnail storage' )
+            
             if self._controller.new_options.GetBoolean( 'advanced_mode' ):
                 
                 ClientGUIMenus.AppendMenuItem( submenu, 'clear orphan tables', 'Clear out surplus db tables that have not been deleted correctly.', self._ClearOrphanTables )
@@ -4427,6 +4518,7 @@ The password is cleartext here but obscured in the entry dialog. Enter a blank p
             ClientGUIMenus.AppendMenuItem( data_actions, 'run slow memory maintenance', 'Tell all the slow caches to maintain themselves.', self._controller.MaintainMemorySlow )
             ClientGUIMenus.AppendMenuItem( data_actions, 'review threads', 'Show current threads and what they are doing.', self._ReviewThreads )
             ClientGUIMenus.AppendMenuItem( data_actions, 'show scheduled jobs', 'Print some information about the currently scheduled jobs log.', self._DebugShowScheduledJobs )
+            ClientGUIMenus.AppendMenuItem( data_actions, 'show image cache stats', 'Show how full the thumbnail and image rendering caches are and how often they are hit.', self._DebugShowImageCacheStats )
             ClientGUIMenus.AppendMenuItem( data_actions, 'subscription manager snapshot', 'Have the subscription system show what it is doing.', self._controller.subscriptions_manager.ShowSnapshot )
             ClientGUIMenus.AppendMenuItem( data_actions, 'flush log', 'Command the log to write any buffered contents to hard drive.', HydrusData.DebugPrint, 'Flushing log' )
             ClientGUIMenus.AppendMenuItem( data_actions, 'print garbage', 'Print some information about the python garbage to the log.', self._DebugPrintGarbage )
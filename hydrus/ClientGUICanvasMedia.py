@@ -1469,9 +1469,9 @@ class EmbedButton( QW.QWidget ):
             
             mime = self._media.GetMime()
             
-            thumbnail_path = HG.client_controller.client_files_manager.GetThumbnailPath( self._media )
+            thumbnail_bytes = HG.client_controller.client_files_manager.GetThumbnailBytes( self._media )
             
-            self._thumbnail_qt_pixmap = ClientRendering.GenerateHydrusBitmap( thumbnail_path, mime ).GetQtPixmap()
+            self._thumbnail_qt_pixmap = ClientRendering.GenerateHydrusBitmapFromBytes( thumbnail_bytes, mime ).GetQtPixmap()
             
             self.update()
             
@@ -1497,9 +1497,9 @@ class OpenExternallyPanel( QW.QWidget ):
             
             mime = self._media.GetMime()
             
-            thumbnail_path = HG.client_controller.client_files_manager.GetThumbnailPath( self._media )
+            thumbnail_bytes = HG.client_controller.client_files_manager.GetThumbnailBytes( self._media )
             
-            qt_pixmap = ClientRendering.GenerateHydrusBitmap( thumbnail_path, mime ).GetQtPixmap()
+            qt_pixmap = ClientRendering.GenerateHydrusBitmapFromBytes( thumbnail_bytes, mime ).GetQtPixmap()
             
             thumbnail_window = ClientGUICommon.BufferedWindowIcon( self, qt_pixmap )
             
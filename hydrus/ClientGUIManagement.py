@@ -938,6 +938,10 @@ class ManagementPanelDuplicateFilter( ManagementPanel ):
         
         menu_items.append( ( 'check', 'search for duplicate pairs at the current distance during normal db maintenance', 'Tell the client to find duplicate pairs in its normal db maintenance cycles, whether you have that set to idle or shutdown time.', check_manager ) )
         
+        check_manager = ClientGUICommon.CheckboxManagerOptions( 'use_in_memory_similar_files_index' )
+        
+        menu_items.append( ( 'check', 'keep the similar files search index in memory', 'Tell the client to hold all the similar file search data in memory for much faster searches. This costs about 16 bytes per file.', check_manager ) )
+        
         self._cog_button = ClientGUICommon.MenuBitmapButton( self._main_left_panel, CC.global_pixmaps().cog, menu_items )
         
         menu_items = []
@@ -1269,7 +1273,7 @@ class ManagementPanelDuplicateFilter( ManagementPanel ):
         
         search_distance = self._search_distance_spinctrl.value()
         
-        self._controller.Write( 'maintain_similar_files_search_for_potential_duplicates', search_distance, job_key = job_key )
+        self._controller.WriteUserRequested( 'maintain_similar_files_search_for_potential_duplicates', search_distance, job_key = job_key )
         
         self._controller.pub( 'modal_message', job_key )
         
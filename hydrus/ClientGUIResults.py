@@ -4044,6 +4044,8 @@ class MediaPanelThumbnails( MediaPanel ):
                 media.UpdateFileInfo( hashes_to_media_results )
                 
             
+            self._ClearSortColumns()
+            
             self._RedrawMedia( affected_media )
             
         
@@ -4065,10 +4067,7 @@ class MediaPanelThumbnails( MediaPanel ):
         
         self._DirtyAllPages()
         
-        for m in self._collected_media:
-            
-            m.RecalcInternals()
-            
+        self.NewTagPresentation()
         
         self.widget().update()
         
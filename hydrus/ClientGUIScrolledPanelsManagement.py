@@ -2975,6 +2975,15 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             #
             
+            local_imports = ClientGUICommon.StaticBox( self, 'local file imports' )
+            
+            self._num_parallel_file_import_workers = QP.MakeQSpinBox( local_imports, min = 1, max = 64 )
+            self._num_parallel_file_import_workers.setToolTip( 'Local file imports and import folders will hash, parse and thumbnail this many files at once. The database still adds them one at a time. If your files are on a slow HDD, you may want to set this low.' )
+            
+            self._num_parallel_file_import_workers.setValue( self._new_options.GetInteger( 'num_parallel_file_import_workers' ) )
+            
+            #
+            
             rows = []
             
             rows.append( ( 'For \'quiet\' import contexts like import folders and subscriptions:', self._quiet_fios ) )
@@ -2984,11 +2993,20 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             default_fios.Add( gridbox, CC.FLAGS_EXPAND_SIZER_PERPENDICULAR )
             
+            rows = []
+            
+            rows.append( ( 'Number of files to process in parallel: ', self._num_parallel_file_import_workers ) )
+            
+            gridbox = ClientGUICommon.WrapInGrid( local_imports, rows )
+            
+            local_imports.Add( gridbox, CC.FLAGS_EXPAND_SIZER_PERPENDICULAR )
+            
             #
             
             vbox = QP.VBoxLayout()
             
             QP.AddToLayout( vbox, default_fios, CC.FLAGS_EXPAND_PERPENDICULAR )
+            QP.AddToLayout( vbox, local_imports, CC.FLAGS_EXPAND_PERPENDICULAR )
             QP.AddToLayout( vbox, QW.QWidget( self ), CC.FLAGS_EXPAND_BOTH_WAYS )
             
             self.setLayout( vbox )
@@ -2999,6 +3017,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._new_options.SetDefaultFileImportOptions( 'quiet', self._quiet_fios.GetValue() )
             self._new_options.SetDefaultFileImportOptions( 'loud', self._loud_fios.GetValue() )
             
+            self._new_options.SetInteger( 'num_parallel_file_import_workers', self._num_parallel_file_import_workers.value() )
+            
         
     
     class _MaintenanceAndProcessingPanel( QW.QWidget ):
@@ -4402,6 +4402,8 @@ class ReviewThreads( ClientGUIScrolledPanels.ReviewPanel ):
         
         ClientGUIScrolledPanels.ReviewPanel.__init__( self, parent )
         
+        self._call_to_thread_stats_st = ClientGUICommon.BetterStaticText( self )
+        
         self._list_ctrl_panel = ClientGUIListCtrl.BetterListCtrlPanel( self )
         
         columns = [ ( 'name', 24 ), ( 'type', 20 ), ( 'current job', -1 ) ]
@@ -4424,6 +4426,7 @@ class ReviewThreads( ClientGUIScrolledPanels.ReviewPanel ):
         
         vbox = QP.VBoxLayout()
         
+        QP.AddToLayout( vbox, self._call_to_thread_stats_st, CC.FLAGS_EXPAND_PERPENDICULAR )
         QP.AddToLayout( vbox, self._list_ctrl_panel, CC.FLAGS_EXPAND_BOTH_WAYS )
         
         self.widget().setLayout( vbox )
@@ -4451,4 +4454,15 @@ class ReviewThreads( ClientGUIScrolledPanels.ReviewPanel ):
         
         self._list_ctrl.SetData( threads )
         
+        stats_texts = []
+        
+        for ( name, stats ) in zip( ( 'call to thread', 'long running' ), self._controller.GetCallToThreadStats() ):
+            
+            stats_text = '{}: {}/{} threads busy, {} jobs waiting, recent wait {} average, {} max'.format( name, HydrusData.ToHumanInt( stats[ 'num_busy_threads' ] ), HydrusData.ToHumanInt( stats[ 'num_threads' ] ), HydrusData.ToHumanInt( stats[ 'queue_depth' ] ), HydrusData.TimeDeltaToPrettyTimeDelta( stats[ 'mean_wait' ] ), HydrusData.TimeDeltaToPrettyTimeDelta( stats[ 'max_wait' ] ) )
+            
+            stats_texts.append( stats_text )
+            
+        
+        self._call_to_thread_stats_st.setText( os.linesep.join( stats_texts ) )
+        
     
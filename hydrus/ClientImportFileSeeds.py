@@ -174,6 +174,7 @@ class FileImportJob( object ):
         self._hash = None
         self._pre_import_status = None
         
+        self._file_header = None
         self._file_info = None
         self._thumbnail_bytes = None
         self._phashes = None
@@ -253,7 +254,9 @@ class FileImportJob( object ):
         
         HydrusImageHandling.ConvertToPngIfBmp( self._temp_path )
         
-        self._hash = HydrusFileHandling.GetHashFromPath( self._temp_path )
+        # we get all the hashes and the mime header in one read of the file here, rather than going back to the disk for each
+        
+        ( self._hash, self._extra_hashes, self._file_header ) = HydrusFileHandling.GetHashesAndHeaderFromPath( self._temp_path )
         
         if HG.file_import_report_mode:
             
@@ -272,7 +275,7 @@ class FileImportJob( object ):
     
     def GenerateInfo( self ):
         
-        mime = HydrusFileHandling.GetMime( self._temp_path )
+        mime = HydrusFileHandling.GetMime( self._temp_path, header = self._file_header )
         
         if HG.file_import_report_mode:
             
@@ -339,12 +342,15 @@ class FileImportJob( object ):
                 
             
         
-        if HG.file_import_report_mode:
+        if self._extra_hashes is None:
             
-            HydrusData.ShowText( 'File import job generating other hashes' )
+            if HG.file_import_report_mode:
+                
+                HydrusData.ShowText( 'File import job generating other hashes' )
+                
+            
+            self._extra_hashes = HydrusFileHandling.GetExtraHashesFromPath( self._temp_path )
             
-        
-        self._extra_hashes = HydrusFileHandling.GetExtraHashesFromPath( self._temp_path )
         
         self._file_modified_timestamp = HydrusFileHandling.GetFileModifiedTimestamp( self._temp_path )
         
@@ -2124,6 +2130,29 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         return None
         
     
+    def GetNextFileSeeds( self, status, num_file_seeds ):
+        
+        file_seeds = []
+        
+        with self._lock:
+            
+            for file_seed in self._file_seeds:
+                
+                if file_seed.status == status:
+                    
+                    file_seeds.append( file_seed )
+                    
+                    if len( file_seeds ) >= num_file_seeds:
+                        
+                        break
+                        
+                    
+                
+            
+        
+        return file_seeds
+        
+    
     def GetNumNewFilesSince( self, since ):
         
         num_files = 0
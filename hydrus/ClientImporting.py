@@ -107,6 +107,56 @@ def GetRepeatingJobInitialDelay():
     
     return 0.5 + ( random.random() * 0.5 )
     
+def ImportPathFileSeeds( file_seeds, file_seed_cache, file_import_options, limited_mimes = None, status_hook = None ):
+    
+    # hashing, ffmpeg probing, thumbnail and phash generation are all outside the db and mostly release the GIL, so we spread them over several threads
+    # the db only has the one writer, so the final 'import_file' writes still queue up and happen one at a time
+    
+    if len( file_seeds ) == 1:
+        
+        ( file_seed, ) = file_seeds
+        
+        file_seed.ImportPath( file_seed_cache, file_import_options, limited_mimes = limited_mimes, status_hook = status_hook )
+        
+        return
+        
+    
+    done_events = []
+    
+    def do_it( file_seed, done_event ):
+        
+        try:
+            
+            file_seed.ImportPath( file_seed_cache, file_import_options, limited_mimes = limited_mimes, status_hook = status_hook )
+            
+        finally:
+            
+            done_event.set()
+            
+        
+    
+    for file_seed in file_seeds:
+        
+        done_event = threading.Event()
+        
+        HG.client_controller.CallToThread( do_it, file_seed, done_event )
+        
+        done_events.append( done_event )
+        
+    
+    for done_event in done_events:
+        
+        while not done_event.wait( 1.0 ):
+            
+            # the workers will finish or fail on their own, but we should not hold up our own thread's shutdown for them
+            
+            if HydrusThreading.IsThreadShuttingDown():
+                
+                return
+                
+            
+        
+    
 def PageImporterShouldStopWorking( page_key ):
     
     return HG.view_shutdown or not HG.client_controller.PageAlive( page_key )
@@ -1,3 +1,4 @@
+import base64
 import collections
 from . import ClientAPI
 from . import ClientConstants as CC
@@ -17,8 +18,10 @@ from . import HydrusTags
 import http.cookiejar
 import json
 import os
+import sys
 import time
 import traceback
+import zlib
 from twisted.web.static import File as FileResource
 
 local_booru_css = FileResource( os.path.join( HC.STATIC_DIR, 'local_booru_style.css' ), defaultType = 'text/css' )
@@ -29,12 +32,20 @@ LOCAL_BOORU_STRING_PARAMS = set()
 LOCAL_BOORU_JSON_PARAMS = set()
 LOCAL_BOORU_JSON_BYTE_LIST_PARAMS = set()
 
-CLIENT_API_INT_PARAMS = { 'file_id' }
-CLIENT_API_BYTE_PARAMS = { 'hash', 'destination_page_key', 'page_key', 'Hydrus-Client-API-Access-Key', 'Hydrus-Client-API-Session-Key' }
-CLIENT_API_STRING_PARAMS = { 'name', 'url', 'domain' }
-CLIENT_API_JSON_PARAMS = { 'basic_permissions', 'system_inbox', 'system_archive', 'tags', 'file_ids', 'only_return_identifiers', 'simple' }
+CLIENT_API_INT_PARAMS = { 'file_id', 'offset', 'limit' }
+CLIENT_API_BYTE_PARAMS = { 'hash', 'destination_page_key', 'page_key', 'search_cursor', 'Hydrus-Client-API-Access-Key', 'Hydrus-Client-API-Session-Key' }
+CLIENT_API_STRING_PARAMS = { 'name', 'url', 'domain', 'file_id_encoding' }
+CLIENT_API_JSON_PARAMS = { 'basic_permissions', 'system_inbox', 'system_archive', 'tags', 'file_ids', 'only_return_identifiers', 'simple', 'stream' }
 CLIENT_API_JSON_BYTE_LIST_PARAMS = { 'hashes' }
 
+METADATA_STREAM_BATCH_SIZE = 256
+
+def GetThumbnailETag( hash, thumbnail_bytes ):
+    
+    # thumbnails get regenerated when the user changes their thumbnail size, so the hash alone is not enough
+    
+    return '{}-{:08x}'.format( hash.hex(), zlib.crc32( thumbnail_bytes ) )
+    
 def ParseLocalBooruGETArgs( requests_args ):
     
     args = HydrusNetworking.ParseTwistedRequestGETArgs( requests_args, LOCAL_BOORU_INT_PARAMS, LOCAL_BOORU_BYTE_PARAMS, LOCAL_BOORU_STRING_PARAMS, LOCAL_BOORU_JSON_PARAMS, LOCAL_BOORU_JSON_BYTE_LIST_PARAMS )
@@ -273,7 +284,7 @@ class HydrusResourceBooruFile( HydrusResourceBooru ):
         
         path = client_files_manager.GetFilePath( hash, mime )
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, path = path )
+        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, path = path, etag = hash.hex() )
         
         return response_context
         
@@ -466,17 +477,21 @@ class HydrusResourceBooruThumbnail( HydrusResourceBooru ):
         
         mime = media_result.GetMime()
         
-        response_context_mime = HC.IMAGE_PNG
-        
         if mime in HC.MIMES_WITH_THUMBNAILS:
             
             client_files_manager = HG.client_controller.client_files_manager
             
-            path = client_files_manager.GetThumbnailPath( media_result )
+            thumbnail_bytes = client_files_manager.GetThumbnailBytes( media_result )
             
-            response_context_mime = HC.APPLICATION_UNKNOWN
+            etag = GetThumbnailETag( hash, thumbnail_bytes )
+            last_modified = client_files_manager.GetThumbnailLastModified( hash )
             
-        elif mime in HC.AUDIO:
+            response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_UNKNOWN, body = thumbnail_bytes, etag = etag, last_modified = last_modified )
+            
+            return response_context
+            
+        
+        if mime in HC.AUDIO:
             
             path = os.path.join( HC.STATIC_DIR, 'audio.png' )
             
@@ -493,7 +508,7 @@ class HydrusResourceBooruThumbnail( HydrusResourceBooru ):
             path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
             
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = response_context_mime, path = path )
+        response_context = HydrusServerResources.ResponseContext( 200, mime = HC.IMAGE_PNG, path = path )
         
         return response_context
         
@@ -1301,19 +1316,84 @@ class HydrusResourceClientAPIRestrictedGetFilesSearchFiles( HydrusResourceClient
     
     def _threadDoGETJob( self, request ):
         
-        tag_search_context = ClientSearch.TagSearchContext( service_key = CC.COMBINED_TAG_SERVICE_KEY )
-        predicates = ParseClientAPISearchPredicates( request )
+        file_id_encoding = request.parsed_request_args.GetValue( 'file_id_encoding', str, default_value = 'json' )
+        
+        if file_id_encoding not in ( 'json', 'packed' ):
+            
+            raise HydrusExceptions.BadRequestException( 'The file_id_encoding must be "json" or "packed"!' )
+            
+        
+        offset = request.parsed_request_args.GetValue( 'offset', int, default_value = 0 )
+        limit = request.parsed_request_args.GetValue( 'limit', int, default_value = -1 )
+        
+        if offset < 0:
+            
+            raise HydrusExceptions.BadRequestException( 'The offset cannot be negative!' )
+            
+        
+        if limit < 0:
+            
+            limit = None
+            
+        
+        paginated = 'search_cursor' in request.parsed_request_args or 'offset' in request.parsed_request_args or 'limit' in request.parsed_request_args
+        
+        if 'search_cursor' in request.parsed_request_args:
+            
+            # we are paging through an earlier search, so no need to run it again
+            
+            search_cursor = request.parsed_request_args.GetValue( 'search_cursor', bytes )
+            
+            search_results = request.client_api_permissions.GetSearchResults( search_cursor )
+            
+        else:
+            
+            tag_search_context = ClientSearch.TagSearchContext( service_key = CC.COMBINED_TAG_SERVICE_KEY )
+            predicates = ParseClientAPISearchPredicates( request )
+            
+            file_search_context = ClientSearch.FileSearchContext( file_service_key = CC.LOCAL_FILE_SERVICE_KEY, tag_search_context = tag_search_context, predicates = predicates )
+            
+            # newest first
+            sort_by = ClientMedia.MediaSort( sort_type = ( 'system', CC.SORT_FILES_BY_IMPORT_TIME ), sort_asc = CC.SORT_DESC )
+            
+            hash_ids = HG.client_controller.Read( 'file_query_ids', file_search_context, sort_by = sort_by )
+            
+            search_results = ClientAPI.SearchResults( hash_ids )
+            
+            if paginated:
+                
+                search_cursor = request.client_api_permissions.SetSearchResults( search_results )
+                
+            
         
-        file_search_context = ClientSearch.FileSearchContext( file_service_key = CC.LOCAL_FILE_SERVICE_KEY, tag_search_context = tag_search_context, predicates = predicates )
+        request.client_api_permissions.SetLastSearchResults( search_results )
         
-        # newest first
-        sort_by = ClientMedia.MediaSort( sort_type = ( 'system', CC.SORT_FILES_BY_IMPORT_TIME ), sort_asc = CC.SORT_DESC )
+        hash_ids = search_results.GetHashIds( offset = offset, limit = limit )
         
-        hash_ids = HG.client_controller.Read( 'file_query_ids', file_search_context, sort_by = sort_by )
+        if file_id_encoding == 'packed':
+            
+            # little-endian uint32s, base64-encoded
+            
+            if sys.byteorder == 'big':
+                
+                hash_ids.byteswap()
+                
+            
+            file_ids = str( base64.b64encode( hash_ids.tobytes() ), 'ascii' )
+            
+        else:
+            
+            file_ids = hash_ids.tolist()
+            
         
-        request.client_api_permissions.SetLastSearchResults( hash_ids )
+        body_dict = { 'file_ids' : file_ids }
         
-        body_dict = { 'file_ids' : list( hash_ids ) }
+        if paginated:
+            
+            body_dict[ 'search_cursor' ] = search_cursor.hex()
+            body_dict[ 'offset' ] = offset
+            body_dict[ 'num_file_ids' ] = len( search_results )
+            
         
         body = json.dumps( body_dict )
         
@@ -1366,16 +1446,122 @@ class HydrusResourceClientAPIRestrictedGetFilesGetFile( HydrusResourceClientAPIR
             raise HydrusExceptions.NotFoundException( 'Could not find that file!' )
             
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, path = path )
+        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, path = path, etag = hash.hex() )
         
         return response_context
         
     
 class HydrusResourceClientAPIRestrictedGetFilesFileMetadata( HydrusResourceClientAPIRestrictedGetFiles ):
     
+    def _GenerateStreamedMetadata( self, file_ids = None, hashes = None, file_ids_to_hashes = None ):
+        
+        # we fetch and send a batch at a time, so the first line goes out quickly and we never hold the whole lot
+        
+        if file_ids_to_hashes is not None:
+            
+            for chunk in HydrusData.SplitIteratorIntoChunks( file_ids_to_hashes.items(), METADATA_STREAM_BATCH_SIZE ):
+                
+                metadata = [ self._GetIdentifiersMetadataRow( file_id, hash ) for ( file_id, hash ) in chunk ]
+                
+                yield self._MetadataToNDJSONBytes( metadata )
+                
+            
+        else:
+            
+            service_keys_to_names = {}
+            
+            if file_ids is not None:
+                
+                ( action, identifiers ) = ( 'media_results_from_ids', file_ids )
+                
+            else:
+                
+                ( action, identifiers ) = ( 'media_results', hashes )
+                
+            
+            for chunk in HydrusData.SplitListIntoChunks( identifiers, METADATA_STREAM_BATCH_SIZE ):
+                
+                media_results = HG.client_controller.Read( action, chunk )
+                
+                metadata = [ self._GetMediaResultMetadataRow( media_result, service_keys_to_names ) for media_result in media_results ]
+                
+                yield self._MetadataToNDJSONBytes( metadata )
+                
+            
+        
+    
+    def _GetIdentifiersMetadataRow( self, file_id, hash ):
+        
+        metadata_row = {}
+        
+        metadata_row[ 'file_id' ] = file_id
+        metadata_row[ 'hash' ] = hash.hex()
+        
+        return metadata_row
+        
+    
+    def _GetMediaResultMetadataRow( self, media_result, service_keys_to_names ):
+        
+        services_manager = HG.client_controller.services_manager
+        
+        metadata_row = {}
+        
+        file_info_manager = media_result.GetFileInfoManager()
+        
+        metadata_row[ 'file_id' ] = file_info_manager.hash_id
+        metadata_row[ 'hash' ] = file_info_manager.hash.hex()
+        metadata_row[ 'size' ] = file_info_manager.size
+        metadata_row[ 'mime' ] = HC.mime_mimetype_string_lookup[ file_info_manager.mime ]
+        metadata_row[ 'width' ] = file_info_manager.width
+        metadata_row[ 'height' ] = file_info_manager.height
+        metadata_row[ 'duration' ] = file_info_manager.duration
+        metadata_row[ 'num_frames' ] = file_info_manager.num_frames
+        metadata_row[ 'num_words' ] = file_info_manager.num_words
+        metadata_row[ 'has_audio' ] = file_info_manager.has_audio
+        
+        known_urls = list( media_result.GetLocationsManager().GetURLs() )
+        
+        known_urls.sort()
+        
+        metadata_row[ 'known_urls' ] = known_urls
+        
+        tags_manager = media_result.GetTagsManager()
+        
+        service_names_to_statuses_to_tags = {}
+        
+        service_keys_to_statuses_to_tags = tags_manager.GetServiceKeysToStatusesToTags( ClientTags.TAG_DISPLAY_STORAGE )
+        
+        for ( service_key, statuses_to_tags ) in service_keys_to_statuses_to_tags.items():
+            
+            if service_key not in service_keys_to_names:
+                
+                service_keys_to_names[ service_key ] = services_manager.GetName( service_key )
+                
+            
+            service_name = service_keys_to_names[ service_key ]
+            
+            service_names_to_statuses_to_tags[ service_name ] = { str( status ) : list( tags ) for ( status, tags ) in statuses_to_tags.items() }
+            
+        
+        metadata_row[ 'service_names_to_statuses_to_tags' ] = service_names_to_statuses_to_tags
+        
+        return metadata_row
+        
+    
+    def _MetadataToNDJSONBytes( self, metadata ):
+        
+        return bytes( ''.join( json.dumps( metadata_row ) + '\n' for metadata_row in metadata ), 'utf-8' )
+        
+    
     def _threadDoGETJob( self, request ):
         
         only_return_identifiers = request.parsed_request_args.GetValue( 'only_return_identifiers', bool, default_value = False )
+        stream = request.parsed_request_args.GetValue( 'stream', bool, default_value = False )
+        
+        file_ids = None
+        hashes = None
+        file_ids_to_hashes = None
+        media_results = None
         
         try:
             
@@ -1385,7 +1571,9 @@ class HydrusResourceClientAPIRestrictedGetFilesFileMetadata( HydrusResourceClien
                 
                 request.client_api_permissions.CheckPermissionToSeeFiles( file_ids )
                 
-                if only_return_identifiers:
+                if only_return_identifiers or stream:
+                    
+                    # when streaming, this also checks every id exists before we commit to a 200
                     
                     file_ids_to_hashes = HG.client_controller.Read( 'hash_ids_to_hashes', hash_ids = file_ids )
                     
@@ -1404,7 +1592,7 @@ class HydrusResourceClientAPIRestrictedGetFilesFileMetadata( HydrusResourceClien
                     
                     file_ids_to_hashes = HG.client_controller.Read( 'hash_ids_to_hashes', hashes = hashes )
                     
-                else:
+                elif not stream:
                     
                     media_results = HG.client_controller.Read( 'media_results', hashes )
                     
@@ -1419,73 +1607,33 @@ class HydrusResourceClientAPIRestrictedGetFilesFileMetadata( HydrusResourceClien
             raise HydrusExceptions.NotFoundException( 'One or more of those file identifiers was missing!' )
             
         
-        body_dict = {}
-        
-        metadata = []
-        
-        if only_return_identifiers:
+        if stream:
             
-            for ( file_id, hash ) in file_ids_to_hashes.items():
+            if only_return_identifiers:
                 
-                metadata_row = {}
+                body_generator = self._GenerateStreamedMetadata( file_ids_to_hashes = file_ids_to_hashes )
                 
-                metadata_row[ 'file_id' ] = file_id
-                metadata_row[ 'hash' ] = hash.hex()
+            else:
                 
-                metadata.append( metadata_row )
+                body_generator = self._GenerateStreamedMetadata( file_ids = file_ids, hashes = hashes )
                 
             
-        else:
+            response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_NDJSON, body_generator = body_generator )
             
-            services_manager = HG.client_controller.services_manager
+            return response_context
+            
+        
+        body_dict = {}
+        
+        if only_return_identifiers:
+            
+            metadata = [ self._GetIdentifiersMetadataRow( file_id, hash ) for ( file_id, hash ) in file_ids_to_hashes.items() ]
+            
+        else:
             
             service_keys_to_names = {}
             
-            for media_result in media_results:
-                
-                metadata_row = {}
-                
-                file_info_manager = media_result.GetFileInfoManager()
-                
-                metadata_row[ 'file_id' ] = file_info_manager.hash_id
-                metadata_row[ 'hash' ] = file_info_manager.hash.hex()
-                metadata_row[ 'size' ] = file_info_manager.size
-                metadata_row[ 'mime' ] = HC.mime_mimetype_string_lookup[ file_info_manager.mime ]
-                metadata_row[ 'width' ] = file_info_manager.width
-                metadata_row[ 'height' ] = file_info_manager.height
-                metadata_row[ 'duration' ] = file_info_manager.duration
-                metadata_row[ 'num_frames' ] = file_info_manager.num_frames
-                metadata_row[ 'num_words' ] = file_info_manager.num_words
-                metadata_row[ 'has_audio' ] = file_info_manager.has_audio
-                
-                known_urls = list( media_result.GetLocationsManager().GetURLs() )
-                
-                known_urls.sort()
-                
-                metadata_row[ 'known_urls' ] = known_urls
-                
-                tags_manager = media_result.GetTagsManager()
-                
-                service_names_to_statuses_to_tags = {}
-                
-                service_keys_to_statuses_to_tags = tags_manager.GetServiceKeysToStatusesToTags( ClientTags.TAG_DISPLAY_STORAGE )
-                
-                for ( service_key, statuses_to_tags ) in service_keys_to_statuses_to_tags.items():
-                    
-                    if service_key not in service_keys_to_names:
-                        
-                        service_keys_to_names[ service_key ] = services_manager.GetName( service_key )
-                        
-                    
-                    service_name = service_keys_to_names[ service_key ]
-                    
-                    service_names_to_statuses_to_tags[ service_name ] = { str( status ) : list( tags ) for ( status, tags ) in statuses_to_tags.items() }
-                    
-                
-                metadata_row[ 'service_names_to_statuses_to_tags' ] = service_names_to_statuses_to_tags
-                
-                metadata.append( metadata_row )
-                
+            metadata = [ self._GetMediaResultMetadataRow( media_result, service_keys_to_names ) for media_result in media_results ]
             
         
         body_dict[ 'metadata' ] = metadata
@@ -1532,14 +1680,17 @@ class HydrusResourceClientAPIRestrictedGetFilesGetThumbnail( HydrusResourceClien
         
         try:
             
-            path = HG.client_controller.client_files_manager.GetThumbnailPath( media_result )
+            thumbnail_bytes = HG.client_controller.client_files_manager.GetThumbnailBytes( media_result )
+            
+            etag = GetThumbnailETag( media_result.GetHash(), thumbnail_bytes )
+            last_modified = HG.client_controller.client_files_manager.GetThumbnailLastModified( media_result.GetHash() )
             
         except HydrusExceptions.FileMissingException:
             
             raise HydrusExceptions.NotFoundException( 'Could not find that file!' )
             
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_OCTET_STREAM, path = path )
+        response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_OCTET_STREAM, body = thumbnail_bytes, etag = etag, last_modified = last_modified )
         
         return response_context
         
@@ -10,12 +10,13 @@ from . import HydrusTags
 import random
 import threading
 import collections
+import itertools
 import traceback
 import typing
 from qtpy import QtGui as QG
 
 # now let's fill out grandparents
-def BuildServiceKeysToChildrenToParents( service_keys_to_simple_children_to_parents ):
+def BuildChildrenToParents( simple_children_to_parents ):
     
     # important thing here, and reason why it is recursive, is because we want to preserve the parent-grandparent interleaving in list order
     def AddParentsAndGrandparents( simple_children_to_parents, this_childs_parents, parents ):
@@ -37,18 +38,24 @@ def BuildServiceKeysToChildrenToParents( service_keys_to_simple_children_to_pare
             
         
     
+    children_to_parents = HydrusData.default_dict_list()
+    
+    for ( child, parents ) in list( simple_children_to_parents.items() ):
+        
+        this_childs_parents = children_to_parents[ child ]
+        
+        AddParentsAndGrandparents( simple_children_to_parents, this_childs_parents, parents )
+        
+    
+    return children_to_parents
+    
+def BuildServiceKeysToChildrenToParents( service_keys_to_simple_children_to_parents ):
+    
     service_keys_to_children_to_parents = collections.defaultdict( HydrusData.default_dict_list )
     
     for ( service_key, simple_children_to_parents ) in service_keys_to_simple_children_to_parents.items():
         
-        children_to_parents = service_keys_to_children_to_parents[ service_key ]
-        
-        for ( child, parents ) in list( simple_children_to_parents.items() ):
-            
-            this_childs_parents = children_to_parents[ child ]
-            
-            AddParentsAndGrandparents( simple_children_to_parents, this_childs_parents, parents )
-            
+        service_keys_to_children_to_parents[ service_key ] = BuildChildrenToParents( simple_children_to_parents )
         
     
     return service_keys_to_children_to_parents
@@ -620,6 +627,155 @@ class ServicesManager( object ):
             
         
     
+class TagParentsLookup( object ):
+    
+    # holds children_to_parents for one service and keeps it up to date as pairs come and go
+    # a pair can only affect the tags it is connected to, so on a change we only recalculate the connected groups it touches
+    
+    def __init__( self, pairs = None ):
+        
+        self._pairs_to_counts = collections.Counter()
+        self._tags_to_pairs = collections.defaultdict( set )
+        
+        self._children_to_parents = HydrusData.default_dict_list()
+        
+        if pairs is not None:
+            
+            self.UpdatePairs( pairs, [] )
+            
+        
+    
+    def _GetConnectedTags( self, tags ):
+        
+        connected_tags = set( tags )
+        
+        tags_to_search = list( connected_tags )
+        
+        while len( tags_to_search ) > 0:
+            
+            tag = tags_to_search.pop()
+            
+            if tag not in self._tags_to_pairs:
+                
+                continue
+                
+            
+            for pair in self._tags_to_pairs[ tag ]:
+                
+                for connected_tag in pair:
+                    
+                    if connected_tag not in connected_tags:
+                        
+                        connected_tags.add( connected_tag )
+                        
+                        tags_to_search.append( connected_tag )
+                        
+                    
+                
+            
+        
+        return connected_tags
+        
+    
+    def GetChildrenToParents( self ):
+        
+        return self._children_to_parents
+        
+    
+    def UpdatePairs( self, pairs_added, pairs_deleted ):
+        
+        # pairs here are counted, since different raw pairs can collapse to the same one
+        
+        pairs_added = list( pairs_added )
+        pairs_deleted = list( pairs_deleted )
+        
+        pairs_present_before = { pair for pair in itertools.chain( pairs_added, pairs_deleted ) if pair in self._pairs_to_counts }
+        
+        for pair in pairs_added:
+            
+            self._pairs_to_counts[ pair ] += 1
+            
+        
+        for pair in pairs_deleted:
+            
+            if pair in self._pairs_to_counts:
+                
+                self._pairs_to_counts[ pair ] -= 1
+                
+                if self._pairs_to_counts[ pair ] <= 0:
+                    
+                    del self._pairs_to_counts[ pair ]
+                    
+                
+            
+        
+        pairs_present_after = { pair for pair in itertools.chain( pairs_added, pairs_deleted ) if pair in self._pairs_to_counts }
+        
+        pairs_appeared = pairs_present_after.difference( pairs_present_before )
+        pairs_disappeared = pairs_present_before.difference( pairs_present_after )
+        
+        if len( pairs_appeared ) + len( pairs_disappeared ) == 0:
+            
+            return
+            
+        
+        touched_tags = set()
+        
+        for pair in itertools.chain( pairs_appeared, pairs_disappeared ):
+            
+            touched_tags.update( pair )
+            
+        
+        old_connected_tags = self._GetConnectedTags( touched_tags )
+        
+        for pair in pairs_disappeared:
+            
+            for tag in pair:
+                
+                self._tags_to_pairs[ tag ].discard( pair )
+                
+                if len( self._tags_to_pairs[ tag ] ) == 0:
+                    
+                    del self._tags_to_pairs[ tag ]
+                    
+                
+            
+        
+        for pair in pairs_appeared:
+            
+            for tag in pair:
+                
+                self._tags_to_pairs[ tag ].add( pair )
+                
+            
+        
+        connected_tags = self._GetConnectedTags( old_connected_tags )
+        
+        connected_pairs = set()
+        
+        for tag in connected_tags:
+            
+            if tag in self._tags_to_pairs:
+                
+                connected_pairs.update( self._tags_to_pairs[ tag ] )
+                
+            
+        
+        children_to_parents = BuildChildrenToParents( BuildSimpleChildrenToParents( connected_pairs ) )
+        
+        for tag in connected_tags:
+            
+            if tag in children_to_parents:
+                
+                self._children_to_parents[ tag ] = children_to_parents[ tag ]
+                
+            elif tag in self._children_to_parents:
+                
+                del self._children_to_parents[ tag ]
+                
+            
+        
+    
 class TagParentsManager( object ):
     
     def __init__( self, controller ):
@@ -628,6 +784,14 @@ class TagParentsManager( object ):
         
         self._dirty = False
         self._refresh_job = None
+        self._pending_changes = []
+        self._pending_sibling_changed_tags = set()
+        
+        self._service_keys_to_children_to_raw_pairs = collections.defaultdict( HydrusData.default_dict_set )
+        self._service_keys_to_tags_to_raw_pairs = collections.defaultdict( HydrusData.default_dict_set )
+        self._service_keys_to_raw_pairs_to_collapsed_pairs = collections.defaultdict( dict )
+        
+        self._service_keys_to_lookups = {}
         
         self._service_keys_to_children_to_parents = collections.defaultdict( HydrusData.default_dict_list )
         
@@ -636,17 +800,71 @@ class TagParentsManager( object ):
         self._lock = threading.Lock()
         
         self._controller.sub( self, 'NotifyNewParents', 'notify_new_parents' )
+        self._controller.sub( self, 'NotifyNewSiblingsLookup', 'notify_new_siblings_lookup' )
         
     
-    def _RefreshParents( self ):
+    def _GetLookup( self, service_key ):
         
-        service_keys_to_statuses_to_pairs = self._controller.Read( 'tag_parents' )
+        if service_key not in self._service_keys_to_lookups:
+            
+            lookup = TagParentsLookup()
+            
+            self._service_keys_to_lookups[ service_key ] = lookup
+            
+            self._service_keys_to_children_to_parents[ service_key ] = lookup.GetChildrenToParents()
+            
         
-        # first collapse siblings
+        return self._service_keys_to_lookups[ service_key ]
+        
+    
+    def _RecollapseTags( self, tags ):
+        
+        # siblings have changed for these tags, so any pair that uses them may now collapse differently
         
         siblings_manager = self._controller.tag_siblings_manager
         
-        collapsed_service_keys_to_statuses_to_pairs = collections.defaultdict( HydrusData.default_dict_set )
+        for ( service_key, tags_to_raw_pairs ) in list( self._service_keys_to_tags_to_raw_pairs.items() ):
+            
+            raw_pairs = set()
+            
+            for tag in tags:
+                
+                if tag in tags_to_raw_pairs:
+                    
+                    raw_pairs.update( tags_to_raw_pairs[ tag ] )
+                    
+                
+            
+            if len( raw_pairs ) == 0:
+                
+                continue
+                
+            
+            raw_pairs_to_collapsed_pairs = self._service_keys_to_raw_pairs_to_collapsed_pairs[ service_key ]
+            
+            collapsed_pairs_deleted = [ raw_pairs_to_collapsed_pairs[ raw_pair ] for raw_pair in raw_pairs ]
+            
+            raw_pairs_to_collapsed_pairs.update( siblings_manager.CollapsePairsToLookup( service_key, raw_pairs ) )
+            
+            collapsed_pairs_added = [ raw_pairs_to_collapsed_pairs[ raw_pair ] for raw_pair in raw_pairs ]
+            
+            self._UpdateCollapsedPairs( service_key, collapsed_pairs_added, collapsed_pairs_deleted )
+            
+        
+    
+    def _RefreshParents( self ):
+        
+        self._service_keys_to_children_to_raw_pairs = collections.defaultdict( HydrusData.default_dict_set )
+        self._service_keys_to_tags_to_raw_pairs = collections.defaultdict( HydrusData.default_dict_set )
+        self._service_keys_to_raw_pairs_to_collapsed_pairs = collections.defaultdict( dict )
+        
+        self._service_keys_to_lookups = {}
+        
+        self._service_keys_to_children_to_parents = collections.defaultdict( HydrusData.default_dict_list )
+        
+        self._GetLookup( CC.COMBINED_TAG_SERVICE_KEY )
+        
+        service_keys_to_statuses_to_pairs = self._controller.Read( 'tag_parents' )
         
         for ( service_key, statuses_to_pairs ) in service_keys_to_statuses_to_pairs.items():
             
@@ -655,41 +873,108 @@ class TagParentsManager( object ):
                 continue
                 
             
-            for ( status, pairs ) in statuses_to_pairs.items():
-                
-                pairs = siblings_manager.CollapsePairs( service_key, pairs )
+            # we collapse current and pending together
+            
+            pairs_flat = statuses_to_pairs[ HC.CONTENT_STATUS_CURRENT ].union( statuses_to_pairs[ HC.CONTENT_STATUS_PENDING ] )
+            
+            self._SetRawPairs( service_key, set(), pairs_flat )
+            
+        
+    
+    def _ScheduleRefresh( self ):
+        
+        self._dirty = True
+        
+        if self._refresh_job is not None:
+            
+            self._refresh_job.Cancel()
+            
+        
+        self._refresh_job = self._controller.CallLater( 8.0, self.RefreshParentsIfDirty )
+        
+    
+    def _SetRawPairs( self, service_key, children, raw_pairs ):
+        
+        # replaces all the raw pairs for these children with the given ones
+        
+        children_to_raw_pairs = self._service_keys_to_children_to_raw_pairs[ service_key ]
+        tags_to_raw_pairs = self._service_keys_to_tags_to_raw_pairs[ service_key ]
+        raw_pairs_to_collapsed_pairs = self._service_keys_to_raw_pairs_to_collapsed_pairs[ service_key ]
+        
+        old_raw_pairs = set()
+        
+        for child in children:
+            
+            if child in children_to_raw_pairs:
                 
-                collapsed_service_keys_to_statuses_to_pairs[ service_key ][ status ] = pairs
+                old_raw_pairs.update( children_to_raw_pairs[ child ] )
                 
             
         
-        # now collapse current and pending
+        new_raw_pairs = set( raw_pairs )
+        
+        raw_pairs_added = new_raw_pairs.difference( old_raw_pairs )
+        raw_pairs_deleted = old_raw_pairs.difference( new_raw_pairs )
         
-        service_keys_to_pairs_flat = HydrusData.default_dict_set()
+        collapsed_pairs_deleted = []
         
-        for ( service_key, statuses_to_pairs ) in collapsed_service_keys_to_statuses_to_pairs.items():
+        for raw_pair in raw_pairs_deleted:
             
-            pairs_flat = statuses_to_pairs[ HC.CONTENT_STATUS_CURRENT ].union( statuses_to_pairs[ HC.CONTENT_STATUS_PENDING ] )
+            ( child, parent ) = raw_pair
             
-            service_keys_to_pairs_flat[ service_key ] = pairs_flat
+            children_to_raw_pairs[ child ].discard( raw_pair )
+            
+            if len( children_to_raw_pairs[ child ] ) == 0:
+                
+                del children_to_raw_pairs[ child ]
+                
+            
+            for tag in raw_pair:
+                
+                tags_to_raw_pairs[ tag ].discard( raw_pair )
+                
+                if len( tags_to_raw_pairs[ tag ] ) == 0:
+                    
+                    del tags_to_raw_pairs[ tag ]
+                    
+                
+            
+            collapsed_pairs_deleted.append( raw_pairs_to_collapsed_pairs.pop( raw_pair ) )
             
         
-        # now create the combined tag service
+        for raw_pair in raw_pairs_added:
+            
+            ( child, parent ) = raw_pair
+            
+            children_to_raw_pairs[ child ].add( raw_pair )
+            
+            for tag in raw_pair:
+                
+                tags_to_raw_pairs[ tag ].add( raw_pair )
+                
+            
+        
+        # first collapse siblings
         
-        combined_pairs_flat = set()
+        raw_pairs_to_collapsed_pairs.update( self._controller.tag_siblings_manager.CollapsePairsToLookup( service_key, raw_pairs_added ) )
         
-        for pairs_flat in service_keys_to_pairs_flat.values():
+        collapsed_pairs_added = [ raw_pairs_to_collapsed_pairs[ raw_pair ] for raw_pair in raw_pairs_added ]
+        
+        self._UpdateCollapsedPairs( service_key, collapsed_pairs_added, collapsed_pairs_deleted )
+        
+    
+    def _UpdateCollapsedPairs( self, service_key, collapsed_pairs_added, collapsed_pairs_deleted ):
+        
+        if len( collapsed_pairs_added ) + len( collapsed_pairs_deleted ) == 0:
             
-            combined_pairs_flat.update( pairs_flat )
+            return
             
         
-        service_keys_to_pairs_flat[ CC.COMBINED_TAG_SERVICE_KEY ] = combined_pairs_flat
-        
-        #
+        self._GetLookup( service_key ).UpdatePairs( collapsed_pairs_added, collapsed_pairs_deleted )
         
-        service_keys_to_simple_children_to_parents = BuildServiceKeysToSimpleChildrenToParents( service_keys_to_pairs_flat )
+        # the combined service is all the services' pairs together
         
-        self._service_keys_to_children_to_parents = BuildServiceKeysToChildrenToParents( service_keys_to_simple_children_to_parents )
+        self._GetLookup( CC.COMBINED_TAG_SERVICE_KEY ).UpdatePairs( collapsed_pairs_added, collapsed_pairs_deleted )
         
     
     def ExpandPredicates( self, service_key, predicates, service_strict = False ):
@@ -759,18 +1044,44 @@ class TagParentsManager( object ):
             
         
     
-    def NotifyNewParents( self ):
+    def NotifyNewParents( self, service_keys_to_changes = None ):
         
         with self._lock:
             
-            self._dirty = True
+            # no changes means we do not know what happened, so we'll rebuild everything
             
-            if self._refresh_job is not None:
+            if service_keys_to_changes is None:
                 
-                self._refresh_job.Cancel()
+                self._pending_changes = None
+                
+            elif self._pending_changes is not None:
+                
+                self._pending_changes.append( service_keys_to_changes )
+                
+            
+            self._ScheduleRefresh()
+            
+        
+    
+    def NotifyNewSiblingsLookup( self, changed_tags ):
+        
+        with self._lock:
+            
+            if changed_tags is None:
+                
+                self._pending_changes = None
+                
+            elif self._pending_changes is not None:
+                
+                if len( changed_tags ) == 0:
+                    
+                    return
+                    
+                
+                self._pending_sibling_changed_tags.update( changed_tags )
                 
             
-            self._refresh_job = self._controller.CallLater( 8.0, self.RefreshParentsIfDirty )
+            self._ScheduleRefresh()
             
         
     
@@ -780,13 +1091,242 @@ class TagParentsManager( object ):
             
             if self._dirty:
                 
-                self._RefreshParents()
+                if self._pending_changes is None:
+                    
+                    self._RefreshParents()
+                    
+                else:
+                    
+                    for service_keys_to_changes in self._pending_changes:
+                        
+                        for ( service_key, ( children, raw_pairs ) ) in service_keys_to_changes.items():
+                            
+                            self._SetRawPairs( service_key, children, raw_pairs )
+                            
+                        
+                    
+                    if len( self._pending_sibling_changed_tags ) > 0:
+                        
+                        self._RecollapseTags( self._pending_sibling_changed_tags )
+                        
+                    
+                
+                self._pending_changes = []
+                self._pending_sibling_changed_tags = set()
                 
                 self._dirty = False
                 
             
         
     
+class TagSiblingsLookup( object ):
+    
+    # holds the collapsed siblings for one service and keeps them up to date as pairs come and go
+    # groups of pairs are in descending order of precedence, just like CollapseTagSiblingPairs
+    # a pair can only affect the tags it is connected to, so on a change we only recollapse the connected groups it touches
+    
+    def __init__( self, groups_of_pairs ):
+        
+        groups_of_pairs = [ set( pairs ) for pairs in groups_of_pairs ]
+        
+        self._groups_of_bad_tags_to_pairs = [ collections.defaultdict( set ) for pairs in groups_of_pairs ]
+        self._tags_to_group_pairs = collections.defaultdict( set )
+        
+        for ( group_index, pairs ) in enumerate( groups_of_pairs ):
+            
+            bad_tags_to_pairs = self._groups_of_bad_tags_to_pairs[ group_index ]
+            
+            for pair in pairs:
+                
+                ( bad, good ) = pair
+                
+                bad_tags_to_pairs[ bad ].add( pair )
+                
+                self._tags_to_group_pairs[ bad ].add( ( group_index, pair ) )
+                self._tags_to_group_pairs[ good ].add( ( group_index, pair ) )
+                
+            
+        
+        self._siblings = CollapseTagSiblingPairs( groups_of_pairs )
+        
+        self._reverse_lookup = collections.defaultdict( list )
+        
+        for ( bad, good ) in self._siblings.items():
+            
+            self._reverse_lookup[ good ].append( bad )
+            
+        
+    
+    def _GetConnectedTags( self, tags ):
+        
+        connected_tags = set( tags )
+        
+        tags_to_search = list( connected_tags )
+        
+        while len( tags_to_search ) > 0:
+            
+            tag = tags_to_search.pop()
+            
+            if tag not in self._tags_to_group_pairs:
+                
+                continue
+                
+            
+            for ( group_index, pair ) in self._tags_to_group_pairs[ tag ]:
+                
+                for connected_tag in pair:
+                    
+                    if connected_tag not in connected_tags:
+                        
+                        connected_tags.add( connected_tag )
+                        
+                        tags_to_search.append( connected_tag )
+                        
+                    
+                
+            
+        
+        return connected_tags
+        
+    
+    def GetPairs( self, bad_tags, group_index = 0 ):
+        
+        bad_tags_to_pairs = self._groups_of_bad_tags_to_pairs[ group_index ]
+        
+        pairs = set()
+        
+        for bad_tag in bad_tags:
+            
+            if bad_tag in bad_tags_to_pairs:
+                
+                pairs.update( bad_tags_to_pairs[ bad_tag ] )
+                
+            
+        
+        return pairs
+        
+    
+    def GetReverseLookup( self ):
+        
+        return self._reverse_lookup
+        
+    
+    def GetSiblings( self ):
+        
+        return self._siblings
+        
+    
+    def SetPairs( self, bad_tags, pairs, group_index = 0 ):
+        
+        # replaces all the pairs for these bad tags with the given ones, and returns the tags whose ideal has changed
+        
+        bad_tags_to_pairs = self._groups_of_bad_tags_to_pairs[ group_index ]
+        
+        old_pairs = self.GetPairs( bad_tags, group_index = group_index )
+        new_pairs = set( pairs )
+        
+        pairs_added = new_pairs.difference( old_pairs )
+        pairs_deleted = old_pairs.difference( new_pairs )
+        
+        if len( pairs_added ) + len( pairs_deleted ) == 0:
+            
+            return set()
+            
+        
+        touched_tags = set()
+        
+        for pair in itertools.chain( pairs_added, pairs_deleted ):
+            
+            touched_tags.update( pair )
+            
+        
+        old_connected_tags = self._GetConnectedTags( touched_tags )
+        
+        for pair in pairs_deleted:
+            
+            ( bad, good ) = pair
+            
+            bad_tags_to_pairs[ bad ].discard( pair )
+            
+            if len( bad_tags_to_pairs[ bad ] ) == 0:
+                
+                del bad_tags_to_pairs[ bad ]
+                
+            
+            for tag in pair:
+                
+                self._tags_to_group_pairs[ tag ].discard( ( group_index, pair ) )
+                
+                if len( self._tags_to_group_pairs[ tag ] ) == 0:
+                    
+                    del self._tags_to_group_pairs[ tag ]
+                    
+                
+            
+        
+        for pair in pairs_added:
+            
+            ( bad, good ) = pair
+            
+            bad_tags_to_pairs[ bad ].add( pair )
+            
+            for tag in pair:
+                
+                self._tags_to_group_pairs[ tag ].add( ( group_index, pair ) )
+                
+            
+        
+        connected_tags = self._GetConnectedTags( old_connected_tags )
+        
+        # the collapse resolves conflicts in sorted order within each group, and that order is the same on a connected subset, so the result is the same as a full collapse
+        
+        groups_of_pairs = [ set() for i in range( len( self._groups_of_bad_tags_to_pairs ) ) ]
+        
+        for tag in connected_tags:
+            
+            if tag in self._tags_to_group_pairs:
+                
+                for ( pair_group_index, pair ) in self._tags_to_group_pairs[ tag ]:
+                    
+                    groups_of_pairs[ pair_group_index ].add( pair )
+                    
+                
+            
+        
+        siblings = CollapseTagSiblingPairs( groups_of_pairs )
+        
+        changed_tags = set()
+        
+        for tag in connected_tags:
+            
+            if siblings.get( tag, None ) != self._siblings.get( tag, None ):
+                
+                changed_tags.add( tag )
+                
+                if tag in siblings:
+                    
+                    self._siblings[ tag ] = siblings[ tag ]
+                    
+                else:
+                    
+                    del self._siblings[ tag ]
+                    
+                
+            
+            if tag in self._reverse_lookup:
+                
+                del self._reverse_lookup[ tag ]
+                
+            
+        
+        for ( bad, good ) in siblings.items():
+            
+            self._reverse_lookup[ good ].append( bad )
+            
+        
+        return changed_tags
+        
+    
 class TagSiblingsManager( object ):
     
     def __init__( self, controller ):
@@ -795,6 +1335,10 @@ class TagSiblingsManager( object ):
         
         self._dirty = False
         self._refresh_job = None
+        self._pending_changes = []
+        
+        self._service_keys_to_lookups = {}
+        self._service_keys_to_group_indices = {}
         
         self._service_keys_to_siblings = collections.defaultdict( dict )
         self._service_keys_to_reverse_lookup = collections.defaultdict( dict )
@@ -806,6 +1350,51 @@ class TagSiblingsManager( object ):
         self._controller.sub( self, 'NotifyNewSiblings', 'notify_new_siblings_data' )
         
     
+    def _ApplyChanges( self, service_keys_to_changes ):
+        
+        # each change is ( bad_tags, pairs ), with pairs being all the current and pending pairs for those bad tags
+        
+        changed_tags = set()
+        
+        groups_of_bad_tags = [ set(), set() ]
+        
+        for ( service_key, ( bad_tags, pairs ) ) in service_keys_to_changes.items():
+            
+            if service_key not in self._service_keys_to_lookups:
+                
+                self._SetLookup( service_key, TagSiblingsLookup( [ set() ] ) )
+                
+            
+            changed_tags.update( self._service_keys_to_lookups[ service_key ].SetPairs( bad_tags, pairs ) )
+            
+            groups_of_bad_tags[ self._service_keys_to_group_indices[ service_key ] ].update( bad_tags )
+            
+        
+        combined_lookup = self._service_keys_to_lookups[ CC.COMBINED_TAG_SERVICE_KEY ]
+        
+        for ( group_index, bad_tags ) in enumerate( groups_of_bad_tags ):
+            
+            if len( bad_tags ) == 0:
+                
+                continue
+                
+            
+            group_pairs = set()
+            
+            for ( service_key, lookup ) in self._service_keys_to_lookups.items():
+                
+                if service_key != CC.COMBINED_TAG_SERVICE_KEY and self._service_keys_to_group_indices[ service_key ] == group_index:
+                    
+                    group_pairs.update( lookup.GetPairs( bad_tags ) )
+                    
+                
+            
+            changed_tags.update( combined_lookup.SetPairs( bad_tags, group_pairs, group_index = group_index ) )
+            
+        
+        return changed_tags
+        
+    
     def _CollapseTags( self, service_key, tags ):
     
         siblings = self._service_keys_to_siblings[ service_key ]
@@ -815,6 +1404,9 @@ class TagSiblingsManager( object ):
     
     def _RefreshSiblings( self ):
         
+        self._service_keys_to_lookups = {}
+        self._service_keys_to_group_indices = {}
+        
         self._service_keys_to_siblings = collections.defaultdict( dict )
         self._service_keys_to_reverse_lookup = collections.defaultdict( dict )
         
@@ -828,9 +1420,9 @@ class TagSiblingsManager( object ):
             
             all_pairs = statuses_to_pairs[ HC.CONTENT_STATUS_CURRENT ].union( statuses_to_pairs[ HC.CONTENT_STATUS_PENDING ] )
             
-            service = self._controller.services_manager.GetService( service_key )
+            self._SetLookup( service_key, TagSiblingsLookup( [ all_pairs ] ) )
             
-            if service.GetServiceType() == HC.LOCAL_TAG:
+            if self._service_keys_to_group_indices[ service_key ] == 0:
                 
                 local_tags_pairs = set( all_pairs )
                 
@@ -839,32 +1431,32 @@ class TagSiblingsManager( object ):
                 tag_repo_pairs.update( all_pairs )
                 
             
-            siblings = CollapseTagSiblingPairs( [ all_pairs ] )
-            
-            self._service_keys_to_siblings[ service_key ] = siblings
-            
-            reverse_lookup = collections.defaultdict( list )
-            
-            for ( bad, good ) in siblings.items():
-                
-                reverse_lookup[ good ].append( bad )
-                
-            
-            self._service_keys_to_reverse_lookup[ service_key ] = reverse_lookup
-            
         
-        combined_siblings = CollapseTagSiblingPairs( [ local_tags_pairs, tag_repo_pairs ] )
+        self._SetLookup( CC.COMBINED_TAG_SERVICE_KEY, TagSiblingsLookup( [ local_tags_pairs, tag_repo_pairs ] ) )
         
-        self._service_keys_to_siblings[ CC.COMBINED_TAG_SERVICE_KEY ] = combined_siblings
+    
+    def _SetLookup( self, service_key, lookup ):
         
-        combined_reverse_lookup = collections.defaultdict( list )
+        self._service_keys_to_lookups[ service_key ] = lookup
         
-        for ( bad, good ) in combined_siblings.items():
+        if service_key != CC.COMBINED_TAG_SERVICE_KEY:
             
-            combined_reverse_lookup[ good ].append( bad )
+            # local tags take precedence in the combined service
+            
+            service = self._controller.services_manager.GetService( service_key )
+            
+            if service.GetServiceType() == HC.LOCAL_TAG:
+                
+                self._service_keys_to_group_indices[ service_key ] = 0
+                
+            else:
+                
+                self._service_keys_to_group_indices[ service_key ] = 1
+                
             
         
-        self._service_keys_to_reverse_lookup[ CC.COMBINED_TAG_SERVICE_KEY ] = combined_reverse_lookup
+        self._service_keys_to_siblings[ service_key ] = lookup.GetSiblings()
+        self._service_keys_to_reverse_lookup[ service_key ] = lookup.GetReverseLookup()
         
     
     def CollapsePredicates( self, service_key, predicates, service_strict = False ):
@@ -956,6 +1548,40 @@ class TagSiblingsManager( object ):
             
         
     
+    def CollapsePairsToLookup( self, service_key, pairs, service_strict = False ):
+        
+        if not service_strict and self._controller.new_options.GetBoolean( 'apply_all_siblings_to_all_services' ):
+            
+            service_key = CC.COMBINED_TAG_SERVICE_KEY
+            
+        
+        with self._lock:
+            
+            siblings = self._service_keys_to_siblings[ service_key ]
+            
+            pairs_to_collapsed_pairs = {}
+            
+            for pair in pairs:
+                
+                ( a, b ) = pair
+                
+                if a in siblings:
+                    
+                    a = siblings[ a ]
+                    
+                
+                if b in siblings:
+                    
+                    b = siblings[ b ]
+                    
+                
+                pairs_to_collapsed_pairs[ pair ] = ( a, b )
+                
+            
+            return pairs_to_collapsed_pairs
+            
+        
+    
     def CollapseStatusesToTags( self, service_key, statuses_to_tags, service_strict = False ):
         
         if not service_strict and self._controller.new_options.GetBoolean( 'apply_all_siblings_to_all_services' ):
@@ -1093,10 +1719,21 @@ class TagSiblingsManager( object ):
             
         
     
-    def NotifyNewSiblings( self ):
+    def NotifyNewSiblings( self, service_keys_to_changes = None ):
         
         with self._lock:
             
+            # no changes means we do not know what happened, so we'll rebuild everything
+            
+            if service_keys_to_changes is None:
+                
+                self._pending_changes = None
+                
+            elif self._pending_changes is not None:
+                
+                self._pending_changes.append( service_keys_to_changes )
+                
+            
             self._dirty = True
             
             if self._refresh_job is not None:
@@ -1114,11 +1751,27 @@ class TagSiblingsManager( object ):
             
             if self._dirty:
                 
-                self._RefreshSiblings()
+                if self._pending_changes is None:
+                    
+                    self._RefreshSiblings()
+                    
+                    changed_tags = None
+                    
+                else:
+                    
+                    changed_tags = set()
+                    
+                    for service_keys_to_changes in self._pending_changes:
+                        
+                        changed_tags.update( self._ApplyChanges( service_keys_to_changes ) )
+                        
+                    
+                
+                self._pending_changes = []
                 
                 self._dirty = False
                 
-                self._controller.pub( 'notify_new_tag_display_rules' )
+                self._controller.pub( 'notify_new_siblings_lookup', changed_tags )
                 
             
         
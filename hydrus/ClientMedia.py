@@ -1,3 +1,4 @@
+import array
 import bisect
 import collections
 from . import ClientConstants as CC
@@ -8,6 +9,7 @@ from . import ClientTags
 from . import HydrusConstants as HC
 from . import HydrusTags
 from . import HydrusText
+import numpy
 import os
 import random
 import time
@@ -274,8 +276,8 @@ def GetDuplicateComparisonStatements( shown_media, comparison_media ):
     
     # more tags
     
-    s_num_tags = len( shown_media.GetTagsManager().GetCurrentAndPending( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ) )
-    c_num_tags = len( comparison_media.GetTagsManager().GetCurrentAndPending( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ) )
+    s_num_tags = shown_media.GetTagsManager().GetNumCurrentAndPending( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS )
+    c_num_tags = comparison_media.GetTagsManager().GetNumCurrentAndPending( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS )
     
     if s_num_tags != c_num_tags:
         
@@ -1167,6 +1169,8 @@ class MediaList( object ):
         self._singleton_media = set( self._sorted_media )
         self._collected_media = set()
         
+        self._ClearSortColumns()
+        
         self._RecalcHashes()
         
     
@@ -1210,6 +1214,13 @@ class MediaList( object ):
         return keys_to_medias
         
     
+    def _ClearSortColumns( self ):
+        
+        self._sort_columns_media = None
+        self._sort_columns_media_to_rows = None
+        self._sort_types_to_sort_columns = {}
+        
+    
     def _GenerateMediaCollection( self, media_results ):
         
         return MediaCollection( self._file_service_key, media_results )
@@ -1301,6 +1312,42 @@ class MediaList( object ):
             
         
     
+    def _GetSortColumns( self, media_sort ):
+        
+        # the columns are built once per sort type in the snapshot order below and then gathered into the current order, so resorting a big page does not hit every media's getters again
+        
+        if not media_sort.CanSortByColumns():
+            
+            return None
+            
+        
+        if self._sort_columns_media is None:
+            
+            self._sort_columns_media = list( self._sorted_media )
+            self._sort_columns_media_to_rows = { media : row for ( row, media ) in enumerate( self._sort_columns_media ) }
+            
+        
+        sort_type = media_sort.sort_type
+        
+        if sort_type in self._sort_types_to_sort_columns:
+            
+            columns = self._sort_types_to_sort_columns[ sort_type ]
+            
+        else:
+            
+            columns = media_sort.GetSortColumns( self._sort_columns_media, self._file_service_key )
+            
+            if sort_type != ( 'system', CC.SORT_FILES_BY_RANDOM ):
+                
+                self._sort_types_to_sort_columns[ sort_type ] = columns
+                
+            
+        
+        rows = numpy.fromiter( ( self._sort_columns_media_to_rows[ media ] for media in self._sorted_media ), dtype = numpy.int64, count = len( self._sorted_media ) )
+        
+        return [ column[ rows ] for column in columns ]
+        
+    
     def _HasHashes( self, hashes ):
         
         for hash in hashes:
@@ -1379,6 +1426,8 @@ class MediaList( object ):
         
         self._sorted_media.remove_items( singleton_media.union( collected_media ) )
         
+        self._ClearSortColumns()
+        
         self._RecalcHashes()
         
     
@@ -1407,6 +1456,8 @@ class MediaList( object ):
         self._singleton_media.update( addable_media )
         self._sorted_media.append_items( addable_media )
         
+        self._ClearSortColumns()
+        
         return new_media
         
     
@@ -1459,6 +1510,8 @@ class MediaList( object ):
         
         self._sorted_media = SortedList( list( self._singleton_media ) + list( self._collected_media ) )
         
+        self._ClearSortColumns()
+        
         self._RecalcHashes()
         
     
@@ -1520,11 +1573,11 @@ class MediaList( object ):
                 
                 if and_or_or == 'AND':
                     
-                    return sum( ( 1 for m in flat_media if len( m.GetTagsManager().GetCurrentAndPending( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ).intersection( select_tags ) ) == len( select_tags ) ) )
+                    return sum( ( 1 for m in flat_media if m.GetTagsManager().HasAllTags( select_tags, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ) ) )
                     
                 elif and_or_or == 'OR':
                     
-                    return sum( ( 1 for m in flat_media if len( m.GetTagsManager().GetCurrentAndPending( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ).intersection( select_tags ) ) > 0 ) )
+                    return sum( ( 1 for m in flat_media if m.GetTagsManager().HasAnyTags( select_tags, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ) ) )
                     
                 
             
@@ -1599,11 +1652,11 @@ class MediaList( object ):
                 
                 if and_or_or == 'AND':
                     
-                    filtered_media = [ m for m in flat_media if len( m.GetTagsManager().GetCurrentAndPending( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ).intersection( select_tags ) ) == len( select_tags ) ]
+                    filtered_media = [ m for m in flat_media if m.GetTagsManager().HasAllTags( select_tags, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ) ]
                     
                 elif and_or_or == 'OR':
                     
-                    filtered_media = [ m for m in flat_media if len( m.GetTagsManager().GetCurrentAndPending( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ).intersection( select_tags ) ) > 0 ]
+                    filtered_media = [ m for m in flat_media if m.GetTagsManager().HasAnyTags( select_tags, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ) ]
                     
                 
             
@@ -1663,11 +1716,11 @@ class MediaList( object ):
                 
                 if and_or_or == 'AND':
                     
-                    filtered_media = { m for m in self._sorted_media if len( m.GetTagsManager().GetCurrentAndPending( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ).intersection( select_tags ) ) == len( select_tags ) }
+                    filtered_media = { m for m in self._sorted_media if m.GetTagsManager().HasAllTags( select_tags, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ) }
                     
                 elif and_or_or == 'OR':
                     
-                    filtered_media = { m for m in self._sorted_media if len( m.GetTagsManager().GetCurrentAndPending( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ).intersection( select_tags ) ) > 0 }
+                    filtered_media = { m for m in self._sorted_media if m.GetTagsManager().HasAnyTags( select_tags, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ) }
                     
                 
             
@@ -1928,6 +1981,18 @@ class MediaList( object ):
         return len( self._sorted_media ) == 0
         
     
+    def NewTagPresentation( self ):
+        
+        # siblings or display rules changed, so any cached number of tags column is out of date
+        
+        self._ClearSortColumns()
+        
+        for m in self._collected_media:
+            
+            m.NewTagPresentation()
+            
+        
+    
     def ProcessContentUpdates( self, service_keys_to_content_updates ):
         
         for m in self._collected_media:
@@ -1935,6 +2000,10 @@ class MediaList( object ):
             m.ProcessContentUpdates( service_keys_to_content_updates )
             
         
+        # timestamps, ratings, tag counts and so on may have changed under us
+        
+        self._ClearSortColumns()
+        
         for ( service_key, content_updates ) in list(service_keys_to_content_updates.items()):
             
             for content_update in content_updates:
@@ -1975,6 +2044,8 @@ class MediaList( object ):
     
     def ProcessServiceUpdates( self, service_keys_to_service_updates ):
         
+        self._ClearSortColumns()
+        
         for ( service_key, service_updates ) in list(service_keys_to_service_updates.items()):
             
             for service_update in service_updates:
@@ -2021,15 +2092,39 @@ class MediaList( object ):
         
         media_sort_fallback = HG.client_controller.new_options.GetFallbackSort()
         
-        ( sort_key, reverse ) = media_sort_fallback.GetSortKeyAndReverse( self._file_service_key )
-        
-        self._sorted_media.sort( sort_key, reverse = reverse )
-        
-        # this is a stable sort, so the fallback order above will remain for equal items
-        
+        ( fallback_sort_key, fallback_reverse ) = media_sort_fallback.GetSortKeyAndReverse( self._file_service_key )
         ( sort_key, reverse ) = self._media_sort.GetSortKeyAndReverse( self._file_service_key )
         
-        self._sorted_media.sort( sort_key = sort_key, reverse = reverse )
+        fallback_sort_columns = self._GetSortColumns( media_sort_fallback )
+        sort_columns = self._GetSortColumns( self._media_sort )
+        
+        if fallback_sort_columns is None or sort_columns is None:
+            
+            self._sorted_media.sort( fallback_sort_key, reverse = fallback_reverse )
+            
+            # this is a stable sort, so the fallback order above will remain for equal items
+            
+            self._sorted_media.sort( sort_key = sort_key, reverse = reverse )
+            
+        else:
+            
+            # lexsort is stable and treats the last key as most significant, so this is the two sorts above in one go
+            # descending is ascending on the negated column, which keeps equal items in their current order just like a python reverse sort
+            
+            lexsort_keys = []
+            
+            for ( columns, column_reverse ) in ( ( fallback_sort_columns, fallback_reverse ), ( sort_columns, reverse ) ):
+                
+                for column in reversed( columns ):
+                    
+                    lexsort_keys.append( - column if column_reverse else column )
+                    
+                
+            
+            order = numpy.lexsort( lexsort_keys )
+            
+            self._sorted_media.reorder( order.tolist(), sort_key = sort_key, reverse = reverse )
+            
         
     
 FILE_FILTER_ALL = 0
@@ -2495,7 +2590,9 @@ class MediaCollection( MediaList, Media ):
             
         
     
-    def RecalcInternals( self ):
+    def NewTagPresentation( self ):
+        
+        MediaList.NewTagPresentation( self )
         
         self._RecalcInternals()
         
@@ -2514,6 +2611,8 @@ class MediaCollection( MediaList, Media ):
             media.UpdateFileInfo( hashes_to_media_results )
             
         
+        self._ClearSortColumns()
+        
         self._RecalcInternals()
         
     
@@ -2939,6 +3038,33 @@ class MediaSort( HydrusSerialisable.SerialisableBase ):
         return True
         
     
+    def CanSortByColumns( self ):
+        
+        ( sort_metatype, sort_data ) = self.sort_type
+        
+        # namespace slices are lists of mixed strings and numbers, so they stay as python sorts
+        
+        return sort_metatype != 'namespaces'
+        
+    
+    def GetSortColumns( self, medias, file_service_key ):
+        
+        # one float column per part of the sort key, most significant first. collections give their aggregate values through the same getters
+        
+        ( sort_key, reverse ) = self.GetSortKeyAndReverse( file_service_key )
+        
+        num_medias = len( medias )
+        
+        if self.sort_type == ( 'system', CC.SORT_FILES_BY_APPROX_BITRATE ):
+            
+            keys = [ sort_key( media ) for media in medias ]
+            
+            return [ numpy.fromiter( ( key[ i ] for key in keys ), dtype = numpy.float64, count = num_medias ) for i in range( 2 ) ]
+            
+        
+        return [ numpy.fromiter( ( sort_key( media ) for media in medias ), dtype = numpy.float64, count = num_medias ) ]
+        
+    
     def GetSortKeyAndReverse( self, file_service_key ):
         
         reverse = False
@@ -3146,7 +3272,7 @@ class MediaSort( HydrusSerialisable.SerialisableBase ):
                     
                     tags_manager = x.GetTagsManager()
                     
-                    return len( tags_manager.GetCurrentAndPending( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_SINGLE_MEDIA ) )
+                    return tags_manager.GetNumCurrentAndPending( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_SINGLE_MEDIA )
                     
                 
             elif sort_data == CC.SORT_FILES_BY_MIME:
@@ -3388,6 +3514,21 @@ class SortedList( object ):
         self.sort()
         
     
+    def reorder( self, indices, sort_key = None, reverse = False ):
+        
+        # for when the caller has worked out the sort order itself
+        
+        if sort_key is not None:
+            
+            self._sort_key = sort_key
+            self._sort_reverse = reverse
+            
+        
+        self._sorted_list = [ self._sorted_list[ index ] for index in indices ]
+        
+        self._DirtyIndices()
+        
+    
     def remove_items( self, items ):
         
         deletee_indices = [ self.index( item ) for item in items ]
@@ -3422,113 +3563,272 @@ class SortedList( object ):
     
 class TagsManager( object ):
     
-    def __init__( self, service_keys_to_statuses_to_tags ):
+    # tags are stored as compact arrays of ids into ClientTags.tag_id_table, one per ( service_key, status ), and empty ones are not stored at all
+    # a big page of media shares the one copy of each tag string, and layers that would be the same as the layer below just share its arrays
+    
+    def __init__( self, service_keys_to_statuses_to_tags, service_keys_to_statuses_to_display_tags = None ):
         
-        self._tag_display_types_to_service_keys_to_statuses_to_tags = { ClientTags.TAG_DISPLAY_STORAGE : service_keys_to_statuses_to_tags }
+        storage_layer = self._ConvertToLayer( service_keys_to_statuses_to_tags )
         
-        self._cache_is_dirty = True
+        if service_keys_to_statuses_to_display_tags is None:
+            
+            siblings_layer = None
+            
+        else:
+            
+            siblings_layer = self._ConvertToLayer( service_keys_to_statuses_to_display_tags )
+            
+        
+        self._Initialise( storage_layer, siblings_layer )
+        
+    
+    def _ConvertTagIdsToLayer( self, service_keys_to_statuses_to_tag_ids ):
+        
+        layer = {}
+        
+        for ( service_key, statuses_to_tag_ids ) in service_keys_to_statuses_to_tag_ids.items():
+            
+            for ( status, tag_ids ) in statuses_to_tag_ids.items():
+                
+                if len( tag_ids ) > 0:
+                    
+                    layer[ ( service_key, status ) ] = array.array( 'I', tag_ids )
+                    
+                
+            
+        
+        return layer
+        
+    
+    def _ConvertToLayer( self, service_keys_to_statuses_to_tags ):
+        
+        layer = {}
+        
+        for ( service_key, statuses_to_tags ) in service_keys_to_statuses_to_tags.items():
+            
+            for ( status, tags ) in statuses_to_tags.items():
+                
+                if len( tags ) > 0:
+                    
+                    layer[ ( service_key, status ) ] = ClientTags.tag_id_table.GetTagIds( tags )
+                    
+                
+            
+        
+        return layer
         
     
-    def _GetServiceKeysToStatusesToTags( self, tag_display_type ):
+    def _GetLayer( self, tag_display_type ):
         
         self._RecalcCaches()
         
-        return self._tag_display_types_to_service_keys_to_statuses_to_tags[ tag_display_type ]
+        return self._tag_display_types_to_layers[ tag_display_type ]
+        
+    
+    def _GetCurrentAndPendingTagIds( self, tag_display_type ):
+        
+        layer = self._GetLayer( tag_display_type )
+        
+        return set( itertools.chain( layer.get( ( CC.COMBINED_TAG_SERVICE_KEY, HC.CONTENT_STATUS_CURRENT ), () ), layer.get( ( CC.COMBINED_TAG_SERVICE_KEY, HC.CONTENT_STATUS_PENDING ), () ) ) )
+        
+    
+    def _GetServiceKeys( self, layer ):
+        
+        return { service_key for ( service_key, status ) in layer.keys() }
+        
+    
+    def _GetStatusesToTags( self, layer, service_key ):
+        
+        statuses_to_tags = HydrusData.default_dict_set()
+        
+        for status in ( HC.CONTENT_STATUS_CURRENT, HC.CONTENT_STATUS_DELETED, HC.CONTENT_STATUS_PENDING, HC.CONTENT_STATUS_PETITIONED ):
+            
+            key = ( service_key, status )
+            
+            if key in layer:
+                
+                statuses_to_tags[ status ] = ClientTags.tag_id_table.GetTags( layer[ key ] )
+                
+            
+        
+        return statuses_to_tags
+        
+    
+    def _GetTags( self, tag_display_type, service_key, status ):
+        
+        layer = self._GetLayer( tag_display_type )
+        
+        key = ( service_key, status )
+        
+        if key in layer:
+            
+            return ClientTags.tag_id_table.GetTags( layer[ key ] )
+            
+        else:
+            
+            return set()
+            
+        
+    
+    def _Initialise( self, storage_layer, siblings_layer ):
+        
+        if siblings_layer is None:
+            
+            siblings_layer = {}
+            
+            self._siblings_dirty_service_keys = self._GetServiceKeys( storage_layer )
+            
+        else:
+            
+            # the db has already collapsed siblings for us
+            
+            self._siblings_dirty_service_keys = set()
+            
+        
+        self._tag_display_types_to_layers = {}
+        
+        self._tag_display_types_to_layers[ ClientTags.TAG_DISPLAY_STORAGE ] = storage_layer
+        self._tag_display_types_to_layers[ ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ] = siblings_layer
+        
+        self._cache_is_dirty = True
         
     
     def _RecalcCaches( self ):
         
         if self._cache_is_dirty:
             
-            # siblings (parents later)
-            
-            tag_siblings_manager = HG.client_controller.tag_siblings_manager
+            tag_id_table = ClientTags.tag_id_table
             
-            # ultimately, we would like to just have these values pre-computed on the db so we can just read them in, but one step at a time
-            # and ultimately, this will make parents virtual, whether that is before or after we move this calc down to db cache level
-            # we'll want to keep this live updating capability though so we can keep up with content updates without needing a db refresh
-            # main difference is cache_dirty will default to False or similar
+            storage_layer = self._tag_display_types_to_layers[ ClientTags.TAG_DISPLAY_STORAGE ]
+            siblings_layer = self._tag_display_types_to_layers[ ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ]
             
-            source_service_keys_to_statuses_to_tags = self._tag_display_types_to_service_keys_to_statuses_to_tags[ ClientTags.TAG_DISPLAY_STORAGE ]
+            # siblings (parents later)
             
-            destination_service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+            # the db usually gives us these pre-computed, so we only need to collapse here for services that have had content updates since
+            # and ultimately, this will make parents virtual, whether that is before or after we move this calc down to db cache level
             
-            for ( service_key, source_statuses_to_tags ) in source_service_keys_to_statuses_to_tags.items():
+            if len( self._siblings_dirty_service_keys ) > 0:
                 
-                destination_statuses_to_tags = tag_siblings_manager.CollapseStatusesToTags( service_key, source_statuses_to_tags )
+                tag_siblings_manager = HG.client_controller.tag_siblings_manager
+                
+                for service_key in self._siblings_dirty_service_keys:
+                    
+                    source_statuses_to_tags = self._GetStatusesToTags( storage_layer, service_key )
+                    
+                    destination_statuses_to_tags = tag_siblings_manager.CollapseStatusesToTags( service_key, source_statuses_to_tags )
+                    
+                    for status in ( HC.CONTENT_STATUS_CURRENT, HC.CONTENT_STATUS_DELETED, HC.CONTENT_STATUS_PENDING, HC.CONTENT_STATUS_PETITIONED ):
+                        
+                        key = ( service_key, status )
+                        
+                        dest_tags = destination_statuses_to_tags[ status ]
+                        
+                        if len( dest_tags ) == 0:
+                            
+                            if key in siblings_layer:
+                                
+                                del siblings_layer[ key ]
+                                
+                            
+                        elif dest_tags == source_statuses_to_tags[ status ]:
+                            
+                            siblings_layer[ key ] = storage_layer[ key ]
+                            
+                        else:
+                            
+                            siblings_layer[ key ] = tag_id_table.GetTagIds( dest_tags )
+                            
+                        
+                    
                 
-                destination_service_keys_to_statuses_to_tags[ service_key ] = destination_statuses_to_tags
+                self._siblings_dirty_service_keys = set()
                 
             
-            self._tag_display_types_to_service_keys_to_statuses_to_tags[ ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ] = destination_service_keys_to_statuses_to_tags
-            
             # display filtering
             
             tag_display_manager = HG.client_controller.tag_display_manager
             
-            cache_jobs = []
-            
-            cache_jobs.append( ( ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS, ClientTags.TAG_DISPLAY_SINGLE_MEDIA ) )
-            cache_jobs.append( ( ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS, ClientTags.TAG_DISPLAY_SELECTION_LIST ) )
-            
-            for ( source_tag_display_type, dest_tag_display_type ) in cache_jobs:
+            for dest_tag_display_type in ( ClientTags.TAG_DISPLAY_SINGLE_MEDIA, ClientTags.TAG_DISPLAY_SELECTION_LIST ):
                 
-                source_service_keys_to_statuses_to_tags = self._tag_display_types_to_service_keys_to_statuses_to_tags[ source_tag_display_type ]
+                dest_layer = {}
                 
-                destination_service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+                layer_is_different = False
                 
-                for ( service_key, source_statuses_to_tags ) in source_service_keys_to_statuses_to_tags.items():
+                for ( key, tag_ids ) in siblings_layer.items():
+                    
+                    ( service_key, status ) = key
+                    
+                    if service_key == CC.COMBINED_TAG_SERVICE_KEY:
+                        
+                        continue
+                        
                     
                     if tag_display_manager.FiltersTags( dest_tag_display_type, service_key ):
                         
-                        destination_statuses_to_tags = HydrusData.default_dict_set()
+                        source_tags = tag_id_table.GetTags( tag_ids )
                         
-                        for ( status, source_tags ) in source_statuses_to_tags.items():
+                        dest_tags = tag_display_manager.FilterTags( dest_tag_display_type, service_key, source_tags )
+                        
+                        if len( source_tags ) != len( dest_tags ):
                             
-                            dest_tags = tag_display_manager.FilterTags( dest_tag_display_type, service_key, source_tags )
+                            layer_is_different = True
                             
-                            if len( source_tags ) != len( dest_tags ):
-                                
-                                destination_statuses_to_tags[ status ] = dest_tags
+                            if len( dest_tags ) > 0:
                                 
-                            else:
-                                
-                                destination_statuses_to_tags[ status ] = source_tags
+                                dest_layer[ key ] = tag_id_table.GetTagIds( dest_tags )
                                 
                             
+                            continue
+                            
                         
-                        destination_service_keys_to_statuses_to_tags[ service_key ] = destination_statuses_to_tags
-                        
-                    else:
-                        
-                        destination_service_keys_to_statuses_to_tags[ service_key ] = source_statuses_to_tags
-                        
+                    
+                    dest_layer[ key ] = tag_ids
                     
                 
-                self._tag_display_types_to_service_keys_to_statuses_to_tags[ dest_tag_display_type ] = destination_service_keys_to_statuses_to_tags
+                if not layer_is_different:
+                    
+                    dest_layer = siblings_layer
+                    
+                
+                self._tag_display_types_to_layers[ dest_tag_display_type ] = dest_layer
                 
             
             # combined service merge calculation
             # would be great if this also could be db pre-computed
             
-            for ( tag_display_type, service_keys_to_statuses_to_tags ) in self._tag_display_types_to_service_keys_to_statuses_to_tags.items():
+            distinct_layers = { id( layer ) : layer for layer in self._tag_display_types_to_layers.values() }
+            
+            for layer in distinct_layers.values():
                 
-                combined_statuses_to_tags = HydrusData.default_dict_set()
+                statuses_to_tag_ids_arrays = collections.defaultdict( list )
                 
-                for ( service_key, statuses_to_tags ) in service_keys_to_statuses_to_tags.items():
+                for ( key, tag_ids ) in list( layer.items() ):
+                    
+                    ( service_key, status ) = key
                     
                     if service_key == CC.COMBINED_TAG_SERVICE_KEY:
                         
-                        continue
+                        del layer[ key ]
                         
-                    
-                    for ( status, tags ) in statuses_to_tags.items():
+                    else:
                         
-                        combined_statuses_to_tags[ status ].update( tags )
+                        statuses_to_tag_ids_arrays[ status ].append( tag_ids )
                         
                     
                 
-                service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ] = combined_statuses_to_tags
+                for ( status, tag_ids_arrays ) in statuses_to_tag_ids_arrays.items():
+                    
+                    if len( tag_ids_arrays ) == 1:
+                        
+                        ( combined_tag_ids, ) = tag_ids_arrays
+                        
+                    else:
+                        
+                        combined_tag_ids = array.array( 'I', set( itertools.chain.from_iterable( tag_ids_arrays ) ) )
+                        
+                    
+                    layer[ ( CC.COMBINED_TAG_SERVICE_KEY, status ) ] = combined_tag_ids
+                    
                 
             
             #
@@ -3537,6 +3837,52 @@ class TagsManager( object ):
             
         
     
+    def _SetStatusesToTags( self, layer, service_key, statuses_to_tags ):
+        
+        for status in ( HC.CONTENT_STATUS_CURRENT, HC.CONTENT_STATUS_DELETED, HC.CONTENT_STATUS_PENDING, HC.CONTENT_STATUS_PETITIONED ):
+            
+            key = ( service_key, status )
+            
+            tags = statuses_to_tags[ status ]
+            
+            if len( tags ) > 0:
+                
+                layer[ key ] = ClientTags.tag_id_table.GetTagIds( tags )
+                
+            elif key in layer:
+                
+                del layer[ key ]
+                
+            
+        
+        self._siblings_dirty_service_keys.add( service_key )
+        
+        self._cache_is_dirty = True
+        
+    
+    @staticmethod
+    def FromTagIds( service_keys_to_statuses_to_tag_ids, service_keys_to_statuses_to_display_tag_ids = None ):
+        
+        # for callers that already have ClientTags.tag_id_table ids, like the db, so we skip the string lookups
+        
+        tags_manager = TagsManager( {} )
+        
+        storage_layer = tags_manager._ConvertTagIdsToLayer( service_keys_to_statuses_to_tag_ids )
+        
+        if service_keys_to_statuses_to_display_tag_ids is None:
+            
+            siblings_layer = None
+            
+        else:
+            
+            siblings_layer = tags_manager._ConvertTagIdsToLayer( service_keys_to_statuses_to_display_tag_ids )
+            
+        
+        tags_manager._Initialise( storage_layer, siblings_layer )
+        
+        return tags_manager
+        
+    
     @staticmethod
     def MergeTagsManagers( tags_managers ):
         
@@ -3583,16 +3929,16 @@ class TagsManager( object ):
     
     def DeletePending( self, service_key ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( ClientTags.TAG_DISPLAY_STORAGE )
+        storage_layer = self._GetLayer( ClientTags.TAG_DISPLAY_STORAGE )
         
-        statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
-        
-        if len( statuses_to_tags[ HC.CONTENT_STATUS_PENDING ] ) + len( statuses_to_tags[ HC.CONTENT_STATUS_PETITIONED ] ) > 0:
+        if ( service_key, HC.CONTENT_STATUS_PENDING ) in storage_layer or ( service_key, HC.CONTENT_STATUS_PETITIONED ) in storage_layer:
+            
+            statuses_to_tags = self._GetStatusesToTags( storage_layer, service_key )
             
             statuses_to_tags[ HC.CONTENT_STATUS_PENDING ] = set()
             statuses_to_tags[ HC.CONTENT_STATUS_PETITIONED ] = set()
             
-            self._cache_is_dirty = True
+            self._SetStatusesToTags( storage_layer, service_key, statuses_to_tags )
             
         
     
@@ -3600,28 +3946,25 @@ class TagsManager( object ):
         
         dupe_tags_manager = TagsManager( {} )
         
-        dupe_tag_display_types_to_service_keys_to_statuses_to_tags = dict()
+        # the arrays are never edited in place, so they can be shared, but the layers themselves need copying
         
-        for ( tag_display_type, service_keys_to_statuses_to_tags ) in self._tag_display_types_to_service_keys_to_statuses_to_tags.items():
-            
-            dupe_service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+        layer_ids_to_dupe_layers = {}
+        
+        dupe_tag_display_types_to_layers = {}
+        
+        for ( tag_display_type, layer ) in self._tag_display_types_to_layers.items():
             
-            for ( service_key, statuses_to_tags ) in service_keys_to_statuses_to_tags.items():
+            if id( layer ) not in layer_ids_to_dupe_layers:
                 
-                dupe_statuses_to_tags = HydrusData.default_dict_set()
-                
-                for ( status, tags ) in statuses_to_tags.items():
-                    
-                    dupe_statuses_to_tags[ status ] = set( tags )
-                    
-                
-                dupe_service_keys_to_statuses_to_tags[ service_key ] = dupe_statuses_to_tags
+                layer_ids_to_dupe_layers[ id( layer ) ] = dict( layer )
                 
             
-            dupe_tag_display_types_to_service_keys_to_statuses_to_tags[ tag_display_type ] = dupe_service_keys_to_statuses_to_tags
+            dupe_tag_display_types_to_layers[ tag_display_type ] = layer_ids_to_dupe_layers[ id( layer ) ]
             
         
-        dupe_tags_manager._tag_display_types_to_service_keys_to_statuses_to_tags = dupe_tag_display_types_to_service_keys_to_statuses_to_tags
+        dupe_tags_manager._tag_display_types_to_layers = dupe_tag_display_types_to_layers
+        
+        dupe_tags_manager._siblings_dirty_service_keys = set( self._siblings_dirty_service_keys )
         dupe_tags_manager._cache_is_dirty = self._cache_is_dirty
         
         return dupe_tags_manager
@@ -3629,14 +3972,7 @@ class TagsManager( object ):
     
     def GetComparableNamespaceSlice( self, namespaces, tag_display_type ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
-        
-        combined_statuses_to_tags = service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ]
-        
-        combined_current = combined_statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ]
-        combined_pending = combined_statuses_to_tags[ HC.CONTENT_STATUS_PENDING ]
-        
-        combined = combined_current.union( combined_pending )
+        combined = self.GetCurrentAndPending( CC.COMBINED_TAG_SERVICE_KEY, tag_display_type )
         
         pairs = [ HydrusTags.SplitTag( tag ) for tag in combined ]
         
@@ -3656,41 +3992,49 @@ class TagsManager( object ):
     
     def GetCurrent( self, service_key, tag_display_type ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
-        
-        statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
-        
-        return statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ]
+        return self._GetTags( tag_display_type, service_key, HC.CONTENT_STATUS_CURRENT )
         
     
     def GetCurrentAndPending( self, service_key, tag_display_type ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
+        layer = self._GetLayer( tag_display_type )
         
-        statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
+        tag_ids = itertools.chain( layer.get( ( service_key, HC.CONTENT_STATUS_CURRENT ), () ), layer.get( ( service_key, HC.CONTENT_STATUS_PENDING ), () ) )
         
-        return statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ].union( statuses_to_tags[ HC.CONTENT_STATUS_PENDING ] )
+        return ClientTags.tag_id_table.GetTags( tag_ids )
         
     
     def GetDeleted( self, service_key, tag_display_type ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
+        return self._GetTags( tag_display_type, service_key, HC.CONTENT_STATUS_DELETED )
         
-        statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
+    
+    def GetNumCurrentAndPending( self, service_key, tag_display_type ):
         
-        return statuses_to_tags[ HC.CONTENT_STATUS_DELETED ]
+        # for callers that only want the count, like sorting by number of tags, so we do not make the strings
         
-    
-    def GetNamespaceSlice( self, namespaces, tag_display_type ):
+        layer = self._GetLayer( tag_display_type )
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
+        current_tag_ids = layer.get( ( service_key, HC.CONTENT_STATUS_CURRENT ), () )
+        pending_tag_ids = layer.get( ( service_key, HC.CONTENT_STATUS_PENDING ), () )
         
-        combined_statuses_to_tags = service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ]
+        if len( pending_tag_ids ) == 0:
+            
+            return len( current_tag_ids )
+            
+        elif len( current_tag_ids ) == 0:
+            
+            return len( pending_tag_ids )
+            
+        
+        # the combined service can have a tag current in one service and pending in another
         
-        combined_current = combined_statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ]
-        combined_pending = combined_statuses_to_tags[ HC.CONTENT_STATUS_PENDING ]
+        return len( set( current_tag_ids ).union( pending_tag_ids ) )
         
-        combined = combined_current.union( combined_pending )
+    
+    def GetNamespaceSlice( self, namespaces, tag_display_type ):
+        
+        combined = self.GetCurrentAndPending( CC.COMBINED_TAG_SERVICE_KEY, tag_display_type )
         
         slice = { tag for tag in combined if True in ( tag.startswith( namespace + ':' ) for namespace in namespaces ) }
         
@@ -3703,67 +4047,116 @@ class TagsManager( object ):
         
         num_tags = 0
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
+        layer = self._GetLayer( tag_display_type )
         
-        statuses_to_tags = service_keys_to_statuses_to_tags[ tag_search_context.service_key ]
+        service_key = tag_search_context.service_key
         
-        if tag_search_context.include_current_tags: num_tags += len( statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ] )
-        if tag_search_context.include_pending_tags: num_tags += len( statuses_to_tags[ HC.CONTENT_STATUS_PENDING ] )
+        if tag_search_context.include_current_tags: num_tags += len( layer.get( ( service_key, HC.CONTENT_STATUS_CURRENT ), () ) )
+        if tag_search_context.include_pending_tags: num_tags += len( layer.get( ( service_key, HC.CONTENT_STATUS_PENDING ), () ) )
         
         return num_tags
         
     
     def GetPending( self, service_key, tag_display_type ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
-        
-        statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
-        
-        return statuses_to_tags[ HC.CONTENT_STATUS_PENDING ]
+        return self._GetTags( tag_display_type, service_key, HC.CONTENT_STATUS_PENDING )
         
     
     def GetPetitioned( self, service_key, tag_display_type ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
-        
-        statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
-        
-        return statuses_to_tags[ HC.CONTENT_STATUS_PETITIONED ]
+        return self._GetTags( tag_display_type, service_key, HC.CONTENT_STATUS_PETITIONED )
         
     
     def GetServiceKeysToStatusesToTags( self, tag_display_type ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
+        layer = self._GetLayer( tag_display_type )
+        
+        service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+        
+        for service_key in self._GetServiceKeys( layer ):
+            
+            service_keys_to_statuses_to_tags[ service_key ] = self._GetStatusesToTags( layer, service_key )
+            
         
         return service_keys_to_statuses_to_tags
         
     
     def GetStatusesToTags( self, service_key, tag_display_type ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
+        layer = self._GetLayer( tag_display_type )
+        
+        return self._GetStatusesToTags( layer, service_key )
+        
+    
+    def HasAllTags( self, tags, tag_display_type ):
+        
+        tag_ids = { ClientTags.tag_id_table.PeekTagId( tag ) for tag in tags }
+        
+        if None in tag_ids:
+            
+            return False
+            
+        
+        return tag_ids.issubset( self._GetCurrentAndPendingTagIds( tag_display_type ) )
+        
+    
+    def HasAnyTags( self, tags, tag_display_type ):
+        
+        tag_ids = { ClientTags.tag_id_table.PeekTagId( tag ) for tag in tags }
         
-        return service_keys_to_statuses_to_tags[ service_key ]
+        return not tag_ids.isdisjoint( self._GetCurrentAndPendingTagIds( tag_display_type ) )
         
     
     def HasTag( self, tag, tag_display_type ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
+        tag_id = ClientTags.tag_id_table.PeekTagId( tag )
         
-        combined_statuses_to_tags = service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ]
+        if tag_id is None:
+            
+            return False
+            
         
-        return tag in combined_statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ] or tag in combined_statuses_to_tags[ HC.CONTENT_STATUS_PENDING ]
+        layer = self._GetLayer( tag_display_type )
+        
+        return tag_id in layer.get( ( CC.COMBINED_TAG_SERVICE_KEY, HC.CONTENT_STATUS_CURRENT ), () ) or tag_id in layer.get( ( CC.COMBINED_TAG_SERVICE_KEY, HC.CONTENT_STATUS_PENDING ), () )
+        
+    
+    def NewSiblingsLookup( self, changed_tag_ids ):
+        
+        # only the services that have a tag whose sibling changed need collapsing again. None means we do not know, so that is all of them
+        
+        storage_layer = self._tag_display_types_to_layers[ ClientTags.TAG_DISPLAY_STORAGE ]
+        
+        for ( key, tag_ids ) in storage_layer.items():
+            
+            ( service_key, status ) = key
+            
+            if service_key in self._siblings_dirty_service_keys:
+                
+                continue
+                
+            
+            if changed_tag_ids is None or not changed_tag_ids.isdisjoint( tag_ids ):
+                
+                self._siblings_dirty_service_keys.add( service_key )
+                
+                self._cache_is_dirty = True
+                
+            
         
     
     def NewTagDisplayRules( self ):
         
+        # the display filters have changed, but siblings have not, so we can keep our sibling layer
+        
         self._cache_is_dirty = True
         
     
     def ProcessContentUpdate( self, service_key, content_update ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( ClientTags.TAG_DISPLAY_STORAGE )
+        storage_layer = self._GetLayer( ClientTags.TAG_DISPLAY_STORAGE )
         
-        statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
+        statuses_to_tags = self._GetStatusesToTags( storage_layer, service_key )
         
         ( data_type, action, row ) = content_update.ToTuple()
         
@@ -3810,18 +4203,16 @@ class TagsManager( object ):
             statuses_to_tags[ HC.CONTENT_STATUS_DELETED ].discard( tag )
             
         
-        self._cache_is_dirty = True
+        self._SetStatusesToTags( storage_layer, service_key, statuses_to_tags )
         
     
     def ResetService( self, service_key ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( ClientTags.TAG_DISPLAY_STORAGE )
+        storage_layer = self._GetLayer( ClientTags.TAG_DISPLAY_STORAGE )
         
-        if service_key in service_keys_to_statuses_to_tags:
-            
-            del service_keys_to_statuses_to_tags[ service_key ]
+        if service_key in self._GetServiceKeys( storage_layer ):
             
-            self._cache_is_dirty = True
+            self._SetStatusesToTags( storage_layer, service_key, HydrusData.default_dict_set() )
             
         
     
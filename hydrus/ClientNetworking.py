@@ -8,6 +8,7 @@ from . import HydrusNetwork
 from . import HydrusNetworking
 from . import HydrusPaths
 from . import HydrusSerialisable
+import heapq
 import itertools
 import os
 import random
@@ -34,6 +35,8 @@ job_status_str_lookup[ JOB_STATUS_AWAITING_LOGIN ] = 'waiting for login'
 job_status_str_lookup[ JOB_STATUS_AWAITING_SLOT ] = 'waiting for slot'
 job_status_str_lookup[ JOB_STATUS_RUNNING ] = 'running'
 
+WAITING_JOB_STATUSES = ( JOB_STATUS_AWAITING_VALIDITY, JOB_STATUS_AWAITING_BANDWIDTH, JOB_STATUS_AWAITING_LOGIN, JOB_STATUS_AWAITING_SLOT )
+
 class NetworkEngine( object ):
     
     def __init__( self, controller, bandwidth_manager, session_manager, domain_manager, login_manager ):
@@ -52,22 +55,41 @@ class NetworkEngine( object ):
         
         self._lock = threading.Lock()
         
-        self.RefreshOptions()
-        
         self._new_work_to_do = threading.Event()
         
         self._domains_to_login = []
         
         self._active_domains_counter = collections.Counter()
         
-        self._jobs_awaiting_validity = []
+        # we don't want to poll every waiting job every second, so jobs are filed by why they are waiting:
+        # awake jobs get processed next loop, sleeping jobs sit in a heap until their wake time, and jobs blocked on the same thing (a bandwidth context, a login, a slot) queue up behind one another so we only test the first
+        # dicts with None values are ordered sets here
+        
+        self._jobs_to_statuses = {}
+        
+        self._statuses_to_awake_jobs = { status : {} for status in WAITING_JOB_STATUSES }
+        
+        self._sleeping_jobs_heap = []
+        self._sleeping_jobs_to_heap_counters = {}
+        self._sleeping_jobs_heap_counter = itertools.count()
+        
+        self._statuses_to_blocking_keys_to_jobs = { status : {} for status in WAITING_JOB_STATUSES }
+        self._blocked_jobs_to_blocking_keys = {}
+        
+        # each queue of blocked jobs has a time to test its first job again: 0 for every loop, a timestamp for when the blocker says it will be free, or None for only when something wakes it, like a job on that domain finishing
+        self._blocking_keys_to_wake_times = {}
+        
+        # jobs tell us about cancels and overrides from their own threads, so this is a lock-free deque rather than something that needs self._lock
+        self._jobs_to_wake = collections.deque()
+        
+        self._wake_bandwidth_jobs = threading.Event()
+        
         self._current_validation_process = None
-        self._jobs_awaiting_bandwidth = []
-        self._jobs_awaiting_login = []
         self._current_login_process = None
-        self._jobs_awaiting_slot = []
         self._jobs_running = []
         
+        self.RefreshOptions()
+        
         self._pause_all_new_network_traffic = self.controller.new_options.GetBoolean( 'pause_all_new_network_traffic' )
         
         self._is_running = False
@@ -77,6 +99,14 @@ class NetworkEngine( object ):
         self.controller.sub( self, 'RefreshOptions', 'notify_new_options' )
         
     
+    def _WakeBlockedJobs( self, status ):
+        
+        for blocking_key in self._statuses_to_blocking_keys_to_jobs[ status ].keys():
+            
+            self._blocking_keys_to_wake_times[ ( status, blocking_key ) ] = 0
+            
+        
+    
     def AddJob( self, job ):
         
         if HG.network_report_mode:
@@ -88,7 +118,9 @@ class NetworkEngine( object ):
             
             job.engine = self
             
-            self._jobs_awaiting_validity.append( job )
+            self._jobs_to_statuses[ job ] = JOB_STATUS_AWAITING_VALIDITY
+            
+            self._statuses_to_awake_jobs[ JOB_STATUS_AWAITING_VALIDITY ][ job ] = None
             
         
         self._new_work_to_do.set()
@@ -108,13 +140,9 @@ class NetworkEngine( object ):
         
         with self._lock:
             
-            jobs = []
+            jobs = [ ( status, job ) for ( job, status ) in self._jobs_to_statuses.items() ]
             
-            jobs.extend( ( ( JOB_STATUS_AWAITING_VALIDITY, j ) for j in self._jobs_awaiting_validity ) )
-            jobs.extend( ( ( JOB_STATUS_AWAITING_BANDWIDTH, j ) for j in self._jobs_awaiting_bandwidth ) )
-            jobs.extend( ( ( JOB_STATUS_AWAITING_LOGIN, j ) for j in self._jobs_awaiting_login ) )
-            jobs.extend( ( ( JOB_STATUS_AWAITING_SLOT, j ) for j in self._jobs_awaiting_slot ) )
-            jobs.extend( ( ( JOB_STATUS_RUNNING, j ) for j in self._jobs_running ) )
+            jobs.sort( key = lambda row: row[0] )
             
             return jobs
             
@@ -124,7 +152,7 @@ class NetworkEngine( object ):
         
         with self._lock:
             
-            return len( self._jobs_awaiting_validity ) + len( self._jobs_awaiting_bandwidth ) + len( self._jobs_awaiting_login ) + len( self._jobs_awaiting_slot ) + len( self._jobs_running ) > 50
+            return len( self._jobs_to_statuses ) > 50
             
         
     
@@ -146,6 +174,231 @@ class NetworkEngine( object ):
     
     def MainLoop( self ):
         
+        # the process functions fill this in to say what a job is blocked on
+        jobs_to_waits = {}
+        
+        def BlockJob( job, status, blocking_key, wake_time ):
+            
+            # jobs waiting on the same thing will all get the same answer, so we only need to ask the first of them
+            
+            blocking_keys_to_jobs = self._statuses_to_blocking_keys_to_jobs[ status ]
+            
+            key = ( status, blocking_key )
+            
+            if blocking_key not in blocking_keys_to_jobs:
+                
+                blocking_keys_to_jobs[ blocking_key ] = {}
+                
+                self._blocking_keys_to_wake_times[ key ] = wake_time
+                
+            else:
+                
+                existing_wake_time = self._blocking_keys_to_wake_times[ key ]
+                
+                if existing_wake_time is None:
+                    
+                    self._blocking_keys_to_wake_times[ key ] = wake_time
+                    
+                elif wake_time is not None:
+                    
+                    self._blocking_keys_to_wake_times[ key ] = min( existing_wake_time, wake_time )
+                    
+                
+            
+            blocking_keys_to_jobs[ blocking_key ][ job ] = None
+            
+            self._blocked_jobs_to_blocking_keys[ job ] = blocking_key
+            
+        
+        def DeleteBlockingKey( status, blocking_key ):
+            
+            del self._statuses_to_blocking_keys_to_jobs[ status ][ blocking_key ]
+            del self._blocking_keys_to_wake_times[ ( status, blocking_key ) ]
+            
+        
+        def MoveJob( job, status ):
+            
+            self._jobs_to_statuses[ job ] = status
+            
+            if status in self._statuses_to_awake_jobs:
+                
+                self._statuses_to_awake_jobs[ status ][ job ] = None
+                
+            
+        
+        def ProcessJob( job, status, process_job_callable ):
+            
+            # returns ( is_blocked, blocking_key, wake_time )
+            
+            job_is_still_here = process_job_callable( job )
+            
+            ( blocking_key, wake_time ) = jobs_to_waits.pop( job, ( None, 0 ) )
+            
+            if self._jobs_to_statuses[ job ] != status:
+                
+                return ( False, None, None )
+                
+            
+            if not job_is_still_here:
+                
+                del self._jobs_to_statuses[ job ]
+                
+                return ( False, None, None )
+                
+            
+            if job.IsAsleep():
+                
+                SleepJob( job )
+                
+                return ( False, None, None )
+                
+            
+            return ( True, blocking_key, wake_time )
+            
+        
+        def ProcessJobs( status, process_job_callable ):
+            
+            blocking_keys_to_jobs = self._statuses_to_blocking_keys_to_jobs[ status ]
+            
+            for ( blocking_key, jobs ) in list( blocking_keys_to_jobs.items() ):
+                
+                if not HydrusData.TimeHasPassed( self._blocking_keys_to_wake_times[ ( status, blocking_key ) ] ):
+                    
+                    continue
+                    
+                
+                while len( jobs ) > 0:
+                    
+                    job = next( iter( jobs ) )
+                    
+                    ( is_blocked, new_blocking_key, wake_time ) = ProcessJob( job, status, process_job_callable )
+                    
+                    if is_blocked and new_blocking_key == blocking_key:
+                        
+                        # still blocked by the same thing, so everything behind it is too
+                        
+                        self._blocking_keys_to_wake_times[ ( status, blocking_key ) ] = wake_time
+                        
+                        break
+                        
+                    
+                    del jobs[ job ]
+                    del self._blocked_jobs_to_blocking_keys[ job ]
+                    
+                    if is_blocked:
+                        
+                        BlockJob( job, status, new_blocking_key, wake_time )
+                        
+                    
+                
+                if len( jobs ) == 0 and blocking_keys_to_jobs.get( blocking_key ) is jobs:
+                    
+                    DeleteBlockingKey( status, blocking_key )
+                    
+                
+            
+            awake_jobs = self._statuses_to_awake_jobs[ status ]
+            
+            while len( awake_jobs ) > 0:
+                
+                job = next( iter( awake_jobs ) )
+                
+                del awake_jobs[ job ]
+                
+                ( is_blocked, blocking_key, wake_time ) = ProcessJob( job, status, process_job_callable )
+                
+                if is_blocked:
+                    
+                    BlockJob( job, status, blocking_key, wake_time )
+                    
+                
+            
+        
+        def SleepJob( job ):
+            
+            heap_counter = next( self._sleeping_jobs_heap_counter )
+            
+            heapq.heappush( self._sleeping_jobs_heap, ( job.GetWakeTime(), heap_counter, job ) )
+            
+            self._sleeping_jobs_to_heap_counters[ job ] = heap_counter
+            
+        
+        def WakeJob( job ):
+            
+            if job not in self._jobs_to_statuses:
+                
+                return
+                
+            
+            status = self._jobs_to_statuses[ job ]
+            
+            if status not in self._statuses_to_awake_jobs:
+                
+                return
+                
+            
+            if job in self._sleeping_jobs_to_heap_counters:
+                
+                # the heap entry is now stale and will be skipped when it comes up
+                
+                del self._sleeping_jobs_to_heap_counters[ job ]
+                
+            
+            if job in self._blocked_jobs_to_blocking_keys:
+                
+                blocking_key = self._blocked_jobs_to_blocking_keys.pop( job )
+                
+                blocking_keys_to_jobs = self._statuses_to_blocking_keys_to_jobs[ status ]
+                
+                del blocking_keys_to_jobs[ blocking_key ][ job ]
+                
+                if len( blocking_keys_to_jobs[ blocking_key ] ) == 0:
+                    
+                    DeleteBlockingKey( status, blocking_key )
+                    
+                
+            
+            self._statuses_to_awake_jobs[ status ][ job ] = None
+            
+        
+        def WakeBlockingKey( status, blocking_key ):
+            
+            if blocking_key in self._statuses_to_blocking_keys_to_jobs[ status ]:
+                
+                self._blocking_keys_to_wake_times[ ( status, blocking_key ) ] = 0
+                
+            
+        
+        def WaitOn( job, blocking_key, wake_time = 0 ):
+            
+            jobs_to_waits[ job ] = ( blocking_key, wake_time )
+            
+        
+        def WakeJobs():
+            
+            while len( self._jobs_to_wake ) > 0:
+                
+                WakeJob( self._jobs_to_wake.popleft() )
+                
+            
+            if self._wake_bandwidth_jobs.is_set():
+                
+                self._wake_bandwidth_jobs.clear()
+                
+                self._WakeBlockedJobs( JOB_STATUS_AWAITING_BANDWIDTH )
+                
+            
+            while len( self._sleeping_jobs_heap ) > 0 and HydrusData.TimeHasPassed( self._sleeping_jobs_heap[0][0] ):
+                
+                ( wake_time, heap_counter, job ) = heapq.heappop( self._sleeping_jobs_heap )
+                
+                if self._sleeping_jobs_to_heap_counters.get( job ) == heap_counter:
+                    
+                    WakeJob( job )
+                    
+                
+            
+        
         def ProcessValidationJob( job ):
             
             if job.IsDone():
@@ -190,7 +443,7 @@ class NetworkEngine( object ):
                 
             else:
                 
-                self._jobs_awaiting_bandwidth.append( job )
+                MoveJob( job, JOB_STATUS_AWAITING_BANDWIDTH )
                 
                 return False
                 
@@ -219,11 +472,15 @@ class NetworkEngine( object ):
                 
             elif not job.BandwidthOK():
                 
+                ( bandwidth_network_context, wake_time ) = job.GetBandwidthWait()
+                
+                WaitOn( job, bandwidth_network_context, wake_time )
+                
                 return True
                 
             else:
                 
-                self._jobs_awaiting_login.append( job )
+                MoveJob( job, JOB_STATUS_AWAITING_LOGIN )
                 
                 return False
                 
@@ -323,11 +580,13 @@ class NetworkEngine( object ):
                     job.SetStatus( 'waiting in login queue\u2026' )
                     
                 
+                WaitOn( job, job.GetLoginNetworkContext() )
+                
                 return True
                 
             else:
                 
-                self._jobs_awaiting_slot.append( job )
+                MoveJob( job, JOB_STATUS_AWAITING_SLOT )
                 
                 return False
                 
@@ -376,12 +635,18 @@ class NetworkEngine( object ):
                     
                     job.SetStatus( 'waiting for a slot on this domain' )
                     
-                    job.Sleep( 2 )
+                    # only a job on this domain finishing will change this
+                    
+                    WaitOn( job, ( 'domain', job.GetSecondLevelDomain() ), None )
                     
                     return True
                     
                 elif not job.TokensOK():
                     
+                    ( token_key, wake_time ) = job.GetGalleryTokenWait()
+                    
+                    WaitOn( job, ( 'gallery token', token_key ), wake_time )
+                    
                     return True
                     
                 else:
@@ -395,6 +660,8 @@ class NetworkEngine( object ):
                     
                     self.controller.CallToThread( job.Start )
                     
+                    MoveJob( job, JOB_STATUS_RUNNING )
+                    
                     self._jobs_running.append( job )
                     
                     return False
@@ -404,6 +671,8 @@ class NetworkEngine( object ):
                 
                 job.SetStatus( 'waiting for a slot\u2026' )
                 
+                WaitOn( job, None, None )
+                
                 return True
                 
             
@@ -426,6 +695,11 @@ class NetworkEngine( object ):
                     del self._active_domains_counter[ second_level_domain ]
                     
                 
+                WakeBlockingKey( JOB_STATUS_AWAITING_SLOT, None )
+                WakeBlockingKey( JOB_STATUS_AWAITING_SLOT, ( 'domain', second_level_domain ) )
+                
+                del self._jobs_to_statuses[ job ]
+                
                 return False
                 
             else:
@@ -440,22 +714,26 @@ class NetworkEngine( object ):
             
             with self._lock:
                 
-                self._jobs_awaiting_validity = list( filter( ProcessValidationJob, self._jobs_awaiting_validity ) )
+                WakeJobs()
+                
+                ProcessJobs( JOB_STATUS_AWAITING_VALIDITY, ProcessValidationJob )
                 
                 ProcessCurrentValidationJob()
                 
-                self._jobs_awaiting_bandwidth = list( filter( ProcessBandwidthJob, self._jobs_awaiting_bandwidth ) )
+                ProcessJobs( JOB_STATUS_AWAITING_BANDWIDTH, ProcessBandwidthJob )
                 
                 ProcessForceLogins()
                 
-                self._jobs_awaiting_login = list( filter( ProcessLoginJob, self._jobs_awaiting_login ) )
+                ProcessJobs( JOB_STATUS_AWAITING_LOGIN, ProcessLoginJob )
                 
                 ProcessCurrentLoginJob()
                 
-                self._jobs_awaiting_slot = list( filter( ProcessReadyJob, self._jobs_awaiting_slot ) )
+                # finished jobs free up their slots before we fill them
                 
                 self._jobs_running = list( filter( ProcessRunningJob, self._jobs_running ) )
                 
+                ProcessJobs( JOB_STATUS_AWAITING_SLOT, ProcessReadyJob )
+                
             
             # we want to catch the rollover of the second for bandwidth jobs
             
@@ -488,6 +766,8 @@ class NetworkEngine( object ):
             self.MAX_JOBS = self.controller.new_options.GetInteger( 'max_network_jobs' )
             self.MAX_JOBS_PER_DOMAIN = self.controller.new_options.GetInteger( 'max_network_jobs_per_domain' )
             
+            self._WakeBlockedJobs( JOB_STATUS_AWAITING_SLOT )
+            
         
     
     def Shutdown( self ):
@@ -497,3 +777,21 @@ class NetworkEngine( object ):
         self._new_work_to_do.set()
         
     
+    def WakeBandwidthJobs( self ):
+        
+        # this comes from whatever thread changed the bandwidth rules, so same deal as below
+        
+        self._wake_bandwidth_jobs.set()
+        
+        self._new_work_to_do.set()
+        
+    
+    def WakeJob( self, job ):
+        
+        # this is called from the job's thread, maybe while it holds its own lock, so we must not take self._lock here
+        
+        self._jobs_to_wake.append( job )
+        
+        self._new_work_to_do.set()
+        
+    
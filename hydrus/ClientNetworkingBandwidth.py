@@ -115,6 +115,16 @@ class NetworkBandwidthManager( HydrusSerialisable.SerialisableBase ):
         self._dirty = True
         
     
+    def _WakeBandwidthJobs( self ):
+        
+        # jobs waiting on bandwidth only get asked again when their estimate says it is free, so tell the engine when we change that estimate
+        
+        if self.engine is not None:
+            
+            self.engine.WakeBandwidthJobs()
+            
+        
+    
     def AlreadyHaveExactlyTheseBandwidthRules( self, network_context, bandwidth_rules ):
         
         with self._lock:
@@ -220,6 +230,8 @@ class NetworkBandwidthManager( HydrusSerialisable.SerialisableBase ):
             self._SetDirty()
             
         
+        self._WakeBandwidthJobs()
+        
     
     def DeleteHistory( self, network_contexts ):
         
@@ -242,6 +254,8 @@ class NetworkBandwidthManager( HydrusSerialisable.SerialisableBase ):
             self._SetDirty()
             
         
+        self._WakeBandwidthJobs()
+        
     
     def GetDefaultRules( self ):
         
@@ -426,6 +440,8 @@ class NetworkBandwidthManager( HydrusSerialisable.SerialisableBase ):
             self._SetDirty()
             
         
+        self._WakeBandwidthJobs()
+        
     
     def TryToConsumeAGalleryToken( self, second_level_domain, query_type ):
         
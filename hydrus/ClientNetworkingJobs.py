@@ -134,6 +134,8 @@ class NetworkJob( object ):
         self._creation_time = HydrusData.GetNow()
         
         self._bandwidth_tracker = HydrusNetworking.BandwidthTracker()
+        self._bandwidth_blocking_network_context = None
+        self._bandwidth_wake_time = 0
         
         self._connection_error_wake_time = 0
         self._serverside_bandwidth_wake_time = 0
@@ -159,6 +161,7 @@ class NetworkJob( object ):
         
         self._gallery_token_name = None
         self._gallery_token_consumed = False
+        self._gallery_token_wake_time = 0
         self._bandwidth_manual_override = False
         self._bandwidth_manual_override_delayed_timestamp = None
         
@@ -500,12 +503,24 @@ class NetworkJob( object ):
         
         self._is_done_event.set()
         
+        self._WakeInEngine()
+        
     
     def _Sleep( self, seconds ):
         
         self._wake_time = HydrusData.GetNow() + seconds
         
     
+    def _WakeInEngine( self ):
+        
+        # the engine only looks at sleeping or blocked jobs when it thinks they are ready, so let it know when something changes early
+        
+        if self.engine is not None:
+            
+            self.engine.WakeJob( self )
+            
+        
+    
     def _WaitOnConnectionError( self, status_text ):
         
         connection_error_wait_time = HG.client_controller.new_options.GetInteger( 'connection_error_wait_time' )
@@ -603,19 +618,20 @@ class NetworkJob( object ):
                     
                     waiting_str += '\u2026 (' + bandwidth_network_context.ToHumanString() + ')'
                     
+                    self._bandwidth_blocking_network_context = bandwidth_network_context
+                    
                     self._status_text = waiting_str
                     
-                    if waiting_duration > 1200:
-                        
-                        self._Sleep( 30 )
-                        
-                    elif waiting_duration > 120:
+                    # the engine queues us up behind the context that blocked us and asks again when it says it will be free
+                    # an override is ours alone, so we sleep until then
+                    
+                    if override_coming_first:
                         
-                        self._Sleep( 10 )
+                        self._Sleep( waiting_duration )
                         
-                    elif waiting_duration > 10:
+                    else:
                         
-                        self._Sleep( 1 )
+                        self._bandwidth_wake_time = HydrusData.GetNow() + waiting_duration
                         
                     
                 
@@ -768,6 +784,30 @@ class NetworkJob( object ):
             
         
     
+    def GetBandwidthBlockingNetworkContext( self ):
+        
+        with self._lock:
+            
+            return self._bandwidth_blocking_network_context
+            
+        
+    
+    def GetBandwidthWait( self ):
+        
+        with self._lock:
+            
+            return ( self._bandwidth_blocking_network_context, self._bandwidth_wake_time )
+            
+        
+    
+    def GetGalleryTokenWait( self ):
+        
+        with self._lock:
+            
+            return ( ( self._second_level_domain, self._gallery_token_name ), self._gallery_token_wake_time )
+            
+        
+    
     def GetLoginNetworkContext( self ):
         
         with self._lock:
@@ -828,6 +868,14 @@ class NetworkJob( object ):
             
         
     
+    def GetWakeTime( self ):
+        
+        with self._lock:
+            
+            return self._wake_time
+            
+        
+    
     def HasError( self ):
         
         with self._lock:
@@ -923,6 +971,8 @@ class NetworkJob( object ):
                 self._wake_time = min( self._wake_time, self._bandwidth_manual_override_delayed_timestamp + 1 )
                 
             
+            self._WakeInEngine()
+            
         
     
     def OverrideConnectionErrorWait( self ):
@@ -949,6 +999,8 @@ class NetworkJob( object ):
             
             self._wake_time = 0
             
+            self._WakeInEngine()
+            
         
     
     def SetError( self, e, error ):
@@ -1227,7 +1279,7 @@ class NetworkJob( object ):
                     
                     self._status_text = 'waiting for a ' + self._gallery_token_name + ' slot: next ' + HydrusData.TimestampToPrettyTimeDelta( next_timestamp, just_now_threshold = 1 )
                     
-                    self._Sleep( 1 )
+                    self._gallery_token_wake_time = next_timestamp
                     
                     return False
                     
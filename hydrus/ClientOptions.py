@@ -142,9 +142,12 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         
         self._dictionary[ 'booleans' ][ 'load_images_with_pil' ] = False
         
+        self._dictionary[ 'booleans' ][ 'thumbnail_pack_storage' ] = False
+        
         self._dictionary[ 'booleans' ][ 'use_system_ffmpeg' ] = False
         
         self._dictionary[ 'booleans' ][ 'maintain_similar_files_duplicate_pairs_during_idle' ] = False
+        self._dictionary[ 'booleans' ][ 'use_in_memory_similar_files_index' ] = False
         
         self._dictionary[ 'booleans' ][ 'show_namespaces' ] = True
         
@@ -310,6 +313,8 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         
         self._dictionary[ 'integers' ][ 'video_thumbnail_percentage_in' ] = 35
         
+        self._dictionary[ 'integers' ][ 'num_parallel_file_import_workers' ] = max( 1, min( 16, os.cpu_count() or 1 ) )
+        
         self._dictionary[ 'integers' ][ 'global_audio_volume' ] = 70
         self._dictionary[ 'integers' ][ 'media_viewer_audio_volume' ] = 70
         self._dictionary[ 'integers' ][ 'preview_audio_volume' ] = 70
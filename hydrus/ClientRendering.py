@@ -57,6 +57,12 @@ def GenerateHydrusBitmap( path, mime, compressed = True ):
     
     return GenerateHydrusBitmapFromNumPyImage( numpy_image, compressed = compressed )
     
+def GenerateHydrusBitmapFromBytes( image_bytes, mime, compressed = True ):
+    
+    numpy_image = ClientImageHandling.GenerateNumPyImageFromBytes( image_bytes, mime )
+    
+    return GenerateHydrusBitmapFromNumPyImage( numpy_image, compressed = compressed )
+    
 def GenerateHydrusBitmapFromNumPyImage( numpy_image, compressed = True ):
     
     ( y, x, depth ) = numpy_image.shape
@@ -4,6 +4,7 @@ from . import ClientData
 from . import ClientTags
 import collections
 import datetime
+import json
 from . import HydrusConstants as HC
 from . import HydrusData
 from . import HydrusExceptions
@@ -393,6 +394,15 @@ class FileSearchContext( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def GetCanonicalKey( self ):
+        
+        # the same search always gets the same key, whatever order its predicates were entered in
+        
+        serialisable_predicates = sorted( ( json.dumps( predicate.GetSerialisableTuple() ) for predicate in self._predicates ) )
+        
+        return json.dumps( ( self._file_service_key.hex(), self._tag_search_context.GetSerialisableTuple(), self._search_type, serialisable_predicates ) )
+        
+    
     def GetFileServiceKey( self ): return self._file_service_key
     def GetNamespacesToExclude( self ): return self._namespaces_to_exclude
     def GetNamespacesToInclude( self ): return self._namespaces_to_include
@@ -6,6 +6,7 @@ from . import ClientNetworkingContexts
 from . import ClientNetworkingJobs
 from . import ClientRatings
 from . import ClientThreading
+import collections
 import hashlib
 from . import HydrusConstants as HC
 from . import HydrusData
@@ -24,6 +25,8 @@ import traceback
 from qtpy import QtWidgets as QW
 from . import QtPorting as QP
 
+REPOSITORY_UPDATE_PREFETCH_DEPTH = 3
+
 def GenerateDefaultServiceDictionary( service_type ):
     
     dictionary = HydrusSerialisable.SerialisableDictionary()
@@ -1145,6 +1148,142 @@ class ServiceRestricted( ServiceRemote ):
             
         
     
+class RepositoryUpdateLoader( object ):
+    
+    UPDATE_OK = 0
+    UPDATE_MISSING = 1
+    UPDATE_INVALID = 2
+    
+    def __init__( self, update_hashes, mime, prefetch_depth = REPOSITORY_UPDATE_PREFETCH_DEPTH ):
+        
+        self._update_hashes = collections.deque( update_hashes )
+        self._mime = mime
+        self._prefetch_depth = max( 1, prefetch_depth )
+        
+        self._lock = threading.Lock()
+        
+        self._cancelled = False
+        self._pending_loads = collections.deque()
+        
+    
+    def __iter__( self ):
+        
+        return self
+        
+    
+    def __next__( self ):
+        
+        with self._lock:
+            
+            self._TopUp()
+            
+            if len( self._pending_loads ) == 0:
+                
+                raise StopIteration()
+                
+            
+            ( update_hash, load_done, result ) = self._pending_loads.popleft()
+            
+            # the consumer is about to chew on this one, so start the next while it does
+            
+            self._TopUp()
+            
+        
+        while not load_done.wait( 1.0 ):
+            
+            if HG.model_shutdown:
+                
+                raise HydrusExceptions.ShutdownException( 'Application shutting down!' )
+                
+            
+        
+        ( status, update ) = result
+        
+        return ( update_hash, status, update )
+        
+    
+    def _TopUp( self ):
+        
+        while not self._cancelled and len( self._pending_loads ) < self._prefetch_depth and len( self._update_hashes ) > 0:
+            
+            update_hash = self._update_hashes.popleft()
+            
+            load_done = threading.Event()
+            result = []
+            
+            self._pending_loads.append( ( update_hash, load_done, result ) )
+            
+            HG.client_controller.CallToThread( self._THREADLoad, update_hash, load_done, result )
+            
+        
+    
+    def _THREADLoad( self, update_hash, load_done, result ):
+        
+        status = self.UPDATE_OK
+        update = None
+        
+        try:
+            
+            with self._lock:
+                
+                if self._cancelled:
+                    
+                    return
+                    
+                
+            
+            try:
+                
+                update_path = HG.client_controller.client_files_manager.GetFilePath( update_hash, self._mime )
+                
+            except HydrusExceptions.FileMissingException:
+                
+                status = self.UPDATE_MISSING
+                
+                return
+                
+            
+            try:
+                
+                with open( update_path, 'rb' ) as f:
+                    
+                    update_network_bytes = f.read()
+                    
+                
+                update = HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
+                
+                if isinstance( update, HydrusNetwork.ContentUpdate ):
+                    
+                    # warm up the row count, which will also catch some truncated payloads here rather than in the db job
+                    
+                    update.GetNumRows()
+                    
+                
+            except:
+                
+                status = self.UPDATE_INVALID
+                update = None
+                
+            
+        finally:
+            
+            result.extend( ( status, update ) )
+            
+            load_done.set()
+            
+        
+    
+    def Cancel( self ):
+        
+        with self._lock:
+            
+            self._cancelled = True
+            
+            self._update_hashes.clear()
+            self._pending_loads.clear()
+            
+        
+    
 class ServiceRepository( ServiceRestricted ):
     
     def __init__( self, service_key, service_type, name, dictionary = None ):
@@ -1519,9 +1658,11 @@ class ServiceRepository( ServiceRestricted ):
             
             definition_start_time = HydrusData.GetNowPrecise()
             
+            update_loader = RepositoryUpdateLoader( definition_hashes, HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS )
+            
             try:
                 
-                for definition_hash in definition_hashes:
+                for ( definition_hash, load_status, definition_update ) in update_loader:
                     
                     progress_string = HydrusData.ConvertValueRangeToPrettyString( num_updates_done + 1, num_updates_to_do )
                     
@@ -1534,27 +1675,14 @@ class ServiceRepository( ServiceRestricted ):
                     job_key.SetVariable( 'popup_text_1', status )
                     job_key.SetVariable( 'popup_gauge_1', ( num_updates_done, num_updates_to_do ) )
                     
-                    try:
-                        
-                        update_path = HG.client_controller.client_files_manager.GetFilePath( definition_hash, HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS )
-                        
-                    except HydrusExceptions.FileMissingException:
+                    if load_status == RepositoryUpdateLoader.UPDATE_MISSING:
                         
                         HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE )
                         
                         raise Exception( 'An unusual error has occured during repository processing: an update file was missing. Your repository should be paused, and all update files have been scheduled for a presence check. Please permit file maintenance to check them, or tell it to do so manually, before unpausing your repository.' )
                         
                     
-                    with open( update_path, 'rb' ) as f:
-                        
-                        update_network_bytes = f.read()
-                        
-                    
-                    try:
-                        
-                        definition_update = HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
-                        
-                    except:
+                    if load_status == RepositoryUpdateLoader.UPDATE_INVALID:
                         
                         HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA )
                         
@@ -1573,8 +1701,8 @@ class ServiceRepository( ServiceRestricted ):
                     
                     iterator_dict = {}
                     
-                    iterator_dict[ 'service_hash_ids_to_hashes' ] = iter( definition_update.GetHashIdsToHashes().items() )
-                    iterator_dict[ 'service_tag_ids_to_tags' ] = iter( definition_update.GetTagIdsToTags().items() )
+                    iterator_dict[ 'service_hash_ids_to_hashes' ] = definition_update.IterateHashIdsAndHashes()
+                    iterator_dict[ 'service_tag_ids_to_tags' ] = definition_update.IterateTagIdsAndTags()
                     
                     while len( iterator_dict ) > 0:
                         
@@ -1637,6 +1765,8 @@ class ServiceRepository( ServiceRestricted ):
                 
             finally:
                 
+                update_loader.Cancel()
+                
                 self._LogFinalRowSpeed( definition_start_time, total_definition_rows_completed, 'definitions' )
                 
             
@@ -1647,9 +1777,11 @@ class ServiceRepository( ServiceRestricted ):
             
             content_start_time = HydrusData.GetNowPrecise()
             
+            update_loader = RepositoryUpdateLoader( content_hashes, HC.APPLICATION_HYDRUS_UPDATE_CONTENT )
+            
             try:
                 
-                for content_hash in content_hashes:
+                for ( content_hash, load_status, content_update ) in update_loader:
                     
                     progress_string = HydrusData.ConvertValueRangeToPrettyString( num_updates_done + 1, num_updates_to_do )
                     
@@ -1662,27 +1794,14 @@ class ServiceRepository( ServiceRestricted ):
                     job_key.SetVariable( 'popup_text_1', status )
                     job_key.SetVariable( 'popup_gauge_1', ( num_updates_done, num_updates_to_do ) )
                     
-                    try:
-                        
-                        update_path = HG.client_controller.client_files_manager.GetFilePath( content_hash, HC.APPLICATION_HYDRUS_UPDATE_CONTENT )
-                        
-                    except HydrusExceptions.FileMissingException:
+                    if load_status == RepositoryUpdateLoader.UPDATE_MISSING:
                         
                         HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE )
                         
                         raise Exception( 'An unusual error has occured during repository processing: an update file was missing. Your repository should be paused, and all update files have been scheduled for a presence check. Please permit file maintenance to check them, or tell it to do so manually, before unpausing your repository.' )
                         
                     
-                    with open( update_path, 'rb' ) as f:
-                        
-                        update_network_bytes = f.read()
-                        
-                    
-                    try:
-                        
-                        content_update = HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
-                        
-                    except:
+                    if load_status == RepositoryUpdateLoader.UPDATE_INVALID:
                         
                         HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA )
                         
@@ -1771,6 +1890,8 @@ class ServiceRepository( ServiceRestricted ):
                 
             finally:
                 
+                update_loader.Cancel()
+                
                 self._LogFinalRowSpeed( content_start_time, total_content_rows_completed, 'content rows' )
                 
             
@@ -1,4 +1,5 @@
 from . import ClientConstants as CC
+import array
 import collections
 from . import HydrusGlobals as HG
 from . import HydrusSerialisable
@@ -692,3 +693,78 @@ class TagFilter( HydrusSerialisable.SerialisableBase ):
         
     
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_TAG_FILTER ] = TagFilter
+
+class TagIdTable( object ):
+    
+    # a client-wide tag <-> small integer lookup, so media can hold compact arrays of ids rather than their own sets of strings
+    # ids are never freed or reused, since any tags manager, including merged or duplicated ones we do not track, may still hold them
+    # so it only grows, but only to one entry per distinct tag the db or the user has given us this session, just like the db's tag_ids_to_tags cache
+    # each entry is one dict slot and one list slot, and the string is the same object the media would otherwise be holding
+    
+    def __init__( self ):
+        
+        self._lock = threading.Lock()
+        
+        self._tags_to_tag_ids = {}
+        self._tag_ids_to_tags = []
+        
+    
+    def GetTag( self, tag_id ):
+        
+        return self._tag_ids_to_tags[ tag_id ]
+        
+    
+    def GetTagId( self, tag ):
+        
+        ( tag_id, ) = self.GetTagIds( ( tag, ) )
+        
+        return tag_id
+        
+    
+    def GetTagIds( self, tags ):
+        
+        tags_to_tag_ids = self._tags_to_tag_ids
+        
+        tags = list( tags )
+        
+        if True in ( tag not in tags_to_tag_ids for tag in tags ):
+            
+            with self._lock:
+                
+                for tag in tags:
+                    
+                    if tag not in tags_to_tag_ids:
+                        
+                        # add the tag first, so a reader that sees the new id can always look it up
+                        
+                        self._tag_ids_to_tags.append( tag )
+                        
+                        tags_to_tag_ids[ tag ] = len( self._tag_ids_to_tags ) - 1
+                        
+                    
+                
+            
+        
+        return array.array( 'I', [ tags_to_tag_ids[ tag ] for tag in tags ] )
+        
+    
+    def GetTags( self, tag_ids ):
+        
+        tag_ids_to_tags = self._tag_ids_to_tags
+        
+        return { tag_ids_to_tags[ tag_id ] for tag_id in tag_ids }
+        
+    
+    def PeekTagId( self, tag ):
+        
+        # does not add anything to the table
+        
+        if tag in self._tags_to_tag_ids:
+            
+            return self._tags_to_tag_ids[ tag ]
+            
+        
+        return None
+        
+    
+tag_id_table = TagIdTable()
@@ -10,7 +10,6 @@ from . import HydrusPaths
 from . import HydrusPubSub
 from . import HydrusThreading
 import os
-import random
 import sys
 import threading
 import time
@@ -45,14 +44,14 @@ class HydrusController( object ):
         
         self._thread_slot_lock = threading.Lock()
         
-        self._call_to_threads = []
-        self._long_running_call_to_threads = []
+        # short jobs share a bounded pool, long-running jobs (which often never finish) always get a thread of their own
+        
+        self._call_to_thread_pool = HydrusThreading.CallToThreadPool( self, 'CallToThread', 10, max_threads = 200 )
+        self._long_running_call_to_thread_pool = HydrusThreading.CallToThreadPool( self, 'CallToThreadLongRunning', 0 )
         
         self._thread_pool_busy_status_text = ''
         self._thread_pool_busy_status_text_new_check_time = 0
         
-        self._call_to_thread_lock = threading.Lock()
-        
         self._timestamps = collections.defaultdict( lambda: 0 )
         
         self._timestamps[ 'boot' ] = HydrusData.GetNow()
@@ -66,61 +65,6 @@ class HydrusController( object ):
         self._system_busy = False
         
     
-    def _GetCallToThread( self ):
-        
-        with self._call_to_thread_lock:
-            
-            for call_to_thread in self._call_to_threads:
-                
-                if not call_to_thread.CurrentlyWorking():
-                    
-                    return call_to_thread
-                    
-                
-            
-            # all the threads in the pool are currently busy
-            
-            calling_from_the_thread_pool = threading.current_thread() in self._call_to_threads
-            
-            if calling_from_the_thread_pool or len( self._call_to_threads ) < 200:
-                
-                call_to_thread = HydrusThreading.THREADCallToThread( self, 'CallToThread' )
-                
-                self._call_to_threads.append( call_to_thread )
-                
-                call_to_thread.start()
-                
-            else:
-                
-                call_to_thread = random.choice( self._call_to_threads )
-                
-            
-            return call_to_thread
-            
-        
-    
-    def _GetCallToThreadLongRunning( self ):
-        
-        with self._call_to_thread_lock:
-            
-            for call_to_thread in self._long_running_call_to_threads:
-                
-                if not call_to_thread.CurrentlyWorking():
-                    
-                    return call_to_thread
-                    
-                
-            
-            call_to_thread = HydrusThreading.THREADCallToThread( self, 'CallToThreadLongRunning' )
-            
-            self._long_running_call_to_threads.append( call_to_thread )
-            
-            call_to_thread.start()
-            
-            return call_to_thread
-            
-        
-    
     def _GetPubsubValidCallable( self ):
         
         return lambda o: True
@@ -153,33 +97,6 @@ class HydrusController( object ):
         self.temp_dir = HydrusPaths.GetTempDir()
         
     
-    def _MaintainCallToThreads( self ):
-        
-        # we don't really want to hang on to threads that are done as event.wait() has a bit of idle cpu
-        # so, any that are in the pools that aren't doing anything can be killed and sent to garbage
-        
-        with self._call_to_thread_lock:
-            
-            def filter_call_to_threads( t ):
-                
-                if t.CurrentlyWorking():
-                    
-                    return True
-                    
-                else:
-                    
-                    t.shutdown()
-                    
-                    return False
-                    
-                
-            
-            self._call_to_threads = list(filter( filter_call_to_threads, self._call_to_threads ))
-            
-            self._long_running_call_to_threads = list(filter( filter_call_to_threads, self._long_running_call_to_threads ))
-            
-        
-    
     def _Read( self, action, *args, **kwargs ):
         
         result = self.db.Read( action, *args, **kwargs )
@@ -321,9 +238,7 @@ class HydrusController( object ):
             HydrusData.ShowText( tuple( what_to_report ) )
             
         
-        call_to_thread = self._GetCallToThread()
-        
-        call_to_thread.put( callable, *args, **kwargs )
+        self._call_to_thread_pool.AddJob( callable, *args, **kwargs )
         
     
     def CallToThreadLongRunning( self, callable, *args, **kwargs ):
@@ -345,9 +260,7 @@ class HydrusController( object ):
             HydrusData.ShowText( tuple( what_to_report ) )
             
         
-        call_to_thread = self._GetCallToThreadLongRunning()
-        
-        call_to_thread.put( callable, *args, **kwargs )
+        self._long_running_call_to_thread_pool.AddJob( callable, *args, **kwargs )
         
     
     def ClearCaches( self ):
@@ -395,6 +308,11 @@ class HydrusController( object ):
         return self._timestamps[ 'boot' ]
         
     
+    def GetCallToThreadStats( self ):
+        
+        return ( self._call_to_thread_pool.GetStats(), self._long_running_call_to_thread_pool.GetStats() )
+        
+    
     def GetDBDir( self ):
         
         return self.db_dir
@@ -419,12 +337,15 @@ class HydrusController( object ):
         
         if HydrusData.TimeHasPassed( self._thread_pool_busy_status_text_new_check_time ):
             
-            with self._call_to_thread_lock:
+            stats = self._call_to_thread_pool.GetStats()
+            
+            num_threads = stats[ 'num_busy_threads' ]
+            
+            if stats[ 'queue_depth' ] > 0:
                 
-                num_threads = sum( ( 1 for t in self._call_to_threads if t.CurrentlyWorking() ) )
+                self._thread_pool_busy_status_text = 'very busy! ({} jobs waiting)'.format( HydrusData.ToHumanInt( stats[ 'queue_depth' ] ) )
                 
-            
-            if num_threads < 4:
+            elif num_threads < 4:
                 
                 self._thread_pool_busy_status_text = ''
                 
@@ -452,8 +373,8 @@ class HydrusController( object ):
         threads = []
         
         threads.extend( self._daemons )
-        threads.extend( self._call_to_threads )
-        threads.extend( self._long_running_call_to_threads )
+        threads.extend( self._call_to_thread_pool.GetWorkers() )
+        threads.extend( self._long_running_call_to_thread_pool.GetWorkers() )
         
         threads.append( self._slow_job_scheduler )
         threads.append( self._fast_job_scheduler )
@@ -562,8 +483,6 @@ class HydrusController( object ):
         
         HydrusPaths.CleanUpOldTempPaths()
         
-        self._MaintainCallToThreads()
-        
     
     def PrintProfile( self, summary, profile_text ):
         
@@ -677,18 +596,8 @@ class HydrusController( object ):
             HydrusPaths.DeletePath( self.temp_dir )
             
         
-        with self._call_to_thread_lock:
-            
-            for call_to_thread in self._call_to_threads:
-                
-                call_to_thread.shutdown()
-                
-            
-            for long_running_call_to_thread in self._long_running_call_to_threads:
-                
-                long_running_call_to_thread.shutdown()
-                
-            
+        self._call_to_thread_pool.Shutdown()
+        self._long_running_call_to_thread_pool.Shutdown()
         
         HG.model_shutdown = True
         
@@ -809,3 +718,13 @@ class HydrusController( object ):
         return self._Write( action, True, *args, **kwargs )
         
     
+    def WriteSynchronousUserRequested( self, action, *args, **kwargs ):
+        
+        return self.db.WriteUserRequested( action, True, *args, **kwargs )
+        
+    
+    def WriteUserRequested( self, action, *args, **kwargs ):
+        
+        return self.db.WriteUserRequested( action, False, *args, **kwargs )
+        
+    
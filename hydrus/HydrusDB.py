@@ -1,3 +1,4 @@
+import collections
 import distutils.version
 from . import HydrusConstants as HC
 from . import HydrusData
@@ -8,8 +9,10 @@ from . import HydrusText
 import os
 import queue
 import sqlite3
+import threading
 import traceback
 import time
+import urllib.parse
 
 CONNECTION_REFRESH_TIME = 60 * 30
 
@@ -128,6 +131,10 @@ def VacuumDB( db_path ):
 class HydrusDB( object ):
     
     READ_WRITE_ACTIONS = []
+    READ_ONLY_ACTIONS = []
+    MAINTENANCE_ACTIONS = []
+    COALESCABLE_WRITE_ACTIONS = []
+    READ_ONLY_CONNECTION_POOL_SIZE = 0
     UPDATE_WAIT = 2
     
     TRANSACTION_COMMIT_TIME = 30
@@ -143,9 +150,13 @@ class HydrusDB( object ):
         self._db_dir = db_dir
         self._db_name = db_name
         
+        # the read-only pool threads each have their own cursor, so self._c looks in here first
+        self._read_only_local = threading.local()
+        
         self._transaction_started = 0
         self._in_transaction = False
         self._transaction_contains_writes = False
+        self._transaction_has_finished_writes = False
         
         self._connection_timestamp = 0
         
@@ -181,15 +192,33 @@ class HydrusDB( object ):
         self._ready_to_serve_requests = False
         self._could_not_initialise = False
         
-        self._jobs = queue.Queue()
+        self._jobs = JobQueue( self.MAINTENANCE_ACTIONS, self.COALESCABLE_WRITE_ACTIONS )
+        self._read_only_jobs = queue.Queue()
         self._pubsubs = []
         
+        self._read_only_lock = threading.Lock()
+        self._read_only_connections_paused = True
+        
+        # every write starts a new epoch, and a read-only job may only fill a shared cache if the epoch it started in is still current
+        self._cache_lock = threading.Lock()
+        self._cache_epoch = 0
+        
+        # a read can go to the pool while a write is running, but not before the writes it might depend on are committed
+        # those are any async write queued before it and any write that has already finished. reads that need a commit wait here, and the main loop commits early for them
+        self._commit_lock = threading.Lock()
+        self._uncommitted_write_jobs = set()
+        self._finished_uncommitted_write_jobs = set()
+        self._reads_waiting_for_commit = []
+        
+        self._num_read_only_connections_open = 0
+        self._num_read_only_loops_running = 0
+        
         self._currently_doing_job = False
         self._current_status = ''
         self._current_job_name = ''
         
         self._db = None
-        self._c = None
+        self._main_c = None
         
         if os.path.exists( os.path.join( self._db_dir, self._db_filenames[ 'main' ] ) ):
             
@@ -276,6 +305,66 @@ class HydrusDB( object ):
                 
             
         
+        for i in range( self.READ_ONLY_CONNECTION_POOL_SIZE ):
+            
+            with self._read_only_lock:
+                
+                self._num_read_only_loops_running += 1
+                
+            
+            self._controller.CallToThreadLongRunning( self.ReadOnlyLoop )
+            
+        
+    
+    def _GetCursor( self ):
+        
+        c = getattr( self._read_only_local, 'c', None )
+        
+        if c is None:
+            
+            return self._main_c
+            
+        
+        return c
+        
+    
+    def _SetCursor( self, c ):
+        
+        self._main_c = c
+        
+    
+    def _DelCursor( self ):
+        
+        self._main_c = None
+        
+    
+    _c = property( _GetCursor, _SetCursor, _DelCursor )
+    
+    def _AddWriteJob( self, job ):
+        
+        if HG.model_shutdown:
+            
+            raise HydrusExceptions.ShutdownException( 'Application has shut down!' )
+            
+        
+        ( action, args, kwargs ) = job.GetCallableTuple()
+        
+        synchronous = job.IsSynchronous()
+        
+        if not synchronous and ( action not in self.MAINTENANCE_ACTIONS or job.IsUserRequested() ):
+            
+            # the caller moves on straight away, so any read from here on has to see this
+            
+            with self._commit_lock:
+                
+                self._uncommitted_write_jobs.add( job )
+                
+            
+        
+        self._jobs.AddJob( job )
+        
+        if synchronous: return job.GetResult()
+        
     
     def _AnalyzeTempTable( self, temp_table_name ):
         
@@ -323,6 +412,8 @@ class HydrusDB( object ):
     
     def _CloseDBCursor( self ):
         
+        self._PauseReadOnlyConnections()
+        
         if self._db is not None:
             
             if self._in_transaction:
@@ -349,6 +440,10 @@ class HydrusDB( object ):
             
             self._in_transaction = False
             
+            self._transaction_has_finished_writes = False
+            
+            self._ForgetFinishedWriteJobs()
+            
         else:
             
             HydrusData.Print( 'Received a call to commit, but was not in a transaction!' )
@@ -360,6 +455,14 @@ class HydrusDB( object ):
         raise NotImplementedError()
         
     
+    def _CommitIfReadsAreWaiting( self ):
+        
+        with self._commit_lock:
+            
+            return len( self._reads_waiting_for_commit ) > 0 and len( self._finished_uncommitted_write_jobs ) > 0
+            
+        
+    
     def _CreateIndex( self, table_name, columns, unique = False ):
         
         if '.' in table_name:
@@ -422,6 +525,56 @@ class HydrusDB( object ):
             
         
     
+    def _FillCache( self, fill_callable, *args, **kwargs ):
+        
+        # a read-only job's snapshot falls behind as soon as the main connection starts a write, and the write's cache invalidation may already have happened
+        # so it only gets to fill a cache if no write has started since it began. the check and the fill share the lock a write takes to start, so one cannot slip in between
+        
+        if not self._InReadOnlyJob():
+            
+            fill_callable( *args, **kwargs )
+            
+            return
+            
+        
+        with self._cache_lock:
+            
+            cache_epoch = getattr( self._read_only_local, 'cache_epoch', None )
+            
+            if cache_epoch is not None and cache_epoch == self._cache_epoch:
+                
+                fill_callable( *args, **kwargs )
+                
+            
+        
+    
+    def _ForgetFinishedWriteJobs( self ):
+        
+        # called once the finished writes are committed, or gone in a failed rollback, so nothing can wait on them any more
+        
+        with self._commit_lock:
+            
+            self._uncommitted_write_jobs.difference_update( self._finished_uncommitted_write_jobs )
+            
+            self._finished_uncommitted_write_jobs = set()
+            
+            self._ReleaseReadsWaitingForCommit()
+            
+        
+    
+    def _ForgetWriteJob( self, job ):
+        
+        # a write that failed and rolled back changed nothing, so nothing can wait on it
+        
+        with self._commit_lock:
+            
+            self._uncommitted_write_jobs.discard( job )
+            self._finished_uncommitted_write_jobs.discard( job )
+            
+            self._ReleaseReadsWaitingForCommit()
+            
+        
+    
     def _GetRowCount( self ):
         
         row_count = self._c.rowcount
@@ -568,6 +721,8 @@ class HydrusDB( object ):
             raise HydrusExceptions.DBAccessException( str( e ) )
             
         
+        self._read_only_connections_paused = False
+        
     
     def _InitDiskCache( self ):
         
@@ -579,11 +734,84 @@ class HydrusDB( object ):
         pass
         
     
+    def _InitReadOnlyDBCursor( self ):
+        
+        # these connections cannot write to the db files at all, so a read that turns out to need to insert something will error out and go to the main connection instead
+        
+        def get_read_only_uri( filename ):
+            
+            path = os.path.join( self._db_dir, filename )
+            
+            return 'file:{}?mode=ro'.format( urllib.parse.quote( path ) )
+            
+        
+        db = sqlite3.connect( get_read_only_uri( self._db_filenames[ 'main' ] ), isolation_level = None, detect_types = sqlite3.PARSE_DECLTYPES, uri = True, check_same_thread = False )
+        
+        c = db.cursor()
+        
+        if HG.no_db_temp_files:
+            
+            c.execute( 'PRAGMA temp_store = 2;' )
+            
+        
+        c.execute( 'ATTACH ":memory:" AS mem;' )
+        
+        for ( name, filename ) in list( self._db_filenames.items() ):
+            
+            if name == 'main':
+                
+                continue
+                
+            
+            c.execute( 'ATTACH ? AS ' + name + ';', ( get_read_only_uri( filename ), ) )
+            
+        
+        for name in self._db_filenames.keys():
+            
+            c.execute( 'PRAGMA {}.cache_size = -10000;'.format( name ) )
+            
+        
+        return ( db, c )
+        
+    
+    def _InReadOnlyJob( self ):
+        
+        return getattr( self._read_only_local, 'c', None ) is not None
+        
+    
     def _ManageDBError( self, job, e ):
         
         raise NotImplementedError()
         
     
+    def _NewCacheEpoch( self ):
+        
+        with self._cache_lock:
+            
+            self._cache_epoch += 1
+            
+        
+    
+    def _PauseReadOnlyConnections( self ):
+        
+        # the main connection is about to go away, maybe so the db files can be copied or vacuumed, so the read-only connections have to let go too
+        
+        self._read_only_connections_paused = True
+        
+        while True:
+            
+            with self._read_only_lock:
+                
+                if self._num_read_only_connections_open == 0:
+                    
+                    return
+                    
+                
+            
+            time.sleep( 0.02 )
+            
+        
+    
     def _ProcessJob( self, job ):
         
         job_type = job.GetType()
@@ -598,6 +826,8 @@ class HydrusDB( object ):
                 
                 self._transaction_contains_writes = True
                 
+                self._NewCacheEpoch()
+                
             else:
                 
                 self._current_status = 'db read locked'
@@ -614,7 +844,16 @@ class HydrusDB( object ):
                 result = self._Write( action, *args, **kwargs )
                 
             
-            if self._transaction_contains_writes and HydrusData.TimeHasPassed( self._transaction_started + self.TRANSACTION_COMMIT_TIME ):
+            if job_type in ( 'read_write', 'write' ):
+                
+                # until this is committed, the read-only connections would give stale answers to anyone who waited on this job
+                
+                self._transaction_has_finished_writes = True
+                
+                self._SetWriteJobsFinished( ( job, ) )
+                
+            
+            if self._transaction_contains_writes and ( HydrusData.TimeHasPassed( self._transaction_started + self.TRANSACTION_COMMIT_TIME ) or self._CommitIfReadsAreWaiting() ):
                 
                 self._current_status = 'db committing'
                 
@@ -661,6 +900,21 @@ class HydrusDB( object ):
                 
                 HydrusData.PrintException( rollback_e )
                 
+                self._ForgetFinishedWriteJobs()
+                
+            
+            if job_type in ( 'read_write', 'write' ):
+                
+                self._ForgetWriteJob( job )
+                
+                self._ResyncCachesAfterRollback()
+                
+            else:
+                
+                # a read changes nothing we keep in memory beyond any definitions it had to add, so there is no need to throw the big caches away
+                
+                self._ResyncDefinitionCachesAfterRollback()
+                
             
         finally:
             
@@ -672,58 +926,278 @@ class HydrusDB( object ):
             
         
     
-    def _Read( self, action, *args, **kwargs ):
-        
-        raise NotImplementedError()
-        
-    
-    def _RepairDB( self ):
-        
-        pass
-        
-    
-    def _ReportOverupdatedDB( self, version ):
-        
-        pass
-        
-    
-    def _ReportUnderupdatedDB( self, version ):
-        
-        pass
-        
-    
-    def _ReportStatus( self, text ):
+    def _ProcessCoalescedWriteJobs( self, jobs ):
         
-        HydrusData.Print( text )
+        try:
+            
+            self._current_status = 'db write locked'
+            
+            self._transaction_contains_writes = True
+            
+            self._NewCacheEpoch()
+            
+            self.publish_status_update()
+            
+            for job in jobs:
+                
+                ( action, args, kwargs ) = job.GetCallableTuple()
+                
+                self._Write( action, *args, **kwargs )
+                
+            
+            self._transaction_has_finished_writes = True
+            
+            self._SetWriteJobsFinished( jobs )
+            
+            if HydrusData.TimeHasPassed( self._transaction_started + self.TRANSACTION_COMMIT_TIME ) or self._CommitIfReadsAreWaiting():
+                
+                self._current_status = 'db committing'
+                
+                self.publish_status_update()
+                
+                self._Commit()
+                
+                self._BeginImmediate()
+                
+                self._transaction_contains_writes = False
+                
+            else:
+                
+                self._Save()
+                
+            
+            for ( topic, args, kwargs ) in self._pubsubs:
+                
+                self._controller.pub( topic, *args, **kwargs )
+                
+            
+        except Exception as e:
+            
+            try:
+                
+                self._Rollback()
+                
+            except Exception as rollback_e:
+                
+                HydrusData.Print( 'When the transaction failed, attempting to rollback the database failed. Please restart the client as soon as is convenient.' )
+                
+                self._in_transaction = False
+                
+                self._CloseDBCursor()
+                
+                self._InitDBCursor()
+                
+                HydrusData.PrintException( rollback_e )
+                
+                self._ForgetFinishedWriteJobs()
+                
+            
+            self._pubsubs = []
+            
+            # the healthy jobs changed things in memory that the rollback just undid in the db, so that has to match again before they replay
+            
+            self._ResyncCachesAfterRollback()
+            
+            # one of them was bad, so let's do them again one at a time so only that one fails
+            
+            for job in jobs:
+                
+                self._ProcessJob( job )
+                
+            
+        finally:
+            
+            self._pubsubs = []
+            
+            self._current_status = ''
+            
+            self.publish_status_update()
+            
         
     
-    def _Rollback( self ):
+    def _ProcessJobs( self, jobs ):
         
-        if self._in_transaction:
+        if len( jobs ) == 1:
             
-            self._c.execute( 'ROLLBACK TO hydrus_savepoint;' )
+            ( job, ) = jobs
+            
+            self._ProcessJob( job )
             
         else:
             
-            HydrusData.Print( 'Received a call to rollback, but was not in a transaction!' )
+            self._ProcessCoalescedWriteJobs( jobs )
             
         
     
-    def _Save( self ):
-        
-        self._c.execute( 'RELEASE hydrus_savepoint;' )
-        
-        self._c.execute( 'SAVEPOINT hydrus_savepoint;' )
+    def _ProcessReadOnlyJob( self, job ):
         
-    
-    def _ShrinkMemory( self ):
+        ( action, args, kwargs ) = job.GetCallableTuple()
         
-        self._c.execute( 'PRAGMA shrink_memory;' )
+        # anything worked out from this job's snapshot can be kept here for the rest of the job
         
-    
-    def _STI( self, iterable_cursor ):
+        self._read_only_local.job_cache = {}
         
-        # strip singleton tuples to an iterator
+        # this has to happen before the snapshot starts. if the main connection has writes in flight, our snapshot is already behind it, so we fill no caches at all
+        
+        with self._cache_lock:
+            
+            if self._transaction_has_finished_writes or self._jobs.WriteIsInProgress():
+                
+                self._read_only_local.cache_epoch = None
+                
+            else:
+                
+                self._read_only_local.cache_epoch = self._cache_epoch
+                
+            
+        
+        try:
+            
+            # a deferred transaction gives the whole job one consistent snapshot
+            
+            self._c.execute( 'BEGIN DEFERRED;' )
+            
+            try:
+                
+                result = self._Read( action, *args, **kwargs )
+                
+            finally:
+                
+                self._c.execute( 'COMMIT;' )
+                
+            
+            job.PutResult( result )
+            
+        except sqlite3.OperationalError as e:
+            
+            if 'readonly' in str( e ):
+                
+                self._jobs.AddJob( job )
+                
+            else:
+                
+                self._ManageDBError( job, e )
+                
+            
+        except Exception as e:
+            
+            self._ManageDBError( job, e )
+            
+        
+    
+    def _Read( self, action, *args, **kwargs ):
+        
+        raise NotImplementedError()
+        
+    
+    def _ReleaseReadsWaitingForCommit( self ):
+        
+        # call this under the commit lock
+        
+        still_waiting = []
+        
+        for ( needed_write_jobs, job ) in self._reads_waiting_for_commit:
+            
+            if needed_write_jobs.isdisjoint( self._uncommitted_write_jobs ):
+                
+                if self._ReadOnlyConnectionsAreAvailable():
+                    
+                    self._read_only_jobs.put( job )
+                    
+                else:
+                    
+                    self._jobs.AddJob( job )
+                    
+                
+            else:
+                
+                still_waiting.append( ( needed_write_jobs, job ) )
+                
+            
+        
+        self._reads_waiting_for_commit = still_waiting
+        
+    
+    def _RepairDB( self ):
+        
+        pass
+        
+    
+    def _ReportOverupdatedDB( self, version ):
+        
+        pass
+        
+    
+    def _ReportUnderupdatedDB( self, version ):
+        
+        pass
+        
+    
+    def _ReportStatus( self, text ):
+        
+        HydrusData.Print( text )
+        
+    
+    def _ResetReadOnlyLocal( self, c ):
+        
+        # anything a subclass keeps in here belongs to this thread's connection, so it goes when the connection does
+        
+        self._read_only_local.__dict__.clear()
+        
+        self._read_only_local.c = c
+        
+    
+    def _ResyncCachesAfterRollback( self ):
+        
+        self._ResyncDefinitionCachesAfterRollback()
+        
+    
+    def _ResyncDefinitionCachesAfterRollback( self ):
+        
+        pass
+        
+    
+    def _Rollback( self ):
+        
+        if self._in_transaction:
+            
+            self._c.execute( 'ROLLBACK TO hydrus_savepoint;' )
+            
+        else:
+            
+            HydrusData.Print( 'Received a call to rollback, but was not in a transaction!' )
+            
+        
+    
+    def _Save( self ):
+        
+        self._c.execute( 'RELEASE hydrus_savepoint;' )
+        
+        self._c.execute( 'SAVEPOINT hydrus_savepoint;' )
+        
+    
+    def _ShrinkMemory( self ):
+        
+        self._c.execute( 'PRAGMA shrink_memory;' )
+        
+    
+    def _ReadOnlyConnectionsAreAvailable( self ):
+        
+        return self._num_read_only_loops_running > 0 and not self._read_only_connections_paused
+        
+    
+    def _SetWriteJobsFinished( self, jobs ):
+        
+        with self._commit_lock:
+            
+            self._uncommitted_write_jobs.update( jobs )
+            self._finished_uncommitted_write_jobs.update( jobs )
+            
+        
+    
+    def _STI( self, iterable_cursor ):
+        
+        # strip singleton tuples to an iterator
         
         return ( item for ( item, ) in iterable_cursor )
         
@@ -835,7 +1309,7 @@ class HydrusDB( object ):
     
     def JobsQueueEmpty( self ):
         
-        return self._jobs.empty()
+        return self._jobs.IsEmpty()
         
     
     def MainLoop( self ):
@@ -861,14 +1335,21 @@ class HydrusDB( object ):
         
         error_count = 0
         
-        while not ( ( self._local_shutdown or HG.model_shutdown ) and self._jobs.empty() ):
+        while not ( ( self._local_shutdown or HG.model_shutdown ) and self._jobs.IsEmpty() and self._num_read_only_loops_running == 0 ):
             
             try:
                 
-                job = self._jobs.get( timeout = 1 )
+                jobs = self._jobs.GetJobs( timeout = 1 )
+                
+                job_name = jobs[0].ToString()
+                
+                if len( jobs ) > 1:
+                    
+                    job_name += ' (coalesced x{})'.format( HydrusData.ToHumanInt( len( jobs ) ) )
+                    
                 
                 self._currently_doing_job = True
-                self._current_job_name = job.ToString()
+                self._current_job_name = job_name
                 
                 self.publish_status_update()
                 
@@ -876,22 +1357,22 @@ class HydrusDB( object ):
                     
                     if HG.db_report_mode:
                         
-                        summary = 'Running ' + job.ToString()
+                        summary = 'Running ' + job_name
                         
                         HydrusData.ShowText( summary )
                         
                     
                     if HG.db_profile_mode:
                         
-                        summary = 'Profiling ' + job.ToString()
+                        summary = 'Profiling ' + job_name
                         
                         HydrusData.ShowText( summary )
                         
-                        HydrusData.Profile( summary, 'self._ProcessJob( job )', globals(), locals() )
+                        HydrusData.Profile( summary, 'self._ProcessJobs( jobs )', globals(), locals() )
                         
                     else:
                         
-                        self._ProcessJob( job )
+                        self._ProcessJobs( jobs )
                         
                     
                     error_count = 0
@@ -905,7 +1386,10 @@ class HydrusDB( object ):
                         raise
                         
                     
-                    self._jobs.put( job ) # couldn't lock db; put job back on queue
+                    for job in jobs:
+                        
+                        self._jobs.AddJob( job ) # couldn't lock db; put job back on queue
+                        
                     
                     time.sleep( 5 )
                     
@@ -917,7 +1401,7 @@ class HydrusDB( object ):
                 
             except queue.Empty:
                 
-                if self._transaction_contains_writes and HydrusData.TimeHasPassed( self._transaction_started + self.TRANSACTION_COMMIT_TIME ):
+                if self._transaction_contains_writes and ( HydrusData.TimeHasPassed( self._transaction_started + self.TRANSACTION_COMMIT_TIME ) or self._CommitIfReadsAreWaiting() ):
                     
                     self._Commit()
                     
@@ -986,11 +1470,150 @@ class HydrusDB( object ):
             raise HydrusExceptions.ShutdownException( 'Application has shut down!' )
             
         
-        self._jobs.put( job )
+        if action in self.READ_ONLY_ACTIONS and self._ReadOnlyConnectionsAreAvailable():
+            
+            # a running write is fine to read around, since its caller is still waiting on it. what we need is anything that already finished or was queued async
+            
+            with self._commit_lock:
+                
+                if len( self._uncommitted_write_jobs ) == 0:
+                    
+                    self._read_only_jobs.put( job )
+                    
+                else:
+                    
+                    self._reads_waiting_for_commit.append( ( set( self._uncommitted_write_jobs ), job ) )
+                    
+                    # if the main loop is idle, it commits for us now rather than when the transaction is due
+                    
+                    self._jobs.Interrupt()
+                    
+                
+            
+        else:
+            
+            self._jobs.AddJob( job )
+            
         
         return job.GetResult()
         
     
+    def ReadOnlyLoop( self ):
+        
+        db = None
+        c = None
+        
+        try:
+            
+            while not ( ( self._local_shutdown or HG.model_shutdown ) and self._read_only_jobs.empty() ):
+                
+                if self._read_only_connections_paused:
+                    
+                    if db is not None:
+                        
+                        self._ResetReadOnlyLocal( None )
+                        
+                        c.close()
+                        db.close()
+                        
+                        db = None
+                        c = None
+                        
+                        with self._read_only_lock:
+                            
+                            self._num_read_only_connections_open -= 1
+                            
+                        
+                    
+                    time.sleep( 0.1 )
+                    
+                    continue
+                    
+                
+                if db is None:
+                    
+                    with self._read_only_lock:
+                        
+                        self._num_read_only_connections_open += 1
+                        
+                    
+                    # if the main connection paused while we were opening, we catch it next loop and close again
+                    
+                    try:
+                        
+                        ( db, c ) = self._InitReadOnlyDBCursor()
+                        
+                    except:
+                        
+                        with self._read_only_lock:
+                            
+                            self._num_read_only_connections_open -= 1
+                            
+                        
+                        raise
+                        
+                    
+                    self._ResetReadOnlyLocal( c )
+                    
+                
+                try:
+                    
+                    job = self._read_only_jobs.get( timeout = 1 )
+                    
+                except queue.Empty:
+                    
+                    continue
+                    
+                
+                if HG.db_report_mode:
+                    
+                    HydrusData.ShowText( 'Running read-only ' + job.ToString() )
+                    
+                
+                self._ProcessReadOnlyJob( job )
+                
+            
+        except:
+            
+            HydrusData.DebugPrint( 'The read-only db connection failed! Reads will go to the main connection from now on. Error:' )
+            HydrusData.DebugPrint( traceback.format_exc() )
+            
+        finally:
+            
+            if db is not None:
+                
+                self._ResetReadOnlyLocal( None )
+                
+                c.close()
+                db.close()
+                
+                with self._read_only_lock:
+                    
+                    self._num_read_only_connections_open -= 1
+                    
+                
+            
+            # anything left over goes to the main connection
+            
+            while not self._read_only_jobs.empty():
+                
+                try:
+                    
+                    self._jobs.AddJob( self._read_only_jobs.get_nowait() )
+                    
+                except queue.Empty:
+                    
+                    break
+                    
+                
+            
+            with self._read_only_lock:
+                
+                self._num_read_only_loops_running -= 1
+                
+            
+        
+    
     def ReadyToServeRequests( self ):
         
         return self._ready_to_serve_requests
@@ -1007,14 +1630,307 @@ class HydrusDB( object ):
         
         job = HydrusData.JobDatabase( job_type, synchronous, action, *args, **kwargs )
         
-        if HG.model_shutdown:
+        return self._AddWriteJob( job )
+        
+    
+    def WriteUserRequested( self, action, synchronous, *args, **kwargs ):
+        
+        # the user is waiting on this one, so even a maintenance action goes in the normal write lane
+        
+        job_type = 'write'
+        
+        job = HydrusData.JobDatabase( job_type, synchronous, action, *args, **kwargs )
+        
+        job.SetUserRequested()
+        
+        return self._AddWriteJob( job )
+        
+    
+class IdCache( object ):
+    
+    # a bounded LRU of master definition -> id, like hash -> hash_id, so busy resolvers can skip the db for things they just saw
+    
+    def __init__( self, max_size ):
+        
+        self._max_size = max_size
+        
+        self._keys_to_ids = collections.OrderedDict()
+        
+    
+    def __len__( self ):
+        
+        return len( self._keys_to_ids )
+        
+    
+    def AddIds( self, keys_to_ids ):
+        
+        for ( key, i ) in keys_to_ids.items():
             
-            raise HydrusExceptions.ShutdownException( 'Application has shut down!' )
+            self._keys_to_ids[ key ] = i
+            
+            self._keys_to_ids.move_to_end( key )
             
         
-        self._jobs.put( job )
+        while len( self._keys_to_ids ) > self._max_size:
+            
+            self._keys_to_ids.popitem( last = False )
+            
         
-        if synchronous: return job.GetResult()
+    
+    def Clear( self ):
+        
+        self._keys_to_ids = collections.OrderedDict()
+        
+    
+    def GetIds( self, keys ):
+        
+        keys_to_ids = {}
+        missing_keys = []
+        
+        for key in keys:
+            
+            if key in self._keys_to_ids:
+                
+                keys_to_ids[ key ] = self._keys_to_ids[ key ]
+                
+                self._keys_to_ids.move_to_end( key )
+                
+            else:
+                
+                missing_keys.append( key )
+                
+            
+        
+        return ( keys_to_ids, missing_keys )
+        
+    
+class JobQueue( object ):
+    
+    # reads go first, then normal writes, then maintenance
+    # a read never skips ahead of an async write queued before it, since whoever queued that write will expect to see it
+    # skipping a synchronous write is fine, since that caller is still waiting and nothing can depend on it yet
+    
+    MAX_COALESCED_JOBS = 256
+    
+    # a maintenance job that has waited this long goes next, so a steady stream of foreground work cannot put it off forever
+    MAINTENANCE_MAX_WAIT = 300
+    
+    def __init__( self, maintenance_actions, coalescable_write_actions ):
+        
+        self._maintenance_actions = set( maintenance_actions )
+        self._coalescable_write_actions = set( coalescable_write_actions )
+        
+        self._condition = threading.Condition()
+        
+        self._reads = collections.deque()
+        self._writes = collections.deque()
+        self._maintenance = collections.deque()
+        
+        self._next_job_index = 1
+        self._last_async_write_job_index = 0
+        self._last_taken_write_job_index = 0
+        self._last_done_write_job_index = 0
+        
+        self._write_in_progress = False
+        
+        self._interrupted = False
+        
+    
+    def _GetNextJobs( self ):
+        
+        if len( self._maintenance ) > 0:
+            
+            ( job_index, time_queued, job ) = self._maintenance[0]
+            
+            if time.monotonic() - time_queued > self.MAINTENANCE_MAX_WAIT:
+                
+                self._maintenance.popleft()
+                
+                return [ job ]
+                
+            
+        
+        if len( self._reads ) > 0:
+            
+            ( job_index, async_write_barrier, job ) = self._reads[0]
+            
+            if async_write_barrier <= self._last_done_write_job_index:
+                
+                self._reads.popleft()
+                
+                return [ job ]
+                
+            
+        
+        if len( self._writes ) > 0:
+            
+            ( job_index, job ) = self._writes.popleft()
+            
+            jobs = [ job ]
+            
+            ( action, args, kwargs ) = job.GetCallableTuple()
+            
+            if not job.IsSynchronous() and action in self._coalescable_write_actions:
+                
+                while len( self._writes ) > 0 and len( jobs ) < self.MAX_COALESCED_JOBS:
+                    
+                    ( next_job_index, next_job ) = self._writes[0]
+                    
+                    ( next_action, next_args, next_kwargs ) = next_job.GetCallableTuple()
+                    
+                    if next_job.IsSynchronous() or next_action != action:
+                        
+                        break
+                        
+                    
+                    self._writes.popleft()
+                    
+                    jobs.append( next_job )
+                    
+                    job_index = next_job_index
+                    
+                
+            
+            self._last_taken_write_job_index = job_index
+            
+            return jobs
+            
+        
+        if len( self._reads ) > 0:
+            
+            ( job_index, async_write_barrier, job ) = self._reads.popleft()
+            
+            return [ job ]
+            
+        
+        if len( self._maintenance ) > 0:
+            
+            ( job_index, time_queued, job ) = self._maintenance.popleft()
+            
+            return [ job ]
+            
+        
+        return None
+        
+    
+    def AddJob( self, job ):
+        
+        with self._condition:
+            
+            job_index = self._next_job_index
+            
+            self._next_job_index += 1
+            
+            ( action, args, kwargs ) = job.GetCallableTuple()
+            
+            if action in self._maintenance_actions and not job.IsUserRequested():
+                
+                self._maintenance.append( ( job_index, time.monotonic(), job ) )
+                
+            elif job.GetType() in ( 'read', 'read_write' ):
+                
+                self._reads.append( ( job_index, self._last_async_write_job_index, job ) )
+                
+            else:
+                
+                if not job.IsSynchronous():
+                    
+                    self._last_async_write_job_index = job_index
+                    
+                
+                self._writes.append( ( job_index, job ) )
+                
+            
+            self._condition.notify()
+            
+        
+    
+    def AsyncWritesAreDone( self ):
+        
+        with self._condition:
+            
+            return self._last_async_write_job_index <= self._last_done_write_job_index
+            
+        
+    
+    def GetJobs( self, timeout = None ):
+        
+        # there is only one consumer, so when it asks for more work, everything it took before is done
+        
+        with self._condition:
+            
+            self._last_done_write_job_index = self._last_taken_write_job_index
+            
+            self._write_in_progress = False
+            
+            if timeout is not None:
+                
+                stop_time = time.monotonic() + timeout
+                
+            
+            while True:
+                
+                jobs = self._GetNextJobs()
+                
+                if jobs is not None:
+                    
+                    self._write_in_progress = any( ( job.GetType() in ( 'write', 'read_write' ) for job in jobs ) )
+                    
+                    return jobs
+                    
+                
+                if self._interrupted:
+                    
+                    self._interrupted = False
+                    
+                    raise queue.Empty()
+                    
+                
+                if timeout is None:
+                    
+                    self._condition.wait()
+                    
+                else:
+                    
+                    time_left = stop_time - time.monotonic()
+                    
+                    if time_left <= 0:
+                        
+                        raise queue.Empty()
+                        
+                    
+                    self._condition.wait( time_left )
+                    
+                
+            
+        
+    
+    def Interrupt( self ):
+        
+        # an idle consumer gets a queue.Empty now rather than at its timeout
+        
+        with self._condition:
+            
+            self._interrupted = True
+            
+            self._condition.notify()
+            
+        
+    
+    def IsEmpty( self ):
+        
+        with self._condition:
+            
+            return len( self._reads ) + len( self._writes ) + len( self._maintenance ) == 0
+            
+        
+    
+    def WriteIsInProgress( self ):
+        
+        with self._condition:
+            
+            return self._write_in_progress
+            
         
     
 class TemporaryIntegerTable( object ):
@@ -1044,3 +1960,36 @@ class TemporaryIntegerTable( object ):
         return False
         
     
+class TemporaryTable( object ):
+    
+    # like TemporaryIntegerTable, but for rows of arbitrary columns, so we can join lists of text or blobs against the master tables
+    
+    def __init__( self, cursor, rows, column_names_and_types ):
+        
+        self._cursor = cursor
+        self._rows = rows
+        self._column_names_and_types = column_names_and_types
+        
+        self._table_name = 'mem.temp' + os.urandom( 32 ).hex()
+        
+    
+    def __enter__( self ):
+        
+        column_names = [ column_name for ( column_name, column_type ) in self._column_names_and_types ]
+        
+        column_definitions = ', '.join( ( column_name + ' ' + column_type for ( column_name, column_type ) in self._column_names_and_types ) )
+        
+        self._cursor.execute( 'CREATE TABLE ' + self._table_name + ' ( ' + column_definitions + ', PRIMARY KEY ( ' + ', '.join( column_names ) + ' ) );' )
+        
+        self._cursor.executemany( 'INSERT OR IGNORE INTO ' + self._table_name + ' ( ' + ', '.join( column_names ) + ' ) VALUES ( ' + ', '.join( ( '?' for column_name in column_names ) ) + ' );', self._rows )
+        
+        return self._table_name
+        
+    
+    def __exit__( self, exc_type, exc_val, exc_tb ):
+        
+        self._cursor.execute( 'DROP TABLE ' + self._table_name + ';' )
+        
+        return False
+        
+    
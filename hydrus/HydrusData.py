@@ -1627,6 +1627,8 @@ class JobDatabase( object ):
         self._args = args
         self._kwargs = kwargs
         
+        self._user_requested = False
+        
         self._result_ready = threading.Event()
         
     
@@ -1668,11 +1670,21 @@ class JobDatabase( object ):
         return self._type
         
     
+    def IsUserRequested( self ):
+        
+        return self._user_requested
+        
+    
     def IsSynchronous( self ):
         
         return self._synchronous
         
     
+    def SetUserRequested( self ):
+        
+        self._user_requested = True
+        
+    
     def PutResult( self, result ):
         
         self._result = result
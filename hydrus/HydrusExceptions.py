@@ -58,6 +58,7 @@ class NetworkVersionException( NetworkException ): pass
 class NoContentException( NetworkException ): pass
 class NotFoundException( NetworkException ): pass
 class NotModifiedException( NetworkException ): pass
+class RangeNotSatisfiableException( NetworkException ): pass
 class BadRequestException( NetworkException ): pass
 class MissingCredentialsException( NetworkException ): pass
 class DoesNotSupportCORSException( NetworkException ): pass
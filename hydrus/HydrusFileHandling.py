@@ -18,6 +18,8 @@ import traceback
 
 # Mime
 
+MIME_HEADER_SIZE = 256
+
 header_and_mime = [
     ( 0, b'\xff\xd8', HC.IMAGE_JPEG ),
     ( 0, b'GIF87a', HC.IMAGE_GIF ),
@@ -263,7 +265,41 @@ def GetHashFromPath( path ):
     
     return h.digest()
     
-def GetMime( path, ok_to_look_for_hydrus_updates = False ):
+def GetHashesAndHeaderFromPath( path ):
+    
+    # on import we want all of these, so let's read the file once rather than once per hash
+    # hashlib releases the GIL on big updates, so this is about as quick as the disk can give us the data
+    
+    h_sha256 = hashlib.sha256()
+    h_md5 = hashlib.md5()
+    h_sha1 = hashlib.sha1()
+    h_sha512 = hashlib.sha512()
+    
+    header = b''
+    
+    with open( path, 'rb' ) as f:
+        
+        for block in HydrusPaths.ReadFileLikeAsBlocks( f ):
+            
+            if len( header ) < MIME_HEADER_SIZE:
+                
+                header += block[ : MIME_HEADER_SIZE - len( header ) ]
+                
+            
+            h_sha256.update( block )
+            h_md5.update( block )
+            h_sha1.update( block )
+            h_sha512.update( block )
+            
+        
+    
+    sha256 = h_sha256.digest()
+    
+    extra_hashes = ( h_md5.digest(), h_sha1.digest(), h_sha512.digest() )
+    
+    return ( sha256, extra_hashes, header )
+    
+def GetMime( path, ok_to_look_for_hydrus_updates = False, header = None ):
     
     size = os.path.getsize( path )
     
@@ -272,16 +308,23 @@ def GetMime( path, ok_to_look_for_hydrus_updates = False ):
         raise HydrusExceptions.SizeException( 'File is of zero length!' )
         
     
-    with open( path, 'rb' ) as f:
+    if header is None:
+        
+        with open( path, 'rb' ) as f:
+            
+            bit_to_check = f.read( MIME_HEADER_SIZE )
+            
+        
+    else:
         
-        bit_to_check = f.read( 256 )
+        bit_to_check = header[ : MIME_HEADER_SIZE ]
         
     
-    for ( offset, header, mime ) in header_and_mime:
+    for ( offset, mime_header, mime ) in header_and_mime:
         
         offset_bit_to_check = bit_to_check[ offset: ]
         
-        if offset_bit_to_check.startswith( header ):
+        if offset_bit_to_check.startswith( mime_header ):
             
             if mime == HC.UNDETERMINED_WM:
                 
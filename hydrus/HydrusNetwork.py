@@ -1,3 +1,4 @@
+import array
 import collections
 from . import HydrusConstants as HC
 from . import HydrusData
@@ -5,6 +6,9 @@ from . import HydrusExceptions
 from . import HydrusGlobals as HG
 from . import HydrusNetworking
 from . import HydrusSerialisable
+import itertools
+import struct
+import sys
 import threading
 import urllib
 
@@ -14,6 +18,74 @@ STRING_PARAMS = { 'subject_tag' }
 JSON_PARAMS = set()
 JSON_BYTE_LIST_PARAMS = set()
 
+# binary updates are a run of sections, each a run of typed columns
+# the sections are only parsed as far as their headers until something asks for their rows
+
+BINARY_UPDATE_COLUMN_UINT32 = 0
+BINARY_UPDATE_COLUMN_INT64 = 1
+BINARY_UPDATE_COLUMN_BYTES = 2
+
+binary_update_column_typecodes = {}
+
+binary_update_column_typecodes[ BINARY_UPDATE_COLUMN_UINT32 ] = 'I'
+binary_update_column_typecodes[ BINARY_UPDATE_COLUMN_INT64 ] = 'q'
+
+BINARY_UPDATE_SECTION_HEADER = struct.Struct( '<BBII' ) # section type, action, num rows, num columns
+BINARY_UPDATE_COLUMN_HEADER = struct.Struct( '<BQ' ) # column type, num bytes
+
+def EncodeBinaryUpdateSection( section_type, action, num_rows, columns ):
+    
+    # columns is a list of ( column_type, values ), where values is an iterable of ints or a single bytes blob
+    
+    chunks = [ BINARY_UPDATE_SECTION_HEADER.pack( section_type, action, num_rows, len( columns ) ) ]
+    
+    for ( column_type, values ) in columns:
+        
+        if column_type == BINARY_UPDATE_COLUMN_BYTES:
+            
+            column_bytes = values
+            
+        else:
+            
+            column = array.array( binary_update_column_typecodes[ column_type ], values )
+            
+            if sys.byteorder == 'big':
+                
+                column.byteswap()
+                
+            
+            column_bytes = column.tobytes()
+            
+        
+        chunks.append( BINARY_UPDATE_COLUMN_HEADER.pack( column_type, len( column_bytes ) ) )
+        chunks.append( column_bytes )
+        
+    
+    return b''.join( chunks )
+    
+def EncodeBinaryUpdateStrings( blobs ):
+    
+    lengths = [ len( blob ) for blob in blobs ]
+    
+    return ( lengths, b''.join( blobs ) )
+    
+def EncodeDeltas( sorted_ints ):
+    
+    # small gaps compress far better than big ids, and itertools.accumulate undoes this at C speed
+    
+    previous = 0
+    
+    deltas = []
+    
+    for i in sorted_ints:
+        
+        deltas.append( i - previous )
+        
+        previous = i
+        
+    
+    return deltas
+    
 def GenerateDefaultServiceDictionary( service_type ):
     
     dictionary = HydrusSerialisable.SerialisableDictionary()
@@ -119,6 +191,67 @@ def GetPossiblePermissions( service_type ):
     
     return permissions
     
+def DecodeBinaryUpdateColumn( column_type, column_bytes ):
+    
+    if column_type == BINARY_UPDATE_COLUMN_BYTES:
+        
+        return column_bytes
+        
+    
+    column = array.array( binary_update_column_typecodes[ column_type ] )
+    
+    column.frombytes( column_bytes )
+    
+    if sys.byteorder == 'big':
+        
+        column.byteswap()
+        
+    
+    return column
+    
+def DecodeBinaryUpdateSections( payload ):
+    
+    payload = memoryview( payload )
+    
+    sections = []
+    
+    offset = 0
+    
+    while offset < len( payload ):
+        
+        ( section_type, action, num_rows, num_columns ) = BINARY_UPDATE_SECTION_HEADER.unpack_from( payload, offset )
+        
+        offset += BINARY_UPDATE_SECTION_HEADER.size
+        
+        columns = []
+        
+        for i in range( num_columns ):
+            
+            ( column_type, num_bytes ) = BINARY_UPDATE_COLUMN_HEADER.unpack_from( payload, offset )
+            
+            offset += BINARY_UPDATE_COLUMN_HEADER.size
+            
+            columns.append( ( column_type, payload[ offset : offset + num_bytes ] ) )
+            
+            offset += num_bytes
+            
+        
+        sections.append( ( section_type, action, num_rows, columns ) )
+        
+    
+    return sections
+    
+def DecodeBinaryUpdateStrings( lengths, blob ):
+    
+    offset = 0
+    
+    for length in lengths:
+        
+        yield bytes( blob[ offset : offset + length ] )
+        
+        offset += length
+        
+    
 def DumpHydrusArgsToNetworkBytes( args ):
     
     if not isinstance( args, HydrusSerialisable.SerialisableBase ):
@@ -1312,6 +1445,7 @@ class ContentUpdate( HydrusSerialisable.SerialisableBase ):
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_CONTENT_UPDATE
     SERIALISABLE_NAME = 'Content Update'
     SERIALISABLE_VERSION = 1
+    SERIALISABLE_BINARY_VERSION = 1
     
     def __init__( self ):
         
@@ -1319,9 +1453,75 @@ class ContentUpdate( HydrusSerialisable.SerialisableBase ):
         
         self._content_data = {}
         
+        self._binary_sections = {}
+        
+    
+    def _GetBinaryPayload( self ):
+        
+        self._MaterialiseBinarySections()
+        
+        sections = []
+        
+        for ( content_type, actions_to_datas ) in self._content_data.items():
+            
+            for ( action, data ) in actions_to_datas.items():
+                
+                if len( data ) == 0:
+                    
+                    continue
+                    
+                
+                if content_type == HC.CONTENT_TYPE_FILES:
+                    
+                    if action == HC.CONTENT_UPDATE_ADD:
+                        
+                        # ( hash_id, size, mime, timestamp, width, height, duration, num_frames, num_words ), where -1 is None
+                        
+                        columns = [ ( BINARY_UPDATE_COLUMN_INT64, [ -1 if value is None else value for value in column ] ) for column in zip( *data ) ]
+                        
+                    else:
+                        
+                        columns = [ ( BINARY_UPDATE_COLUMN_UINT32, EncodeDeltas( sorted( data ) ) ) ]
+                        
+                    
+                elif content_type == HC.CONTENT_TYPE_MAPPINGS:
+                    
+                    tag_ids = []
+                    counts = []
+                    hash_id_deltas = []
+                    
+                    for ( tag_id, hash_ids ) in data:
+                        
+                        tag_ids.append( tag_id )
+                        counts.append( len( hash_ids ) )
+                        hash_id_deltas.extend( EncodeDeltas( sorted( hash_ids ) ) )
+                        
+                    
+                    columns = [ ( BINARY_UPDATE_COLUMN_UINT32, tag_ids ), ( BINARY_UPDATE_COLUMN_UINT32, counts ), ( BINARY_UPDATE_COLUMN_UINT32, hash_id_deltas ) ]
+                    
+                elif content_type in ( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_TYPE_TAG_SIBLINGS ):
+                    
+                    columns = [ ( BINARY_UPDATE_COLUMN_UINT32, column ) for column in zip( *data ) ]
+                    
+                else:
+                    
+                    raise HydrusExceptions.SerialisationException( 'Do not know how to write content type {} to a binary update!'.format( content_type ) )
+                    
+                
+                sections.append( EncodeBinaryUpdateSection( content_type, action, len( data ), columns ) )
+                
+            
+        
+        return b''.join( sections )
+        
     
     def _GetContent( self, content_type, action ):
         
+        if ( content_type, action ) in self._binary_sections:
+            
+            return self._IterateBinarySection( content_type, action )
+            
+        
         if content_type in self._content_data:
             
             if action in self._content_data[ content_type ]:
@@ -1335,6 +1535,8 @@ class ContentUpdate( HydrusSerialisable.SerialisableBase ):
     
     def _GetSerialisableInfo( self ):
         
+        self._MaterialiseBinarySections()
+        
         serialisable_info = []
         
         for ( content_type, actions_to_datas ) in list(self._content_data.items()):
@@ -1357,8 +1559,76 @@ class ContentUpdate( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def _InitialiseFromBinaryPayload( self, payload ):
+        
+        for ( content_type, action, num_rows, columns ) in DecodeBinaryUpdateSections( payload ):
+            
+            self._binary_sections[ ( content_type, action ) ] = ( num_rows, columns )
+            
+        
+    
+    def _IterateBinarySection( self, content_type, action ):
+        
+        ( num_rows, columns ) = self._binary_sections[ ( content_type, action ) ]
+        
+        columns = [ DecodeBinaryUpdateColumn( column_type, column_bytes ) for ( column_type, column_bytes ) in columns ]
+        
+        if content_type == HC.CONTENT_TYPE_FILES:
+            
+            if action == HC.CONTENT_UPDATE_ADD:
+                
+                for row in zip( *columns ):
+                    
+                    yield tuple( ( None if value == -1 else value for value in row ) )
+                    
+                
+            else:
+                
+                ( hash_id_deltas, ) = columns
+                
+                yield from itertools.accumulate( hash_id_deltas )
+                
+            
+        elif content_type == HC.CONTENT_TYPE_MAPPINGS:
+            
+            ( tag_ids, counts, hash_id_deltas ) = columns
+            
+            offset = 0
+            
+            for ( tag_id, count ) in zip( tag_ids, counts ):
+                
+                yield ( tag_id, list( itertools.accumulate( hash_id_deltas[ offset : offset + count ] ) ) )
+                
+                offset += count
+                
+            
+        else:
+            
+            yield from zip( *columns )
+            
+        
+    
+    def _MaterialiseBinarySections( self ):
+        
+        for ( content_type, action ) in list( self._binary_sections.keys() ):
+            
+            data = list( self._IterateBinarySection( content_type, action ) )
+            
+            if content_type not in self._content_data:
+                
+                self._content_data[ content_type ] = {}
+                
+            
+            self._content_data[ content_type ][ action ] = data
+            
+        
+        self._binary_sections = {}
+        
+    
     def AddRow( self, row ):
         
+        self._MaterialiseBinarySections()
+        
         ( content_type, action, data ) = row
         
         if content_type not in self._content_data:
@@ -1418,6 +1688,18 @@ class ContentUpdate( HydrusSerialisable.SerialisableBase ):
         
         num = 0
         
+        for ( ( content_type, action ), ( num_rows, columns ) ) in self._binary_sections.items():
+            
+            if content_type == HC.CONTENT_TYPE_MAPPINGS:
+                
+                ( column_type, column_bytes ) = columns[1]
+                
+                num_rows = sum( DecodeBinaryUpdateColumn( column_type, column_bytes ) )
+                
+            
+            num += num_rows
+            
+        
         for content_type in self._content_data:
             
             for action in self._content_data[ content_type ]:
@@ -1632,6 +1914,7 @@ class DefinitionsUpdate( HydrusSerialisable.SerialisableBase ):
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_DEFINITIONS_UPDATE
     SERIALISABLE_NAME = 'Definitions Update'
     SERIALISABLE_VERSION = 1
+    SERIALISABLE_BINARY_VERSION = 1
     
     def __init__( self ):
         
@@ -1640,9 +1923,47 @@ class DefinitionsUpdate( HydrusSerialisable.SerialisableBase ):
         self._hash_ids_to_hashes = {}
         self._tag_ids_to_tags = {}
         
+        self._binary_sections = {}
+        
+    
+    def _GetBinaryPayload( self ):
+        
+        self._MaterialiseBinarySections()
+        
+        sections = []
+        
+        for ( definitions_type, ids_to_definitions ) in ( ( HC.DEFINITIONS_TYPE_HASHES, self._hash_ids_to_hashes ), ( HC.DEFINITIONS_TYPE_TAGS, self._tag_ids_to_tags ) ):
+            
+            if len( ids_to_definitions ) == 0:
+                
+                continue
+                
+            
+            ids = sorted( ids_to_definitions.keys() )
+            
+            if definitions_type == HC.DEFINITIONS_TYPE_HASHES:
+                
+                blobs = [ ids_to_definitions[ i ] for i in ids ]
+                
+            else:
+                
+                blobs = [ ids_to_definitions[ i ].encode( 'utf-8' ) for i in ids ]
+                
+            
+            ( lengths, blob ) = EncodeBinaryUpdateStrings( blobs )
+            
+            columns = [ ( BINARY_UPDATE_COLUMN_UINT32, EncodeDeltas( ids ) ), ( BINARY_UPDATE_COLUMN_UINT32, lengths ), ( BINARY_UPDATE_COLUMN_BYTES, blob ) ]
+            
+            sections.append( EncodeBinaryUpdateSection( definitions_type, 0, len( ids ), columns ) )
+            
+        
+        return b''.join( sections )
+        
     
     def _GetSerialisableInfo( self ):
         
+        self._MaterialiseBinarySections()
+        
         serialisable_info = []
         
         if len( self._hash_ids_to_hashes ) > 0:
@@ -1673,8 +1994,49 @@ class DefinitionsUpdate( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def _InitialiseFromBinaryPayload( self, payload ):
+        
+        for ( definitions_type, action, num_rows, columns ) in DecodeBinaryUpdateSections( payload ):
+            
+            self._binary_sections[ definitions_type ] = ( num_rows, columns )
+            
+        
+    
+    def _IterateBinarySection( self, definitions_type ):
+        
+        ( num_rows, columns ) = self._binary_sections[ definitions_type ]
+        
+        ( id_deltas, lengths, blob ) = [ DecodeBinaryUpdateColumn( column_type, column_bytes ) for ( column_type, column_bytes ) in columns ]
+        
+        definitions = DecodeBinaryUpdateStrings( lengths, blob )
+        
+        if definitions_type == HC.DEFINITIONS_TYPE_TAGS:
+            
+            definitions = ( str( definition, 'utf-8' ) for definition in definitions )
+            
+        
+        return zip( itertools.accumulate( id_deltas ), definitions )
+        
+    
+    def _MaterialiseBinarySections( self ):
+        
+        if HC.DEFINITIONS_TYPE_HASHES in self._binary_sections:
+            
+            self._hash_ids_to_hashes.update( self._IterateBinarySection( HC.DEFINITIONS_TYPE_HASHES ) )
+            
+        
+        if HC.DEFINITIONS_TYPE_TAGS in self._binary_sections:
+            
+            self._tag_ids_to_tags.update( self._IterateBinarySection( HC.DEFINITIONS_TYPE_TAGS ) )
+            
+        
+        self._binary_sections = {}
+        
+    
     def AddRow( self, row ):
         
+        self._MaterialiseBinarySections()
+        
         ( definitions_type, key, value ) = row
         
         if definitions_type == HC.DEFINITIONS_TYPE_HASHES:
@@ -1689,19 +2051,45 @@ class DefinitionsUpdate( HydrusSerialisable.SerialisableBase ):
     
     def GetHashIdsToHashes( self ):
         
+        self._MaterialiseBinarySections()
+        
         return self._hash_ids_to_hashes
         
     
     def GetNumRows( self ):
         
-        return len( self._hash_ids_to_hashes ) + len( self._tag_ids_to_tags )
+        num_binary_rows = sum( ( num_rows for ( num_rows, columns ) in self._binary_sections.values() ) )
+        
+        return num_binary_rows + len( self._hash_ids_to_hashes ) + len( self._tag_ids_to_tags )
         
     
     def GetTagIdsToTags( self ):
         
+        self._MaterialiseBinarySections()
+        
         return self._tag_ids_to_tags
         
     
+    def IterateHashIdsAndHashes( self ):
+        
+        if HC.DEFINITIONS_TYPE_HASHES in self._binary_sections:
+            
+            return self._IterateBinarySection( HC.DEFINITIONS_TYPE_HASHES )
+            
+        
+        return iter( self._hash_ids_to_hashes.items() )
+        
+    
+    def IterateTagIdsAndTags( self ):
+        
+        if HC.DEFINITIONS_TYPE_TAGS in self._binary_sections:
+            
+            return self._IterateBinarySection( HC.DEFINITIONS_TYPE_TAGS )
+            
+        
+        return iter( self._tag_ids_to_tags.items() )
+        
+    
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_DEFINITIONS_UPDATE ] = DefinitionsUpdate
 
 class Metadata( HydrusSerialisable.SerialisableBase ):
@@ -1,5 +1,7 @@
 from . import HydrusData
+from . import HydrusExceptions
 import json
+import struct
 import zlib
 
 LZ4_OK = False
@@ -100,8 +102,36 @@ SERIALISABLE_TYPE_FAVOURITE_SEARCH_MANAGER = 81
 
 SERIALISABLE_TYPES_TO_OBJECT_TYPES = {}
 
+# zlib output never starts with a null byte, so we can tell the two formats apart
+BINARY_NETWORK_BYTES_PREFIX = b'\x00hydrus binary\x00'
+BINARY_NETWORK_BYTES_HEADER = struct.Struct( '<HH' )
+
+def CreateFromBinaryNetworkBytes( network_bytes ):
+    
+    prefix_length = len( BINARY_NETWORK_BYTES_PREFIX )
+    
+    ( serialisable_type, binary_version ) = BINARY_NETWORK_BYTES_HEADER.unpack_from( network_bytes, prefix_length )
+    
+    if serialisable_type not in SERIALISABLE_TYPES_TO_OBJECT_TYPES:
+        
+        raise HydrusExceptions.SerialisationException( 'Did not understand the binary serialisable type {}!'.format( serialisable_type ) )
+        
+    
+    payload = zlib.decompress( network_bytes[ prefix_length + BINARY_NETWORK_BYTES_HEADER.size : ] )
+    
+    obj = SERIALISABLE_TYPES_TO_OBJECT_TYPES[ serialisable_type ]()
+    
+    obj.InitialiseFromBinaryPayload( binary_version, payload )
+    
+    return obj
+    
 def CreateFromNetworkBytes( network_string ):
     
+    if network_string.startswith( BINARY_NETWORK_BYTES_PREFIX ):
+        
+        return CreateFromBinaryNetworkBytes( network_string )
+        
+    
     try:
         
         obj_bytes = zlib.decompress( network_string )
@@ -158,12 +188,23 @@ class SerialisableBase( object ):
     SERIALISABLE_TYPE = SERIALISABLE_TYPE_BASE
     SERIALISABLE_NAME = 'Base Serialisable Object'
     SERIALISABLE_VERSION = 1
+    SERIALISABLE_BINARY_VERSION = None
+    
+    def _GetBinaryPayload( self ):
+        
+        raise NotImplementedError()
+        
     
     def _GetSerialisableInfo( self ):
         
         raise NotImplementedError()
         
     
+    def _InitialiseFromBinaryPayload( self, payload ):
+        
+        raise NotImplementedError()
+        
+    
     def _InitialiseFromSerialisableInfo( self, serialisable_info ):
         
         raise NotImplementedError()
@@ -174,6 +215,18 @@ class SerialisableBase( object ):
         return old_serialisable_info
         
     
+    def DumpToBinaryNetworkBytes( self ):
+        
+        if self.SERIALISABLE_BINARY_VERSION is None:
+            
+            raise NotImplementedError()
+            
+        
+        payload = self._GetBinaryPayload()
+        
+        return BINARY_NETWORK_BYTES_PREFIX + BINARY_NETWORK_BYTES_HEADER.pack( self.SERIALISABLE_TYPE, self.SERIALISABLE_BINARY_VERSION ) + zlib.compress( payload, 9 )
+        
+    
     def DumpToNetworkBytes( self ):
         
         obj_string = self.DumpToString()
@@ -212,6 +265,16 @@ class SerialisableBase( object ):
         return ( self.SERIALISABLE_TYPE, self.SERIALISABLE_VERSION, serialisable_info )
         
     
+    def InitialiseFromBinaryPayload( self, binary_version, payload ):
+        
+        if binary_version != self.SERIALISABLE_BINARY_VERSION:
+            
+            raise HydrusExceptions.SerialisationException( 'Did not understand binary version {} of {}! Perhaps you need to update?'.format( binary_version, self.SERIALISABLE_NAME ) )
+            
+        
+        self._InitialiseFromBinaryPayload( payload )
+        
+    
     def InitialiseFromSerialisableInfo( self, version, serialisable_info ):
         
         while version < self.SERIALISABLE_VERSION:
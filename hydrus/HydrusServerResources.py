@@ -6,13 +6,15 @@ from . import HydrusNetworking
 from . import HydrusPaths
 from . import HydrusSerialisable
 import os
+import threading
 import time
 import traceback
 from twisted.internet import reactor, defer
 from twisted.internet.threads import deferToThread
+from twisted.web import http
 from twisted.web.server import NOT_DONE_YET
 from twisted.web.resource import Resource
-from twisted.web.static import File as FileResource, NoRangeStaticProducer
+from twisted.web.static import File as FileResource, NoRangeStaticProducer, SingleRangeStaticProducer
 from . import HydrusData
 from . import HydrusGlobals as HG
 
@@ -208,6 +210,155 @@ def GenerateEris( service ):
                                      <font color="gray">MMMM</font>
 </pre></body></html>'''
     
+def GetRequestHeader( request, name ):
+    
+    if not request.requestHeaders.hasHeader( name ):
+        
+        return None
+        
+    
+    return ', '.join( request.requestHeaders.getRawHeaders( name ) )
+    
+def IfRangeMatches( request, etag, last_modified ):
+    
+    if_range = GetRequestHeader( request, 'If-Range' )
+    
+    if if_range is None:
+        
+        return True
+        
+    
+    if_range = if_range.strip()
+    
+    if if_range.startswith( '"' ) or if_range.startswith( 'W/' ):
+        
+        # If-Range needs a strong comparison, so weak tags never match
+        
+        return etag is not None and if_range == '"{}"'.format( etag )
+        
+    
+    try:
+        
+        return http.stringToDatetime( bytes( if_range, 'ascii' ) ) == last_modified
+        
+    except:
+        
+        return False
+        
+    
+def IsNotModified( request, etag, last_modified ):
+    
+    if_none_match = GetRequestHeader( request, 'If-None-Match' )
+    
+    if if_none_match is not None:
+        
+        # If-None-Match wins over If-Modified-Since, and it uses a weak comparison
+        
+        if etag is None:
+            
+            return False
+            
+        
+        client_etags = { client_etag.strip() for client_etag in if_none_match.split( ',' ) }
+        
+        client_etags = { client_etag[2:] if client_etag.startswith( 'W/' ) else client_etag for client_etag in client_etags }
+        
+        return '*' in client_etags or '"{}"'.format( etag ) in client_etags
+        
+    
+    if_modified_since = GetRequestHeader( request, 'If-Modified-Since' )
+    
+    if if_modified_since is not None and last_modified is not None:
+        
+        try:
+            
+            return last_modified <= http.stringToDatetime( bytes( if_modified_since, 'ascii' ) )
+            
+        except:
+            
+            return False
+            
+        
+    
+    return False
+    
+def ParseByteRangeHeader( range_header, size ):
+    
+    # returns an inclusive ( start, end ), or None if we should ignore the header and send the whole file
+    # we only do single ranges--a client asking for several will get the whole file, which the spec allows
+    
+    range_header = range_header.strip()
+    
+    if not range_header.startswith( 'bytes=' ):
+        
+        return None
+        
+    
+    byte_range = range_header[ 6 : ].strip()
+    
+    if ',' in byte_range or '-' not in byte_range:
+        
+        return None
+        
+    
+    ( start_text, end_text ) = byte_range.split( '-', 1 )
+    
+    ( start_text, end_text ) = ( start_text.strip(), end_text.strip() )
+    
+    try:
+        
+        if start_text == '':
+            
+            # suffix range, the last n bytes
+            
+            suffix_length = int( end_text )
+            
+            if suffix_length == 0:
+                
+                raise HydrusExceptions.RangeNotSatisfiableException( 'Cannot serve an empty suffix range!' )
+                
+            
+            start = max( 0, size - suffix_length )
+            end = size - 1
+            
+        else:
+            
+            start = int( start_text )
+            
+            if end_text == '':
+                
+                end = size - 1
+                
+            else:
+                
+                end = int( end_text )
+                
+                if end < start:
+                    
+                    return None
+                    
+                
+                end = min( end, size - 1 )
+                
+            
+        
+    except ValueError:
+        
+        return None
+        
+    
+    if start < 0:
+        
+        return None
+        
+    
+    if start >= size:
+        
+        raise HydrusExceptions.RangeNotSatisfiableException( 'That range starts after the end of the file!' )
+        
+    
+    return ( start, end )
+    
 def ParseFileArguments( path, decompression_bombs_ok = False ):
     
     HydrusImageHandling.ConvertToPngIfBmp( path )
@@ -395,6 +546,66 @@ class HydrusResource( Resource ):
             
         
     
+    def _SetCachingHeadersAndGetByteRange( self, request, status_code, etag, last_modified, size ):
+        
+        # for responses that stand for a file, whether we have it as a path or as bytes
+        # returns ( send_body, byte_range ), where a byte_range of None means the whole thing
+        
+        request.setHeader( 'Accept-Ranges', 'bytes' )
+        
+        if last_modified is not None:
+            
+            request.setHeader( 'Last-Modified', http.datetimeToString( last_modified ) )
+            
+        
+        if etag is not None:
+            
+            request.setHeader( 'ETag', '"{}"'.format( etag ) )
+            
+        
+        request.setHeader( 'Expires', time.strftime( '%a, %d %b %Y %H:%M:%S GMT', time.gmtime( time.time() + 86400 * 365 ) ) )
+        request.setHeader( 'Cache-Control', 'max-age={}'.format( 86400 * 365 ) )
+        
+        if status_code == 200 and IsNotModified( request, etag, last_modified ):
+            
+            request.setResponseCode( 304 )
+            
+            return ( False, None )
+            
+        
+        byte_range = None
+        
+        range_header = GetRequestHeader( request, 'Range' )
+        
+        if status_code == 200 and range_header is not None and IfRangeMatches( request, etag, last_modified ):
+            
+            try:
+                
+                byte_range = ParseByteRangeHeader( range_header, size )
+                
+            except HydrusExceptions.RangeNotSatisfiableException:
+                
+                request.setResponseCode( 416 )
+                
+                request.setHeader( 'Content-Range', 'bytes */{}'.format( size ) )
+                request.setHeader( 'Content-Length', '0' )
+                
+                return ( False, None )
+                
+            
+        
+        if byte_range is not None:
+            
+            ( start, end ) = byte_range
+            
+            request.setResponseCode( 206 )
+            
+            request.setHeader( 'Content-Range', 'bytes {}-{}/{}'.format( start, end, size ) )
+            
+        
+        return ( True, byte_range )
+        
+    
     def _callbackRenderResponseContext( self, request ):
         
         self._CleanUpTempFile( request )
@@ -431,51 +642,123 @@ class HydrusResource( Resource ):
         if response_context.HasPath():
             
             path = response_context.GetPath()
+            etag = response_context.GetETag()
             
-            size = os.path.getsize( path )
+            stat_result = os.stat( path )
+            
+            size = stat_result.st_size
+            last_modified = int( stat_result.st_mtime )
             
             mime = response_context.GetMime()
             
             content_type = HC.mime_mimetype_string_lookup[ mime ]
             
-            content_length = size
-            
             ( base, filename ) = os.path.split( path )
             
             content_disposition = 'inline; filename="' + filename + '"'
             
-            request.setHeader( 'Content-Type', str( content_type ) )
-            request.setHeader( 'Content-Length', str( content_length ) )
-            request.setHeader( 'Content-Disposition', str( content_disposition ) )
-            
-            request.setHeader( 'Expires', time.strftime( '%a, %d %b %Y %H:%M:%S GMT', time.gmtime( time.time() + 86400 * 365 ) ) )
-            request.setHeader( 'Cache-Control', 'max-age={}'.format( 86400 * 365 ) )
-            
-            fileObject = open( path, 'rb' )
+            ( send_body, byte_range ) = self._SetCachingHeadersAndGetByteRange( request, status_code, etag, last_modified, size )
             
-            producer = NoRangeStaticProducer( request, fileObject )
-            
-            producer.start()
-            
-            do_finish = False
+            if send_body:
+                
+                fileObject = open( path, 'rb' )
+                
+                if byte_range is None:
+                    
+                    content_length = size
+                    
+                    producer = NoRangeStaticProducer( request, fileObject )
+                    
+                else:
+                    
+                    ( start, end ) = byte_range
+                    
+                    content_length = end - start + 1
+                    
+                    producer = SingleRangeStaticProducer( request, fileObject, start, content_length )
+                    
+                
+                request.setHeader( 'Content-Type', str( content_type ) )
+                request.setHeader( 'Content-Length', str( content_length ) )
+                request.setHeader( 'Content-Disposition', str( content_disposition ) )
+                
+                producer.start()
+                
+                do_finish = False
+                
+            else:
+                
+                content_length = 0
+                
             
         elif response_context.HasBody():
             
             mime = response_context.GetMime()
+            etag = response_context.GetETag()
+            last_modified = response_context.GetLastModified()
             
             body_bytes = response_context.GetBodyBytes()
             
             content_type = HC.mime_mimetype_string_lookup[ mime ]
             
-            content_length = len( body_bytes )
+            # a body with an etag or a modified time is a file we happen to have in memory, like a thumbnail out of a pack, so it gets the same caching and ranges as a path
             
-            content_disposition = 'inline'
+            if etag is not None or last_modified is not None:
+                
+                ( send_body, byte_range ) = self._SetCachingHeadersAndGetByteRange( request, status_code, etag, last_modified, len( body_bytes ) )
+                
+                if byte_range is not None:
+                    
+                    ( start, end ) = byte_range
+                    
+                    body_bytes = body_bytes[ start : end + 1 ]
+                    
+                
+            else:
+                
+                send_body = True
+                
+            
+            if send_body:
+                
+                content_length = len( body_bytes )
+                
+                content_disposition = 'inline'
+                
+                request.setHeader( 'Content-Type', content_type )
+                request.setHeader( 'Content-Length', str( content_length ) )
+                request.setHeader( 'Content-Disposition', content_disposition )
+                
+                request.write( body_bytes )
+                
+            else:
+                
+                content_length = 0
+                
+            
+        elif response_context.HasBodyGenerator():
+            
+            mime = response_context.GetMime()
+            
+            content_type = HC.mime_mimetype_string_lookup[ mime ]
+            
+            # no Content-Length, so twisted will send this chunked
             
             request.setHeader( 'Content-Type', content_type )
-            request.setHeader( 'Content-Length', str( content_length ) )
-            request.setHeader( 'Content-Disposition', content_disposition )
+            request.setHeader( 'Content-Disposition', 'inline' )
+            
+            def report_data_used( num_bytes ):
+                
+                self._reportDataUsed( request, num_bytes )
+                
+            
+            producer = ThreadedBodyProducer( request, response_context.GetBodyGenerator(), report_data_used )
+            
+            producer.start()
+            
+            content_length = 0 # the producer reports its data as it finishes
             
-            request.write( body_bytes )
+            do_finish = False
             
         else:
             
@@ -854,7 +1137,7 @@ class HydrusResourceWelcome( HydrusResource ):
     
 class ResponseContext( object ):
     
-    def __init__( self, status_code, mime = HC.APPLICATION_JSON, body = None, path = None, cookies = None ):
+    def __init__( self, status_code, mime = HC.APPLICATION_JSON, body = None, path = None, cookies = None, body_generator = None, etag = None, last_modified = None ):
         
         if body is None:
             
@@ -888,6 +1171,9 @@ class ResponseContext( object ):
         self._body_bytes = body_bytes
         self._path = path
         self._cookies = cookies
+        self._body_generator = body_generator
+        self._etag = etag
+        self._last_modified = last_modified
         
     
     def GetBodyBytes( self ):
@@ -895,8 +1181,17 @@ class ResponseContext( object ):
         return self._body_bytes
         
     
+    def GetBodyGenerator( self ):
+        
+        return self._body_generator
+        
+    
     def GetCookies( self ): return self._cookies
     
+    def GetETag( self ): return self._etag
+    
+    def GetLastModified( self ): return self._last_modified
+    
     def GetMime( self ): return self._mime
     
     def GetPath( self ): return self._path
@@ -905,5 +1200,137 @@ class ResponseContext( object ):
     
     def HasBody( self ): return self._body_bytes is not None
     
+    def HasBodyGenerator( self ): return self._body_generator is not None
+    
     def HasPath( self ): return self._path is not None
     
+class ThreadedBodyProducer( object ):
+    
+    # a twisted push producer that pulls bytes from a generator in its own long-running thread, so slow body work stays off the reactor
+    # a slow client can hold the stream open for a long time, so we do not borrow one of twisted's threadpool threads for it
+    # it only generates the next chunk once twisted says the transport can take more, so memory stays flat
+    
+    def __init__( self, request, body_generator, done_callable ):
+        
+        self._request = request
+        self._body_generator = body_generator
+        self._done_callable = done_callable
+        
+        self._can_write = threading.Event()
+        self._stopped = False
+        
+        self._can_write.set()
+        
+    
+    def _Abort( self, num_bytes ):
+        
+        if self._request.channel is not None:
+            
+            self._request.unregisterProducer()
+            
+            # we are mid-body, so a clean finish would tell the client it got everything
+            
+            self._request.loseConnection()
+            
+        
+        self._done_callable( num_bytes )
+        
+    
+    def _Finish( self, num_bytes ):
+        
+        if not self._stopped and self._request.channel is not None:
+            
+            self._request.unregisterProducer()
+            
+            self._request.finish()
+            
+        
+        self._done_callable( num_bytes )
+        
+    
+    def _ShouldStop( self ):
+        
+        return self._stopped or self._request.channel is None or HG.model_shutdown
+        
+    
+    def _Write( self, chunk ):
+        
+        if not self._stopped and self._request.channel is not None:
+            
+            self._request.write( chunk )
+            
+        
+    
+    def THREADProduce( self ):
+        
+        num_bytes = 0
+        
+        try:
+            
+            while True:
+                
+                # block here until the transport wants more, before we do the work for the next chunk
+                
+                while not self._can_write.wait( 1.0 ):
+                    
+                    if self._ShouldStop():
+                        
+                        break
+                        
+                    
+                
+                if self._ShouldStop():
+                    
+                    break
+                    
+                
+                chunk = next( self._body_generator, None )
+                
+                if chunk is None:
+                    
+                    break
+                    
+                
+                reactor.callFromThread( self._Write, chunk )
+                
+                num_bytes += len( chunk )
+                
+            
+            reactor.callFromThread( self._Finish, num_bytes )
+            
+        except Exception as e:
+            
+            HydrusData.Print( traceback.format_exc() )
+            
+            reactor.callFromThread( self._Abort, num_bytes )
+            
+        finally:
+            
+            self._body_generator.close()
+            
+        
+    
+    def pauseProducing( self ):
+        
+        self._can_write.clear()
+        
+    
+    def resumeProducing( self ):
+        
+        self._can_write.set()
+        
+    
+    def start( self ):
+        
+        self._request.registerProducer( self, True )
+        
+        HG.controller.CallToThreadLongRunning( self.THREADProduce )
+        
+    
+    def stopProducing( self ):
+        
+        self._stopped = True
+        
+        self._can_write.set()
+        
+    
@@ -1,5 +1,6 @@
-import bisect
 import collections
+import heapq
+import itertools
 from . import HydrusExceptions
 import queue
 import random
@@ -369,6 +370,259 @@ class THREADCallToThread( DAEMON ):
             
         
     
+class CallToThreadPool( object ):
+    
+    # a shared queue of work with a core of threads that hang around and an elastic overflow that goes away once idle
+    # any idle thread takes the next job, so short work never gets stuck behind a long job on a busy thread
+    
+    IDLE_THREAD_TIMEOUT = 60
+    
+    def __init__( self, controller, name, min_threads, max_threads = None ):
+        
+        self._controller = controller
+        self._name = name
+        self._min_threads = min_threads
+        self._max_threads = max_threads
+        
+        self._lock = threading.Lock()
+        self._new_job_arrived = threading.Condition( self._lock )
+        
+        self._queue = collections.deque()
+        
+        self._workers = set()
+        self._num_idle_workers = 0
+        
+        self._num_jobs_done = 0
+        self._recent_wait_times = collections.deque( maxlen = 256 )
+        
+        self._is_shutdown = False
+        
+    
+    def _SpawnWorker( self ):
+        
+        worker = THREADCallToThreadPoolWorker( self._controller, self._name, self )
+        
+        self._workers.add( worker )
+        
+        # it counts as idle from now, so quick successive jobs don't each spawn a new thread while it is starting up
+        self._num_idle_workers += 1
+        
+        worker.start()
+        
+    
+    def AddJob( self, callable, *args, **kwargs ):
+        
+        with self._lock:
+            
+            self._queue.append( ( HydrusData.GetNowPrecise(), ( callable, args, kwargs ) ) )
+            
+            if self._num_idle_workers < len( self._queue ) and not self._is_shutdown:
+                
+                # if all our threads are busy and one of them is asking, it may be waiting on this job, so it gets a new thread whatever our max is
+                
+                calling_from_the_pool = threading.current_thread() in self._workers
+                
+                if self._max_threads is None or len( self._workers ) < self._max_threads or calling_from_the_pool:
+                    
+                    self._SpawnWorker()
+                    
+                
+            
+            self._new_job_arrived.notify()
+            
+        
+    
+    def GetJob( self, worker ):
+        
+        with self._lock:
+            
+            idle_started = HydrusData.GetNowPrecise()
+            
+            while len( self._queue ) == 0:
+                
+                CheckIfThreadShuttingDown()
+                
+                if len( self._workers ) > self._min_threads and HydrusData.GetNowPrecise() - idle_started > self.IDLE_THREAD_TIMEOUT:
+                    
+                    self._workers.discard( worker )
+                    
+                    self._num_idle_workers -= 1
+                    
+                    return None
+                    
+                
+                self._new_job_arrived.wait( 10.0 )
+                
+            
+            CheckIfThreadShuttingDown()
+            
+            ( time_queued, job ) = self._queue.popleft()
+            
+            self._recent_wait_times.append( HydrusData.GetNowPrecise() - time_queued )
+            
+            self._num_idle_workers -= 1
+            
+            return job
+            
+        
+    
+    def GetNumBusyWorkers( self ):
+        
+        with self._lock:
+            
+            return len( self._workers ) - self._num_idle_workers
+            
+        
+    
+    def GetStats( self ):
+        
+        with self._lock:
+            
+            if len( self._recent_wait_times ) > 0:
+                
+                mean_wait = sum( self._recent_wait_times ) / len( self._recent_wait_times )
+                max_wait = max( self._recent_wait_times )
+                
+            else:
+                
+                mean_wait = 0.0
+                max_wait = 0.0
+                
+            
+            stats = {}
+            
+            stats[ 'num_threads' ] = len( self._workers )
+            stats[ 'num_busy_threads' ] = len( self._workers ) - self._num_idle_workers
+            stats[ 'queue_depth' ] = len( self._queue )
+            stats[ 'num_jobs_done' ] = self._num_jobs_done
+            stats[ 'mean_wait' ] = mean_wait
+            stats[ 'max_wait' ] = max_wait
+            
+            return stats
+            
+        
+    
+    def GetWorkers( self ):
+        
+        with self._lock:
+            
+            return list( self._workers )
+            
+        
+    
+    def RemoveWorker( self, worker ):
+        
+        with self._lock:
+            
+            if worker in self._workers:
+                
+                self._workers.discard( worker )
+                
+                self._num_idle_workers -= 1
+                
+            
+        
+    
+    def ReportJobDone( self ):
+        
+        with self._lock:
+            
+            self._num_jobs_done += 1
+            
+            self._num_idle_workers += 1
+            
+        
+    
+    def Shutdown( self ):
+        
+        with self._lock:
+            
+            self._is_shutdown = True
+            
+            for worker in self._workers:
+                
+                ShutdownThread( worker )
+                
+            
+            self._new_job_arrived.notify_all()
+            
+        
+    
+class THREADCallToThreadPoolWorker( DAEMON ):
+    
+    def __init__( self, controller, name, pool ):
+        
+        DAEMON.__init__( self, controller, name )
+        
+        self._pool = pool
+        
+        self._callable = None
+        
+    
+    def GetCurrentJobSummary( self ):
+        
+        return self._callable
+        
+    
+    def run( self ):
+        
+        try:
+            
+            while True:
+                
+                job = self._pool.GetJob( self )
+                
+                if job is None:
+                    
+                    return
+                    
+                
+                try:
+                    
+                    CheckIfThreadShuttingDown()
+                    
+                    self._DoPreCall()
+                    
+                    ( callable, args, kwargs ) = job
+                    
+                    self._callable = job
+                    
+                    callable( *args, **kwargs )
+                    
+                    del callable
+                    
+                except HydrusExceptions.ShutdownException:
+                    
+                    return
+                    
+                except Exception as e:
+                    
+                    HydrusData.Print( traceback.format_exc() )
+                    
+                    HydrusData.ShowException( e )
+                    
+                finally:
+                    
+                    self._callable = None
+                    
+                    job = None
+                    
+                    self._pool.ReportJobDone()
+                    
+                
+                time.sleep( 0.00001 )
+                
+            
+        except HydrusExceptions.ShutdownException:
+            
+            return
+            
+        finally:
+            
+            self._pool.RemoveWorker( self )
+            
+        
+    
 class JobScheduler( threading.Thread ):
     
     def __init__( self, controller ):
@@ -377,41 +631,65 @@ class JobScheduler( threading.Thread ):
         
         self._controller = controller
         
-        self._waiting = []
+        # a timer heap of ( next_work_time, counter, job )
+        # an entry is only valid if its counter is the one we have for the job, so cancelling or rescheduling a job just orphans its old entry
+        
+        self._heap = []
+        self._jobs_to_heap_counters = {}
+        self._heap_counter = itertools.count()
         
         self._waiting_lock = threading.Lock()
         
         self._new_job_arrived = threading.Event()
         
-        self._current_job = None
-        
-        self._cancel_filter_needed = threading.Event()
-        self._sort_needed = threading.Event()
+        self._recent_latenesses = collections.deque( maxlen = 256 )
+        self._max_lateness = 0.0
         
         self._controller.sub( self, 'shutdown', 'shutdown' )
         
     
-    def _FilterCancelled( self ):
+    def _CompactHeapIfNeeded( self ):
         
-        with self._waiting_lock:
+        num_stale = len( self._heap ) - len( self._jobs_to_heap_counters )
+        
+        if num_stale > 64 and num_stale > len( self._jobs_to_heap_counters ):
+            
+            self._heap = [ entry for entry in self._heap if self._EntryIsValid( entry ) ]
             
-            self._waiting = [ job for job in self._waiting if not job.IsCancelled() ]
+            heapq.heapify( self._heap )
             
         
     
+    def _CullStaleHeapTop( self ):
+        
+        while len( self._heap ) > 0 and not self._EntryIsValid( self._heap[0] ):
+            
+            heapq.heappop( self._heap )
+            
+        
+    
+    def _EntryIsValid( self, entry ):
+        
+        ( next_work_time, counter, job ) = entry
+        
+        return job in self._jobs_to_heap_counters and self._jobs_to_heap_counters[ job ] == counter
+        
+    
     def _GetLoopWaitTime( self ):
         
         with self._waiting_lock:
             
-            if len( self._waiting ) == 0:
+            self._CullStaleHeapTop()
+            
+            if len( self._heap ) == 0:
                 
-                return 0.2
+                return 1.0
                 
             
-            next_job = self._waiting[0]
+            ( next_work_time, counter, job ) = self._heap[0]
             
         
-        time_delta_until_due = next_job.GetTimeDeltaUntilDue()
+        time_delta_until_due = HydrusData.GetTimeDeltaUntilTimeFloat( next_work_time )
         
         return min( 1.0, time_delta_until_due )
         
@@ -420,32 +698,28 @@ class JobScheduler( threading.Thread ):
         
         with self._waiting_lock:
             
-            if len( self._waiting ) == 0:
+            self._CullStaleHeapTop()
+            
+            if len( self._heap ) == 0:
                 
                 return True
                 
             
-            next_job = self._waiting[0]
+            ( next_work_time, counter, job ) = self._heap[0]
             
         
-        if next_job.IsDue():
-            
-            return False
-            
-        else:
-            
-            return True
-            
+        return not HydrusData.TimeHasPassedFloat( next_work_time )
         
     
-    def _SortWaiting( self ):
+    def _PushJob( self, job ):
         
-        # sort the waiting jobs in ascending order of expected work time
+        counter = next( self._heap_counter )
         
-        with self._waiting_lock: # this uses __lt__ to sort
-            
-            self._waiting.sort()
-            
+        self._jobs_to_heap_counters[ job ] = counter
+        
+        heapq.heappush( self._heap, ( job.GetNextWorkTime(), counter, job ) )
+        
+        self._CompactHeapIfNeeded()
         
     
     def _StartWork( self ):
@@ -456,43 +730,52 @@ class JobScheduler( threading.Thread ):
             
             with self._waiting_lock:
                 
-                if len( self._waiting ) == 0:
+                if jobs_started >= 10: # try to avoid spikes
                     
                     break
                     
                 
-                if jobs_started >= 10: # try to avoid spikes
+                self._CullStaleHeapTop()
+                
+                if len( self._heap ) == 0:
                     
                     break
                     
                 
-                next_job = self._waiting[0]
+                ( next_work_time, counter, next_job ) = self._heap[0]
                 
-                if next_job.IsDue():
+                now = HydrusData.GetNowFloat()
+                
+                if next_work_time > now:
                     
-                    next_job = self._waiting.pop( 0 )
+                    break # all the rest in the queue are not due
                     
-                    if next_job.IsCancelled():
-                        
-                        continue
-                        
+                
+                heapq.heappop( self._heap )
+                
+                del self._jobs_to_heap_counters[ next_job ]
+                
+                if next_job.IsCancelled():
                     
-                    if next_job.SlotOK():
-                        
-                        next_job.StartWork()
-                        
-                        jobs_started += 1
-                        
-                    else:
-                        
-                        # delay is automatically set by SlotOK
-                        
-                        bisect.insort( self._waiting, next_job )
-                        
+                    continue
+                    
+                
+                if next_job.SlotOK():
+                    
+                    lateness = now - next_work_time
+                    
+                    self._recent_latenesses.append( lateness )
+                    self._max_lateness = max( self._max_lateness, lateness )
+                    
+                    next_job.StartWork()
+                    
+                    jobs_started += 1
                     
                 else:
                     
-                    break # all the rest in the queue are not due
+                    # delay is automatically set by SlotOK
+                    
+                    self._PushJob( next_job )
                     
                 
             
@@ -502,7 +785,7 @@ class JobScheduler( threading.Thread ):
         
         with self._waiting_lock:
             
-            bisect.insort( self._waiting, job )
+            self._PushJob( job )
             
         
         self._new_job_arrived.set()
@@ -512,7 +795,11 @@ class JobScheduler( threading.Thread ):
         
         with self._waiting_lock:
             
-            self._waiting = [ job for job in self._waiting if not job.IsDead() ]
+            self._jobs_to_heap_counters = { job : counter for ( job, counter ) in self._jobs_to_heap_counters.items() if not job.IsDead() }
+            
+            self._heap = [ entry for entry in self._heap if self._EntryIsValid( entry ) ]
+            
+            heapq.heapify( self._heap )
             
         
     
@@ -525,19 +812,44 @@ class JobScheduler( threading.Thread ):
         
         with self._waiting_lock:
             
-            return HydrusData.ToHumanInt( len( self._waiting ) ) + ' jobs'
+            return HydrusData.ToHumanInt( len( self._jobs_to_heap_counters ) ) + ' jobs'
+            
+        
+    
+    def GetLatenessStats( self ):
+        
+        with self._waiting_lock:
+            
+            num_started = len( self._recent_latenesses )
+            
+            if num_started == 0:
+                
+                average_lateness = 0.0
+                
+            else:
+                
+                average_lateness = sum( self._recent_latenesses ) / num_started
+                
+            
+            return ( average_lateness, self._max_lateness )
             
         
     
     def GetPrettyJobSummary( self ):
         
+        ( average_lateness, max_lateness ) = self.GetLatenessStats()
+        
         with self._waiting_lock:
             
-            num_jobs = len( self._waiting )
+            entries = sorted( ( entry for entry in self._heap if self._EntryIsValid( entry ) ), key = lambda entry: entry[:2] )
+            
+            num_jobs = len( entries )
+            
+            job_lines = [ repr( job ) for ( next_work_time, counter, job ) in entries ]
             
-            job_lines = [ repr( job ) for job in self._waiting ]
+            lateness_line = 'recent average lateness: {:.3f}s, max lateness: {:.3f}s'.format( average_lateness, max_lateness )
             
-            lines = [ HydrusData.ToHumanInt( num_jobs ) + ' jobs:' ] + job_lines
+            lines = [ HydrusData.ToHumanInt( num_jobs ) + ' jobs:', lateness_line ] + job_lines
             
             text = os.linesep.join( lines )
             
@@ -545,9 +857,17 @@ class JobScheduler( threading.Thread ):
             
         
     
-    def JobCancelled( self ):
+    def JobCancelled( self, job ):
         
-        self._cancel_filter_needed.set()
+        with self._waiting_lock:
+            
+            if job in self._jobs_to_heap_counters:
+                
+                del self._jobs_to_heap_counters[ job ]
+                
+                self._CompactHeapIfNeeded()
+                
+            
         
     
     def shutdown( self ):
@@ -557,9 +877,21 @@ class JobScheduler( threading.Thread ):
         self._new_job_arrived.set()
         
     
-    def WorkTimesHaveChanged( self ):
+    def WorkTimesHaveChanged( self, job ):
         
-        self._sort_needed.set()
+        with self._waiting_lock:
+            
+            # a job that is not waiting is working or done, and it will re-add itself if it repeats
+            
+            if job not in self._jobs_to_heap_counters:
+                
+                return
+                
+            
+            self._PushJob( job )
+            
+        
+        self._new_job_arrived.set()
         
     
     def run( self ):
@@ -575,32 +907,14 @@ class JobScheduler( threading.Thread ):
                         return
                         
                     
-                    #
-                    
-                    if self._cancel_filter_needed.is_set():
-                        
-                        self._FilterCancelled()
-                        
-                        self._cancel_filter_needed.clear()
-                        
+                    # clear before we look at the heap, so anything that arrives after still wakes us
                     
-                    if self._sort_needed.is_set():
-                        
-                        self._SortWaiting()
-                        
-                        self._sort_needed.clear()
-                        
-                        continue # if some work is now due, let's do it!
-                        
-                    
-                    #
+                    self._new_job_arrived.clear()
                     
                     wait_time = self._GetLoopWaitTime()
                     
                     self._new_job_arrived.wait( wait_time )
                     
-                    self._new_job_arrived.clear()
-                    
                 
                 self._StartWork()
                 
@@ -638,15 +952,13 @@ class SchedulableJob( object ):
         self._currently_working = threading.Event()
         self._is_cancelled = threading.Event()
         
-    
-    def __lt__( self, other ): # for the scheduler to do bisect.insort noice
-        
-        return self._next_work_time < other._next_work_time
+        self._last_lateness = 0.0
+        self._max_lateness = 0.0
         
     
     def __repr__( self ):
         
-        return repr( self.__class__ ) + ': ' + repr( self._work_callable ) + ' next in ' + HydrusData.TimeDeltaToPrettyTimeDelta( self._next_work_time - HydrusData.GetNowFloat() )
+        return repr( self.__class__ ) + ': ' + repr( self._work_callable ) + ' next in ' + HydrusData.TimeDeltaToPrettyTimeDelta( self._next_work_time - HydrusData.GetNowFloat() ) + ', last late by {:.3f}s, max late by {:.3f}s'.format( self._last_lateness, self._max_lateness )
         
     
     def _BootWorker( self ):
@@ -658,7 +970,7 @@ class SchedulableJob( object ):
         
         self._is_cancelled.set()
         
-        self._scheduler.JobCancelled()
+        self._scheduler.JobCancelled( self )
         
     
     def CurrentlyWorking( self ):
@@ -666,6 +978,16 @@ class SchedulableJob( object ):
         return self._currently_working.is_set()
         
     
+    def GetLateness( self ):
+        
+        return ( self._last_lateness, self._max_lateness )
+        
+    
+    def GetNextWorkTime( self ):
+        
+        return self._next_work_time
+        
+    
     def GetTimeDeltaUntilDue( self ):
         
         return HydrusData.GetTimeDeltaUntilTimeFloat( self._next_work_time )
@@ -727,6 +1049,9 @@ class SchedulableJob( object ):
             return
             
         
+        self._last_lateness = max( 0.0, HydrusData.GetNowFloat() - self._next_work_time )
+        self._max_lateness = max( self._max_lateness, self._last_lateness )
+        
         self._currently_working.set()
         
         self._BootWorker()
@@ -741,7 +1066,7 @@ class SchedulableJob( object ):
         
         self._next_work_time = next_work_time
         
-        self._scheduler.WorkTimesHaveChanged()
+        self._scheduler.WorkTimesHaveChanged( self )
         
     
     def WakeOnPubSub( self, topic ):
@@ -825,7 +1150,7 @@ class RepeatingJob( SchedulableJob ):
         
         self._next_work_time = HydrusData.GetNowFloat() + delay
         
-        self._scheduler.WorkTimesHaveChanged()
+        self._scheduler.WorkTimesHaveChanged( self )
         
     
     def IsRepeatingWorkFinished( self ):
@@ -1553,7 +1553,16 @@ class DB( HydrusDB.HydrusDB ):
                     total_content_rows += num_rows
                     
                 
-                update_bytes = update.DumpToNetworkBytes()
+                try:
+                    
+                    update_bytes = update.DumpToBinaryNetworkBytes()
+                    
+                except ( OverflowError, UnicodeEncodeError ):
+                    
+                    # an id did not fit in the binary format's columns, or a tag (e.g. with a lone surrogate) will not go to utf-8, so fall back to the old json, which escapes it
+                    
+                    update_bytes = update.DumpToNetworkBytes()
+                    
                 
                 update_hash = hashlib.sha256( update_bytes ).digest()
                 
@@ -1,3 +1,4 @@
+import base64
 from . import ClientCaches
 from . import ClientConstants as CC
 from . import ClientAPI
@@ -20,6 +21,7 @@ import json
 import os
 import random
 import shutil
+import struct
 import time
 import unittest
 import urllib
@@ -1468,6 +1470,62 @@ class TestClientAPI( unittest.TestCase ):
         
         self.assertEqual( d, expected_answer )
         
+        # paged search
+        
+        path = '/get_files/search_files?tags={}&limit=4'.format( urllib.parse.quote( json.dumps( tags ) ) )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        
+        d = json.loads( text )
+        
+        self.assertEqual( d[ 'file_ids' ], hash_ids[ : 4 ] )
+        self.assertEqual( d[ 'offset' ], 0 )
+        self.assertEqual( d[ 'num_file_ids' ], len( hash_ids ) )
+        
+        search_cursor = d[ 'search_cursor' ]
+        
+        HG.test_controller.SetRead( 'file_query_ids', set() ) # the cursor should not search again
+        
+        path = '/get_files/search_files?search_cursor={}&offset=4&file_id_encoding=packed'.format( search_cursor )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        
+        d = json.loads( text )
+        
+        packed_file_ids = base64.b64decode( d[ 'file_ids' ] )
+        
+        self.assertEqual( list( struct.unpack( '<{}I'.format( len( packed_file_ids ) // 4 ), packed_file_ids ) ), hash_ids[ 4 : ] )
+        self.assertEqual( d[ 'search_cursor' ], search_cursor )
+        self.assertEqual( d[ 'offset' ], 4 )
+        
+        path = '/get_files/search_files?search_cursor={}'.format( os.urandom( 32 ).hex() )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 404 )
+        
+        HG.test_controller.SetRead( 'file_query_ids', set( hash_ids ) )
+        
         # some file search param parsing
         
         class PretendRequest( object ):
@@ -1724,6 +1782,25 @@ class TestClientAPI( unittest.TestCase ):
         
         self.assertEqual( d, expected_metadata_result )
         
+        # streamed metadata from file_ids
+        
+        path = '/get_files/file_metadata?file_ids={}&stream=true'.format( urllib.parse.quote( json.dumps( [ 1, 2, 3 ] ) ) )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        self.assertEqual( response.getheader( 'Content-Type' ), 'application/x-ndjson' )
+        
+        metadata = [ json.loads( line ) for line in text.splitlines() ]
+        
+        self.assertEqual( metadata, expected_metadata_result[ 'metadata' ] )
+        
         # now from hashes
         
         api_permissions = set_up_permissions[ 'everything' ]
@@ -1912,6 +1989,81 @@ class TestClientAPI( unittest.TestCase ):
         
         self.assertEqual( hashlib.sha256( data ).digest(), hash )
         
+        full_data = data
+        
+        etag = response.getheader( 'ETag' )
+        last_modified = response.getheader( 'Last-Modified' )
+        
+        self.assertEqual( etag, '"{}"'.format( hash_hex ) )
+        self.assertEqual( response.getheader( 'Accept-Ranges' ), 'bytes' )
+        
+        # conditional
+        
+        connection.request( 'GET', path, headers = dict( headers, **{ 'If-None-Match' : etag } ) )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 304 )
+        self.assertEqual( data, b'' )
+        
+        connection.request( 'GET', path, headers = dict( headers, **{ 'If-Modified-Since' : last_modified } ) )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 304 )
+        
+        connection.request( 'GET', path, headers = dict( headers, **{ 'If-None-Match' : '"{}"'.format( 'a' * 64 ) } ) )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 200 )
+        self.assertEqual( data, full_data )
+        
+        # ranges
+        
+        connection.request( 'GET', path, headers = dict( headers, **{ 'Range' : 'bytes=10-19' } ) )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 206 )
+        self.assertEqual( data, full_data[ 10 : 20 ] )
+        self.assertEqual( response.getheader( 'Content-Range' ), 'bytes 10-19/{}'.format( len( full_data ) ) )
+        
+        connection.request( 'GET', path, headers = dict( headers, **{ 'Range' : 'bytes=-5', 'If-Range' : etag } ) )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 206 )
+        self.assertEqual( data, full_data[ -5 : ] )
+        
+        connection.request( 'GET', path, headers = dict( headers, **{ 'Range' : 'bytes=10-19', 'If-Range' : '"{}"'.format( 'a' * 64 ) } ) )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 200 )
+        self.assertEqual( data, full_data )
+        
+        connection.request( 'GET', path, headers = dict( headers, **{ 'Range' : 'bytes={}-'.format( len( full_data ) ) } ) )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 416 )
+        self.assertEqual( response.getheader( 'Content-Range' ), 'bytes */{}'.format( len( full_data ) ) )
+        
         #
         
         path = '/get_files/thumbnail?hash={}'.format( hash_hex )
@@ -1926,6 +2078,42 @@ class TestClientAPI( unittest.TestCase ):
         
         self.assertEqual( hashlib.sha256( data ).digest(), thumb_hash )
         
+        etag = response.getheader( 'ETag' )
+        
+        self.assertTrue( etag.startswith( '"{}-'.format( hash_hex ) ) )
+        
+        connection.request( 'GET', path, headers = dict( headers, **{ 'If-None-Match' : etag } ) )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 304 )
+        
+        self.assertEqual( response.getheader( 'Accept-Ranges' ), 'bytes' )
+        
+        last_modified = response.getheader( 'Last-Modified' )
+        
+        self.assertIsNotNone( last_modified )
+        
+        connection.request( 'GET', path, headers = dict( headers, **{ 'If-Modified-Since' : last_modified } ) )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 304 )
+        
+        connection.request( 'GET', path, headers = dict( headers, **{ 'Range' : 'bytes=10-19' } ) )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 206 )
+        self.assertEqual( len( data ), 10 )
+        self.assertTrue( response.getheader( 'Content-Range' ).startswith( 'bytes 10-19/' ) )
+        
         # now 404
         
         hash_404 = os.urandom( 32 )
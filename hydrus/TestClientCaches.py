@@ -0,0 +1,339 @@
+from . import ClientCaches
+from . import HydrusData
+from . import HydrusGlobals as HG
+import os
+import random
+import unittest
+from mock import patch
+
+class FakeCacheData( object ):
+    
+    def __init__( self, memory_footprint ):
+        
+        self._memory_footprint = memory_footprint
+        
+    
+    def GetEstimatedMemoryFootprint( self ):
+        
+        return self._memory_footprint
+        
+    
+class TestDataCache( unittest.TestCase ):
+    
+    def test_size_limit( self ):
+        
+        data_cache = ClientCaches.DataCache( HG.test_controller, 100 )
+        
+        for i in range( 10 ):
+            
+            data_cache.AddData( i, FakeCacheData( 20 ) )
+            
+        
+        stats = data_cache.GetStats()
+        
+        self.assertEqual( stats[ 'num_items' ], 5 )
+        self.assertEqual( stats[ 'estimated_memory_footprint' ], 100 )
+        self.assertEqual( stats[ 'num_evictions' ], 5 )
+        
+        for i in range( 5 ):
+            
+            self.assertFalse( data_cache.HasData( i ) )
+            
+        
+        for i in range( 5, 10 ):
+            
+            self.assertTrue( data_cache.HasData( i ) )
+            
+        
+        # a big item clears out enough room for itself
+        
+        data_cache.AddData( 'big', FakeCacheData( 70 ) )
+        
+        stats = data_cache.GetStats()
+        
+        self.assertEqual( stats[ 'num_items' ], 2 )
+        self.assertEqual( stats[ 'estimated_memory_footprint' ], 90 )
+        
+        data_cache.DeleteData( 'big' )
+        
+        self.assertEqual( data_cache.GetStats()[ 'estimated_memory_footprint' ], 20 )
+        
+        data_cache.Clear()
+        
+        self.assertEqual( data_cache.GetStats()[ 'num_items' ], 0 )
+        self.assertEqual( data_cache.GetStats()[ 'estimated_memory_footprint' ], 0 )
+        
+    
+    def test_scan_resistance( self ):
+        
+        data_cache = ClientCaches.DataCache( HG.test_controller, 100 )
+        
+        # the working set, fetched more than once, gets protected
+        
+        for key in ( 'a', 'b', 'c' ):
+            
+            data_cache.AddData( key, FakeCacheData( 10 ) )
+            
+            data_cache.GetData( key )
+            
+        
+        # a long scan of one-off items
+        
+        for i in range( 50 ):
+            
+            data_cache.AddData( i, FakeCacheData( 10 ) )
+            
+        
+        for key in ( 'a', 'b', 'c' ):
+            
+            self.assertIsNotNone( data_cache.GetIfHasData( key ) )
+            
+        
+        self.assertIsNone( data_cache.GetIfHasData( 0 ) )
+        
+        stats = data_cache.GetStats()
+        
+        self.assertEqual( stats[ 'num_hits' ], 6 )
+        self.assertEqual( stats[ 'num_misses' ], 1 )
+        self.assertEqual( stats[ 'num_protected_items' ], 3 )
+        self.assertLessEqual( stats[ 'estimated_memory_footprint' ], 100 )
+        
+    
+    def test_growing_data( self ):
+        
+        data_cache = ClientCaches.DataCache( HG.test_controller, 100 )
+        
+        datas = [ FakeCacheData( 20 ) for i in range( 5 ) ]
+        
+        for ( i, data ) in enumerate( datas ):
+            
+            data_cache.AddData( i, data )
+            
+        
+        # like a renderer that has now rendered
+        
+        datas[4]._memory_footprint = 60
+        
+        data_cache.GetData( 4 )
+        
+        stats = data_cache.GetStats()
+        
+        self.assertEqual( stats[ 'estimated_memory_footprint' ], 100 )
+        self.assertEqual( stats[ 'num_evictions' ], 2 )
+        self.assertTrue( data_cache.HasData( 4 ) )
+        
+        datas[3]._memory_footprint = 40
+        
+        data_cache.MaintainCache()
+        
+        stats = data_cache.GetStats()
+        
+        self.assertLessEqual( stats[ 'estimated_memory_footprint' ], 100 )
+        self.assertEqual( stats[ 'num_evictions' ], 3 )
+        
+    
+    def test_timeout( self ):
+        
+        data_cache = ClientCaches.DataCache( HG.test_controller, 100, timeout = 1200 )
+        
+        with patch.object( HydrusData, 'GetNow', return_value = 0 ):
+            
+            data_cache.AddData( 'old', FakeCacheData( 10 ) )
+            
+            data_cache.GetData( 'old' )
+            
+        
+        with patch.object( HydrusData, 'GetNow', return_value = 1000 ):
+            
+            data_cache.AddData( 'probationary', FakeCacheData( 10 ) )
+            
+            # enough newly protected items to demote 'old' back to probation, behind 'probationary'
+            
+            for i in range( 8 ):
+                
+                data_cache.AddData( i, FakeCacheData( 10 ) )
+                
+                data_cache.GetData( i )
+                
+            
+        
+        self.assertEqual( data_cache.GetStats()[ 'num_protected_items' ], 8 )
+        
+        with patch.object( HydrusData, 'GetNow', return_value = 1500 ):
+            
+            data_cache.MaintainCache()
+            
+        
+        self.assertFalse( data_cache.HasData( 'old' ) )
+        self.assertTrue( data_cache.HasData( 'probationary' ) )
+        
+        with patch.object( HydrusData, 'GetNow', return_value = 2500 ):
+            
+            data_cache.MaintainCache()
+            
+        
+        self.assertEqual( data_cache.GetStats()[ 'num_items' ], 0 )
+        
+    
+
+class TestFileSearchResultCache( unittest.TestCase ):
+    
+    def test_cache( self ):
+        
+        cache = ClientCaches.FileSearchResultCache( 2, 1024 )
+        
+        cache.SetResult( 'a', [ 5, 1, 3 ], { ( 'service', 1 ), 'inbox' } )
+        
+        result = cache.GetResult( 'a' )
+        
+        self.assertEqual( result, [ 5, 1, 3 ] )
+        
+        # the caller gets a copy
+        
+        result.append( 4 )
+        
+        self.assertEqual( cache.GetResult( 'a' ), [ 5, 1, 3 ] )
+        
+        cache.InvalidateDependency( ( 'service', 2 ) )
+        
+        self.assertIsNotNone( cache.GetResult( 'a' ) )
+        
+        cache.InvalidateDependency( 'inbox' )
+        
+        self.assertIsNone( cache.GetResult( 'a' ) )
+        
+        for key in ( 'a', 'b', 'c' ):
+            
+            cache.SetResult( key, [ 1 ], set() )
+            
+        
+        self.assertIsNone( cache.GetResult( 'a' ) )
+        self.assertEqual( cache.GetResult( 'c' ), [ 1 ] )
+        
+    
+class TestHashIdPostingListCache( unittest.TestCase ):
+    
+    def test_cache( self ):
+        
+        cache = ClientCaches.HashIdPostingListCache( 1024 )
+        
+        key = ( 'tag', 1, 2 )
+        
+        # the first miss only counts the request
+        
+        self.assertFalse( cache.WantsPostingList( key ) )
+        self.assertTrue( cache.WantsPostingList( key ) )
+        
+        posting_list = ClientCaches.ConvertHashIdsToPostingList( { 5, 3, 9 } )
+        
+        cache.SetPostingList( key, posting_list, service_ids = ( 1, 2 ) )
+        
+        self.assertEqual( posting_list.tolist(), [ 3, 5, 9 ] )
+        self.assertIs( cache.GetPostingList( key ), posting_list )
+        
+        self.assertEqual( ClientCaches.IntersectHashIdsWithPostingList( { 1, 3, 9, 10 }, posting_list ), { 3, 9 } )
+        self.assertEqual( ClientCaches.SubtractPostingListFromHashIds( { 1, 3, 9, 10 }, posting_list ), { 1, 10 } )
+        self.assertEqual( ClientCaches.IntersectPostingLists( posting_list, ClientCaches.ConvertHashIdsToPostingList( [ 9, 1, 5 ] ) ).tolist(), [ 5, 9 ] )
+        
+        cache.InvalidateService( 3 )
+        
+        self.assertIsNotNone( cache.GetPostingList( key ) )
+        
+        cache.InvalidateService( 2 )
+        
+        self.assertIsNone( cache.GetPostingList( key ) )
+        
+        # 4 bytes an id, so 200 ids each means only one fits
+        
+        cache.SetPostingList( ( 'a', ), ClientCaches.ConvertHashIdsToPostingList( range( 200 ) ) )
+        cache.SetPostingList( ( 'b', ), ClientCaches.ConvertHashIdsToPostingList( range( 200 ) ) )
+        
+        self.assertIsNone( cache.GetPostingList( ( 'a', ) ) )
+        self.assertIsNotNone( cache.GetPostingList( ( 'b', ) ) )
+        
+    
+class TestPHashIndex( unittest.TestCase ):
+    
+    def test_search( self ):
+        
+        phash_ids_to_phashes = { phash_id : os.urandom( 8 ) for phash_id in range( 1, 1001 ) }
+        
+        # some near neighbours of the first phash
+        
+        base = int.from_bytes( phash_ids_to_phashes[ 1 ], 'big' )
+        
+        for ( phash_id, num_bits ) in ( ( 1001, 1 ), ( 1002, 3 ), ( 1003, 8 ) ):
+            
+            bits = random.sample( range( 64 ), num_bits )
+            
+            value = base
+            
+            for bit in bits:
+                
+                value ^= 1 << bit
+                
+            
+            phash_ids_to_phashes[ phash_id ] = value.to_bytes( 8, 'big' )
+            
+        
+        phash_index = ClientCaches.PHashIndex()
+        
+        phash_index.AddPHashes( list( phash_ids_to_phashes.items() ) )
+        
+        self.assertEqual( phash_index.GetNumPHashes(), len( phash_ids_to_phashes ) )
+        
+        search_phashes = [ phash_ids_to_phashes[ 1 ], phash_ids_to_phashes[ 500 ], os.urandom( 8 ) ]
+        
+        for max_hamming_distance in ( 0, 4, 8, 12 ):
+            
+            results = phash_index.SearchMany( search_phashes, max_hamming_distance )
+            
+            for ( search_phash, result ) in zip( search_phashes, results ):
+                
+                expected = { ( phash_id, HydrusData.Get64BitHammingDistance( search_phash, phash ) ) for ( phash_id, phash ) in phash_ids_to_phashes.items() if HydrusData.Get64BitHammingDistance( search_phash, phash ) <= max_hamming_distance }
+                
+                self.assertEqual( set( result ), expected )
+                
+            
+        
+        result = phash_index.Search( [ phash_ids_to_phashes[ 1 ] ], 3 )
+        
+        self.assertEqual( result[ 1 ], 0 )
+        self.assertEqual( result[ 1001 ], 1 )
+        self.assertEqual( result[ 1002 ], 3 )
+        self.assertNotIn( 1003, result )
+        
+    
+    def test_sync( self ):
+        
+        phash_index = ClientCaches.PHashIndex()
+        
+        phash_a = b'\x00' * 8
+        phash_b = b'\x00' * 7 + b'\x01'
+        phash_c = b'\xff' * 8
+        
+        phash_index.AddPHashes( [ ( 5, phash_a ), ( 2, phash_b ) ] )
+        
+        self.assertEqual( phash_index.Search( [ phash_a ], 1 ), { 5 : 0, 2 : 1 } )
+        
+        phash_index.DeletePHashIds( [ 5 ] )
+        
+        self.assertEqual( phash_index.Search( [ phash_a ], 1 ), { 2 : 1 } )
+        
+        # deleting and re-adding before the next search should leave it in
+        
+        phash_index.DeletePHashIds( [ 2 ] )
+        phash_index.AddPHashes( [ ( 2, phash_b ), ( 3, phash_c ) ] )
+        
+        self.assertEqual( phash_index.Search( [ phash_a ], 1 ), { 2 : 1 } )
+        self.assertEqual( phash_index.Search( [ phash_c ], 0 ), { 3 : 0 } )
+        
+        # adding something already present does not duplicate it
+        
+        phash_index.AddPHashes( [ ( 3, phash_c ) ] )
+        
+        self.assertEqual( phash_index.GetNumPHashes(), 2 )
+        
+        self.assertEqual( phash_index.SearchMany( [], 8 ), [] )
+        
+    
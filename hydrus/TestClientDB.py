@@ -12,6 +12,7 @@ from . import ClientImportLocal
 from . import ClientImportOptions
 from . import ClientImportFileSeeds
 from . import ClientRatings
+from . import ClientMedia
 from . import ClientSearch
 from . import ClientServices
 from . import ClientTags
@@ -172,6 +173,26 @@ class TestClientDB( unittest.TestCase ):
         
         #
         
+        # infix wildcards go through the trigram index
+        
+        result = self._read( 'autocomplete_predicates', tag_search_context = tag_search_context, search_text = '*ars*' )
+        
+        pred = ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'series:cars', min_current_count = 1 )
+        
+        ( read_pred, ) = result
+        
+        self.assertEqual( pred, read_pred )
+        
+        result = self._read( 'autocomplete_predicates', tag_search_context = tag_search_context, search_text = '*cAr*' )
+        
+        self.assertEqual( { p.GetValue() for p in result }, { 'car', 'series:cars' } )
+        
+        result = self._read( 'autocomplete_predicates', tag_search_context = tag_search_context, search_text = '*arx*' )
+        
+        self.assertEqual( result, [] )
+        
+        #
+        
         result = self._read( 'autocomplete_predicates', tag_search_context = tag_search_context, search_text = 'car', exact_match = True )
         
         pred = ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'car', min_current_count = 1 )
@@ -1029,6 +1050,41 @@ class TestClientDB( unittest.TestCase ):
         self.assertEqual( mr_has_audio, False )
         self.assertEqual( mr_num_words, None )
         
+        #
+        
+        service_keys_to_content_updates = {}
+        
+        content_updates = []
+        
+        content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'sibling test bad', ( hash, ) ) ) )
+        content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_ADD, ( 'sibling test bad', 'sibling test good' ) ) )
+        
+        service_keys_to_content_updates[ CC.DEFAULT_LOCAL_TAG_SERVICE_KEY ] = content_updates
+        
+        self._write( 'content_updates', service_keys_to_content_updates )
+        
+        hash_ids_to_tags_managers = self._read( 'force_refresh_tags_managers', ( mr_hash_id, ) )
+        
+        tags_manager = hash_ids_to_tags_managers[ mr_hash_id ]
+        
+        self.assertEqual( tags_manager.GetCurrent( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_STORAGE ), { 'sibling test bad' } )
+        self.assertEqual( tags_manager.GetCurrent( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ), { 'sibling test good' } )
+        
+        # the db updates its lookups as siblings come and go
+        
+        def do_sibling_update( action, pair ):
+            
+            self._write( 'content_updates', { CC.DEFAULT_LOCAL_TAG_SERVICE_KEY : [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_TAG_SIBLINGS, action, pair ) ] } )
+            
+            tags_manager = self._read( 'force_refresh_tags_managers', ( mr_hash_id, ) )[ mr_hash_id ]
+            
+            return ( tags_manager.GetCurrent( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ), tags_manager.GetCurrent( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ) )
+            
+        
+        self.assertEqual( do_sibling_update( HC.CONTENT_UPDATE_ADD, ( 'sibling test good', 'sibling test better' ) ), ( { 'sibling test better' }, { 'sibling test better' } ) )
+        self.assertEqual( do_sibling_update( HC.CONTENT_UPDATE_DELETE, ( 'sibling test good', 'sibling test better' ) ), ( { 'sibling test good' }, { 'sibling test good' } ) )
+        self.assertEqual( do_sibling_update( HC.CONTENT_UPDATE_DELETE, ( 'sibling test bad', 'sibling test good' ) ), ( { 'sibling test bad' }, { 'sibling test bad' } ) )
+        
     
     def test_nums_pending( self ):
         
@@ -1092,6 +1148,264 @@ class TestClientDB( unittest.TestCase ):
         self.assertTrue( result, ( pixiv_id, password ) )
         
     
+    def test_search_caches( self ):
+        
+        TestClientDB._clear_db()
+        
+        services = self._read( 'services' )
+        
+        services.append( ClientServices.GenerateService( TestController.LOCAL_RATING_LIKE_SERVICE_KEY, HC.LOCAL_RATING_LIKE, 'test like rating service' ) )
+        
+        self._write( 'update_services', services )
+        
+        hashes = []
+        
+        for filename in ( 'muh_jpg.jpg', 'muh_png.png', 'muh_gif.gif' ):
+            
+            path = os.path.join( HC.STATIC_DIR, 'testing', filename )
+            
+            file_import_job = ClientImportFileSeeds.FileImportJob( path )
+            
+            file_import_job.GenerateHashAndStatus()
+            
+            file_import_job.GenerateInfo()
+            
+            self._write( 'import_file', file_import_job )
+            
+            hashes.append( file_import_job.GetHash() )
+            
+        
+        def run_search( predicates ):
+            
+            search_context = ClientSearch.FileSearchContext( file_service_key = CC.LOCAL_FILE_SERVICE_KEY, predicates = predicates )
+            
+            return self._read( 'file_query_ids', search_context )
+            
+        
+        def run_search_counting_hits( predicates ):
+            
+            before = self._read( 'search_cache_hits_and_misses' )
+            
+            num_results = len( run_search( predicates ) )
+            
+            after = self._read( 'search_cache_hits_and_misses' )
+            
+            ( ( results_hits_before, results_misses_before ), ( posting_list_hits_before, posting_list_misses_before ) ) = ( before[ 'file_search_results' ], before[ 'hash_id_posting_lists' ] )
+            ( ( results_hits_after, results_misses_after ), ( posting_list_hits_after, posting_list_misses_after ) ) = ( after[ 'file_search_results' ], after[ 'hash_id_posting_lists' ] )
+            
+            return ( num_results, results_hits_after - results_hits_before, posting_list_hits_after - posting_list_hits_before )
+            
+        
+        service_keys_to_content_updates = {}
+        
+        service_keys_to_content_updates[ CC.DEFAULT_LOCAL_TAG_SERVICE_KEY ] = ( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'car', hashes[ :1 ] ) ), )
+        
+        self._write( 'content_updates', service_keys_to_content_updates )
+        
+        car_predicate = ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'car' )
+        inbox_predicate = ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_INBOX )
+        
+        # ( num results, file search result hits, posting list hits )
+        # the same search again is a result hit. the tag posting list gets cached on its second request, the inbox straight away
+        
+        self.assertEqual( run_search_counting_hits( [ car_predicate ] ), ( 1, 0, 0 ) )
+        self.assertEqual( run_search_counting_hits( [ car_predicate ] ), ( 1, 1, 0 ) )
+        self.assertEqual( run_search_counting_hits( [ car_predicate, inbox_predicate ] ), ( 1, 0, 0 ) )
+        self.assertEqual( run_search_counting_hits( [ inbox_predicate ] ), ( 3, 0, 1 ) )
+        
+        # new mappings drop the results searched on that tag service and the tag's posting list, but the inbox posting list stays
+        
+        service_keys_to_content_updates[ CC.DEFAULT_LOCAL_TAG_SERVICE_KEY ] = ( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'car', hashes[ 1: ] ) ), )
+        
+        self._write( 'content_updates', service_keys_to_content_updates )
+        
+        self.assertEqual( run_search_counting_hits( [ car_predicate ] ), ( 3, 0, 0 ) )
+        self.assertEqual( run_search_counting_hits( [ car_predicate, inbox_predicate ] ), ( 3, 0, 2 ) )
+        self.assertEqual( run_search_counting_hits( [ inbox_predicate ] ), ( 3, 0, 1 ) )
+        
+        # archiving drops everything that depends on the inbox
+        
+        service_keys_to_content_updates = {}
+        
+        service_keys_to_content_updates[ CC.COMBINED_LOCAL_FILE_SERVICE_KEY ] = ( HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ARCHIVE, hashes[ :2 ] ), )
+        
+        self._write( 'content_updates', service_keys_to_content_updates )
+        
+        self.assertEqual( run_search_counting_hits( [ inbox_predicate ] ), ( 1, 0, 0 ) )
+        self.assertEqual( run_search_counting_hits( [ car_predicate, inbox_predicate ] ), ( 1, 0, 2 ) )
+        self.assertEqual( run_search_counting_hits( [ car_predicate ] ), ( 3, 1, 0 ) )
+        
+        rating_predicate = ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_RATING, ( '=', 1.0, TestController.LOCAL_RATING_LIKE_SERVICE_KEY ) )
+        
+        self.assertEqual( run_search_counting_hits( [ rating_predicate ] ), ( 0, 0, 0 ) )
+        self.assertEqual( run_search_counting_hits( [ rating_predicate ] ), ( 0, 1, 0 ) )
+        
+        service_keys_to_content_updates = {}
+        
+        service_keys_to_content_updates[ TestController.LOCAL_RATING_LIKE_SERVICE_KEY ] = ( HydrusData.ContentUpdate( HC.CONTENT_TYPE_RATINGS, HC.CONTENT_UPDATE_ADD, ( 1.0, hashes[ :1 ] ) ), )
+        
+        self._write( 'content_updates', service_keys_to_content_updates )
+        
+        self.assertEqual( run_search_counting_hits( [ rating_predicate ] ), ( 1, 0, 0 ) )
+        
+        # later tests want the default services back
+        
+        TestClientDB._clear_db()
+        
+    
+    def test_search_cache_new_files( self ):
+        
+        TestClientDB._clear_db()
+        
+        path = os.path.join( HC.STATIC_DIR, 'testing', 'muh_png.png' )
+        
+        file_import_job = ClientImportFileSeeds.FileImportJob( path )
+        
+        file_import_job.GenerateHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        hash = file_import_job.GetHash()
+        other_hash = HydrusData.GenerateKey()
+        
+        # all known files searches what has tags, so we tag the files before we have them, like a tag repository would
+        
+        service_keys_to_content_updates = { CC.DEFAULT_LOCAL_TAG_SERVICE_KEY : [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'new file', ( hash, other_hash ) ) ) ] }
+        
+        self._write( 'content_updates', service_keys_to_content_updates )
+        
+        tag_predicate = ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'new file' )
+        mime_predicate = ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_MIME, ( HC.IMAGE_PNG, ) )
+        
+        def run_search( file_service_key, predicates ):
+            
+            tag_search_context = ClientSearch.TagSearchContext( service_key = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY )
+            
+            search_context = ClientSearch.FileSearchContext( file_service_key = file_service_key, tag_search_context = tag_search_context, predicates = predicates )
+            
+            return self._read( 'file_query_ids', search_context )
+            
+        
+        self.assertEqual( len( run_search( CC.COMBINED_FILE_SERVICE_KEY, [ tag_predicate, mime_predicate ] ) ), 0 )
+        self.assertEqual( len( run_search( CC.LOCAL_FILE_SERVICE_KEY, [ tag_predicate, mime_predicate ] ) ), 0 )
+        
+        self._write( 'import_file', file_import_job )
+        
+        self.assertEqual( len( run_search( CC.COMBINED_FILE_SERVICE_KEY, [ tag_predicate, mime_predicate ] ) ), 1 )
+        self.assertEqual( len( run_search( CC.LOCAL_FILE_SERVICE_KEY, [ tag_predicate, mime_predicate ] ) ), 1 )
+        
+        # all known files checks the mime against files_info directly, so a file's first files_info row has to show up there even though that search's file service did not change
+        
+        hash_ids_to_hashes = self._read( 'hash_ids_to_hashes', hash_ids = run_search( CC.COMBINED_FILE_SERVICE_KEY, [ tag_predicate ] ) )
+        
+        ( other_hash_id, ) = [ hash_id for ( hash_id, h ) in hash_ids_to_hashes.items() if h == other_hash ]
+        
+        file_info_manager = ClientMedia.FileInfoManager( other_hash_id, other_hash, size = 100, mime = HC.IMAGE_PNG, width = 10, height = 10 )
+        
+        service_keys_to_content_updates = { CC.LOCAL_FILE_SERVICE_KEY : [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, ( file_info_manager, HydrusData.GetNow() ) ) ] }
+        
+        self._write( 'content_updates', service_keys_to_content_updates )
+        
+        self.assertEqual( len( run_search( CC.COMBINED_FILE_SERVICE_KEY, [ tag_predicate, mime_predicate ] ) ), 2 )
+        
+        TestClientDB._clear_db()
+        
+    
+    def test_search_planner( self ):
+        
+        TestClientDB._clear_db()
+        
+        services = self._read( 'services' )
+        
+        services.append( ClientServices.GenerateService( TestController.LOCAL_RATING_LIKE_SERVICE_KEY, HC.LOCAL_RATING_LIKE, 'test like rating service' ) )
+        
+        self._write( 'update_services', services )
+        
+        hashes = []
+        
+        for filename in ( 'muh_jpg.jpg', 'muh_png.png', 'muh_gif.gif' ):
+            
+            path = os.path.join( HC.STATIC_DIR, 'testing', filename )
+            
+            file_import_job = ClientImportFileSeeds.FileImportJob( path )
+            
+            file_import_job.GenerateHashAndStatus()
+            
+            file_import_job.GenerateInfo()
+            
+            self._write( 'import_file', file_import_job )
+            
+            hashes.append( file_import_job.GetHash() )
+            
+        
+        service_keys_to_content_updates = {}
+        
+        service_keys_to_content_updates[ CC.DEFAULT_LOCAL_TAG_SERVICE_KEY ] = [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( tag, tag_hashes ) ) for ( tag, tag_hashes ) in ( ( 'car', hashes ), ( 'red', hashes[ :2 ] ), ( 'blue', hashes[ 2: ] ) ) ]
+        service_keys_to_content_updates[ CC.COMBINED_LOCAL_FILE_SERVICE_KEY ] = [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ARCHIVE, hashes[ 1:2 ] ) ]
+        service_keys_to_content_updates[ TestController.LOCAL_RATING_LIKE_SERVICE_KEY ] = [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_RATINGS, HC.CONTENT_UPDATE_ADD, ( 1.0, [ hashes[0], hashes[2] ] ) ), HydrusData.ContentUpdate( HC.CONTENT_TYPE_RATINGS, HC.CONTENT_UPDATE_ADD, ( 0.0, hashes[ 1:2 ] ) ) ]
+        
+        self._write( 'content_updates', service_keys_to_content_updates )
+        
+        def run_search( predicates ):
+            
+            search_context = ClientSearch.FileSearchContext( file_service_key = CC.LOCAL_FILE_SERVICE_KEY, predicates = predicates )
+            
+            return set( self._read( 'file_query_ids', search_context ) )
+            
+        
+        tests = []
+        
+        tests.append( ( ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'car' ), 3 ) )
+        tests.append( ( ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'red' ), 2 ) )
+        tests.append( ( ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'blue' ), 1 ) )
+        tests.append( ( ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_INBOX ), 2 ) )
+        tests.append( ( ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_RATING, ( '=', 1.0, TestController.LOCAL_RATING_LIKE_SERVICE_KEY ) ), 2 ) )
+        tests.append( ( ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_RATING, ( '=', 0.0, TestController.LOCAL_RATING_LIKE_SERVICE_KEY ) ), 1 ) )
+        tests.append( ( ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_AGE, ( '<', 'delta', ( 0, 0, 1, 0 ) ) ), 3 ) )
+        tests.append( ( ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_MODIFIED_TIME, ( '>', 'delta', ( 0, 0, 1, 0 ) ) ), 3 ) )
+        tests.append( ( ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_MODIFIED_TIME, ( '<', 'delta', ( 0, 0, 1, 0 ) ) ), 0 ) )
+        
+        predicates_to_results = {}
+        
+        for ( predicate, num_results ) in tests:
+            
+            result = run_search( [ predicate ] )
+            
+            self.assertEqual( len( result ), num_results )
+            
+            predicates_to_results[ predicate ] = result
+            
+        
+        # however the steps get ordered, a mixed search has to give the intersection of its parts
+        
+        def run_mixed_tests():
+            
+            for num_predicates in ( 2, 3 ):
+                
+                for predicates in itertools.combinations( [ predicate for ( predicate, num_results ) in tests ], num_predicates ):
+                    
+                    expected_result = set.intersection( *[ predicates_to_results[ predicate ] for predicate in predicates ] )
+                    
+                    self.assertEqual( run_search( list( predicates ) ), expected_result )
+                    
+                
+            
+        
+        run_mixed_tests()
+        
+        # and again with ANALYZE stats, which the rating and modified time estimates use
+        
+        self._write( 'analyze', force_reanalyze = True )
+        
+        TestClientDB._db._file_search_result_cache.Clear()
+        
+        run_mixed_tests()
+        
+        # later tests want the default services back
+        
+        TestClientDB._clear_db()
+        
+    
     def test_services( self ):
         
         result = self._read( 'services', ( HC.LOCAL_FILE_DOMAIN, HC.LOCAL_FILE_TRASH_DOMAIN, HC.COMBINED_LOCAL_FILE, HC.LOCAL_TAG ) )
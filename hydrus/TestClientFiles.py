@@ -0,0 +1,179 @@
+from . import ClientFiles
+from . import ClientThreading
+from . import HydrusData
+from . import HydrusExceptions
+from . import HydrusGlobals as HG
+from . import HydrusPaths
+import os
+import tempfile
+import unittest
+
+class TestThumbnailPack( unittest.TestCase ):
+    
+    def test_pack( self ):
+        
+        dir = tempfile.mkdtemp()
+        
+        try:
+            
+            path = os.path.join( dir, ClientFiles.THUMBNAIL_PACK_FILENAME )
+            
+            hashes = [ HydrusData.GenerateKey() for i in range( 10 ) ]
+            
+            hashes_to_thumbnail_bytes = { hash : os.urandom( 200 + i ) for ( i, hash ) in enumerate( hashes ) }
+            
+            thumbnail_pack = ClientFiles.ThumbnailPack( path )
+            
+            self.assertFalse( thumbnail_pack.HasThumbnail( hashes[0] ) )
+            
+            thumbnail_pack.AddThumbnails( list( hashes_to_thumbnail_bytes.items() ) )
+            
+            for ( hash, thumbnail_bytes ) in hashes_to_thumbnail_bytes.items():
+                
+                self.assertEqual( thumbnail_pack.GetThumbnailBytes( hash ), thumbnail_bytes )
+                
+            
+            # replace one, delete two
+            
+            hashes_to_thumbnail_bytes[ hashes[0] ] = b'new thumbnail'
+            
+            thumbnail_pack.AddThumbnails( [ ( hashes[0], b'new thumbnail' ) ] )
+            
+            thumbnail_pack.DeleteThumbnails( hashes[1:3] )
+            
+            del hashes_to_thumbnail_bytes[ hashes[1] ]
+            del hashes_to_thumbnail_bytes[ hashes[2] ]
+            
+            self.assertEqual( thumbnail_pack.GetThumbnailBytes( hashes[0] ), b'new thumbnail' )
+            
+            with self.assertRaises( HydrusExceptions.FileMissingException ):
+                
+                thumbnail_pack.GetThumbnailBytes( hashes[1] )
+                
+            
+            self.assertTrue( thumbnail_pack.NeedsCompaction() )
+            
+            # a fresh object rebuilds the same index from disk, even with a torn record at the end
+            
+            thumbnail_pack.Close()
+            
+            with open( path, 'ab' ) as f:
+                
+                f.write( ClientFiles.THUMBNAIL_PACK_RECORD_HEADER.pack( HydrusData.GenerateKey(), 5000 ) + b'partial' )
+                
+            
+            size_before_truncation = os.path.getsize( path )
+            
+            thumbnail_pack = ClientFiles.ThumbnailPack( path )
+            
+            self.assertEqual( set( thumbnail_pack.GetHashes() ), set( hashes_to_thumbnail_bytes.keys() ) )
+            
+            self.assertLess( os.path.getsize( path ), size_before_truncation )
+            
+            size_before_compaction = os.path.getsize( path )
+            
+            thumbnail_pack.Compact()
+            
+            self.assertLess( os.path.getsize( path ), size_before_compaction )
+            self.assertFalse( thumbnail_pack.NeedsCompaction() )
+            
+            for ( hash, thumbnail_bytes ) in hashes_to_thumbnail_bytes.items():
+                
+                self.assertEqual( thumbnail_pack.GetThumbnailBytes( hash ), thumbnail_bytes )
+                
+            
+            thumbnail_pack.Close()
+            
+        finally:
+            
+            HydrusPaths.DeletePath( dir )
+            
+        
+    
+    def test_migration( self ):
+        
+        client_files_manager = HG.test_controller.client_files_manager
+        
+        hash = HydrusData.GenerateKey()
+        thumbnail_bytes = os.urandom( 500 )
+        
+        loose_path = client_files_manager._GenerateExpectedThumbnailPath( hash )
+        pack_path = os.path.join( os.path.dirname( loose_path ), ClientFiles.THUMBNAIL_PACK_FILENAME )
+        
+        client_files_manager.AddThumbnailFromBytes( hash, thumbnail_bytes, silent = True )
+        
+        self.assertTrue( os.path.exists( loose_path ) )
+        
+        try:
+            
+            client_files_manager.MigrateThumbnailStorage( True, ClientThreading.JobKey() )
+            
+            self.assertFalse( os.path.exists( loose_path ) )
+            self.assertTrue( os.path.exists( pack_path ) )
+            
+            self.assertTrue( client_files_manager.LocklessHasThumbnail( hash ) )
+            self.assertEqual( client_files_manager._GetThumbnailBytes( hash ), thumbnail_bytes )
+            
+            # new thumbnails go straight to the pack
+            
+            client_files_manager.AddThumbnailFromBytes( hash, b'regenerated', silent = True )
+            
+            self.assertFalse( os.path.exists( loose_path ) )
+            self.assertEqual( client_files_manager._GetThumbnailBytes( hash ), b'regenerated' )
+            
+            client_files_manager.MigrateThumbnailStorage( False, ClientThreading.JobKey() )
+            
+            self.assertTrue( os.path.exists( loose_path ) )
+            self.assertFalse( os.path.exists( pack_path ) )
+            
+            self.assertEqual( client_files_manager._GetThumbnailBytes( hash ), b'regenerated' )
+            
+        finally:
+            
+            HG.test_controller.new_options.SetBoolean( 'thumbnail_pack_storage', False )
+            
+        
+    
+    def test_migration_batches( self ):
+        
+        client_files_manager = HG.test_controller.client_files_manager
+        
+        # same prefix, so one prefix takes several batches each way
+        
+        hashes_to_thumbnail_bytes = { b'\xab' + os.urandom( 31 ) : os.urandom( 100 ) for i in range( 7 ) }
+        
+        for ( hash, thumbnail_bytes ) in hashes_to_thumbnail_bytes.items():
+            
+            client_files_manager.AddThumbnailFromBytes( hash, thumbnail_bytes, silent = True )
+            
+        
+        batch_size = ClientFiles.THUMBNAIL_MIGRATION_BATCH_SIZE
+        
+        ClientFiles.THUMBNAIL_MIGRATION_BATCH_SIZE = 3
+        
+        try:
+            
+            client_files_manager.MigrateThumbnailStorage( True, ClientThreading.JobKey() )
+            
+            for ( hash, thumbnail_bytes ) in hashes_to_thumbnail_bytes.items():
+                
+                self.assertFalse( os.path.exists( client_files_manager._GenerateExpectedThumbnailPath( hash ) ) )
+                self.assertEqual( client_files_manager._GetThumbnailBytes( hash ), thumbnail_bytes )
+                
+            
+            client_files_manager.MigrateThumbnailStorage( False, ClientThreading.JobKey() )
+            
+            for ( hash, thumbnail_bytes ) in hashes_to_thumbnail_bytes.items():
+                
+                self.assertTrue( os.path.exists( client_files_manager._GenerateExpectedThumbnailPath( hash ) ) )
+                self.assertEqual( client_files_manager._GetThumbnailBytes( hash ), thumbnail_bytes )
+                
+            
+        finally:
+            
+            ClientFiles.THUMBNAIL_MIGRATION_BATCH_SIZE = batch_size
+            
+            HG.test_controller.new_options.SetBoolean( 'thumbnail_pack_storage', False )
+            
+        
+    
@@ -0,0 +1,89 @@
+from . import ClientConstants as CC
+from . import ClientImporting
+from . import ClientImportFileSeeds
+from . import HydrusConstants as HC
+from . import HydrusGlobals as HG
+from . import HydrusThreading
+import hashlib
+import os
+import threading
+import unittest
+
+class BlockingFileSeed( object ):
+    
+    def __init__( self, release_event ):
+        
+        self._release_event = release_event
+        
+    
+    def ImportPath( self, file_seed_cache, file_import_options, limited_mimes = None, status_hook = None ):
+        
+        self._release_event.wait( 30 )
+        
+    
+class TestImportPathFileSeeds( unittest.TestCase ):
+    
+    def test_parallel_import( self ):
+        
+        HG.test_controller.SetRead( 'hash_status', ( CC.STATUS_UNKNOWN, None, '' ) )
+        HG.test_controller.ClearWrites( 'import_file' )
+        
+        paths = [ os.path.join( HC.STATIC_DIR, 'testing', filename ) for filename in ( 'muh_jpg.jpg', 'muh_png.png', 'muh_gif.gif' ) ]
+        
+        paths.append( os.path.join( HC.STATIC_DIR, 'testing', 'does_not_exist.jpg' ) )
+        
+        file_seeds = [ ClientImportFileSeeds.FileSeed( ClientImportFileSeeds.FILE_SEED_TYPE_HDD, path ) for path in paths ]
+        
+        file_seed_cache = ClientImportFileSeeds.FileSeedCache()
+        
+        file_seed_cache.AddFileSeeds( file_seeds )
+        
+        file_import_options = HG.test_controller.new_options.GetDefaultFileImportOptions( 'loud' )
+        
+        ClientImporting.ImportPathFileSeeds( file_seeds, file_seed_cache, file_import_options )
+        
+        for ( path, file_seed ) in zip( paths[ :3 ], file_seeds[ :3 ] ):
+            
+            self.assertEqual( file_seed.status, CC.STATUS_SUCCESSFUL_AND_NEW )
+            
+            with open( path, 'rb' ) as f:
+                
+                self.assertEqual( file_seed.GetHash(), hashlib.sha256( f.read() ).digest() )
+                
+            
+        
+        self.assertEqual( file_seeds[3].status, CC.STATUS_VETOED )
+        
+        self.assertEqual( len( HG.test_controller.GetWrite( 'import_file' ) ), 3 )
+        
+    
+    def test_shutdown( self ):
+        
+        release_event = threading.Event()
+        
+        file_seeds = [ BlockingFileSeed( release_event ), BlockingFileSeed( release_event ) ]
+        
+        thread = threading.Thread( target = ClientImporting.ImportPathFileSeeds, args = ( file_seeds, None, None ) )
+        
+        try:
+            
+            thread.start()
+            
+            thread.join( 2 )
+            
+            self.assertTrue( thread.is_alive() )
+            
+            # the workers are still stuck, but the waiting thread is told to shut down
+            
+            HydrusThreading.ShutdownThread( thread )
+            
+            thread.join( 5 )
+            
+            self.assertFalse( thread.is_alive() )
+            
+        finally:
+            
+            release_event.set()
+            
+        
+    
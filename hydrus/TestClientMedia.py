@@ -0,0 +1,139 @@
+from . import ClientConstants as CC
+from . import ClientMedia
+from . import ClientRatings
+from . import HydrusConstants as HC
+from . import HydrusData
+from . import HydrusGlobals as HG
+import random
+import unittest
+
+class TestMediaListSort( unittest.TestCase ):
+    
+    def _GetMediaResults( self, num_files ):
+        
+        media_results = []
+        
+        for file_id in range( num_files ):
+            
+            hash = HydrusData.GenerateKey()
+            
+            # small ranges so plenty of ties fall through to the fallback sort and the original order
+            
+            size = random.choice( [ 1024, 2048, 4096, None ] )
+            mime = random.choice( [ HC.IMAGE_JPEG, HC.VIDEO_WEBM, HC.APPLICATION_PDF ] )
+            width = random.choice( [ 200, 640, 1920 ] )
+            height = random.choice( [ 200, 480, 1080 ] )
+            duration = random.choice( [ 220, 16.66667, None ] )
+            num_frames = random.choice( [ 10, 60, None ] )
+            
+            file_info_manager = ClientMedia.FileInfoManager( file_id, hash, size = size, mime = mime, width = width, height = height, duration = duration, num_frames = num_frames )
+            
+            tags_manager = ClientMedia.TagsManager( {} )
+            
+            current_to_timestamps = { CC.LOCAL_FILE_SERVICE_KEY : random.choice( [ 100, 200, 300 ] ), CC.COMBINED_LOCAL_FILE_SERVICE_KEY : random.choice( [ 100, 200, 300 ] ) }
+            
+            locations_manager = ClientMedia.LocationsManager( set( current_to_timestamps.keys() ), set(), set(), set(), current_to_timestamps = current_to_timestamps )
+            ratings_manager = ClientRatings.RatingsManager( {} )
+            file_viewing_stats_manager = ClientMedia.FileViewingStatsManager( 0, 0, random.choice( [ 0, 1, 5 ] ), 0 )
+            
+            media_results.append( ClientMedia.MediaResult( file_info_manager, tags_manager, locations_manager, ratings_manager, file_viewing_stats_manager ) )
+            
+        
+        return media_results
+        
+    
+    def _GetPythonSortedHashes( self, media_list, media_sort ):
+        
+        # the plain two pass stable sort the columns are meant to reproduce
+        
+        medias = list( media_list._sorted_media )
+        
+        media_sort_fallback = HG.client_controller.new_options.GetFallbackSort()
+        
+        ( sort_key, reverse ) = media_sort_fallback.GetSortKeyAndReverse( CC.LOCAL_FILE_SERVICE_KEY )
+        
+        medias.sort( key = sort_key, reverse = reverse )
+        
+        ( sort_key, reverse ) = media_sort.GetSortKeyAndReverse( CC.LOCAL_FILE_SERVICE_KEY )
+        
+        medias.sort( key = sort_key, reverse = reverse )
+        
+        return [ media.GetHash() for media in medias ]
+        
+    
+    def test_sort( self ):
+        
+        media_list = ClientMedia.MediaList( CC.LOCAL_FILE_SERVICE_KEY, self._GetMediaResults( 200 ) )
+        
+        sort_datas = [ CC.SORT_FILES_BY_FILESIZE, CC.SORT_FILES_BY_APPROX_BITRATE, CC.SORT_FILES_BY_RATIO, CC.SORT_FILES_BY_NUM_PIXELS, CC.SORT_FILES_BY_MIME, CC.SORT_FILES_BY_IMPORT_TIME, CC.SORT_FILES_BY_MEDIA_VIEWS, CC.SORT_FILES_BY_FRAMERATE ]
+        
+        for sort_data in sort_datas:
+            
+            for sort_asc in ( CC.SORT_ASC, CC.SORT_DESC ):
+                
+                media_sort = ClientMedia.MediaSort( ( 'system', sort_data ), sort_asc )
+                
+                expected_hashes = self._GetPythonSortedHashes( media_list, media_sort )
+                
+                media_list.Sort( media_sort )
+                
+                self.assertEqual( [ media.GetHash() for media in media_list.GetSortedMedia() ], expected_hashes )
+                
+            
+        
+        # new media has to show up in the next sort, not be dropped by the cached columns
+        
+        media_sort = ClientMedia.MediaSort( ( 'system', CC.SORT_FILES_BY_FILESIZE ), CC.SORT_DESC )
+        
+        new_media = [ ClientMedia.MediaSingleton( media_result ) for media_result in self._GetMediaResults( 20 ) ]
+        
+        media_list.AddMedia( new_media )
+        
+        expected_hashes = self._GetPythonSortedHashes( media_list, media_sort )
+        
+        media_list.Sort( media_sort )
+        
+        self.assertEqual( len( expected_hashes ), 220 )
+        self.assertEqual( [ media.GetHash() for media in media_list.GetSortedMedia() ], expected_hashes )
+        
+    
+    def test_sort_num_tags_new_tag_presentation( self ):
+        
+        media_results = self._GetMediaResults( 100 )
+        
+        for media_result in media_results:
+            
+            tags_manager = media_result.GetTagsManager()
+            
+            for i in range( random.randint( 0, 3 ) ):
+                
+                content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'tag {}'.format( i ), { media_result.GetHash() } ) )
+                
+                tags_manager.ProcessContentUpdate( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, content_update )
+                
+            
+        
+        media_list = ClientMedia.MediaList( CC.LOCAL_FILE_SERVICE_KEY, media_results )
+        
+        media_sort = ClientMedia.MediaSort( ( 'system', CC.SORT_FILES_BY_NUM_TAGS ), CC.SORT_DESC )
+        
+        media_list.Sort( media_sort )
+        
+        self.assertEqual( [ media.GetHash() for media in media_list.GetSortedMedia() ], self._GetPythonSortedHashes( media_list, media_sort ) )
+        
+        # the number of tags changes underneath the list without a content update, as a siblings or display rules change would
+        
+        for media_result in media_results[ : 50 ]:
+            
+            content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'new tag', { media_result.GetHash() } ) )
+            
+            media_result.GetTagsManager().ProcessContentUpdate( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, content_update )
+            
+        
+        media_list.NewTagPresentation()
+        
+        media_list.Sort( media_sort )
+        
+        self.assertEqual( [ media.GetHash() for media in media_list.GetSortedMedia() ], self._GetPythonSortedHashes( media_list, media_sort ) )
+        
+    
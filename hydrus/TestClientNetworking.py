@@ -330,6 +330,68 @@ class TestNetworkingDomain( unittest.TestCase ):
     
 class TestNetworkingEngine( unittest.TestCase ):
     
+    def test_engine_bandwidth_jobs( self ):
+        
+        RESTRICTIVE_DATA_RULES = HydrusNetworking.BandwidthRules()
+        
+        RESTRICTIVE_DATA_RULES.AddRule( HC.BANDWIDTH_TYPE_DATA, 86400, 10 )
+        
+        DOMAIN_NETWORK_CONTEXT = ClientNetworkingContexts.NetworkContext( CC.NETWORK_CONTEXT_DOMAIN, MOCK_DOMAIN )
+        
+        mock_controller = TestController.MockController()
+        bandwidth_manager = ClientNetworkingBandwidth.NetworkBandwidthManager()
+        session_manager = ClientNetworkingSessions.NetworkSessionManager()
+        domain_manager = ClientNetworkingDomain.NetworkDomainManager()
+        login_manager = ClientNetworkingLogin.NetworkLoginManager()
+        
+        engine = ClientNetworking.NetworkEngine( mock_controller, bandwidth_manager, session_manager, domain_manager, login_manager )
+        
+        bandwidth_manager.ReportDataUsed( [ DOMAIN_NETWORK_CONTEXT ], 50 )
+        
+        bandwidth_manager.SetRules( DOMAIN_NETWORK_CONTEXT, RESTRICTIVE_DATA_RULES )
+        
+        mock_controller.CallToThread( engine.MainLoop )
+        
+        #
+        
+        with HTTMock( catch_all ):
+            
+            with HTTMock( catch_wew_ok ):
+                
+                jobs = [ ClientNetworkingJobs.NetworkJob( 'GET', MOCK_URL ) for i in range( 3 ) ]
+                
+                for job in jobs:
+                    
+                    engine.AddJob( job )
+                    
+                
+                time.sleep( 0.25 )
+                
+                # they all queue up behind the context that is blocking them, rather than each sleeping on its own timer
+                
+                self.assertEqual( [ status for ( status, job ) in engine.GetJobsSnapshot() ], [ ClientNetworking.JOB_STATUS_AWAITING_BANDWIDTH ] * 3 )
+                self.assertEqual( list( engine._statuses_to_blocking_keys_to_jobs[ ClientNetworking.JOB_STATUS_AWAITING_BANDWIDTH ].keys() ), [ DOMAIN_NETWORK_CONTEXT ] )
+                self.assertEqual( len( engine._sleeping_jobs_to_heap_counters ), 0 )
+                
+                # and new rules get them going straight away, not when the old estimate runs out
+                
+                bandwidth_manager.SetRules( DOMAIN_NETWORK_CONTEXT, HydrusNetworking.BandwidthRules() )
+                
+                time.sleep( 0.5 )
+                
+                for job in jobs:
+                    
+                    self.assertTrue( job.IsDone() )
+                    self.assertFalse( job.HasError() )
+                    
+                
+            
+        
+        #
+        
+        engine.Shutdown()
+        
+    
     def test_engine_shutdown_app( self ):
         
         mock_controller = TestController.MockController()
@@ -429,10 +491,7 @@ class TestNetworkingEngine( unittest.TestCase ):
                 
                 time.sleep( 0.25 )
                 
-                self.assertEqual( len( engine._jobs_awaiting_validity ), 0 )
-                self.assertEqual( len( engine._jobs_awaiting_bandwidth ), 0 )
-                self.assertEqual( len( engine._jobs_awaiting_login ), 0 )
-                self.assertEqual( len( engine._jobs_awaiting_slot ), 0 )
+                self.assertEqual( engine.GetJobsSnapshot(), [] )
                 self.assertEqual( len( engine._jobs_running ), 0 )
                 
             
@@ -442,6 +501,44 @@ class TestNetworkingEngine( unittest.TestCase ):
         engine.Shutdown()
         
     
+    def test_engine_sleeping_job( self ):
+        
+        mock_controller = TestController.MockController()
+        bandwidth_manager = ClientNetworkingBandwidth.NetworkBandwidthManager()
+        session_manager = ClientNetworkingSessions.NetworkSessionManager()
+        domain_manager = ClientNetworkingDomain.NetworkDomainManager()
+        login_manager = ClientNetworkingLogin.NetworkLoginManager()
+        
+        engine = ClientNetworking.NetworkEngine( mock_controller, bandwidth_manager, session_manager, domain_manager, login_manager )
+        
+        mock_controller.CallToThread( engine.MainLoop )
+        
+        #
+        
+        job = ClientNetworkingJobs.NetworkJob( 'GET', MOCK_URL )
+        
+        job.Sleep( 3600 )
+        
+        engine.AddJob( job )
+        
+        time.sleep( 0.25 )
+        
+        self.assertEqual( engine.GetJobsSnapshot(), [ ( ClientNetworking.JOB_STATUS_AWAITING_VALIDITY, job ) ] )
+        self.assertIn( job, engine._sleeping_jobs_to_heap_counters )
+        
+        # cancelling wakes the job up in the engine, so it does not hang around until its wake time
+        
+        job.Cancel()
+        
+        time.sleep( 0.25 )
+        
+        self.assertEqual( engine.GetJobsSnapshot(), [] )
+        
+        #
+        
+        engine.Shutdown()
+        
+    
 class TestNetworkingJob( unittest.TestCase ):
     
     def _GetJob( self, for_login = False ):
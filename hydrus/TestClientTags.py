@@ -152,6 +152,17 @@ class TestTagsManager( unittest.TestCase ):
         self.assertEqual( self._tags_manager.GetNamespaceSlice( [], ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ), frozenset() )
         
     
+    def test_get_num_current_and_pending( self ):
+        
+        for service_key in ( self._first_key, self._second_key, self._third_key, CC.COMBINED_TAG_SERVICE_KEY ):
+            
+            self.assertEqual( self._tags_manager.GetNumCurrentAndPending( service_key, ClientTags.TAG_DISPLAY_STORAGE ), len( self._tags_manager.GetCurrentAndPending( service_key, ClientTags.TAG_DISPLAY_STORAGE ) ) )
+            
+        
+        self.assertEqual( self._tags_manager.GetNumCurrentAndPending( self._second_key, ClientTags.TAG_DISPLAY_STORAGE ), 3 )
+        self.assertEqual( self._tags_manager.GetNumCurrentAndPending( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_STORAGE ), 11 )
+        
+    
     def test_get_num_tags( self ):
         
         self.assertEqual( self._tags_manager.GetNumTags( ClientSearch.TagSearchContext( service_key = self._first_key, include_current_tags = False, include_pending_tags = False ), ClientTags.TAG_DISPLAY_STORAGE ), 0 )
@@ -215,6 +226,94 @@ class TestTagsManager( unittest.TestCase ):
         self.assertFalse( self._tags_manager.HasTag( 'not_exist', ClientTags.TAG_DISPLAY_STORAGE ) )
         
     
+    def test_has_tags( self ):
+        
+        self.assertTrue( self._tags_manager.HasAllTags( { 'current', 'pending' }, ClientTags.TAG_DISPLAY_STORAGE ) )
+        self.assertFalse( self._tags_manager.HasAllTags( { 'current', 'not_exist' }, ClientTags.TAG_DISPLAY_STORAGE ) )
+        self.assertFalse( self._tags_manager.HasAllTags( { 'current', 'reset_current' }, ClientTags.TAG_DISPLAY_STORAGE ) )
+        
+        self.assertTrue( self._tags_manager.HasAnyTags( { 'not_exist', 'pending' }, ClientTags.TAG_DISPLAY_STORAGE ) )
+        self.assertFalse( self._tags_manager.HasAnyTags( { 'not_exist', 'reset_current' }, ClientTags.TAG_DISPLAY_STORAGE ) )
+        
+    
+    def test_precomputed_display_tags( self ):
+        
+        service_key = HydrusData.GenerateKey()
+        
+        service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+        
+        service_keys_to_statuses_to_tags[ service_key ][ HC.CONTENT_STATUS_CURRENT ] = { 'bad' }
+        
+        service_keys_to_statuses_to_display_tags = collections.defaultdict( HydrusData.default_dict_set )
+        
+        service_keys_to_statuses_to_display_tags[ service_key ][ HC.CONTENT_STATUS_CURRENT ] = { 'good' }
+        
+        tags_manager = ClientMedia.TagsManager( service_keys_to_statuses_to_tags, service_keys_to_statuses_to_display_tags )
+        
+        self.assertEqual( tags_manager.GetCurrent( service_key, ClientTags.TAG_DISPLAY_STORAGE ), { 'bad' } )
+        self.assertEqual( tags_manager.GetCurrent( service_key, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ), { 'good' } )
+        self.assertEqual( tags_manager.GetCurrent( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ), { 'good' } )
+        
+        dupe_tags_manager = tags_manager.Duplicate()
+        
+        self.assertEqual( dupe_tags_manager.GetCurrent( service_key, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ), { 'good' } )
+        
+        # a content update means we have to work the siblings out ourselves again
+        
+        content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'new', { HydrusData.GenerateKey() } ) )
+        
+        tags_manager.ProcessContentUpdate( service_key, content_update )
+        
+        self.assertEqual( tags_manager.GetCurrent( service_key, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ), { 'bad', 'new' } )
+        self.assertEqual( dupe_tags_manager.GetCurrent( service_key, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ), { 'good' } )
+        
+        # new display rules or siblings of tags we do not have leave the db's siblings alone
+        
+        dupe_tags_manager.NewTagDisplayRules()
+        
+        self.assertEqual( dupe_tags_manager.GetCurrent( service_key, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ), { 'good' } )
+        
+        dupe_tags_manager.NewSiblingsLookup( set( ClientTags.tag_id_table.GetTagIds( [ 'unrelated' ] ) ) )
+        
+        self.assertEqual( dupe_tags_manager.GetCurrent( service_key, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ), { 'good' } )
+        
+        # but new siblings for our tags do not
+        
+        dupe_tags_manager.NewSiblingsLookup( set( ClientTags.tag_id_table.GetTagIds( [ 'bad' ] ) ) )
+        
+        self.assertEqual( dupe_tags_manager.GetCurrent( service_key, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ), { 'bad' } )
+        
+    
+    def test_tag_ids( self ):
+        
+        service_key = HydrusData.GenerateKey()
+        
+        tag_ids = ClientTags.tag_id_table.GetTagIds( [ 'tag_ids_a', 'tag_ids_b' ] )
+        
+        self.assertEqual( ClientTags.tag_id_table.GetTagIds( [ 'tag_ids_b', 'tag_ids_a' ] ).tolist(), [ tag_ids[1], tag_ids[0] ] )
+        self.assertEqual( ClientTags.tag_id_table.GetTags( tag_ids ), { 'tag_ids_a', 'tag_ids_b' } )
+        self.assertEqual( ClientTags.tag_id_table.PeekTagId( 'tag_ids_never_seen' ), None )
+        
+        service_keys_to_statuses_to_tag_ids = collections.defaultdict( HydrusData.default_dict_set )
+        
+        service_keys_to_statuses_to_tag_ids[ service_key ][ HC.CONTENT_STATUS_CURRENT ] = set( tag_ids )
+        
+        tags_manager = ClientMedia.TagsManager.FromTagIds( service_keys_to_statuses_to_tag_ids )
+        
+        self.assertEqual( tags_manager.GetCurrent( service_key, ClientTags.TAG_DISPLAY_STORAGE ), { 'tag_ids_a', 'tag_ids_b' } )
+        self.assertEqual( tags_manager.GetCurrent( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_STORAGE ), { 'tag_ids_a', 'tag_ids_b' } )
+        self.assertEqual( tags_manager.GetPending( service_key, ClientTags.TAG_DISPLAY_STORAGE ), set() )
+        
+        self.assertTrue( tags_manager.HasTag( 'tag_ids_a', ClientTags.TAG_DISPLAY_STORAGE ) )
+        self.assertFalse( tags_manager.HasTag( 'tag_ids_never_seen', ClientTags.TAG_DISPLAY_STORAGE ) )
+        
+        # what we get back is a copy, so editing it does not touch the manager
+        
+        tags_manager.GetCurrent( service_key, ClientTags.TAG_DISPLAY_STORAGE ).add( 'tag_ids_c' )
+        
+        self.assertEqual( tags_manager.GetCurrent( service_key, ClientTags.TAG_DISPLAY_STORAGE ), { 'tag_ids_a', 'tag_ids_b' } )
+        
+    
     def test_process_content_update( self ):
         
         hashes = { HydrusData.GenerateKey() for i in range( 6 ) }
@@ -763,6 +862,42 @@ class TestTagParents( unittest.TestCase ):
         self.assertEqual( self._tag_parents_manager.ExpandTags( CC.COMBINED_TAG_SERVICE_KEY, [ 'deleted_b' ] ), { 'deleted_b' } )
         
     
+    def test_incremental_update( self ):
+        
+        # no loops here, so the result does not depend on which pair wins
+        
+        all_pairs = [ ( 'tag_{}'.format( i ), 'tag_{}'.format( j ) ) for i in range( 12 ) for j in range( i + 1, 12 ) if ( i * 7 + j * 3 ) % 5 == 0 ]
+        
+        current_pairs = set( all_pairs[ : len( all_pairs ) // 2 ] )
+        
+        lookup = ClientManagers.TagParentsLookup( current_pairs )
+        
+        for ( i, pair ) in enumerate( all_pairs ):
+            
+            if pair in current_pairs:
+                
+                current_pairs.discard( pair )
+                
+                lookup.UpdatePairs( [], [ pair ] )
+                
+            else:
+                
+                current_pairs.add( pair )
+                
+                lookup.UpdatePairs( [ pair ], [] )
+                
+            
+            expected = ClientManagers.BuildChildrenToParents( ClientManagers.BuildSimpleChildrenToParents( current_pairs ) )
+            
+            children_to_parents = lookup.GetChildrenToParents()
+            
+            for tag in [ 'tag_{}'.format( i ) for i in range( 12 ) ]:
+                
+                self.assertEqual( set( children_to_parents[ tag ] ), set( expected[ tag ] ) )
+                
+            
+        
+    
     def test_no_loop( self ):
         
         self.assertEqual( self._tag_parents_manager.GetParents( CC.COMBINED_TAG_SERVICE_KEY, 'closed_loop' ), [] )
@@ -882,6 +1017,63 @@ class TestTagSiblings( unittest.TestCase ):
         self.assertEqual( self._tag_siblings_manager.CollapseTagsToCount( self._first_key, { 'deleted_a' : 10, 'deleted_b' : 5 } ), { 'deleted_a' : 10, 'deleted_b' : 5 } )
         
     
+    def test_incremental_update( self ):
+        
+        all_pairs = [ ( 'tag_{}'.format( i ), 'tag_{}'.format( j ) ) for i in range( 10 ) for j in range( 10 ) if ( i * 3 + j ) % 4 == 1 ]
+        
+        local_pairs = set( all_pairs[ : : 3 ] )
+        repo_pairs = set( all_pairs[ 1 : : 2 ] )
+        
+        lookup = ClientManagers.TagSiblingsLookup( [ local_pairs, repo_pairs ] )
+        
+        for ( i, pair ) in enumerate( all_pairs ):
+            
+            ( bad, good ) = pair
+            
+            group_index = i % 2
+            
+            pairs = ( local_pairs, repo_pairs )[ group_index ]
+            
+            if pair in pairs:
+                
+                pairs.discard( pair )
+                
+            else:
+                
+                pairs.add( pair )
+                
+            
+            lookup.SetPairs( { bad }, { p for p in pairs if p[0] == bad }, group_index = group_index )
+            
+            expected = ClientManagers.CollapseTagSiblingPairs( [ local_pairs, repo_pairs ] )
+            
+            self.assertEqual( lookup.GetSiblings(), expected )
+            
+            expected_reverse_lookup = HydrusData.BuildKeyToSetDict( ( ( good, bad ) for ( bad, good ) in expected.items() ) )
+            
+            self.assertEqual( { good : set( bads ) for ( good, bads ) in lookup.GetReverseLookup().items() if len( bads ) > 0 }, dict( expected_reverse_lookup ) )
+            
+        
+        #
+        
+        tag_siblings_manager = ClientManagers.TagSiblingsManager( HG.test_controller )
+        
+        self.assertEqual( tag_siblings_manager.GetSibling( self._first_key, 'tree_1' ), 'tree_6' )
+        
+        tag_siblings_manager.NotifyNewSiblings( { self._first_key : ( { 'tree_5' }, { ( 'tree_5', 'tree_7' ) } ) } )
+        tag_siblings_manager.NotifyNewSiblings( { self._first_key : ( { 'tree_4' }, set() ) } )
+        
+        tag_siblings_manager.RefreshSiblingsIfDirty()
+        
+        self.assertEqual( tag_siblings_manager.GetSibling( self._first_key, 'tree_1' ), 'tree_7' )
+        self.assertEqual( tag_siblings_manager.GetSibling( self._first_key, 'tree_4' ), None )
+        self.assertEqual( tag_siblings_manager.GetSibling( CC.COMBINED_TAG_SERVICE_KEY, 'tree_1' ), 'tree_7' )
+        
+        self.assertEqual( tag_siblings_manager.GetSibling( self._first_key, 'tree_6' ), None )
+        
+        self.assertEqual( set( tag_siblings_manager.GetAllSiblings( self._first_key, 'tree_7' ) ), { 'tree_1', 'tree_2', 'tree_3', 'tree_5', 'tree_7' } )
+        
+    
     def test_no_loop( self ):
         
         self.assertEqual( self._tag_siblings_manager.GetSibling( self._first_key, 'closed_loop' ), None )
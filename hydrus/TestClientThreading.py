@@ -1,8 +1,11 @@
 from . import ClientConstants as CC
+from . import ClientServices
 from . import ClientThreading
 from . import HydrusConstants as HC
+from . import HydrusData
 from . import HydrusExceptions
 from . import HydrusGlobals as HG
+from . import HydrusNetwork
 import os
 import threading
 import time
@@ -227,3 +230,72 @@ class TestFileRWLock( unittest.TestCase ):
                 
             
         
+    
+class TestRepositoryUpdateLoader( unittest.TestCase ):
+    
+    def test_loader( self ):
+        
+        client_files_manager = HG.client_controller.client_files_manager
+        
+        expected_results = []
+        
+        for i in range( 5 ):
+            
+            definitions_update = HydrusNetwork.DefinitionsUpdate()
+            
+            definitions_update.AddRow( ( HC.DEFINITIONS_TYPE_TAGS, i + 1, 'tag ' + str( i ) ) )
+            
+            network_bytes = definitions_update.DumpToBinaryNetworkBytes()
+            
+            update_hash = HydrusData.GenerateKey()
+            
+            client_files_manager.LocklessAddFileFromBytes( update_hash, HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS, network_bytes )
+            
+            expected_results.append( ( update_hash, ClientServices.RepositoryUpdateLoader.UPDATE_OK, { i + 1 : 'tag ' + str( i ) } ) )
+            
+        
+        missing_hash = HydrusData.GenerateKey()
+        
+        expected_results.insert( 2, ( missing_hash, ClientServices.RepositoryUpdateLoader.UPDATE_MISSING, None ) )
+        
+        invalid_hash = HydrusData.GenerateKey()
+        
+        client_files_manager.LocklessAddFileFromBytes( invalid_hash, HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS, b'not an update' )
+        
+        expected_results.append( ( invalid_hash, ClientServices.RepositoryUpdateLoader.UPDATE_INVALID, None ) )
+        
+        update_hashes = [ update_hash for ( update_hash, status, tag_ids_to_tags ) in expected_results ]
+        
+        update_loader = ClientServices.RepositoryUpdateLoader( update_hashes, HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS, prefetch_depth = 2 )
+        
+        results = []
+        
+        for ( update_hash, status, update ) in update_loader:
+            
+            if update is None:
+                
+                tag_ids_to_tags = None
+                
+            else:
+                
+                tag_ids_to_tags = update.GetTagIdsToTags()
+                
+            
+            results.append( ( update_hash, status, tag_ids_to_tags ) )
+            
+        
+        self.assertEqual( results, expected_results )
+        
+        # cancelling drops everything not yet handed out
+        
+        update_loader = ClientServices.RepositoryUpdateLoader( update_hashes, HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS, prefetch_depth = 2 )
+        
+        ( update_hash, status, update ) = next( update_loader )
+        
+        self.assertEqual( update_hash, update_hashes[0] )
+        
+        update_loader.Cancel()
+        
+        self.assertEqual( list( update_loader ), [] )
+        
+    
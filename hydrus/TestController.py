@@ -31,14 +31,18 @@ from . import HydrusSessions
 from . import HydrusTags
 from . import HydrusThreading
 from . import TestClientAPI
+from . import TestClientCaches
 from . import TestClientConstants
 from . import TestClientDaemons
 from . import TestClientData
 from . import TestClientDB
 from . import TestClientDBDuplicates
+from . import TestClientFiles
 from . import TestClientImageHandling
+from . import TestClientImporting
 from . import TestClientImportOptions
 from . import TestClientImportSubscriptions
+from . import TestClientMedia
 from . import TestClientListBoxes
 from . import TestClientMigration
 from . import TestClientNetworking
@@ -46,11 +50,14 @@ from . import TestClientTags
 from . import TestClientThreading
 from . import TestDialogs
 from . import TestFunctions
+from . import TestHydrusDB
+from . import TestHydrusFileHandling
 from . import TestHydrusNATPunch
 from . import TestHydrusNetworking
 from . import TestHydrusSerialisable
 from . import TestHydrusServer
 from . import TestHydrusSessions
+from . import TestHydrusThreading
 from . import TestServerDB
 from twisted.internet import reactor
 from . import ClientCaches
@@ -668,14 +675,20 @@ class Controller( object ):
             
         if run_all or self.only_run == 'data':
             
+            suites.append( unittest.TestLoader().loadTestsFromModule( TestClientCaches ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientConstants ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientData ) )
+            suites.append( unittest.TestLoader().loadTestsFromModule( TestClientFiles ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientImportOptions ) )
+            suites.append( unittest.TestLoader().loadTestsFromModule( TestClientMedia ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientTags ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientThreading ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestFunctions ) )
+            suites.append( unittest.TestLoader().loadTestsFromModule( TestHydrusDB ) )
+            suites.append( unittest.TestLoader().loadTestsFromModule( TestHydrusFileHandling ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestHydrusSerialisable ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestHydrusSessions ) )
+            suites.append( unittest.TestLoader().loadTestsFromModule( TestHydrusThreading ) )
             
         if run_all or self.only_run == 'db':
             
@@ -693,6 +706,7 @@ class Controller( object ):
             
         if run_all or self.only_run == 'import':
             
+            suites.append( unittest.TestLoader().loadTestsFromModule( TestClientImporting ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientImportSubscriptions ) )
             
         if run_all or self.only_run == 'image':
@@ -802,3 +816,13 @@ class Controller( object ):
             
         
     
+    def WriteSynchronousUserRequested( self, name, *args, **kwargs ):
+        
+        return self.WriteSynchronous( name, *args, **kwargs )
+        
+    
+    def WriteUserRequested( self, name, *args, **kwargs ):
+        
+        self.Write( name, *args, **kwargs )
+        
+    
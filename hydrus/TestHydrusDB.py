@@ -0,0 +1,397 @@
+from . import HydrusConstants as HC
+from . import HydrusData
+from . import HydrusDB
+from . import HydrusGlobals as HG
+from . import HydrusPaths
+import queue
+import tempfile
+import threading
+import time
+import unittest
+
+class SimpleTestDB( HydrusDB.HydrusDB ):
+    
+    READ_ONLY_ACTIONS = [ 'value' ]
+    READ_ONLY_CONNECTION_POOL_SIZE = 2
+    COALESCABLE_WRITE_ACTIONS = [ 'add' ]
+    
+    # commit after every write, so the pool can see it straight away
+    TRANSACTION_COMMIT_TIME = -1
+    
+    def _CreateDB( self ):
+        
+        self._c.execute( 'CREATE TABLE version ( version INTEGER );' )
+        self._c.execute( 'INSERT INTO version ( version ) VALUES ( ? );', ( HC.SOFTWARE_VERSION, ) )
+        
+        self._c.execute( 'CREATE TABLE test_value ( value INTEGER );' )
+        self._c.execute( 'INSERT INTO test_value ( value ) VALUES ( ? );', ( 0, ) )
+        
+    
+    def _InitCaches( self ):
+        
+        self._num_resyncs = 0
+        
+        self._ResyncCachesAfterRollback()
+        
+    
+    def _ManageDBError( self, job, e ):
+        
+        if job.IsSynchronous():
+            
+            job.PutResult( e )
+            
+        
+    
+    def _Read( self, action, *args, **kwargs ):
+        
+        if action == 'value_in_memory':
+            
+            return self._value_in_memory
+            
+        elif action == 'num_resyncs':
+            
+            return self._num_resyncs
+            
+        elif action == 'broken':
+            
+            raise Exception( 'This job is broken!' )
+            
+        
+        ( value, ) = self._c.execute( 'SELECT value FROM test_value;' ).fetchone()
+        
+        return ( value, self._InReadOnlyJob() )
+        
+    
+    def _ResyncCachesAfterRollback( self ):
+        
+        self._num_resyncs += 1
+        
+        ( self._value_in_memory, ) = self._c.execute( 'SELECT value FROM test_value;' ).fetchone()
+        
+    
+    def _Write( self, action, value, wait_event = None ):
+        
+        if action == 'add':
+            
+            if value is None:
+                
+                raise Exception( 'This job is broken!' )
+                
+            
+            self._c.execute( 'UPDATE test_value SET value = value + ?;', ( value, ) )
+            
+            self._value_in_memory += value
+            
+        else:
+            
+            self._c.execute( 'UPDATE test_value SET value = ?;', ( value, ) )
+            
+            self._value_in_memory = value
+            
+        
+        if wait_event is not None:
+            
+            wait_event.wait( 10 )
+            
+        
+    
+class LongTransactionTestDB( SimpleTestDB ):
+    
+    TRANSACTION_COMMIT_TIME = 3600
+    
+
+class TestIdCache( unittest.TestCase ):
+    
+    def test_lru( self ):
+        
+        id_cache = HydrusDB.IdCache( 2 )
+        
+        id_cache.AddIds( { 'a' : 1, 'b' : 2 } )
+        
+        self.assertEqual( id_cache.GetIds( [ 'a', 'c' ] ), ( { 'a' : 1 }, [ 'c' ] ) )
+        
+        # 'a' was just used, so 'b' is the one to go
+        
+        id_cache.AddIds( { 'c' : 3 } )
+        
+        self.assertEqual( len( id_cache ), 2 )
+        self.assertEqual( id_cache.GetIds( [ 'a', 'b', 'c' ] ), ( { 'a' : 1, 'c' : 3 }, [ 'b' ] ) )
+        
+        id_cache.Clear()
+        
+        self.assertEqual( id_cache.GetIds( [ 'a' ] ), ( {}, [ 'a' ] ) )
+        
+    
+class TestDBJobs( unittest.TestCase ):
+    
+    def _wait_for( self, test_callable ):
+        
+        stop_time = time.monotonic() + 10
+        
+        while not test_callable():
+            
+            self.assertLess( time.monotonic(), stop_time )
+            
+            time.sleep( 0.02 )
+            
+        
+    
+    def test_coalesced_rollback( self ):
+        
+        db_dir = tempfile.mkdtemp()
+        
+        db = SimpleTestDB( HG.test_controller, db_dir, 'coalesce_test' )
+        
+        try:
+            
+            # hold the main loop up so the async writes queue up and get coalesced
+            
+            wait_event = threading.Event()
+            
+            write_thread = threading.Thread( target = db.Write, args = ( 'value', True, 10 ), kwargs = { 'wait_event' : wait_event } )
+            
+            write_thread.start()
+            
+            self._wait_for( db._jobs.WriteIsInProgress )
+            
+            db.Write( 'add', False, 1 )
+            db.Write( 'add', False, None )
+            db.Write( 'add', False, 2 )
+            
+            wait_event.set()
+            
+            write_thread.join( 10 )
+            
+            # the broken job rolls back the group and the other two replay on their own, so memory and db have to agree on both
+            
+            self.assertEqual( db.Read( 'value' )[0], 13 )
+            self.assertEqual( db.Read( 'value_in_memory' ), 13 )
+            
+        finally:
+            
+            db.Shutdown()
+            
+            self._wait_for( db.LoopIsFinished )
+            
+            HydrusPaths.DeletePath( db_dir )
+            
+        
+    
+    def test_failed_job_resync( self ):
+        
+        db_dir = tempfile.mkdtemp()
+        
+        db = SimpleTestDB( HG.test_controller, db_dir, 'resync_test' )
+        
+        try:
+            
+            num_resyncs = db.Read( 'num_resyncs' )
+            
+            # a read has nothing to undo, so the caches stay as they are
+            
+            with self.assertRaises( Exception ):
+                
+                db.Read( 'broken' )
+                
+            
+            self.assertEqual( db.Read( 'num_resyncs' ), num_resyncs )
+            
+            with self.assertRaises( Exception ):
+                
+                db.Write( 'add', True, None )
+                
+            
+            self.assertEqual( db.Read( 'num_resyncs' ), num_resyncs + 1 )
+            
+        finally:
+            
+            db.Shutdown()
+            
+            self._wait_for( db.LoopIsFinished )
+            
+            HydrusPaths.DeletePath( db_dir )
+            
+        
+    
+    def test_pool( self ):
+        
+        db_dir = tempfile.mkdtemp()
+        
+        db = SimpleTestDB( HG.test_controller, db_dir, 'pool_test' )
+        
+        try:
+            
+            db.Write( 'value', True, 1 )
+            
+            # once the write is committed and the main loop has moved on, reads go to the pool and see it
+            
+            self._wait_for( lambda: db.Read( 'value' ) == ( 1, True ) )
+            
+            # a read asked for while a long write is running does not wait for it. the write's caller is still waiting, so nothing can depend on it yet
+            
+            wait_event = threading.Event()
+            
+            write_thread = threading.Thread( target = db.Write, args = ( 'value', True, 2 ), kwargs = { 'wait_event' : wait_event } )
+            
+            write_thread.start()
+            
+            self._wait_for( db._jobs.WriteIsInProgress )
+            
+            results = []
+            
+            read_thread = threading.Thread( target = lambda: results.append( db.Read( 'value' ) ) )
+            
+            read_thread.start()
+            
+            read_thread.join( 5 )
+            
+            self.assertEqual( results, [ ( 1, True ) ] )
+            self.assertTrue( write_thread.is_alive() )
+            
+            wait_event.set()
+            
+            write_thread.join( 10 )
+            
+            self.assertEqual( db.Read( 'value' ), ( 2, True ) )
+            
+        finally:
+            
+            db.Shutdown()
+            
+            self._wait_for( db.LoopIsFinished )
+            
+            HydrusPaths.DeletePath( db_dir )
+            
+        
+    
+    def test_pool_read_your_writes( self ):
+        
+        db_dir = tempfile.mkdtemp()
+        
+        db = LongTransactionTestDB( HG.test_controller, db_dir, 'long_transaction_test' )
+        
+        try:
+            
+            # the transaction is not due to commit for an hour, but a read after a finished write still sees it, from the pool
+            
+            db.Write( 'value', True, 1 )
+            
+            self.assertEqual( db.Read( 'value' ), ( 1, True ) )
+            
+            # and an async write queued before a read is seen too
+            
+            db.Write( 'value', False, 5 )
+            
+            self.assertEqual( db.Read( 'value' ), ( 5, True ) )
+            
+        finally:
+            
+            db.Shutdown()
+            
+            self._wait_for( db.LoopIsFinished )
+            
+            HydrusPaths.DeletePath( db_dir )
+            
+        
+    
+class TestJobQueue( unittest.TestCase ):
+    
+    def _get_actions( self, job_queue ):
+        
+        actions = []
+        
+        while not job_queue.IsEmpty():
+            
+            jobs = job_queue.GetJobs( timeout = 0 )
+            
+            actions.append( tuple( job.GetCallableTuple()[0] for job in jobs ) )
+            
+        
+        return actions
+        
+    
+    def test_priority( self ):
+        
+        job_queue = HydrusDB.JobQueue( [ 'vacuum' ], [] )
+        
+        job_queue.AddJob( HydrusData.JobDatabase( 'write', True, 'vacuum' ) )
+        job_queue.AddJob( HydrusData.JobDatabase( 'write', True, 'import_file' ) )
+        job_queue.AddJob( HydrusData.JobDatabase( 'read', True, 'media_results' ) )
+        
+        self.assertEqual( self._get_actions( job_queue ), [ ( 'media_results', ), ( 'import_file', ), ( 'vacuum', ) ] )
+        
+        # a read has to wait for an async write that was queued before it
+        
+        job_queue.AddJob( HydrusData.JobDatabase( 'write', False, 'content_updates' ) )
+        job_queue.AddJob( HydrusData.JobDatabase( 'read', True, 'media_results' ) )
+        job_queue.AddJob( HydrusData.JobDatabase( 'write', False, 'save_options' ) )
+        
+        self.assertFalse( job_queue.AsyncWritesAreDone() )
+        
+        self.assertEqual( self._get_actions( job_queue ), [ ( 'content_updates', ), ( 'media_results', ), ( 'save_options', ) ] )
+        
+        with self.assertRaises( queue.Empty ):
+            
+            job_queue.GetJobs( timeout = 0 )
+            
+        
+        self.assertTrue( job_queue.AsyncWritesAreDone() )
+        
+    
+    def test_maintenance_aging( self ):
+        
+        job_queue = HydrusDB.JobQueue( [ 'vacuum' ], [] )
+        
+        job_queue.MAINTENANCE_MAX_WAIT = 0.1
+        
+        job_queue.AddJob( HydrusData.JobDatabase( 'write', True, 'vacuum' ) )
+        job_queue.AddJob( HydrusData.JobDatabase( 'write', True, 'import_file' ) )
+        
+        self.assertEqual( self._get_actions( job_queue ), [ ( 'import_file', ), ( 'vacuum', ) ] )
+        
+        # once it has waited long enough, it goes ahead of the foreground work
+        
+        job_queue.AddJob( HydrusData.JobDatabase( 'write', True, 'vacuum' ) )
+        
+        time.sleep( 0.2 )
+        
+        job_queue.AddJob( HydrusData.JobDatabase( 'write', True, 'import_file' ) )
+        job_queue.AddJob( HydrusData.JobDatabase( 'read', True, 'media_results' ) )
+        
+        self.assertEqual( self._get_actions( job_queue ), [ ( 'vacuum', ), ( 'media_results', ), ( 'import_file', ) ] )
+        
+    
+    def test_user_requested_maintenance( self ):
+        
+        job_queue = HydrusDB.JobQueue( [ 'vacuum' ], [] )
+        
+        job_queue.AddJob( HydrusData.JobDatabase( 'write', True, 'maintain_similar_files_tree' ) )
+        
+        job = HydrusData.JobDatabase( 'write', False, 'vacuum' )
+        
+        job.SetUserRequested()
+        
+        job_queue.AddJob( job )
+        job_queue.AddJob( HydrusData.JobDatabase( 'write', True, 'vacuum' ) )
+        job_queue.AddJob( HydrusData.JobDatabase( 'write', True, 'import_file' ) )
+        
+        # the one the user asked for waits its turn with the normal writes, the background one still goes last
+        
+        self.assertEqual( self._get_actions( job_queue ), [ ( 'maintain_similar_files_tree', ), ( 'vacuum', ), ( 'import_file', ), ( 'vacuum', ) ] )
+        
+    
+    def test_coalesce( self ):
+        
+        job_queue = HydrusDB.JobQueue( [], [ 'content_updates' ] )
+        
+        job_queue.AddJob( HydrusData.JobDatabase( 'write', False, 'content_updates' ) )
+        job_queue.AddJob( HydrusData.JobDatabase( 'write', False, 'content_updates' ) )
+        job_queue.AddJob( HydrusData.JobDatabase( 'write', False, 'content_updates' ) )
+        job_queue.AddJob( HydrusData.JobDatabase( 'write', True, 'content_updates' ) )
+        job_queue.AddJob( HydrusData.JobDatabase( 'write', False, 'content_updates' ) )
+        job_queue.AddJob( HydrusData.JobDatabase( 'write', False, 'save_options' ) )
+        job_queue.AddJob( HydrusData.JobDatabase( 'write', False, 'content_updates' ) )
+        
+        self.assertEqual( self._get_actions( job_queue ), [ ( 'content_updates', ) * 3, ( 'content_updates', ), ( 'content_updates', ), ( 'save_options', ), ( 'content_updates', ) ] )
+        
+    
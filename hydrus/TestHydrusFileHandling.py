@@ -0,0 +1,51 @@
+from . import HydrusConstants as HC
+from . import HydrusFileHandling
+import hashlib
+import os
+import unittest
+
+class TestHydrusFileHandling( unittest.TestCase ):
+    
+    def test_hashes_and_header( self ):
+        
+        for filename in ( 'muh_jpg.jpg', 'muh_png.png', 'muh_gif.gif' ):
+            
+            path = os.path.join( HC.STATIC_DIR, 'testing', filename )
+            
+            with open( path, 'rb' ) as f:
+                
+                file_bytes = f.read()
+                
+            
+            ( sha256, ( md5, sha1, sha512 ), header ) = HydrusFileHandling.GetHashesAndHeaderFromPath( path )
+            
+            self.assertEqual( sha256, hashlib.sha256( file_bytes ).digest() )
+            self.assertEqual( md5, hashlib.md5( file_bytes ).digest() )
+            self.assertEqual( sha1, hashlib.sha1( file_bytes ).digest() )
+            self.assertEqual( sha512, hashlib.sha512( file_bytes ).digest() )
+            
+            self.assertEqual( header, file_bytes[ : HydrusFileHandling.MIME_HEADER_SIZE ] )
+            
+        
+    
+    def test_mime_from_header( self ):
+        
+        jpg_path = os.path.join( HC.STATIC_DIR, 'testing', 'muh_jpg.jpg' )
+        png_path = os.path.join( HC.STATIC_DIR, 'testing', 'muh_png.png' )
+        gif_path = os.path.join( HC.STATIC_DIR, 'testing', 'muh_gif.gif' )
+        
+        for ( path, mime ) in ( ( jpg_path, HC.IMAGE_JPEG ), ( png_path, HC.IMAGE_PNG ), ( gif_path, HC.IMAGE_GIF ) ):
+            
+            ( sha256, extra_hashes, header ) = HydrusFileHandling.GetHashesAndHeaderFromPath( path )
+            
+            self.assertEqual( HydrusFileHandling.GetMime( path ), mime )
+            self.assertEqual( HydrusFileHandling.GetMime( path, header = header ), mime )
+            
+        
+        # a pre-read header is trusted over the file, so it really is what gets checked
+        
+        ( sha256, extra_hashes, gif_header ) = HydrusFileHandling.GetHashesAndHeaderFromPath( gif_path )
+        
+        self.assertEqual( HydrusFileHandling.GetMime( jpg_path, header = gif_header ), HC.IMAGE_GIF )
+        
+    
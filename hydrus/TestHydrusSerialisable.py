@@ -152,6 +152,97 @@ class TestSerialisables( unittest.TestCase ):
             
         
     
+    def test_SERIALISABLE_TYPE_CONTENT_UPDATE( self ):
+        
+        def test( obj, dupe_obj ):
+            
+            self.assertEqual( dupe_obj.GetNumRows(), obj.GetNumRows() )
+            
+            self.assertEqual( sorted( tuple( row ) for row in dupe_obj.GetNewFiles() ), sorted( tuple( row ) for row in obj.GetNewFiles() ) )
+            self.assertEqual( sorted( dupe_obj.GetDeletedFiles() ), sorted( obj.GetDeletedFiles() ) )
+            self.assertEqual( sorted( ( tag_id, sorted( hash_ids ) ) for ( tag_id, hash_ids ) in dupe_obj.GetNewMappings() ), sorted( ( tag_id, sorted( hash_ids ) ) for ( tag_id, hash_ids ) in obj.GetNewMappings() ) )
+            self.assertEqual( sorted( ( tag_id, sorted( hash_ids ) ) for ( tag_id, hash_ids ) in dupe_obj.GetDeletedMappings() ), sorted( ( tag_id, sorted( hash_ids ) ) for ( tag_id, hash_ids ) in obj.GetDeletedMappings() ) )
+            self.assertEqual( sorted( tuple( row ) for row in dupe_obj.GetNewTagParents() ), sorted( tuple( row ) for row in obj.GetNewTagParents() ) )
+            self.assertEqual( sorted( tuple( row ) for row in dupe_obj.GetDeletedTagSiblings() ), sorted( tuple( row ) for row in obj.GetDeletedTagSiblings() ) )
+            
+        
+        content_update = HydrusNetwork.ContentUpdate()
+        
+        content_update.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, ( 5, 123456, HC.IMAGE_JPEG, 1500000000, 640, 480, None, None, None ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, ( 3, 8 * 1024 ** 3, HC.VIDEO_WEBM, 1500000001, 1920, 1080, 60000, 3600, None ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, 9 ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, 2 ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 7, [ 500, 3, 1000000 ] ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 1, [ 2 ] ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DELETE, ( 8, [ 4, 6 ] ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_ADD, ( 10, 11 ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_DELETE, ( 12, 13 ) ) )
+        
+        self._dump_and_load_and_test( content_update, test )
+        
+        network_bytes = content_update.DumpToBinaryNetworkBytes()
+        
+        self.assertTrue( network_bytes.startswith( HydrusSerialisable.BINARY_NETWORK_BYTES_PREFIX ) )
+        
+        dupe_content_update = HydrusSerialisable.CreateFromNetworkBytes( network_bytes )
+        
+        self.assertIsInstance( dupe_content_update, HydrusNetwork.ContentUpdate )
+        
+        test( content_update, dupe_content_update )
+        
+        # and it converts back to json fine
+        
+        dupe_content_update = HydrusSerialisable.CreateFromNetworkBytes( network_bytes )
+        
+        self._dump_and_load_and_test( dupe_content_update, test )
+        
+    
+    def test_SERIALISABLE_TYPE_DEFINITIONS_UPDATE( self ):
+        
+        def test( obj, dupe_obj ):
+            
+            self.assertEqual( dupe_obj.GetNumRows(), obj.GetNumRows() )
+            
+            self.assertEqual( dict( dupe_obj.IterateHashIdsAndHashes() ), obj.GetHashIdsToHashes() )
+            self.assertEqual( dict( dupe_obj.IterateTagIdsAndTags() ), obj.GetTagIdsToTags() )
+            
+        
+        definitions_update = HydrusNetwork.DefinitionsUpdate()
+        
+        for i in range( 100, 200 ):
+            
+            definitions_update.AddRow( ( HC.DEFINITIONS_TYPE_TAGS, i * 3, 'series:test \u043a\u0438\u043d\u043e ' + str( i ) ) )
+            definitions_update.AddRow( ( HC.DEFINITIONS_TYPE_HASHES, i + 500, HydrusData.GenerateKey() ) )
+            
+        
+        self._dump_and_load_and_test( definitions_update, test )
+        
+        network_bytes = definitions_update.DumpToBinaryNetworkBytes()
+        
+        self.assertLess( len( network_bytes ), len( definitions_update.DumpToNetworkBytes() ) )
+        
+        dupe_definitions_update = HydrusSerialisable.CreateFromNetworkBytes( network_bytes )
+        
+        self.assertIsInstance( dupe_definitions_update, HydrusNetwork.DefinitionsUpdate )
+        
+        test( definitions_update, dupe_definitions_update )
+        
+        # a lone surrogate cannot go to utf-8, so the server falls back to json for these
+        
+        definitions_update = HydrusNetwork.DefinitionsUpdate()
+        
+        definitions_update.AddRow( ( HC.DEFINITIONS_TYPE_TAGS, 1, 'bad \ud800 tag' ) )
+        
+        with self.assertRaises( UnicodeEncodeError ):
+            
+            definitions_update.DumpToBinaryNetworkBytes()
+            
+        
+        dupe_definitions_update = HydrusSerialisable.CreateFromNetworkBytes( definitions_update.DumpToNetworkBytes() )
+        
+        test( definitions_update, dupe_definitions_update )
+        
+    
     def test_SERIALISABLE_TYPE_DUPLICATE_ACTION_OPTIONS( self ):
         
         def test( obj, dupe_obj ):
@@ -0,0 +1,109 @@
+from . import HydrusData
+from . import HydrusGlobals as HG
+from . import HydrusThreading
+import threading
+import time
+import unittest
+
+class TestCallToThreadPool( unittest.TestCase ):
+    
+    def test_pool( self ):
+        
+        pool = HydrusThreading.CallToThreadPool( HG.test_controller, 'test pool', 1, max_threads = 2 )
+        
+        try:
+            
+            release_event = threading.Event()
+            
+            results = []
+            
+            pool.AddJob( release_event.wait )
+            pool.AddJob( results.append, 'short job' )
+            
+            time.sleep( 0.25 )
+            
+            # the short job got a new thread and did not wait behind the long one
+            
+            self.assertEqual( results, [ 'short job' ] )
+            
+            pool.AddJob( release_event.wait )
+            pool.AddJob( results.append, 'queued job' )
+            
+            time.sleep( 0.25 )
+            
+            # we are at max threads, so the new job waits for a free one
+            
+            stats = pool.GetStats()
+            
+            self.assertEqual( stats[ 'num_threads' ], 2 )
+            self.assertEqual( stats[ 'num_busy_threads' ], 2 )
+            self.assertEqual( stats[ 'queue_depth' ], 1 )
+            self.assertEqual( results, [ 'short job' ] )
+            
+            release_event.set()
+            
+            time.sleep( 0.25 )
+            
+            stats = pool.GetStats()
+            
+            self.assertEqual( results, [ 'short job', 'queued job' ] )
+            self.assertEqual( stats[ 'num_busy_threads' ], 0 )
+            self.assertEqual( stats[ 'queue_depth' ], 0 )
+            self.assertEqual( stats[ 'num_jobs_done' ], 4 )
+            self.assertGreater( stats[ 'max_wait' ], 0.1 )
+            
+        finally:
+            
+            pool.Shutdown()
+            
+        
+    
+class TestJobScheduler( unittest.TestCase ):
+    
+    def test_scheduler( self ):
+        
+        scheduler = HydrusThreading.JobScheduler( HG.test_controller )
+        
+        scheduler.start()
+        
+        try:
+            
+            results = []
+            
+            late_job = HydrusThreading.SingleJob( HG.test_controller, scheduler, 0.5, HydrusData.Call( results.append, 'late' ) )
+            early_job = HydrusThreading.SingleJob( HG.test_controller, scheduler, 0.2, HydrusData.Call( results.append, 'early' ) )
+            cancelled_job = HydrusThreading.SingleJob( HG.test_controller, scheduler, 0.1, HydrusData.Call( results.append, 'cancelled' ) )
+            woken_job = HydrusThreading.SingleJob( HG.test_controller, scheduler, 3600, HydrusData.Call( results.append, 'woken' ) )
+            
+            for job in ( late_job, early_job, cancelled_job, woken_job ):
+                
+                scheduler.AddJob( job )
+                
+            
+            self.assertEqual( scheduler.GetCurrentJobSummary(), '4 jobs' )
+            
+            cancelled_job.Cancel()
+            
+            self.assertEqual( scheduler.GetCurrentJobSummary(), '3 jobs' )
+            
+            woken_job.Wake()
+            
+            time.sleep( 1.0 )
+            
+            self.assertEqual( results, [ 'woken', 'early', 'late' ] )
+            self.assertEqual( scheduler.GetCurrentJobSummary(), '0 jobs' )
+            
+            ( average_lateness, max_lateness ) = scheduler.GetLatenessStats()
+            
+            self.assertLess( max_lateness, 0.5 )
+            
+            ( last_lateness, job_max_lateness ) = late_job.GetLateness()
+            
+            self.assertLess( last_lateness, 0.5 )
+            
+        finally:
+            
+            scheduler.shutdown()
+            
+        
+    